@@ -521,6 +521,7 @@ def Exec(
   universal_newlines: bool = True,
   log: bool = True,
   opt: typing.Optional[pathlib.Path] = None,
+  cwd: typing.Optional[pathlib.Path] = None,
 ) -> subprocess.Popen:
   """Run LLVM's optimizer.
 
@@ -532,9 +533,13 @@ def Exec(
     universal_newlines: Argument passed to Popen() of opt process.
     log: If true, print executed command to DEBUG log.
     opt: An optional `opt` binary path to use.
+    cwd: An optional working directory to run opt in.
 
   Returns:
     A Popen instance with stdout and stderr set to strings.
+
+  Raises:
+    LlvmTimeout: If opt does not complete within timeout_seconds.
   """
   opt = opt or OPT
   cmd = ["timeout", "-s9", str(timeout_seconds), str(opt)] + args
@@ -546,13 +551,16 @@ def Exec(
     stderr=subprocess.PIPE,
     stdin=subprocess.PIPE if stdin else None,
     universal_newlines=universal_newlines,
+    cwd=cwd,
   )
   if stdin:
     stdout, stderr = process.communicate(stdin)
   else:
     stdout, stderr = process.communicate()
-  if process.returncode == 9:
-    raise llvm.LlvmTimeout(f"clang timed out after {timeout_seconds}s")
+  # timeout(1) sends SIGKILL to its process group, so it may itself be killed,
+  # or exit with 128 + 9.
+  if process.returncode in {9, -9, 128 + 9}:
+    raise llvm.LlvmTimeout(f"opt timed out after {timeout_seconds}s")
   process.stdout = stdout
   process.stderr = stderr
   return process
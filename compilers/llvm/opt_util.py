@@ -12,11 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Utility functions """
+import collections
+import itertools
+import multiprocessing
+import multiprocessing.util
+import os
 import pathlib
+import queue
 import re
+import shutil
 import subprocess
 import tempfile
+import threading
 import typing
+import weakref
+from concurrent import futures
 
 from compilers.llvm import llvm
 from compilers.llvm import llvm_as
@@ -124,6 +134,7 @@ def DotGraphsFromBytecode(
   opt_args: typing.List[str],
   opt_path: str = None,
   output_pred: typing.Callable[[str], bool] = None,
+  timeout_seconds: int = 60,
 ) -> typing.Tuple[typing.List[str], typing.List[str]]:
   """Obtain dot graphs from an LLVM bytecode file using an opt pass.
 
@@ -135,64 +146,324 @@ def DotGraphsFromBytecode(
                  True if it should be collected in the first part of the result tuple,
                  or False if it should be collected in the second tuple element.
                  If None, all outputs are collected to the first element.
+    timeout_seconds: The number of seconds to allow opt to run for.
 
   Returns:
     A 2-tuple of lists of graphs as dot strings.
 
   Raises:
     OptException: In case the opt pass fails.
+    LlvmTimeout: If opt does not complete within timeout_seconds.
     UnicodeDecodeError: If generated dotfile can't be read.
   """
+  with tempfile.TemporaryDirectory(prefix="phd_") as d:
+    return _DotGraphsFromBytecodeInDirectory(
+      bytecode,
+      opt_args,
+      pathlib.Path(d),
+      opt_path,
+      output_pred,
+      timeout_seconds,
+    )
+
+
+def _DotGraphsFromBytecodeInDirectory(
+  bytecode: str,
+  opt_args: typing.List[str],
+  output_dir: pathlib.Path,
+  opt_path: str = None,
+  output_pred: typing.Callable[[str], bool] = None,
+  timeout_seconds: int = 60,
+) -> typing.Tuple[typing.List[str], typing.List[str]]:
+  """Run an opt pass in an empty directory and collect the dot graphs.
+
+  See DotGraphsFromBytecode() for arguments. Opt is run with output_dir as its
+  working directory, rather than changing the working directory of this
+  process, so that multiple threads may extract graphs concurrently.
+  """
   graph_dots_true = []
   graph_dots_false = []
 
-  with tempfile.TemporaryDirectory(prefix="phd_") as d:
-    output_dir = pathlib.Path(d)
-    # Change into the output directory, because the -dot-callgraph pass writes
-    # to the current working directory.
-    with fs.chdir(output_dir):
-      # We run with universal_newlines=False because the stdout of opt is the
-      # binary bitcode, which we completely ignore (we're only interested in
-      # stderr). This means we must encode stdin and decode stderr ourselves.
-      process = opt.Exec(
-        opt_args,
-        stdin=bytecode.encode("utf-8"),
-        universal_newlines=False,
-        log=False,
-        opt=opt_path,
+  # We run with universal_newlines=False because the stdout of opt is the
+  # binary bitcode, which we completely ignore (we're only interested in
+  # stderr). This means we must encode stdin and decode stderr ourselves.
+  # The -dot-cfg and -dot-callgraph passes write to the working directory.
+  process = opt.Exec(
+    opt_args,
+    stdin=bytecode.encode("utf-8"),
+    timeout_seconds=timeout_seconds,
+    universal_newlines=False,
+    log=False,
+    opt=opt_path,
+    cwd=output_dir,
+  )
+  stderr = process.stderr.decode("utf-8")
+
+  # Propagate failures from opt as OptExceptions.
+  if process.returncode:
+    raise opt.OptException(returncode=process.returncode, stderr=stderr)
+
+  for file in output_dir.iterdir():
+    # Opt pass prints the name of the dot files it generates, e.g.:
+    #
+    #     $ opt -dot-cfg < foo.ll
+    #     WARNING: You're attempting to print out a bitcode file.
+    #     This is inadvisable as it may cause display problems. If
+    #     you REALLY want to taste LLVM bitcode first-hand, you
+    #     can force output with the `-f' option.
+    #
+    #     Writing 'cfg.DoSomething.dot'...
+    #     Writing 'cfg.main.dot'...
+    if f"Writing '{file.name}'..." not in stderr:
+      raise OSError(
+        f"Could not find reference to file '{file.name}' in "
+        f"opt stderr:\n{stderr}"
       )
-      stderr = process.stderr.decode("utf-8")
+    if not output_pred or output_pred(file.name):
+      graph_dots_true.append(fs.Read(file))
+    else:
+      graph_dots_false.append(fs.Read(file))
 
-      # Propagate failures from opt as OptExceptions.
-      if process.returncode:
-        raise opt.OptException(returncode=process.returncode, stderr=stderr)
+  return graph_dots_true, graph_dots_false
 
-      for file in output_dir.iterdir():
-        # Opt pass prints the name of the dot files it generates, e.g.:
-        #
-        #     $ opt -dot-cfg < foo.ll
-        #     WARNING: You're attempting to print out a bitcode file.
-        #     This is inadvisable as it may cause display problems. If
-        #     you REALLY want to taste LLVM bitcode first-hand, you
-        #     can force output with the `-f' option.
-        #
-        #     Writing 'cfg.DoSomething.dot'...
-        #     Writing 'cfg.main.dot'...
-        if f"Writing '{file.name}'..." not in stderr:
-          raise OSError(
-            f"Could not find reference to file '{file.name}' in "
-            f"opt stderr:\n{process.stderr}"
-          )
-        if not output_pred or output_pred(file.name):
-          graph_dots_true.append(fs.Read(file))
+
+def _DefaultScratchRoot() -> typing.Optional[str]:
+  """Return the directory to create scratch directories in.
+
+  Prefer a tmpfs-backed directory when one is available, since the dot files
+  written by opt are short-lived.
+  """
+  if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+    return "/dev/shm"
+  return None
+
+
+# The opt arguments used to produce the call graph and CFGs of a bytecode.
+_CALL_GRAPH_AND_CFG_OPT_ARGS = ["-metarenamer", "-dot-cfg", "-dot-callgraph"]
+
+
+def _IsControlFlowGraphDotFile(name: str) -> bool:
+  return name != "callgraph.dot"
+
+
+def _SplitCallGraphAndControlFlowGraphs(
+  control_flow_graph_dots: typing.List[str], callgraph_dots: typing.List[str]
+) -> typing.Tuple[str, typing.List[str]]:
+  """Check that a single call graph was produced and return the outputs."""
+  if len(callgraph_dots) != 1:
+    raise OSError(f"Callgraph dotfile not produced")
+
+  return callgraph_dots[0], control_flow_graph_dots
+
+
+def _RemoveScratchRoot(scratch_root: pathlib.Path, pid: int) -> None:
+  """Remove a scratch root, provided that this is the process which created
+  it.
+
+  A forked child process inherits its parent's extractors. It must never remove
+  their scratch directories, which are still in use by the parent.
+  """
+  if os.getpid() == pid:
+    shutil.rmtree(scratch_root, ignore_errors=True)
+
+
+class DotGraphExtractor(object):
+  """A pool of reusable workers for extracting dot graphs using opt.
+
+  Each worker is a scratch directory, created once, which opt writes its dot
+  files into. Scratch directories are created on tmpfs when available, and are
+  emptied after every job, so that no per-bytecode temporary directories are
+  created. Jobs block until a worker is free, and the Map() method distributes
+  jobs across all workers. Each job runs opt as a subprocess with its own
+  timeout, so an extractor may be used from any thread.
+  """
+
+  def __init__(
+    self,
+    nproc: typing.Optional[int] = None,
+    scratch_root: typing.Optional[typing.Union[str, pathlib.Path]] = None,
+  ):
+    """Constructor.
+
+    Args:
+      nproc: The number of workers. Defaults to the number of CPUs.
+      scratch_root: The directory to create scratch directories in. Defaults
+        to /dev/shm if available, else the system temporary directory.
+    """
+    self.nproc = nproc or multiprocessing.cpu_count()
+    # The process which owns the scratch directories.
+    self.pid = os.getpid()
+    self.scratch_root = pathlib.Path(
+      tempfile.mkdtemp(
+        prefix="phd_opt_", dir=scratch_root or _DefaultScratchRoot()
+      )
+    )
+    # Remove the scratch directories when the extractor is closed or garbage
+    # collected, but only in the process which created them.
+    self._finalizer = weakref.finalize(
+      self, _RemoveScratchRoot, self.scratch_root, self.pid
+    )
+    self._scratch_dirs: queue.Queue = queue.Queue()
+    for i in range(self.nproc):
+      scratch_dir = self.scratch_root / str(i)
+      scratch_dir.mkdir()
+      self._scratch_dirs.put(scratch_dir)
+    self._executor: typing.Optional[futures.ThreadPoolExecutor] = None
+    self._lock = threading.Lock()
+
+  def DotGraphsFromBytecode(
+    self,
+    bytecode: str,
+    opt_args: typing.List[str],
+    opt_path: str = None,
+    output_pred: typing.Callable[[str], bool] = None,
+    timeout_seconds: int = 60,
+  ) -> typing.Tuple[typing.List[str], typing.List[str]]:
+    """Obtain dot graphs from an LLVM bytecode using a pooled worker.
+
+    See DotGraphsFromBytecode() for arguments and return values.
+    """
+    scratch_dir = self._scratch_dirs.get()
+    try:
+      return _DotGraphsFromBytecodeInDirectory(
+        bytecode, opt_args, scratch_dir, opt_path, output_pred, timeout_seconds,
+      )
+    finally:
+      # Empty the scratch directory for the next job.
+      for path in scratch_dir.iterdir():
+        if path.is_dir():
+          shutil.rmtree(path)
         else:
-          graph_dots_false.append(fs.Read(file))
+          path.unlink()
+      self._scratch_dirs.put(scratch_dir)
+
+  def DotCallGraphAndControlFlowGraphsFromBytecode(
+    self, bytecode: str, opt_path: str = None, timeout_seconds: int = 60,
+  ) -> typing.Tuple[str, typing.List[str]]:
+    """Create call graph and control flow graphs using a pooled worker.
+
+    See DotCallGraphAndControlFlowGraphsFromBytecode() for arguments and return
+    values.
+    """
+    return _SplitCallGraphAndControlFlowGraphs(
+      *self.DotGraphsFromBytecode(
+        bytecode,
+        _CALL_GRAPH_AND_CFG_OPT_ARGS,
+        opt_path,
+        _IsControlFlowGraphDotFile,
+        timeout_seconds,
+      )
+    )
 
-      return graph_dots_true, graph_dots_false
+  def Map(
+    self,
+    bytecodes: typing.Iterable[str],
+    opt_path: str = None,
+    timeout_seconds: int = 60,
+    max_in_flight: typing.Optional[int] = None,
+  ) -> typing.Iterator[
+    typing.Union[typing.Tuple[str, typing.List[str]], Exception]
+  ]:
+    """Create call graphs and control flow graphs for many bytecodes.
+
+    Bytecodes are processed concurrently by all workers, and results are
+    returned in the order of the input bytecodes. Bytecodes are read from the
+    input lazily, and at most max_in_flight jobs are submitted ahead of the
+    result being consumed, so that the bytecodes and results of a large input
+    are not all held in memory at once.
+
+    Args:
+      bytecodes: The bytecodes to process.
+      opt_path: The path to a custom opt binary.
+      timeout_seconds: The number of seconds to allow each opt job to run for.
+      max_in_flight: The maximum number of jobs which are queued or running, or
+        whose results have not been consumed. Defaults to twice the number of
+        workers.
+
+    Returns:
+      An iterator of results of DotCallGraphAndControlFlowGraphsFromBytecode()
+      for each bytecode. If a job fails, the exception that it raised is
+      returned in place of the result.
+    """
+
+    def _Job(bytecode: str):
+      try:
+        return self.DotCallGraphAndControlFlowGraphsFromBytecode(
+          bytecode, opt_path=opt_path, timeout_seconds=timeout_seconds
+        )
+      except Exception as e:
+        return e
+
+    with self._lock:
+      if self._executor is None:
+        self._executor = futures.ThreadPoolExecutor(max_workers=self.nproc)
+      executor = self._executor
+
+    max_in_flight = max_in_flight or 2 * self.nproc
+    bytecodes = iter(bytecodes)
+    pending = collections.deque(
+      executor.submit(_Job, bytecode)
+      for bytecode in itertools.islice(bytecodes, max_in_flight)
+    )
+    try:
+      while pending:
+        result = pending.popleft().result()
+        # Keep the workers busy while the caller consumes the result.
+        for bytecode in itertools.islice(bytecodes, 1):
+          pending.append(executor.submit(_Job, bytecode))
+        yield result
+    finally:
+      # Cancel the queued jobs of an abandoned iterator.
+      for future in pending:
+        future.cancel()
+
+  def Close(self) -> None:
+    """Stop the workers and remove the scratch directories.
+
+    This is a no-op in a forked child process, since the workers and scratch
+    directories belong to the parent.
+    """
+    if os.getpid() != self.pid:
+      return
+    with self._lock:
+      if self._executor is not None:
+        self._executor.shutdown(wait=True)
+        self._executor = None
+    self._finalizer()
+
+  def __enter__(self) -> "DotGraphExtractor":
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.Close()
+
+
+# A process-wide extractor, created on first use.
+_dot_graph_extractor: typing.Optional[DotGraphExtractor] = None
+_dot_graph_extractor_lock = threading.Lock()
+
+
+def GetDotGraphExtractor() -> DotGraphExtractor:
+  """Return the process-wide dot graph extractor.
+
+  A forked child process creates its own extractor rather than sharing the
+  scratch directories of its parent. The extractor inherited from the parent
+  never removes the parent's scratch directories.
+  """
+  global _dot_graph_extractor
+  with _dot_graph_extractor_lock:
+    if _dot_graph_extractor is None or _dot_graph_extractor.pid != os.getpid():
+      _dot_graph_extractor = DotGraphExtractor()
+      # Use a multiprocessing finalizer rather than atexit, since it is also
+      # run when multiprocessing worker processes exit.
+      multiprocessing.util.Finalize(
+        _dot_graph_extractor, _dot_graph_extractor.Close, exitpriority=10
+      )
+    return _dot_graph_extractor
 
 
 def DotCallGraphAndControlFlowGraphsFromBytecode(
-  bytecode: str, opt_path: str = None
+  bytecode: str, opt_path: str = None, timeout_seconds: int = 60,
 ) -> typing.Tuple[str, typing.List[str]]:
   """Create call graph and control flow graphs from an LLVM bytecode file.
 
@@ -200,9 +471,13 @@ def DotCallGraphAndControlFlowGraphsFromBytecode(
   marginally faster than calling DotControlFlowGraphsFromBytecode() and
   DotCallGraphFromBytecode() separately.
 
+  This uses the process-wide DotGraphExtractor, so concurrent calls share a
+  bounded pool of reusable scratch directories.
+
   Args:
     bytecode: The LLVM bytecode to create call graph and CFGs from.
     opt_path: The path to a custom opt binary. Overrides the default version.
+    timeout_seconds: The number of seconds to allow opt to run for.
 
   Returns:
     A tuple, where the first element is the call graph dot string, and the
@@ -210,22 +485,13 @@ def DotCallGraphAndControlFlowGraphsFromBytecode(
 
   Raises:
     OptException: In case the opt pass fails.
+    LlvmTimeout: If opt does not complete within timeout_seconds.
     UnicodeDecodeError: If generated dotfile can't be read.
   """
-  control_flow_graph_dots, callgraph_dots = DotGraphsFromBytecode(
-    bytecode,
-    ["-metarenamer", "-dot-cfg", "-dot-callgraph"],
-    opt_path,
-    lambda name: name != "callgraph.dot",
+  return GetDotGraphExtractor().DotCallGraphAndControlFlowGraphsFromBytecode(
+    bytecode, opt_path=opt_path, timeout_seconds=timeout_seconds
   )
 
-  if len(callgraph_dots) != 1:
-    raise OSError(f"Callgraph dotfile not produced")
-
-  callgraph = callgraph_dots[0]
-
-  return callgraph, control_flow_graph_dots
-
 
 def GetOptArgs(
   cflags: typing.Optional[typing.List[str]] = None,
@@ -0,0 +1,255 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //compilers/llvm:opt_util."""
+import gc
+import os
+import pathlib
+import re
+
+from compilers.llvm import llvm
+from compilers.llvm import opt
+from compilers.llvm import opt_util
+from labm8.py import app
+from labm8.py import test
+
+FLAGS = app.FLAGS
+
+# A module with a single function.
+ONE_FUNCTION_BYTECODE = """
+define i32 @A() {
+  ret i32 10
+}
+"""
+
+# A module with two functions, one of which calls the other.
+TWO_FUNCTION_BYTECODE = """
+define i32 @B() {
+  ret i32 10
+}
+
+define i32 @A() {
+  %1 = call i32 @B()
+  ret i32 %1
+}
+"""
+
+
+@test.Fixture(scope="function")
+def extractor(tempdir: pathlib.Path) -> opt_util.DotGraphExtractor:
+  """A test fixture which yields a dot graph extractor with two workers."""
+  with opt_util.DotGraphExtractor(nproc=2, scratch_root=tempdir) as extractor:
+    yield extractor
+
+
+@test.Fixture(scope="function")
+def sleeping_opt(tempdir2: pathlib.Path) -> str:
+  """A test fixture which returns the path of an opt that never completes."""
+  path = tempdir2 / "opt"
+  path.write_text("#!/bin/sh\nsleep 60\n")
+  path.chmod(0o755)
+  return str(path)
+
+
+def test_DotGraphExtractor_DotCallGraphAndControlFlowGraphsFromBytecode(
+  extractor: opt_util.DotGraphExtractor,
+):
+  """Test that a call graph and a CFG per function are produced."""
+  call_graph, cfgs = extractor.DotCallGraphAndControlFlowGraphsFromBytecode(
+    TWO_FUNCTION_BYTECODE
+  )
+  assert call_graph.startswith("digraph")
+  assert len(cfgs) == 2
+
+
+def test_DotGraphExtractor_scratch_dirs_are_emptied(
+  extractor: opt_util.DotGraphExtractor,
+):
+  """Test that no dot files are left in the scratch directories."""
+  extractor.DotCallGraphAndControlFlowGraphsFromBytecode(TWO_FUNCTION_BYTECODE)
+  scratch_dirs = list(extractor.scratch_root.iterdir())
+  assert len(scratch_dirs) == 2
+  for scratch_dir in scratch_dirs:
+    assert not list(scratch_dir.iterdir())
+
+
+def test_DotGraphExtractor_invalid_bytecode(
+  extractor: opt_util.DotGraphExtractor,
+):
+  """Test that an opt failure is raised as an OptException."""
+  with test.Raises(opt.OptException):
+    extractor.DotCallGraphAndControlFlowGraphsFromBytecode("invalid bytecode!")
+
+
+def test_DotGraphExtractor_timeout(
+  extractor: opt_util.DotGraphExtractor, sleeping_opt: str
+):
+  """Test that an opt which does not complete is killed."""
+  with test.Raises(llvm.LlvmTimeout):
+    extractor.DotCallGraphAndControlFlowGraphsFromBytecode(
+      ONE_FUNCTION_BYTECODE, opt_path=sleeping_opt, timeout_seconds=1
+    )
+
+
+def test_DotGraphExtractor_Map_order(extractor: opt_util.DotGraphExtractor):
+  """Test that results are returned in the order of the input bytecodes."""
+  bytecodes = [
+    ONE_FUNCTION_BYTECODE,
+    TWO_FUNCTION_BYTECODE,
+    "invalid bytecode!",
+  ] * 3
+  results = list(extractor.Map(bytecodes))
+  assert len(results) == 9
+  for i in range(0, 9, 3):
+    assert len(results[i][1]) == 1
+    assert len(results[i + 1][1]) == 2
+    assert isinstance(results[i + 2], opt.OptException)
+
+
+def test_DotGraphExtractor_Map_timeout(
+  extractor: opt_util.DotGraphExtractor, sleeping_opt: str
+):
+  """Test that a timeout is returned in place of a result."""
+  results = list(
+    extractor.Map(
+      [ONE_FUNCTION_BYTECODE] * 2, opt_path=sleeping_opt, timeout_seconds=1
+    )
+  )
+  assert len(results) == 2
+  assert all(isinstance(result, llvm.LlvmTimeout) for result in results)
+
+
+def test_DotGraphExtractor_Map_bounds_jobs_in_flight(
+  extractor: opt_util.DotGraphExtractor,
+):
+  """Test that bytecodes are read from the input as results are consumed."""
+  consumed = []
+
+  def Bytecodes():
+    for i in range(10):
+      consumed.append(i)
+      yield ONE_FUNCTION_BYTECODE
+
+  results = extractor.Map(Bytecodes(), max_in_flight=3)
+  assert len(next(results)[1]) == 1
+  assert len(consumed) == 4
+  assert len(list(results)) == 9
+
+
+def _StripNodeAddresses(dots):
+  """Remove the pointer addresses which opt uses as dot node names, and sort
+  the CFGs, which are produced in directory order."""
+  call_graph, cfgs = dots
+  return (
+    re.sub(r"Node0x[0-9a-f]+", "Node", call_graph),
+    sorted(re.sub(r"Node0x[0-9a-f]+", "Node", cfg) for cfg in cfgs),
+  )
+
+
+def test_DotGraphExtractor_Map_matches_DotGraphsFromBytecode(
+  extractor: opt_util.DotGraphExtractor,
+):
+  """Test that Map() produces the same graphs as individual jobs."""
+  bytecodes = [ONE_FUNCTION_BYTECODE, TWO_FUNCTION_BYTECODE]
+  assert [_StripNodeAddresses(dots) for dots in extractor.Map(bytecodes)] == [
+    _StripNodeAddresses(
+      opt_util.DotCallGraphAndControlFlowGraphsFromBytecode(bytecode)
+    )
+    for bytecode in bytecodes
+  ]
+
+
+def test_DotGraphExtractor_Close_removes_scratch_root(tempdir: pathlib.Path):
+  """Test that closing an extractor removes its scratch directories."""
+  extractor = opt_util.DotGraphExtractor(nproc=1, scratch_root=tempdir)
+  list(extractor.Map([ONE_FUNCTION_BYTECODE]))
+  assert extractor.scratch_root.is_dir()
+  extractor.Close()
+  assert not extractor.scratch_root.exists()
+  # Closing is idempotent.
+  extractor.Close()
+
+
+def test_DotGraphExtractor_garbage_collection_removes_scratch_root(
+  tempdir: pathlib.Path,
+):
+  """Test that an extractor which is not closed is cleaned up by gc."""
+  extractor = opt_util.DotGraphExtractor(nproc=1, scratch_root=tempdir)
+  scratch_root = extractor.scratch_root
+  del extractor
+  gc.collect()
+  assert not scratch_root.exists()
+
+
+def test_GetDotGraphExtractor_is_process_wide():
+  """Test that the same extractor is returned for repeated calls."""
+  assert opt_util.GetDotGraphExtractor() is opt_util.GetDotGraphExtractor()
+
+
+def _RunInForkedChild(fn) -> int:
+  """Run a function in a forked child process and return its exit code."""
+  pid = os.fork()
+  if not pid:
+    try:
+      os._exit(0 if fn() else 1)
+    except:
+      os._exit(2)
+  _, status = os.waitpid(pid, 0)
+  return os.WEXITSTATUS(status)
+
+
+def test_GetDotGraphExtractor_forked_child_keeps_parent_scratch_root():
+  """Test that a forked child never removes its parent's scratch directories.
+  """
+  parent_extractor = opt_util.GetDotGraphExtractor()
+
+  def _Child():
+    # Release the extractor inherited from the parent.
+    child_extractor = opt_util.GetDotGraphExtractor()
+    parent_extractor.Close()
+    gc.collect()
+    ok = child_extractor is not parent_extractor
+    ok &= child_extractor.scratch_root != parent_extractor.scratch_root
+    ok &= parent_extractor.scratch_root.is_dir()
+    child_extractor.Close()
+    return ok
+
+  assert _RunInForkedChild(_Child) == 0
+  assert parent_extractor.scratch_root.is_dir()
+  assert opt_util.GetDotGraphExtractor() is parent_extractor
+  list(parent_extractor.Map([ONE_FUNCTION_BYTECODE]))
+
+
+def test_DotGraphExtractor_forked_child_gc_keeps_parent_scratch_root(
+  tempdir: pathlib.Path,
+):
+  """Test that gc of an inherited extractor in a child is harmless."""
+  extractor = opt_util.DotGraphExtractor(nproc=1, scratch_root=tempdir)
+  scratch_root = extractor.scratch_root
+
+  def _Child():
+    nonlocal extractor
+    extractor = None
+    gc.collect()
+    return scratch_root.is_dir()
+
+  assert _RunInForkedChild(_Child) == 0
+  assert scratch_root.is_dir()
+  extractor.Close()
+  assert not scratch_root.exists()
+
+
+if __name__ == "__main__":
+  test.Main()
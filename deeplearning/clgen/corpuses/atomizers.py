@@ -85,6 +85,22 @@ class AtomizerBase(object):
     """
     raise NotImplementedError("abstract class")
 
+  def AtomizeStrings(
+    self, texts: typing.Iterable[str]
+  ) -> typing.List[np.array]:
+    """Atomize a batch of texts into arrays of vocabulary indices.
+
+    Args:
+      texts: Input texts.
+
+    Returns:
+      A list of arrays of indices into vocabulary, one for each input text.
+
+    Raises:
+      VocabError: If an input text contains elements not in the vocabulary.
+    """
+    return [self.AtomizeString(text) for text in texts]
+
   def TokenizeString(self, text: str) -> typing.List[str]:
     """Split the text into atoms, but do not encode to indices.
 
@@ -173,7 +189,13 @@ class AsciiCharacterAtomizer(AtomizerBase):
 
 
 class GreedyAtomizer(AtomizerBase):
-  """A greedy atomizer supports multi-character tokens."""
+  """A greedy atomizer supports multi-character tokens.
+
+  Text is atomized by repeatedly taking the longest multi-character atom which
+  matches the start of the remaining text, else a single character. The
+  longest match is found by walking a prefix trie of the multi-character atoms,
+  which is built once per vocabulary.
+  """
 
   def __init__(self, vocab: typing.Dict[str, int], determine_chars=False):
     self.determine_chars = determine_chars
@@ -184,6 +206,32 @@ class GreedyAtomizer(AtomizerBase):
     self.lookup = dict(
       (c, [a for a in multichars if a[0] == c]) for c in first_chars
     )
+    self._trie = None
+
+  @property
+  def trie(self) -> typing.Dict[str, typing.Any]:
+    """A prefix trie of the multi-character atoms.
+
+    Each node is a dictionary mapping characters to child nodes. A node at the
+    end of an atom maps the key None to the vocabulary index of the atom.
+    """
+    # Atomizers which were pickled before the trie was added have no _trie
+    # attribute.
+    if getattr(self, "_trie", None) is None:
+      self._trie = {}
+      for atoms in self.lookup.values():
+        for atom in atoms:
+          node = self._trie
+          for char in atom:
+            node = node.setdefault(char, {})
+          node[None] = self.vocab[atom]
+    return self._trie
+
+  def __getstate__(self) -> typing.Dict[str, typing.Any]:
+    # Exclude the trie from pickles, since it is cheap to rebuild.
+    state = self.__dict__.copy()
+    state["_trie"] = None
+    return state
 
   def AtomizeString(self, text: str) -> np.array:
     """Atomize a text into an array of vocabulary indices.
@@ -194,41 +242,36 @@ class GreedyAtomizer(AtomizerBase):
     Returns:
       An array of indices into vocabulary for all atoms in text.
     """
-
-    def _AddToVocab(token: str) -> int:
-      """Add a token to the vocabulary and return its index."""
-      if self.determine_chars and token not in self.vocab:
-        max_index = max(self.vocab.values())
-        self.vocab[token] = max_index + 1
-      return self.vocab[token]
+    trie = self.trie
+    vocab = self.vocab
+    text_length = len(text)
 
     indices = []
     i = 0
-    j = 2
     try:
-      while i < len(text):
-        if self.lookup.get(text[i]):
-          if j <= len(text) and any(
-            x.startswith(text[i:j]) for x in self.lookup[text[i]]
-          ):
-            j += 1
-          else:
-            while j > i + 1:
-              if any(x == text[i:j] for x in self.lookup[text[i]]):
-                indices.append(self.vocab[text[i:j]])
-                i = j
-                j += 2
-                break
-              else:
-                j -= 1
-            else:
-              indices.append(_AddToVocab(text[i]))
-              i += 1
-              j += 2
-        else:
-          indices.append(_AddToVocab(text[i]))
+      while i < text_length:
+        # Walk the trie to find the longest multi-character atom at i.
+        index = None
+        node = trie.get(text[i])
+        j = i + 1
+        while node is not None:
+          if None in node:
+            index = node[None]
+            end = j
+          if j == text_length:
+            break
+          node = node.get(text[j])
+          j += 1
+
+        if index is None:
+          char = text[i]
+          if self.determine_chars and char not in vocab:
+            vocab[char] = max(vocab.values()) + 1
+          indices.append(vocab[char])
           i += 1
-          j += 2
+        else:
+          indices.append(index)
+          i = end
     except KeyError:
       raise errors.VocabError
 
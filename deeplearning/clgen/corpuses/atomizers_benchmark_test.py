@@ -0,0 +1,160 @@
+# Copyright (c) 2016, 2017, 2018, 2019 Chris Cummins.
+#
+# clgen is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# clgen is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with clgen.  If not, see <https://www.gnu.org/licenses/>.
+"""Benchmarks for //deeplearning/clgen/corpuses:atomizers.
+
+The benchmarks atomize the OpenCL kernels of the tiny test corpus, comparing
+the trie-based GreedyAtomizer against the original implementation.
+"""
+import re
+import tarfile
+import typing
+
+import numpy as np
+
+from deeplearning.clgen import errors
+from deeplearning.clgen.corpuses import atomizers
+from labm8.py import bazelutil
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+MODULE_UNDER_TEST = None
+
+TINY_CORPUS = bazelutil.DataPath(
+  "phd/deeplearning/clgen/tests/data/tiny.tar.bz2"
+)
+
+# The number of contentfiles of the tiny corpus to atomize. The original
+# implementation takes minutes to atomize the entire corpus.
+CONTENTFILE_COUNT = 100
+
+
+def AtomizeStringReference(
+  atomizer: atomizers.GreedyAtomizer, text: str
+) -> np.array:
+  """The original implementation of GreedyAtomizer.AtomizeString(), used as a
+  baseline for comparison.
+  """
+
+  def _AddToVocab(token: str) -> int:
+    """Add a token to the vocabulary and return its index."""
+    if atomizer.determine_chars and token not in atomizer.vocab:
+      max_index = max(atomizer.vocab.values())
+      atomizer.vocab[token] = max_index + 1
+    return atomizer.vocab[token]
+
+  indices = []
+  i = 0
+  j = 2
+  try:
+    while i < len(text):
+      if atomizer.lookup.get(text[i]):
+        if j <= len(text) and any(
+          x.startswith(text[i:j]) for x in atomizer.lookup[text[i]]
+        ):
+          j += 1
+        else:
+          while j > i + 1:
+            if any(x == text[i:j] for x in atomizer.lookup[text[i]]):
+              indices.append(atomizer.vocab[text[i:j]])
+              i = j
+              j += 2
+              break
+            else:
+              j -= 1
+          else:
+            indices.append(_AddToVocab(text[i]))
+            i += 1
+            j += 2
+      else:
+        indices.append(_AddToVocab(text[i]))
+        i += 1
+        j += 2
+  except KeyError:
+    raise errors.VocabError
+
+  if atomizer.determine_chars:
+    atomizer._UpdateVocabulary()
+
+  return np.array(indices, dtype=np.int32)
+
+
+@test.Fixture(scope="session")
+def texts() -> typing.List[str]:
+  """Test fixture which returns contentfiles of the tiny corpus."""
+  with tarfile.open(TINY_CORPUS, "r:bz2") as tar:
+    members = sorted(
+      [m for m in tar.getmembers() if m.isfile() and m.name.endswith(".cl")],
+      key=lambda m: m.name,
+    )
+    texts = [
+      tar.extractfile(member).read().decode("utf-8")
+      for member in members[:CONTENTFILE_COUNT]
+    ]
+  assert texts
+  return texts
+
+
+@test.Fixture(scope="session")
+def atomizer(texts: typing.List[str]) -> atomizers.GreedyAtomizer:
+  """Test fixture which returns a greedy atomizer for the tiny corpus.
+
+  The multi-character atoms are the identifiers, multi-character operators,
+  and runs of whitespace of the corpus, producing a large vocabulary with many
+  atoms which share prefixes.
+  """
+  atoms = set()
+  for text in texts:
+    atoms.update(re.findall(r"[A-Za-z_]\w+|[-+*/%<>=!&|^]{2,}| {2,}", text))
+  return atomizers.GreedyAtomizer.FromText("".join(texts), atoms)
+
+
+def test_AtomizeString_equals_reference(
+  atomizer: atomizers.GreedyAtomizer, texts: typing.List[str]
+):
+  """Check that atomized texts match the original implementation."""
+  for text in texts:
+    np.testing.assert_array_equal(
+      atomizer.AtomizeString(text), AtomizeStringReference(atomizer, text)
+    )
+
+
+def test_AtomizeStrings_equals_AtomizeString(
+  atomizer: atomizers.GreedyAtomizer, texts: typing.List[str]
+):
+  """Check that batch atomized texts match the individually atomized texts."""
+  for a, b in zip(atomizer.AtomizeStrings(texts), texts):
+    np.testing.assert_array_equal(a, atomizer.AtomizeString(b))
+
+
+def test_benchmark_AtomizeStrings(
+  benchmark, atomizer: atomizers.GreedyAtomizer, texts: typing.List[str]
+):
+  """Benchmark the trie-based atomizer."""
+  benchmark(atomizer.AtomizeStrings, texts)
+
+
+def test_benchmark_AtomizeStringReference(
+  benchmark, atomizer: atomizers.GreedyAtomizer, texts: typing.List[str]
+):
+  """Benchmark the original atomizer."""
+  benchmark.pedantic(
+    lambda: [AtomizeStringReference(atomizer, text) for text in texts],
+    rounds=3,
+  )
+
+
+if __name__ == "__main__":
+  test.Main()
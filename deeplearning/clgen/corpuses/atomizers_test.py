@@ -15,6 +15,7 @@
 """Unit tests for //deeplearning/clgen/atomizers.py."""
 import pathlib
 import tempfile
+import typing
 
 import pytest
 
@@ -404,5 +405,54 @@ __kernel void A(__global float* a, __global float* b, const int c) {
   assert c.vocab_size == len(tokens)
 
 
+def test_GreedyAtomizer_AtomizeString_vocab_error():
+  """Test that VocabError is raised for characters not in the vocabulary."""
+  c = atomizers.GreedyAtomizer({"ab": 0, "b": 1})
+  with test.Raises(deeplearning.clgen.errors.VocabError):
+    c.AtomizeString("ac")
+
+
+def test_GreedyAtomizer_AtomizeStrings():
+  """Test that a batch of texts is atomized individually."""
+  c = atomizers.GreedyAtomizer({"ab": 0, "a": 1, "b": 2})
+  a, b, empty = c.AtomizeStrings(["aab", "ba", ""])
+  assert a.tolist() == [1, 0]
+  assert b.tolist() == [2, 1]
+  assert empty.tolist() == []
+
+
+@test.Parametrize(
+  "text,tokens",
+  [
+    ("abcd", ["abcd"]),
+    # A partial match of 'abcd' falls back to the longest complete atom.
+    ("abcx", ["ab", "c", "x"]),
+    ("abc", ["ab", "c"]),
+    ("bcd", ["bc", "d"]),
+    ("aabcdbc", ["a", "abcd", "bc"]),
+    ("xa", ["x", "a"]),
+  ],
+)
+def test_GreedyAtomizer_AtomizeString_longest_match(
+  text: str, tokens: typing.List[str]
+):
+  """Test that the longest multi-character atom is matched at each position."""
+  vocab = {"abcd": 0, "ab": 1, "bc": 2, "a": 3, "b": 4, "c": 5, "d": 6, "x": 7}
+  c = atomizers.GreedyAtomizer(vocab)
+  assert c.AtomizeString(text).tolist() == [vocab[t] for t in tokens]
+
+
+def test_GreedyAtomizer_ToFile_FromFile_trie():
+  """Test that the trie is rebuilt for atomizers loaded from file."""
+  c1 = atomizers.GreedyAtomizer({"abc": 0, "a": 1, "b": 2, "c": 3})
+  assert c1.AtomizeString("abc").tolist() == [0]
+
+  with tempfile.TemporaryDirectory() as d:
+    c1.ToFile(pathlib.Path(d) / "atomizer")
+    c2 = atomizers.AtomizerBase.FromFile(pathlib.Path(d) / "atomizer")
+    assert c2._trie is None
+    assert c2.AtomizeString("ababc").tolist() == [1, 2, 0]
+
+
 if __name__ == "__main__":
   test.Main()
@@ -19,7 +19,6 @@ is a file containing text to train over.
 """
 import os
 import pathlib
-import random
 import subprocess
 import tempfile
 import time
@@ -137,9 +136,11 @@ class Corpus(object):
     self.dashboard_db = dashboard_db.GetDatabase()
     self._dashboard_db_id: typing.Optional[int] = None  # Set in Create()
 
-    # An in-memory cache of the encoded contentfiles indices arrays.
-    # Set and used in GetTrainingData().
-    self._indices_arrays: typing.Optional[typing.List[np.array]] = None
+    # The packed encoded corpus, which is memory mapped from the corpus cache.
+    # Set and used in GetPackedTrainingData().
+    self._packed_training_data: typing.Optional[
+      encoded.PackedEncodedCorpus
+    ] = None
 
     cache.cachepath("corpus").mkdir(parents=True, exist_ok=True)
     hc = hashcache.HashCache(cache.cachepath("hashcache.db"), "sha1")
@@ -200,6 +201,12 @@ class Corpus(object):
     self.atomizer_path = cache.cachepath(
       "corpus", "encoded", encoded_id, "atomizer.pkl"
     )
+    self.packed_tokens_path = cache.cachepath(
+      "corpus", "encoded", encoded_id, "training_data.int32"
+    )
+    self.packed_offsets_path = cache.cachepath(
+      "corpus", "encoded", encoded_id, "training_data_offsets.npy"
+    )
     # Create symlink to preprocessed files.
     # TODO(github.com/ChrisCummins/clgen/issues/130): Refactor this conditional
     # logic after splitting Corpus class.
@@ -348,30 +355,45 @@ class Corpus(object):
   def GetTrainingData(self, shuffle: bool) -> np.ndarray:
     """Concatenate the entire encoded corpus into an array.
 
+    This loads the entire corpus into memory. To stream training data from
+    corpuses larger than system memory, use GetPackedTrainingData().
+
     Args:
       shuffle: If true, randomize order of encoded contentfiles.
 
     Returns:
       The encoded corpus.
     """
-    with prof.Profile("GetTrainingData()"):
-      # Load all indices from the database into memory, and keep them there.
-      # This is to remove the latency from reading the contents from a
-      # database.
-      #
-      # TODO(https://github.com/ChrisCummins/clgen/issues/128): Storing the
-      # entire corpus in memory like this prevents training on corpuses larger
-      # than system memory. Replace this method with an interface for streaming
-      # data from the encoded database.
-      if not self._indices_arrays:
-        with self.encoded.Session() as session:
-          query = session.query(encoded.EncodedContentFile)
-          self._indices_arrays = [x.indices_array for x in query]
+    return self.GetPackedTrainingData(shuffle).ToArray()
 
-      if shuffle:
-        random.shuffle(self._indices_arrays)
+  def GetPackedTrainingData(self, shuffle: bool) -> encoded.PackedEncodedCorpus:
+    """Get a memory mapped view of the encoded corpus.
+
+    On first call, the encoded contentfiles are written to a packed tokens file
+    in the corpus cache. Subsequent calls, including those from other
+    processes, reuse this file.
+
+    Args:
+      shuffle: If true, randomize order of encoded contentfiles. This permutes
+        the index of contentfiles, and does not copy the encoded corpus.
+
+    Returns:
+      A PackedEncodedCorpus.
+    """
+    if self._packed_training_data is None:
+      with lockfile.LockFile(self.packed_tokens_path.parent / "LOCK"):
+        if not self.packed_offsets_path.is_file():
+          with prof.Profile("Packed encoded contentfiles"):
+            self.encoded.ExportPacked(
+              self.packed_tokens_path, self.packed_offsets_path
+            )
+      self._packed_training_data = encoded.PackedEncodedCorpus.FromFiles(
+        self.packed_tokens_path, self.packed_offsets_path
+      )
 
-      return np.concatenate(self._indices_arrays)
+    if shuffle:
+      return self._packed_training_data.Shuffle()
+    return self._packed_training_data
 
   def GetNumContentFiles(self) -> int:
     """Get the number of contentfiles which were pre-processed."""
@@ -18,6 +18,7 @@ import os
 import pathlib
 import tempfile
 
+import numpy as np
 import pytest
 
 from deeplearning.clgen import errors
@@ -436,7 +437,8 @@ def abc_pre_encoded() -> str:
     with db.Session(commit=True) as s:
       s.add(
         encoded.EncodedContentFile(
-          data="0.1.2.0.1",
+          data=np.array([0, 1, 2, 0, 1], dtype=np.uint16).tobytes(),
+          data_dtype="<u2",
           tokencount=5,
           encoding_time_ms=10,
           wall_time_ms=10,
@@ -445,7 +447,8 @@ def abc_pre_encoded() -> str:
       )
       s.add(
         encoded.EncodedContentFile(
-          data="2.2.2",
+          data=np.array([2, 2, 2], dtype=np.uint16).tobytes(),
+          data_dtype="<u2",
           tokencount=3,
           encoding_time_ms=10,
           wall_time_ms=10,
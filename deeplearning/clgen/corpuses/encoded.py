@@ -15,7 +15,8 @@
 """This file defines a database for encoded content files."""
 import datetime
 import multiprocessing
-import pickle
+import os
+import pathlib
 import time
 import typing
 
@@ -28,7 +29,6 @@ from sqlalchemy.sql import func
 from deeplearning.clgen import errors
 from deeplearning.clgen.corpuses import atomizers
 from deeplearning.clgen.corpuses import preprocessed
-from deeplearning.clgen.proto import internal_pb2
 from labm8.py import app
 from labm8.py import humanize
 from labm8.py import sqlutil
@@ -54,12 +54,12 @@ class EncodedContentFile(Base):
 
   # The ID of the PreprocessedContentFile.
   id: int = sql.Column(sql.Integer, primary_key=True)
-  # We store the vocabulary indices array as a string of period-separated
-  # integers, e.g. '0.1.2.0.1'. To access the values as an array of integers,
-  # use EncodedContentFile.indices_array.
-  data: str = sql.Column(
-    sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable=False
-  )
+  # We store the vocabulary indices array as the raw bytes of a little-endian
+  # integer array, of type data_dtype. To access the values as an array of
+  # integers, use EncodedContentFile.indices_array.
+  data: bytes = sql.Column(sqlutil.ColumnTypes.LargeBinary(), nullable=False)
+  # The numpy dtype string of the data array, e.g. '<u2'.
+  data_dtype: str = sql.Column(sql.String(8), nullable=False)
   tokencount: int = sql.Column(sql.Integer, nullable=False)
   # The number of milliseconds encoding took.
   encoding_time_ms: int = sql.Column(sql.Integer, nullable=False)
@@ -73,19 +73,35 @@ class EncodedContentFile(Base):
   date_added: datetime.datetime = sql.Column(sql.DateTime, nullable=False)
 
   @staticmethod
-  def DataStringToNumpyArray(data: str) -> np.ndarray:
-    """Convert the 'data' string to a numpy array."""
-    return np.array([int(x) for x in data.split(".")], dtype=np.int32)
+  def GetDataDtype(vocab_size: int) -> str:
+    """Return the dtype string used to store indices of a vocabulary."""
+    if vocab_size <= 2 ** 16:
+      return np.dtype("<u2").str
+    return np.dtype("<i4").str
+
+  @staticmethod
+  def DataToNumpyArray(data: bytes, data_dtype: str) -> np.ndarray:
+    """Convert the 'data' bytes to a numpy array."""
+    return np.frombuffer(data, dtype=data_dtype).astype(np.int32)
 
   @staticmethod
-  def NumpyArrayToDataString(array: np.ndarray) -> str:
-    """Convert the 'data' string to a numpy array."""
-    return ".".join(str(x) for x in array)
+  def NumpyArrayToData(array: np.ndarray, data_dtype: str) -> bytes:
+    """Convert a numpy array to 'data' bytes."""
+    return np.asarray(array).astype(data_dtype).tobytes()
+
+  @staticmethod
+  def DataStringToNumpyArray(data: str) -> np.ndarray:
+    """Convert a legacy 'data' string to a numpy array.
+
+    Before binary storage, the vocabulary indices array was stored as a string
+    of period-separated integers, e.g. '0.1.2.0.1'.
+    """
+    return np.array([int(x) for x in data.split(".")], dtype=np.int32)
 
   @property
   def indices_array(self) -> np.ndarray:
     """The numpy array of the encoded data."""
-    return self.DataStringToNumpyArray(self.data)
+    return self.DataToNumpyArray(self.data, self.data_dtype)
 
   @classmethod
   def FromPreprocessed(
@@ -107,15 +123,17 @@ class EncodedContentFile(Base):
     start_time = time.time()
     data = atomizer.AtomizeString(preprocessed_cf.text)
     encoding_time_ms = int((time.time() - start_time) * 1000)
+    data_dtype = cls.GetDataDtype(atomizer.vocab_size)
     return EncodedContentFile(
       id=preprocessed_cf.id,
       # Encode the end-of-file marker separately to ensure that it resolves to
       # the correct token. For example if the vocabulary contains 'a', 'b',
       # and 'ab', then a content file 'a' with EOF marker 'b' would be encoded
       # as 'ab', instead of 'a'+'b'.
-      data=cls.NumpyArrayToDataString(
-        np.concatenate((data, atomizer.AtomizeString(eof)))
+      data=cls.NumpyArrayToData(
+        np.concatenate((data, atomizer.AtomizeString(eof))), data_dtype
       ),
+      data_dtype=data_dtype,
       tokencount=len(data),
       encoding_time_ms=encoding_time_ms,
       wall_time_ms=encoding_time_ms,  # The outer-loop may change this.
@@ -123,22 +141,209 @@ class EncodedContentFile(Base):
     )
 
 
+# The name of the encoded contentfiles table during migration.
+LEGACY_TABLE_NAME = "encoded_contentfiles_legacy"
+
+
+def IsLegacyDatabase(engine: sql.engine.Engine) -> bool:
+  """Return whether an encoded database stores tokens as strings.
+
+  Legacy databases must be migrated using
+  //deeplearning/clgen/corpuses:migrate_encoded_db before they can be used.
+  """
+  inspector = sql.inspect(engine)
+  table_names = inspector.get_table_names()
+  if LEGACY_TABLE_NAME in table_names:
+    # A partially migrated database.
+    return True
+  if EncodedContentFile.__tablename__ not in table_names:
+    return False
+  columns = inspector.get_columns(EncodedContentFile.__tablename__)
+  return "data_dtype" not in {column["name"] for column in columns}
+
+
+def IsInMemorySqliteUrl(url: str) -> bool:
+  """Return whether a database URL is for an in-memory SQLite database.
+
+  The contents of an in-memory database are private to the connection which
+  created it, so they cannot be read by other processes.
+  """
+  url = sql.engine.url.make_url(url)
+  return url.drivername.startswith("sqlite") and url.database in (
+    None,
+    "",
+    ":memory:",
+  )
+
+
+# The state of an encoder worker process, set by _InitEncoderWorker().
+_worker_preprocessed_db: typing.Optional[
+  preprocessed.PreprocessedContentFiles
+] = None
+_worker_atomizer: typing.Optional[atomizers.AtomizerBase] = None
+_worker_contentfile_separator: typing.Optional[str] = None
+
+
+def _InitEncoderWorker(
+  preprocessed_db_url: str,
+  atomizer: atomizers.AtomizerBase,
+  contentfile_separator: str,
+) -> None:
+  """Initialize an encoder worker process.
+
+  The atomizer is sent to each worker process once, rather than with every
+  job.
+  """
+  global _worker_preprocessed_db
+  global _worker_atomizer
+  global _worker_contentfile_separator
+  _worker_preprocessed_db = preprocessed.PreprocessedContentFiles(
+    preprocessed_db_url, must_exist=True
+  )
+  _worker_atomizer = atomizer
+  _worker_contentfile_separator = contentfile_separator
+
+
 def EncoderWorker(
-  job: internal_pb2.EncoderWorker,
-) -> typing.Optional[EncodedContentFile]:
-  """Encode a single content file."""
-  # TODO(cec): There is a bug in the atomizer creation logic such that the
-  # derived atomizer is not always capable of encoding the preprocessed files.
-  # Once this has been fixed, there is no need to catch the VocabError here,
-  # and EncoderWorker can always return an EncodedContentFile instance.
-  try:
-    return EncodedContentFile.FromPreprocessed(
-      preprocessed.PreprocessedContentFile(id=job.id, text=job.text),
-      pickle.loads(job.pickled_atomizer),
-      job.contentfile_separator,
+  ids: typing.List[int],
+) -> typing.List[typing.Dict[str, typing.Any]]:
+  """Encode a chunk of preprocessed content files.
+
+  Args:
+    ids: A sorted list of preprocessed content file IDs to encode.
+
+  Returns:
+    A list of encoded content file column values, for use in a bulk insert.
+  """
+  ids_to_encode = set(ids)
+  columns = EncodedContentFile.__table__.columns
+  rows = []
+  with _worker_preprocessed_db.Session() as session:
+    # Select the range of IDs, which is cheaper than a large IN clause.
+    query = session.query(
+      preprocessed.PreprocessedContentFile.id,
+      preprocessed.PreprocessedContentFile.text,
+    ).filter(
+      preprocessed.PreprocessedContentFile.id.between(ids[0], ids[-1]),
+      preprocessed.PreprocessedContentFile.preprocessing_succeeded == True,
+    )
+    for id, text in query:
+      if id not in ids_to_encode:
+        continue
+      # TODO(cec): There is a bug in the atomizer creation logic such that the
+      # derived atomizer is not always capable of encoding the preprocessed
+      # files. Once this has been fixed, there is no need to catch the
+      # VocabError here.
+      try:
+        encoded_cf = EncodedContentFile.FromPreprocessed(
+          preprocessed.PreprocessedContentFile(id=id, text=text),
+          _worker_atomizer,
+          _worker_contentfile_separator,
+        )
+      except errors.VocabError:
+        continue
+      rows.append(
+        {column.name: getattr(encoded_cf, column.name) for column in columns}
+      )
+  return rows
+
+
+class PackedEncodedCorpus(object):
+  """A packed encoded corpus which can be read without loading it into memory.
+
+  A packed corpus is the concatenation of the indices arrays of every encoded
+  contentfile, with an index of per-contentfile offsets into the tokens array.
+  When created from files, the tokens array is memory mapped, so that training
+  data is read from disk on demand, rather than requiring that the entire
+  corpus fit in memory.
+
+  The contentfiles are read in the order of a permutation of the offsets
+  index. Shuffling the corpus permutes this index, without copying any tokens.
+  """
+
+  def __init__(
+    self,
+    tokens: np.ndarray,
+    offsets: np.ndarray,
+    order: typing.Optional[np.ndarray] = None,
+  ):
+    """Constructor.
+
+    Args:
+      tokens: A 1D array of the concatenated vocabulary indices of every
+        contentfile.
+      offsets: A 1D array of num_contentfiles + 1 offsets into the tokens
+        array, where contentfile i is tokens[offsets[i]:offsets[i+1]].
+      order: The order to read contentfiles in. If not provided, contentfiles
+        are read in the order they appear in the tokens array.
+    """
+    self.tokens = tokens
+    self.offsets = offsets
+    if order is None:
+      order = np.arange(len(offsets) - 1)
+    self.order = order
+
+    lengths = np.diff(offsets)[order]
+    # The end position of each contentfile in the ordered corpus.
+    self._ends = np.cumsum(lengths)
+    # The value to add to a position in the ordered corpus to produce an index
+    # into the tokens array, for each contentfile in the ordered corpus.
+    self._shifts = offsets[:-1][order] - (self._ends - lengths)
+
+  @classmethod
+  def FromFiles(
+    cls, tokens_path: pathlib.Path, offsets_path: pathlib.Path
+  ) -> "PackedEncodedCorpus":
+    """Open a packed corpus written by EncodedContentFiles.ExportPacked()."""
+    offsets = np.load(offsets_path)
+    # A zero-length file cannot be memory mapped.
+    if offsets[-1]:
+      tokens = np.memmap(tokens_path, dtype=np.int32, mode="r")
+    else:
+      tokens = np.zeros(0, dtype=np.int32)
+    return cls(tokens, offsets)
+
+  @property
+  def contentfile_count(self) -> int:
+    """The number of contentfiles in the corpus."""
+    return len(self.order)
+
+  def __len__(self) -> int:
+    """Return the number of tokens in the corpus."""
+    return int(self._ends[-1]) if len(self._ends) else 0
+
+  def Shuffle(self) -> "PackedEncodedCorpus":
+    """Return a view of the corpus with the contentfiles in random order."""
+    return PackedEncodedCorpus(
+      self.tokens, self.offsets, np.random.permutation(self.contentfile_count)
+    )
+
+  def GetWindows(self, starts: np.ndarray, length: int) -> np.ndarray:
+    """Read windows of consecutive tokens from the ordered corpus.
+
+    Windows may span multiple contentfiles.
+
+    Args:
+      starts: A 1D array of the start positions of the windows.
+      length: The number of tokens in each window.
+
+    Returns:
+      A 2D array of shape (len(starts), length).
+
+    Raises:
+      IndexError: If a window extends beyond the end of the corpus.
+    """
+    positions = np.asarray(starts)[:, np.newaxis] + np.arange(length)
+    contentfiles = np.searchsorted(self._ends, positions, side="right")
+    return np.asarray(self.tokens[positions + self._shifts[contentfiles]])
+
+  def ToArray(self) -> np.ndarray:
+    """Concatenate the ordered corpus into an in-memory array."""
+    if not self.contentfile_count:
+      return np.zeros(0, dtype=self.tokens.dtype)
+    return np.concatenate(
+      [self.tokens[self.offsets[i] : self.offsets[i + 1]] for i in self.order]
     )
-  except errors.VocabError:
-    return None
 
 
 class EncodedContentFiles(sqlutil.Database):
@@ -146,6 +351,11 @@ class EncodedContentFiles(sqlutil.Database):
 
   def __init__(self, url: str, must_exist: bool = False):
     super(EncodedContentFiles, self).__init__(url, Base, must_exist=must_exist)
+    if IsLegacyDatabase(self.engine):
+      raise errors.UserError(
+        f"Encoded database '{url}' stores tokens as strings. Migrate it using "
+        "//deeplearning/clgen/corpuses:migrate_encoded_db"
+      )
 
   def Create(
     self,
@@ -209,6 +419,36 @@ class EncodedContentFiles(sqlutil.Database):
     with self.Session() as session:
       return session.query(func.sum(EncodedContentFile.tokencount)).scalar()
 
+  def ExportPacked(
+    self, tokens_path: pathlib.Path, offsets_path: pathlib.Path
+  ) -> None:
+    """Write the encoded contentfiles to a packed corpus.
+
+    Contentfiles are read one at a time, in order of ID, so that the corpus
+    does not need to fit in memory. The offsets index is written last, so that
+    a partially written packed corpus is never read.
+
+    Args:
+      tokens_path: The path of the concatenated int32 tokens file to write.
+      offsets_path: The path of the offsets index to write.
+    """
+    offsets = [0]
+    with self.Session() as session, open(tokens_path, "wb") as f:
+      query = (
+        session.query(EncodedContentFile.data, EncodedContentFile.data_dtype)
+        .order_by(EncodedContentFile.id)
+        .yield_per(1000)
+      )
+      for data, data_dtype in query:
+        indices = EncodedContentFile.DataToNumpyArray(data, data_dtype)
+        indices.tofile(f)
+        offsets.append(offsets[-1] + len(indices))
+
+    temp_path = offsets_path.parent / f"{offsets_path.name}.tmp"
+    with open(temp_path, "wb") as f:
+      np.save(f, np.array(offsets, dtype=np.int64))
+    os.replace(temp_path, offsets_path)
+
   def IsDone(self, session: sqlutil.Session):
     if session.query(Meta).filter(Meta.key == "done").first():
       return True
@@ -224,57 +464,98 @@ class EncodedContentFiles(sqlutil.Database):
     preprocessed_db: preprocessed.PreprocessedContentFiles,
     atomizer: atomizers.AtomizerBase,
     contentfile_separator: str,
+    chunk_size: int = 256,
   ) -> None:
-    with preprocessed_db.Session() as p_session:
-      query = p_session.query(preprocessed.PreprocessedContentFile).filter(
-        preprocessed.PreprocessedContentFile.preprocessing_succeeded == True,
-        ~preprocessed.PreprocessedContentFile.id.in_(
-          session.query(EncodedContentFile.id).all()
-        ),
+    """Encode the preprocessed content files which are not already encoded.
+
+    Content files are encoded in chunks of IDs by a pool of worker processes,
+    which read the texts directly from the preprocessed database. The encoded
+    chunks are bulk inserted. Since the workers open their own connections to
+    the preprocessed database, it cannot be an in-memory SQLite database.
+
+    Args:
+      session: A session for this database.
+      preprocessed_db: The database of preprocessed content files.
+      atomizer: The atomizer to encode using.
+      contentfile_separator: The contentfile separator.
+      chunk_size: The number of content files to encode in each job.
+
+    Raises:
+      EmptyCorpusException: If there are no content files to encode.
+      UserError: If the preprocessed database is an in-memory SQLite database.
+    """
+    if IsInMemorySqliteUrl(preprocessed_db.url):
+      raise errors.UserError(
+        "Cannot encode an in-memory preprocessed database: "
+        f"'{preprocessed_db.url}'"
       )
-      jobs = [
-        internal_pb2.EncoderWorker(
-          id=x.id,
-          text=x.text,
-          contentfile_separator=contentfile_separator,
-          pickled_atomizer=pickle.dumps(atomizer),
-        )
-        for x in query
-      ]
-      if not jobs:
-        raise errors.EmptyCorpusException(
-          "Pre-processed corpus contains no files: " f"'{preprocessed_db.url}'"
-        )
 
-      app.Log(
-        1,
-        "Encoding %s of %s preprocessed files",
-        humanize.Commas(query.count()),
-        humanize.Commas(
-          p_session.query(preprocessed.PreprocessedContentFile)
-          .filter(
-            preprocessed.PreprocessedContentFile.preprocessing_succeeded == True
+    with preprocessed_db.Session() as p_session:
+      preprocessed_ids = np.array(
+        [
+          row.id
+          for row in p_session.query(
+            preprocessed.PreprocessedContentFile.id
+          ).filter(
+            preprocessed.PreprocessedContentFile.preprocessing_succeeded
+            == True
           )
-          .count()
-        ),
+        ],
+        dtype=np.int64,
+      )
+    encoded_ids = np.array(
+      [row.id for row in session.query(EncodedContentFile.id)], dtype=np.int64
+    )
+    # The sorted IDs of the content files to encode.
+    ids_to_do = np.setdiff1d(preprocessed_ids, encoded_ids)
+    if not ids_to_do.size:
+      raise errors.EmptyCorpusException(
+        "Pre-processed corpus contains no files: " f"'{preprocessed_db.url}'"
       )
-      pool = multiprocessing.Pool()
-      bar = progressbar.ProgressBar(max_value=len(jobs))
+
+    app.Log(
+      1,
+      "Encoding %s of %s preprocessed files",
+      humanize.Commas(ids_to_do.size),
+      humanize.Commas(preprocessed_ids.size),
+    )
+    # Jobs are produced lazily, and contain only IDs.
+    jobs = (
+      ids_to_do[i : i + chunk_size].tolist()
+      for i in range(0, ids_to_do.size, chunk_size)
+    )
+    pool = multiprocessing.Pool(
+      initializer=_InitEncoderWorker,
+      initargs=(preprocessed_db.url, atomizer, contentfile_separator),
+    )
+    try:
+      bar = progressbar.ProgressBar(max_value=ids_to_do.size)
+      done_count = 0
       last_commit = time.time()
       wall_time_start = time.time()
-      for encoded_cf in bar(pool.imap_unordered(EncoderWorker, jobs)):
+      for rows in pool.imap_unordered(EncoderWorker, jobs):
         wall_time_end = time.time()
-        # TODO(cec): Remove the if check once EncoderWorker no longer returns
-        # None on atomizer encode error.
-        if encoded_cf:
-          encoded_cf.wall_time_ms = int(
-            (wall_time_end - wall_time_start) * 1000
+        # Attribute the wall time of the chunk evenly across its files.
+        for row in rows:
+          row["wall_time_ms"] = int(
+            (wall_time_end - wall_time_start) * 1000 / len(rows)
           )
-          session.add(encoded_cf)
         wall_time_start = wall_time_end
+        session.bulk_insert_mappings(EncodedContentFile, rows)
+        done_count += min(chunk_size, ids_to_do.size - done_count)
+        bar.update(done_count)
         if wall_time_end - last_commit > 10:
           session.commit()
           last_commit = wall_time_end
+      bar.finish()
+    except:
+      # Discard the outstanding jobs, rather than waiting for them to finish.
+      pool.terminate()
+      raise
+    else:
+      pool.close()
+    finally:
+      pool.join()
 
   @staticmethod
   def GetVocabFromMetaTable(session) -> typing.Dict[str, int]:
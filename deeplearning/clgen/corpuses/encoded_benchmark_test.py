@@ -0,0 +1,160 @@
+# Copyright (c) 2016, 2017, 2018, 2019 Chris Cummins.
+#
+# clgen is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# clgen is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with clgen.  If not, see <https://www.gnu.org/licenses/>.
+"""Benchmarks for //deeplearning/clgen/corpuses:encoded.
+
+The benchmarks load the indices arrays of a synthetic encoded corpus, comparing
+binary token storage against the legacy period-separated string storage.
+"""
+import datetime
+import tempfile
+import typing
+
+import numpy as np
+import sqlalchemy as sql
+
+from deeplearning.clgen.corpuses import encoded
+from labm8.py import sqlutil
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+MODULE_UNDER_TEST = None
+
+# The number of contentfiles in the synthetic corpus.
+CONTENTFILE_COUNT = 1000
+# The vocabulary size of the synthetic corpus.
+VOCAB_SIZE = 200
+
+
+def LoadLegacyIndicesArrays(
+  engine: sql.engine.Engine,
+) -> typing.List[np.ndarray]:
+  """Load the indices arrays of a database of legacy string storage, used as a
+  baseline for comparison.
+  """
+  with engine.begin() as connection:
+    query = connection.execute(
+      "SELECT data FROM encoded_contentfiles ORDER BY id"
+    )
+    return [
+      encoded.EncodedContentFile.DataStringToNumpyArray(data)
+      for (data,) in query
+    ]
+
+
+def LoadIndicesArrays(
+  db: encoded.EncodedContentFiles,
+) -> typing.List[np.ndarray]:
+  """Load the indices arrays of an encoded database."""
+  with db.Session() as session:
+    query = session.query(encoded.EncodedContentFile).order_by(
+      encoded.EncodedContentFile.id
+    )
+    return [cf.indices_array for cf in query]
+
+
+@test.Fixture(scope="session")
+def indices_arrays() -> typing.List[np.ndarray]:
+  """Test fixture which returns the indices arrays of a synthetic corpus."""
+  rng = np.random.RandomState(0)
+  return [
+    rng.randint(0, VOCAB_SIZE, size=rng.randint(100, 5000), dtype=np.int32)
+    for _ in range(CONTENTFILE_COUNT)
+  ]
+
+
+@test.Fixture(scope="session")
+def encoded_db(
+  indices_arrays: typing.List[np.ndarray],
+) -> encoded.EncodedContentFiles:
+  """Test fixture which returns an encoded database of the synthetic corpus."""
+  data_dtype = encoded.EncodedContentFile.GetDataDtype(VOCAB_SIZE)
+  with tempfile.TemporaryDirectory() as d:
+    db = encoded.EncodedContentFiles(f"sqlite:///{d}/encoded.db")
+    with db.Session(commit=True) as session:
+      session.add_all(
+        [
+          encoded.EncodedContentFile(
+            id=i,
+            data=encoded.EncodedContentFile.NumpyArrayToData(
+              indices, data_dtype
+            ),
+            data_dtype=data_dtype,
+            tokencount=len(indices),
+            encoding_time_ms=0,
+            wall_time_ms=0,
+            date_added=datetime.datetime.utcnow(),
+          )
+          for i, indices in enumerate(indices_arrays)
+        ]
+      )
+    yield db
+
+
+@test.Fixture(scope="session")
+def legacy_db_engine(
+  indices_arrays: typing.List[np.ndarray],
+) -> sql.engine.Engine:
+  """Test fixture which returns a legacy string storage database of the
+  synthetic corpus.
+  """
+  with tempfile.TemporaryDirectory() as d:
+    engine = sqlutil.CreateEngine(f"sqlite:///{d}/legacy.db")
+    with engine.begin() as connection:
+      connection.execute(
+        "CREATE TABLE encoded_contentfiles "
+        "(id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+      )
+      connection.execute(
+        "INSERT INTO encoded_contentfiles (id, data) VALUES (?, ?)",
+        [
+          (i, ".".join(str(x) for x in indices))
+          for i, indices in enumerate(indices_arrays)
+        ],
+      )
+    yield engine
+
+
+def test_LoadIndicesArrays_equals_reference(
+  encoded_db: encoded.EncodedContentFiles,
+  legacy_db_engine: sql.engine.Engine,
+  indices_arrays: typing.List[np.ndarray],
+):
+  """Check that binary and legacy storage load the same indices arrays."""
+  binary = LoadIndicesArrays(encoded_db)
+  legacy = LoadLegacyIndicesArrays(legacy_db_engine)
+  assert len(binary) == len(legacy) == len(indices_arrays)
+  for a, b, c in zip(binary, legacy, indices_arrays):
+    np.testing.assert_array_equal(a, c)
+    np.testing.assert_array_equal(b, c)
+    assert a.dtype == b.dtype
+
+
+def test_benchmark_LoadIndicesArrays(
+  benchmark, encoded_db: encoded.EncodedContentFiles
+):
+  """Benchmark loading the corpus from binary storage."""
+  benchmark(LoadIndicesArrays, encoded_db)
+
+
+def test_benchmark_LoadLegacyIndicesArrays(
+  benchmark, legacy_db_engine: sql.engine.Engine
+):
+  """Benchmark loading the corpus from legacy string storage."""
+  benchmark(LoadLegacyIndicesArrays, legacy_db_engine)
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -103,6 +103,63 @@ def test_EncodedContentFile_FromPreprocessed_date_added(
   assert enc.date_added
 
 
+def test_EncodedContentFile_FromPreprocessed_data_dtype(
+  abc_atomizer, abc_preprocessed
+):
+  """Test that small vocabularies are stored as 16-bit integers."""
+  enc = encoded.EncodedContentFile.FromPreprocessed(
+    abc_preprocessed, abc_atomizer, eof="a"
+  )
+  assert enc.data_dtype == "<u2"
+  assert len(enc.data) == 2 * 11
+  assert enc.indices_array.dtype == np.int32
+
+
+@test.Parametrize(
+  "vocab_size,data_dtype",
+  [(10, "<u2"), (2 ** 16, "<u2"), (2 ** 16 + 1, "<i4")],
+)
+def test_EncodedContentFile_GetDataDtype(vocab_size: int, data_dtype: str):
+  """Test the dtype used to store vocabulary indices."""
+  assert encoded.EncodedContentFile.GetDataDtype(vocab_size) == data_dtype
+
+
+@test.Parametrize("data_dtype", ["<u2", "<i4"])
+def test_EncodedContentFile_data_round_trip(data_dtype: str):
+  """Test that indices arrays are unchanged by conversion to bytes."""
+  array = np.array([0, 5, 65535, 3], dtype=np.int32)
+  data = encoded.EncodedContentFile.NumpyArrayToData(array, data_dtype)
+  np.testing.assert_array_equal(
+    encoded.EncodedContentFile.DataToNumpyArray(data, data_dtype), array
+  )
+
+
+
+@test.Parametrize(
+  "data_dtype,data",
+  [
+    ("<u2", b"\x01\x00\x02\x01"),
+    ("<i4", b"\x01\x00\x00\x00\x02\x01\x00\x00"),
+  ],
+)
+def test_EncodedContentFile_NumpyArrayToData_bytes(
+  data_dtype: str, data: bytes
+):
+  """Test the little-endian byte layout of stored indices."""
+  array = np.array([1, 258], dtype=np.int32)
+  assert encoded.EncodedContentFile.NumpyArrayToData(array, data_dtype) == data
+  np.testing.assert_array_equal(
+    encoded.EncodedContentFile.DataToNumpyArray(data, data_dtype), array
+  )
+
+
+def test_EncodedContentFile_DataStringToNumpyArray():
+  """Test conversion of a legacy period-separated indices string."""
+  array = encoded.EncodedContentFile.DataStringToNumpyArray("0.1.2.0.70000")
+  assert array.dtype == np.int32
+  assert array.tolist() == [0, 1, 2, 0, 70000]
+
+
 # EncodedContentFiles tests.
 
 
@@ -164,5 +221,231 @@ def test_EncodedContentFiles_empty_preprocessed_db(
       temp_db.Create(p, abc_atomizer, "\n\n")
 
 
+@test.Fixture(scope="function")
+def abc_preprocessed_db() -> preprocessed.PreprocessedContentFiles:
+  """A test fixture which returns a preprocessed db of five content files.
+
+  File 3 failed preprocessing, and file 4 cannot be encoded by abc_atomizer.
+  """
+  with tempfile.TemporaryDirectory() as d:
+    p = preprocessed.PreprocessedContentFiles(
+      f"sqlite:///{pathlib.Path(d)}/preprocessed.db"
+    )
+    with p.Session(commit=True) as session:
+      session.add_all(
+        [
+          preprocessed.PreprocessedContentFile(
+            id=i,
+            input_relpath=f"{i}.txt",
+            input_sha256="000",
+            input_charcount=len(text),
+            input_linecount=1,
+            sha256="000",
+            charcount=len(text),
+            linecount=1,
+            text=text,
+            preprocessing_succeeded=i != 3,
+            preprocess_time_ms=0,
+            wall_time_ms=0,
+          )
+          for i, text in enumerate(["a", "ab", "abc", "!!", "abcde"], start=1)
+        ]
+      )
+    yield p
+
+
+@test.Parametrize("chunk_size", [1, 2, 256])
+def test_EncodedContentFiles_Import(
+  temp_db: encoded.EncodedContentFiles,
+  abc_atomizer: atomizers.AsciiCharacterAtomizer,
+  abc_preprocessed_db: preprocessed.PreprocessedContentFiles,
+  chunk_size: int,
+):
+  """Test that the encodable preprocessed files are encoded."""
+  with temp_db.Session(commit=True) as session:
+    temp_db.Import(
+      session, abc_preprocessed_db, abc_atomizer, "a", chunk_size=chunk_size
+    )
+  with temp_db.Session() as session:
+    cfs = session.query(encoded.EncodedContentFile).order_by(
+      encoded.EncodedContentFile.id
+    )
+    assert [cf.id for cf in cfs] == [1, 2, 5]
+    assert [cf.tokencount for cf in cfs] == [1, 2, 5]
+    np.testing.assert_array_equal(cfs[1].indices_array, [0, 1, 0])
+  assert temp_db.token_count == 8
+
+
+def test_EncodedContentFiles_Import_resumes(
+  temp_db: encoded.EncodedContentFiles,
+  abc_atomizer: atomizers.AsciiCharacterAtomizer,
+  abc_preprocessed_db: preprocessed.PreprocessedContentFiles,
+):
+  """Test that only the files which are not already encoded are encoded."""
+  with temp_db.Session(commit=True) as session:
+    session.add(
+      encoded.EncodedContentFile.FromPreprocessed(
+        preprocessed.PreprocessedContentFile(id=2, text="e"), abc_atomizer, "a"
+      )
+    )
+  with temp_db.Session(commit=True) as session:
+    temp_db.Import(session, abc_preprocessed_db, abc_atomizer, "a")
+  with temp_db.Session() as session:
+    cfs = session.query(encoded.EncodedContentFile).order_by(
+      encoded.EncodedContentFile.id
+    )
+    assert [cf.id for cf in cfs] == [1, 2, 5]
+    np.testing.assert_array_equal(cfs[1].indices_array, [4, 0])
+
+
+class FailingAtomizer(atomizers.AsciiCharacterAtomizer):
+  """An atomizer which fails to encode anything."""
+
+  def AtomizeString(self, text: str) -> np.ndarray:
+    raise OSError("atomizer failed")
+
+
+def test_EncodedContentFiles_Import_worker_error(
+  temp_db: encoded.EncodedContentFiles,
+  abc_preprocessed_db: preprocessed.PreprocessedContentFiles,
+):
+  """Test that an error in an encoder worker is raised, and nothing stored."""
+  atomizer = FailingAtomizer({"a": 0})
+  with test.Raises(OSError):
+    with temp_db.Session() as session:
+      temp_db.Import(session, abc_preprocessed_db, atomizer, "a", chunk_size=1)
+  with temp_db.Session() as session:
+    assert not session.query(encoded.EncodedContentFile).count()
+
+
+def test_EncodedContentFiles_Import_in_memory_preprocessed_db(
+  temp_db: encoded.EncodedContentFiles,
+  abc_atomizer: atomizers.AsciiCharacterAtomizer,
+):
+  """Test that an in-memory preprocessed database is rejected."""
+  p = preprocessed.PreprocessedContentFiles("sqlite://")
+  with test.Raises(errors.UserError):
+    with temp_db.Session() as session:
+      temp_db.Import(session, p, abc_atomizer, "a")
+
+
+@test.Parametrize(
+  "url,in_memory",
+  [
+    ("sqlite://", True),
+    ("sqlite:///:memory:", True),
+    ("sqlite:////tmp/preprocessed.db", False),
+    ("mysql://user@localhost/preprocessed", False),
+  ],
+)
+def test_IsInMemorySqliteUrl(url: str, in_memory: bool):
+  """Test in-memory SQLite database URL detection."""
+  assert encoded.IsInMemorySqliteUrl(url) == in_memory
+
+
+# PackedEncodedCorpus tests.
+
+
+@test.Fixture(scope="function")
+def packed_corpus() -> encoded.PackedEncodedCorpus:
+  """A test fixture which returns a packed corpus of three contentfiles."""
+  return encoded.PackedEncodedCorpus(
+    np.array([0, 1, 2, 3, 4, 5, 6, 7, 8], dtype=np.int32),
+    np.array([0, 2, 7, 9], dtype=np.int64),
+  )
+
+
+def test_PackedEncodedCorpus_len(packed_corpus: encoded.PackedEncodedCorpus):
+  """Test the number of tokens and contentfiles in a packed corpus."""
+  assert len(packed_corpus) == 9
+  assert packed_corpus.contentfile_count == 3
+
+
+def test_PackedEncodedCorpus_ToArray_order(
+  packed_corpus: encoded.PackedEncodedCorpus,
+):
+  """Test that contentfiles are concatenated in the given order."""
+  reordered = encoded.PackedEncodedCorpus(
+    packed_corpus.tokens, packed_corpus.offsets, np.array([2, 0, 1])
+  )
+  assert reordered.ToArray().tolist() == [7, 8, 0, 1, 2, 3, 4, 5, 6]
+  assert packed_corpus.ToArray().tolist() == list(range(9))
+
+
+def test_PackedEncodedCorpus_GetWindows_spans_contentfiles(
+  packed_corpus: encoded.PackedEncodedCorpus,
+):
+  """Test that windows are read across contentfile boundaries."""
+  reordered = encoded.PackedEncodedCorpus(
+    packed_corpus.tokens, packed_corpus.offsets, np.array([2, 0, 1])
+  )
+  np.testing.assert_array_equal(
+    reordered.GetWindows(np.array([0, 1, 5]), 4),
+    np.array([[7, 8, 0, 1], [8, 0, 1, 2], [3, 4, 5, 6]]),
+  )
+
+
+def test_PackedEncodedCorpus_GetWindows_out_of_range(
+  packed_corpus: encoded.PackedEncodedCorpus,
+):
+  """Test that an error is raised for a window past the end of the corpus."""
+  with test.Raises(IndexError):
+    packed_corpus.GetWindows(np.array([6]), 4)
+
+
+def test_PackedEncodedCorpus_Shuffle(
+  packed_corpus: encoded.PackedEncodedCorpus,
+):
+  """Test that shuffling permutes contentfiles without copying tokens."""
+  shuffled = packed_corpus.Shuffle()
+  assert shuffled.tokens is packed_corpus.tokens
+  assert sorted(shuffled.order.tolist()) == [0, 1, 2]
+  assert sorted(shuffled.ToArray().tolist()) == list(range(9))
+
+
+def test_EncodedContentFiles_ExportPacked(
+  temp_db: encoded.EncodedContentFiles,
+  abc_preprocessed: preprocessed.PreprocessedContentFile,
+  abc_atomizer: atomizers.AsciiCharacterAtomizer,
+):
+  """Test that a packed corpus contains the encoded contentfiles."""
+  enc1 = encoded.EncodedContentFile.FromPreprocessed(
+    abc_preprocessed, abc_atomizer, "a"
+  )
+  abc_preprocessed.id -= 1
+  abc_preprocessed.text = "edcba"
+  enc2 = encoded.EncodedContentFile.FromPreprocessed(
+    abc_preprocessed, abc_atomizer, "a"
+  )
+  with temp_db.Session(commit=True) as session:
+    session.add_all([enc1, enc2])
+
+  with tempfile.TemporaryDirectory() as d:
+    tokens_path = pathlib.Path(d) / "tokens.int32"
+    offsets_path = pathlib.Path(d) / "offsets.npy"
+    temp_db.ExportPacked(tokens_path, offsets_path)
+    packed = encoded.PackedEncodedCorpus.FromFiles(tokens_path, offsets_path)
+
+    assert isinstance(packed.tokens, np.memmap)
+    # Contentfiles are packed in order of ID.
+    assert packed.offsets.tolist() == [0, 6, 17]
+    assert packed.ToArray().tolist() == (
+      [4, 3, 2, 1, 0, 0] + [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 0]
+    )
+
+
+def test_EncodedContentFiles_ExportPacked_empty(
+  temp_db: encoded.EncodedContentFiles,
+):
+  """Test that an empty database produces an empty packed corpus."""
+  with tempfile.TemporaryDirectory() as d:
+    tokens_path = pathlib.Path(d) / "tokens.int32"
+    offsets_path = pathlib.Path(d) / "offsets.npy"
+    temp_db.ExportPacked(tokens_path, offsets_path)
+    packed = encoded.PackedEncodedCorpus.FromFiles(tokens_path, offsets_path)
+    assert len(packed) == 0
+    assert packed.ToArray().tolist() == []
+
+
 if __name__ == "__main__":
   test.Main()
@@ -0,0 +1,145 @@
+# Copyright (c) 2016, 2017, 2018, 2019 Chris Cummins.
+#
+# clgen is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# clgen is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with clgen.  If not, see <https://www.gnu.org/licenses/>.
+"""Migrate an encoded contentfiles database to binary token storage.
+
+Encoded contentfiles used to store their vocabulary indices as a string of
+period-separated integers, e.g. '0.1.2.0.1'. This script converts every encoded
+contentfile in a database to the binary representation, which is much faster
+to load.
+
+The migration is performed in batches of contentfiles, and may be resumed if
+interrupted.
+
+Usage:
+
+  bazel run //deeplearning/clgen/corpuses:migrate_encoded_db -- \
+      --encoded_db='sqlite:////path/to/encoded.db'
+"""
+import typing
+
+import sqlalchemy as sql
+
+from deeplearning.clgen.corpuses import encoded
+from labm8.py import app
+from labm8.py import humanize
+from labm8.py import sqlutil
+
+FLAGS = app.FLAGS
+
+app.DEFINE_string(
+  "encoded_db", None, "The URL of the encoded database to migrate."
+)
+app.DEFINE_integer(
+  "migrate_batch_size",
+  1000,
+  "The number of encoded contentfiles to migrate in a single transaction.",
+)
+
+
+def MigrateRow(row) -> typing.Dict[str, typing.Any]:
+  """Convert a row of the legacy table to a row of the binary table.
+
+  The legacy table does not record the vocabulary size, so the dtype of each
+  contentfile is determined by its largest vocabulary index.
+  """
+  indices = encoded.EncodedContentFile.DataStringToNumpyArray(row.data)
+  data_dtype = encoded.EncodedContentFile.GetDataDtype(int(indices.max()) + 1)
+  return {
+    "id": row.id,
+    "data": encoded.EncodedContentFile.NumpyArrayToData(indices, data_dtype),
+    "data_dtype": data_dtype,
+    "tokencount": row.tokencount,
+    "encoding_time_ms": row.encoding_time_ms,
+    "wall_time_ms": row.wall_time_ms,
+    "date_added": row.date_added,
+  }
+
+
+def MigrateEncodedContentFiles(
+  engine: sql.engine.Engine, batch_size: int = 1000
+) -> int:
+  """Migrate the encoded contentfiles of a database to binary storage.
+
+  The legacy table is renamed, and its rows are copied in batches to a new
+  table. Once every row has been copied, the legacy table is dropped.
+
+  Args:
+    engine: The engine of the encoded database.
+    batch_size: The number of contentfiles to migrate per transaction.
+
+  Returns:
+    The number of contentfiles migrated.
+  """
+  if not encoded.IsLegacyDatabase(engine):
+    return 0
+
+  table = encoded.EncodedContentFile.__table__
+  if encoded.LEGACY_TABLE_NAME not in sql.inspect(engine).get_table_names():
+    with engine.begin() as connection:
+      connection.execute(
+        f"ALTER TABLE {table.name} RENAME TO {encoded.LEGACY_TABLE_NAME}"
+      )
+  table.create(engine, checkfirst=True)
+  legacy_table = sql.Table(
+    encoded.LEGACY_TABLE_NAME,
+    sql.MetaData(),
+    autoload=True,
+    autoload_with=engine,
+  )
+
+  # Resume from the last migrated row of a partially migrated database.
+  with engine.begin() as connection:
+    last_id = connection.execute(
+      sql.select([sql.func.max(table.c.id)])
+    ).scalar()
+
+  migrated_count = 0
+  while True:
+    query = sql.select([legacy_table]).order_by(legacy_table.c.id)
+    if last_id is not None:
+      query = query.where(legacy_table.c.id > last_id)
+    with engine.begin() as connection:
+      rows = connection.execute(query.limit(batch_size)).fetchall()
+      if not rows:
+        break
+      connection.execute(table.insert(), [MigrateRow(row) for row in rows])
+    last_id = rows[-1].id
+    migrated_count += len(rows)
+    app.Log(
+      1, "Migrated %s encoded contentfiles", humanize.Commas(migrated_count)
+    )
+
+  legacy_table.drop(engine)
+  return migrated_count
+
+
+def main():
+  """Main entry point."""
+  if not FLAGS.encoded_db:
+    raise app.UsageError("--encoded_db must be set")
+  engine = sqlutil.CreateEngine(FLAGS.encoded_db, must_exist=True)
+  migrated_count = MigrateEncodedContentFiles(
+    engine, batch_size=FLAGS.migrate_batch_size
+  )
+  app.Log(
+    1,
+    "Migrated %s encoded contentfiles of %s",
+    humanize.Commas(migrated_count),
+    FLAGS.encoded_db,
+  )
+
+
+if __name__ == "__main__":
+  app.Run(main)
@@ -0,0 +1,140 @@
+# Copyright (c) 2016, 2017, 2018, 2019 Chris Cummins.
+#
+# clgen is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# clgen is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with clgen.  If not, see <https://www.gnu.org/licenses/>.
+"""Unit tests for //deeplearning/clgen/corpuses:migrate_encoded_db."""
+import datetime
+import tempfile
+
+import sqlalchemy as sql
+
+from deeplearning.clgen import errors
+from deeplearning.clgen.corpuses import encoded
+from deeplearning.clgen.corpuses import migrate_encoded_db
+from labm8.py import app
+from labm8.py import sqlutil
+from labm8.py import test
+
+FLAGS = app.FLAGS
+
+
+def CreateLegacyDatabase(url: str, data: list) -> None:
+  """Create an encoded database which stores tokens as strings."""
+  engine = sqlutil.CreateEngine(url)
+  metadata = sql.MetaData()
+  table = sql.Table(
+    "encoded_contentfiles",
+    metadata,
+    sql.Column("id", sql.Integer, primary_key=True),
+    sql.Column("data", sql.UnicodeText(), nullable=False),
+    sql.Column("tokencount", sql.Integer, nullable=False),
+    sql.Column("encoding_time_ms", sql.Integer, nullable=False),
+    sql.Column("wall_time_ms", sql.Integer, nullable=False),
+    sql.Column("date_added", sql.DateTime, nullable=False),
+  )
+  metadata.create_all(engine)
+  with engine.begin() as connection:
+    connection.execute(
+      table.insert(),
+      [
+        {
+          "id": i,
+          "data": d,
+          "tokencount": d.count("."),
+          "encoding_time_ms": 10,
+          "wall_time_ms": 5,
+          "date_added": datetime.datetime.utcnow(),
+        }
+        for i, d in enumerate(data)
+      ],
+    )
+
+
+@test.Fixture(scope="function")
+def legacy_db_url() -> str:
+  """A test fixture which returns the URL of a legacy encoded database."""
+  with tempfile.TemporaryDirectory() as d:
+    url = f"sqlite:///{d}/encoded.db"
+    CreateLegacyDatabase(url, ["0.1.2.0.1", "2.2.2", "70000.1"])
+    yield url
+
+
+def test_EncodedContentFiles_legacy_database(legacy_db_url: str):
+  """Test that an error is raised for a database which is not migrated."""
+  with test.Raises(errors.UserError):
+    encoded.EncodedContentFiles(legacy_db_url)
+
+
+@test.Parametrize("batch_size", [1, 1000])
+def test_MigrateEncodedContentFiles(legacy_db_url: str, batch_size: int):
+  """Test that migrated contentfiles have the same indices arrays."""
+  engine = sqlutil.CreateEngine(legacy_db_url)
+  assert (
+    migrate_encoded_db.MigrateEncodedContentFiles(engine, batch_size=batch_size)
+    == 3
+  )
+
+  db = encoded.EncodedContentFiles(legacy_db_url)
+  with db.Session() as session:
+    contentfiles = session.query(encoded.EncodedContentFile).order_by(
+      encoded.EncodedContentFile.id
+    )
+    assert [cf.indices_array.tolist() for cf in contentfiles] == [
+      [0, 1, 2, 0, 1],
+      [2, 2, 2],
+      [70000, 1],
+    ]
+    assert [cf.data_dtype for cf in contentfiles] == ["<u2", "<u2", "<i4"]
+    assert [cf.wall_time_ms for cf in contentfiles] == [5, 5, 5]
+  assert db.token_count == 7
+
+
+def test_MigrateEncodedContentFiles_resume(legacy_db_url: str):
+  """Test that a partially migrated database can be resumed."""
+  engine = sqlutil.CreateEngine(legacy_db_url)
+  with engine.begin() as connection:
+    connection.execute(
+      f"ALTER TABLE encoded_contentfiles RENAME TO {encoded.LEGACY_TABLE_NAME}"
+    )
+  encoded.EncodedContentFile.__table__.create(engine)
+  legacy_table = sql.Table(
+    encoded.LEGACY_TABLE_NAME,
+    sql.MetaData(),
+    autoload=True,
+    autoload_with=engine,
+  )
+  with engine.begin() as connection:
+    rows = connection.execute(
+      sql.select([legacy_table]).where(legacy_table.c.id == 0)
+    )
+    connection.execute(
+      encoded.EncodedContentFile.__table__.insert(),
+      [migrate_encoded_db.MigrateRow(row) for row in rows],
+    )
+  assert encoded.IsLegacyDatabase(engine)
+
+  assert migrate_encoded_db.MigrateEncodedContentFiles(engine) == 2
+  assert not encoded.IsLegacyDatabase(engine)
+  with encoded.EncodedContentFiles(legacy_db_url).Session() as session:
+    assert session.query(encoded.EncodedContentFile).count() == 3
+
+
+def test_MigrateEncodedContentFiles_already_migrated():
+  """Test that migrating a binary database is a no-op."""
+  with tempfile.TemporaryDirectory() as d:
+    db = encoded.EncodedContentFiles(f"sqlite:///{d}/encoded.db")
+    assert migrate_encoded_db.MigrateEncodedContentFiles(db.engine) == 0
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -75,24 +75,33 @@ def BatchGenerator(
   Returns:
     A generator suitable for use by a model's fit_generator() method.
   """
-  x, y, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+  corpus_data, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+  batch_size = training_opts.batch_size
+  sequence_length = training_opts.sequence_length
 
   # Per-epoch outer loop.
   epoch_num = 0
   while True:
     # Re-shuffle corpus if needed.
     if epoch_num and training_opts.shuffle_corpus_contentfiles_between_epochs:
-      x, y, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+      corpus_data, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
 
-    # Roll so that we don't need to reset model states over epochs.
-    x_epoch = np.split(np.roll(x, -epoch_num, axis=0), steps_per_epoch, axis=1)
-    y_epoch = np.split(np.roll(y, -epoch_num, axis=0), steps_per_epoch, axis=1)
+    # The corpus is split into batch_size rows, and each batch is the next
+    # sequence_length columns of the rows. Roll the rows so that we don't need
+    # to reset model states over epochs.
+    row_starts = np.roll(
+      np.arange(batch_size) * steps_per_epoch * sequence_length, -epoch_num
+    )
     # Per-batch inner loop.
     for batch_num in range(steps_per_epoch):
+      # Read one extra token per row for the y vectors.
+      windows = corpus_data.GetWindows(
+        row_starts + batch_num * sequence_length, sequence_length + 1
+      )
       batch = DataBatch(
-        X=x_epoch[batch_num],
+        X=windows[:, :-1],
         # Lazy one-hot encoding.
-        y=OneHotEncode(y_epoch[batch_num], corpus.vocab_size),
+        y=OneHotEncode(windows[:, 1:], corpus.vocab_size),
       )
       if not batch_num and not epoch_num:
         LogBatchTelemetry(batch, steps_per_epoch, training_opts.num_epochs)
@@ -110,14 +119,18 @@ class TensorflowBatchGenerator(object):
     # Lazily instantiated.
     self.encoded_corpus = None
     self.num_batches = 0
-    self.batches = None
     self.CreateBatches()
 
     LogBatchTelemetry(
-      self.batches[0], self.num_batches, self.training_opts.num_epochs
+      self.GetBatch(0), self.num_batches, self.training_opts.num_epochs
     )
 
   def CreateBatches(self) -> None:
+    """Prepare the batches for an epoch.
+
+    Batches are read from the packed corpus on demand by NextBatch(), so this
+    does not copy the encoded corpus.
+    """
     start_time = time.time()
 
     # generate a kernel corpus
@@ -126,7 +139,7 @@ class TensorflowBatchGenerator(object):
       self.encoded_corpus is None
       or self.training_opts.shuffle_corpus_contentfiles_between_epochs
     ):
-      self.encoded_corpus = self.corpus.GetTrainingData(
+      self.encoded_corpus = self.corpus.GetPackedTrainingData(
         shuffle=self.training_opts.shuffle_corpus_contentfiles_between_epochs
       )
 
@@ -142,37 +155,53 @@ class TensorflowBatchGenerator(object):
         "Not enough data. Use a smaller sequence_length and batch_size"
       )
 
-    # split into batches
-    clipped_corpus_length = self.num_batches * batch_size * sequence_length
-    clipped_corpus = self.encoded_corpus[:clipped_corpus_length]
-    xdata = clipped_corpus
-    ydata = np.copy(clipped_corpus)
-
-    # Wrap-around.
-    ydata[:-1] = xdata[1:]
-    ydata[-1] = xdata[0]
-    self.batches = [
-      DataBatch(x, y)
-      for x, y in zip(
-        np.split(xdata.reshape(batch_size, -1), self.num_batches, 1),
-        np.split(ydata.reshape(batch_size, -1), self.num_batches, 1),
-      )
-    ]
+    # The clipped corpus is split into batch_size rows, and each batch is the
+    # next sequence_length columns of the rows.
+    self.clipped_corpus_length = (
+      self.num_batches * batch_size * sequence_length
+    )
+    self.row_starts = np.arange(batch_size) * (
+      self.num_batches * sequence_length
+    )
     app.Log(
       1,
       "Encoded corpus of %s tokens (clipped last %s tokens) in %s ms.",
-      humanize.Commas(clipped_corpus_length),
-      humanize.Commas(len(self.encoded_corpus) - clipped_corpus_length),
+      humanize.Commas(self.clipped_corpus_length),
+      humanize.Commas(len(self.encoded_corpus) - self.clipped_corpus_length),
       humanize.Commas(int((time.time() - start_time) * 1000)),
     )
 
+  def GetBatch(self, batch_num: int) -> DataBatch:
+    """Read a batch from the encoded corpus.
+
+    Args:
+      batch_num: The index of the batch in the epoch.
+
+    Returns:
+      X, Y DataBatch.
+    """
+    sequence_length = self.training_opts.sequence_length
+    x = self.encoded_corpus.GetWindows(
+      self.row_starts + batch_num * sequence_length, sequence_length
+    )
+    y = np.empty_like(x)
+    y[:, :-1] = x[:, 1:]
+    # The last token of each row is followed by the first token of the next
+    # row, wrapping around to the start of the clipped corpus.
+    y[:, -1] = self.encoded_corpus.GetWindows(
+      (self.row_starts + (batch_num + 1) * sequence_length)
+      % self.clipped_corpus_length,
+      1,
+    )[:, 0]
+    return DataBatch(x, y)
+
   def NextBatch(self) -> DataBatch:
     """Fetch next batch.
 
     Returns:
       X, Y DataBatch.
     """
-    batch = self.batches[self.i]
+    batch = self.GetBatch(self.i)
     self.i += 1
     assert 0 <= self.i <= self.num_batches
     return batch
@@ -180,7 +209,7 @@ class TensorflowBatchGenerator(object):
 
 def GetTrainingCorpus(
   corpus: "corpuses.Corpus", training_opts: model_pb2.TrainingOptions
-) -> typing.Tuple[np.ndarray, np.ndarray, int]:
+) -> typing.Tuple["encoded.PackedEncodedCorpus", int]:
   """Get the corpus to train over.
 
   Args:
@@ -188,14 +217,15 @@ def GetTrainingCorpus(
     training_opts: A TrainingOptions proto.
 
   Returns:
-    An X, y pair of data for an epoch, and the number of steps in the epoch.
+    The packed encoded corpus for an epoch, and the number of steps in the
+    epoch.
 
   Raises:
     UserError: If batch_size and sequence_length are too large for the corpus,
       yielding no batches.
   """
   start_time = time.time()
-  encoded_corpus = corpus.GetTrainingData(
+  encoded_corpus = corpus.GetPackedTrainingData(
     shuffle=training_opts.shuffle_corpus_contentfiles_between_epochs
   )
   corpus_length = len(encoded_corpus)
@@ -213,15 +243,6 @@ def GetTrainingCorpus(
     steps_per_epoch * training_opts.batch_size * training_opts.sequence_length
   )
 
-  x = np.reshape(
-    encoded_corpus[:clipped_corpus_length],
-    [training_opts.batch_size, steps_per_epoch * training_opts.sequence_length],
-  )
-  y = np.reshape(
-    encoded_corpus[1 : clipped_corpus_length + 1],
-    [training_opts.batch_size, steps_per_epoch * training_opts.sequence_length],
-  )
-
   app.Log(
     1,
     "Encoded corpus of %s tokens (clipped last %s tokens) in %s ms.",
@@ -229,7 +250,7 @@ def GetTrainingCorpus(
     humanize.Commas(corpus_length - clipped_corpus_length),
     humanize.Commas(int((time.time() - start_time) * 1000)),
   )
-  return x, y, steps_per_epoch
+  return encoded_corpus, steps_per_epoch
 
 
 def OneHotEncode(indices: np.ndarray, vocabulary_size: int):
@@ -17,7 +17,9 @@ import numpy as np
 import pytest
 
 from deeplearning.clgen import errors
+from deeplearning.clgen.corpuses import encoded
 from deeplearning.clgen.models import data_generators
+from deeplearning.clgen.proto import model_pb2
 from labm8.py import app
 from labm8.py import test
 
@@ -35,6 +37,42 @@ class CorpusMock(object):
     del kwargs
     return np.array([1] * self.corpus_len)
 
+  def GetPackedTrainingData(self, *args, **kwargs):
+    """Mock to return packed encoded training data."""
+    return encoded.PackedEncodedCorpus(
+      self.GetTrainingData(*args, **kwargs), np.array([0, self.corpus_len])
+    )
+
+
+class PackedCorpusMock(object):
+  """A corpus mock of contentfiles with distinct tokens."""
+
+  def __init__(self, contentfile_lengths, vocabulary_size: int = 100):
+    self.offsets = np.concatenate(([0], np.cumsum(contentfile_lengths)))
+    self.tokens = np.arange(self.offsets[-1], dtype=np.int32) % vocabulary_size
+    self.vocab_size = vocabulary_size
+
+  def GetTrainingData(self, shuffle: bool) -> np.ndarray:
+    del shuffle
+    return self.tokens
+
+  def GetPackedTrainingData(
+    self, shuffle: bool
+  ) -> encoded.PackedEncodedCorpus:
+    del shuffle
+    return encoded.PackedEncodedCorpus(self.tokens, self.offsets)
+
+
+def MakeTrainingOptions(
+  batch_size: int, sequence_length: int
+) -> model_pb2.TrainingOptions:
+  return model_pb2.TrainingOptions(
+    num_epochs=2,
+    sequence_length=sequence_length,
+    batch_size=batch_size,
+    shuffle_corpus_contentfiles_between_epochs=False,
+  )
+
 
 # BatchGenerator() tests.
 @test.Skip(reason="TODO(cec):")
@@ -61,6 +99,54 @@ def test_BatchGenerator_batch_size_too_large(abc_model_config):
   assert ("") == str(e_info.value)
 
 
+def test_BatchGenerator_batches():
+  """Test that batches are rows of the corpus which roll over epochs."""
+  corpus = PackedCorpusMock([7, 11, 5, 8])
+  opt = MakeTrainingOptions(batch_size=3, sequence_length=4)
+  generator = data_generators.BatchGenerator(corpus, opt)
+
+  # (31 - 1) // (3 * 4) = 2 steps per epoch, over rows of 8 tokens.
+  x = corpus.tokens[:24].reshape(3, 8)
+  y = corpus.tokens[1:25].reshape(3, 8)
+  for epoch_num in range(4):
+    for batch_num in range(2):
+      batch = next(generator)
+      columns = slice(batch_num * 4, (batch_num + 1) * 4)
+      np.testing.assert_array_equal(
+        batch.X, np.roll(x, -epoch_num, axis=0)[:, columns]
+      )
+      np.testing.assert_array_equal(
+        batch.y,
+        data_generators.OneHotEncode(
+          np.roll(y, -epoch_num, axis=0)[:, columns], corpus.vocab_size
+        ),
+      )
+
+
+def test_TensorflowBatchGenerator_batches():
+  """Test that batch targets wrap around to the start of the corpus."""
+  corpus = PackedCorpusMock([7, 11, 5, 8])
+  opt = MakeTrainingOptions(batch_size=3, sequence_length=5)
+  generator = data_generators.TensorflowBatchGenerator(corpus, opt)
+
+  # 31 // (3 * 5) = 2 batches, over rows of 10 tokens.
+  assert generator.num_batches == 2
+  x = corpus.tokens[:30]
+  y = np.concatenate((x[1:], x[:1]))
+  for batch_num in range(2):
+    batch = generator.NextBatch()
+    columns = slice(batch_num * 5, (batch_num + 1) * 5)
+    np.testing.assert_array_equal(batch.X, x.reshape(3, 10)[:, columns])
+    np.testing.assert_array_equal(batch.y, y.reshape(3, 10)[:, columns])
+
+
+def test_TensorflowBatchGenerator_not_enough_data():
+  """Test that an error is raised if the corpus yields no batches."""
+  opt = MakeTrainingOptions(batch_size=5, sequence_length=5)
+  with test.Raises(errors.UserError):
+    data_generators.TensorflowBatchGenerator(CorpusMock(corpus_length=10), opt)
+
+
 # OneHotEncode() tests.
 
 
@@ -290,9 +290,10 @@ class Model(object):
     sample_observers: typing.List[sample_observers_lib.SampleObserver],
   ) -> bool:
     """Run a single iteration of the batched sample inner-loop."""
-    samples_in_progress = [
-      sampler.tokenized_start_text.copy() for _ in range(sampler.batch_size)
-    ]
+    # The generated tokens of each sample, as a list of arrays.
+    samples_in_progress = [[] for _ in range(sampler.batch_size)]
+    termination_tracker = sampler.CreateTerminationTracker()
+    start_text = "".join(sampler.tokenized_start_text)
     done = np.zeros(sampler.batch_size, dtype=np.bool)
     start_time = labdate.MillisecondsTimestamp()
     wall_time_start = start_time
@@ -307,33 +308,36 @@ class Model(object):
     while not done.all():
       indices = self.backend.SampleNextIndices(sampler, done)
 
-      # Iterate over all samples in batch to determine whether they're
-      # done.
-      for i in range(sampler.batch_size):
-        if done[i]:
+      # Determine which of the samples in the batch are done, and which of
+      # their tokens completes them.
+      rows = np.flatnonzero(~done)
+      row_indices = np.asarray(indices[rows], dtype=np.int32)
+      ends = termination_tracker.Update(rows, row_indices)
+
+      for i, sample_indices, end in zip(rows, row_indices, ends):
+        if end < 0:
+          samples_in_progress[i].append(sample_indices)
           continue
 
-        for index in indices[i]:
-          samples_in_progress[i].append(atomizer.decoder[index])
-          if sampler.SampleIsComplete(samples_in_progress[i]):
-            end_time = labdate.MillisecondsTimestamp()
-            done[i] = 1
-            sample = model_pb2.Sample(
-              text="".join(samples_in_progress[i]),
-              sample_start_epoch_ms_utc=start_time,
-              sample_time_ms=end_time - start_time,
-              wall_time_ms=end_time - wall_time_start,
-              num_tokens=len(samples_in_progress[i]),
-            )
-            # Notify sample observers.
-            continue_sampling &= all(
-              [obs.OnSample(sample) for obs in sample_observers]
-            )
-
-            # Wall sample time is the difference between the end of the previous
-            # sample and the end of the current sample.
-            wall_time_start = labdate.MillisecondsTimestamp()
-            break
+        samples_in_progress[i].append(sample_indices[: end + 1])
+        end_time = labdate.MillisecondsTimestamp()
+        done[i] = 1
+        encoded_sample = np.concatenate(samples_in_progress[i])
+        sample = model_pb2.Sample(
+          text=start_text + atomizer.DeatomizeIndices(encoded_sample),
+          sample_start_epoch_ms_utc=start_time,
+          sample_time_ms=end_time - start_time,
+          wall_time_ms=end_time - wall_time_start,
+          num_tokens=len(sampler.tokenized_start_text) + len(encoded_sample),
+        )
+        # Notify sample observers.
+        continue_sampling &= all(
+          [obs.OnSample(sample) for obs in sample_observers]
+        )
+
+        # Wall sample time is the difference between the end of the previous
+        # sample and the end of the current sample.
+        wall_time_start = labdate.MillisecondsTimestamp()
 
     return continue_sampling
 
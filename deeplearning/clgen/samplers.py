@@ -19,6 +19,8 @@ determines the shape of the generated samples.
 """
 import typing
 
+import numpy as np
+
 from deeplearning.clgen import errors
 from deeplearning.clgen.corpuses import atomizers
 from deeplearning.clgen.proto import sampler_pb2
@@ -71,9 +73,11 @@ def AssertConfigIsValid(config: sampler_pb2.Sampler) -> sampler_pb2.Sampler:
 class TerminationCriterionBase(object):
   """Base class for TerminationCriterion objects.
 
-  A TerminationCriterion is an object with a single public function
+  A TerminationCriterion is an object with a public function
   SampleIsComplete(), which accepts as its sole argument a sample-in-progress,
-  and returns whether to stop sampling.
+  and returns whether to stop sampling. For incrementally checking a batch of
+  samples as they are generated, CreateTracker() returns a
+  TerminationTracker.
   """
 
   def Specialize(self, atomizer: atomizers.AtomizerBase) -> None:
@@ -100,6 +104,48 @@ class TerminationCriterionBase(object):
     """
     raise NotImplementedError("abstract class")
 
+  def CreateTracker(
+    self, encoded_start_text: np.ndarray, batch_size: int
+  ) -> "TerminationTrackerBase":
+    """Create a tracker for a batch of samples.
+
+    This must be called after Specialize().
+
+    Args:
+      encoded_start_text: The encoded start text of the samples.
+      batch_size: The number of samples in the batch.
+
+    Returns:
+      A TerminationTracker instance.
+    """
+    raise NotImplementedError("abstract class")
+
+
+class TerminationTrackerBase(object):
+  """Base class for TerminationTracker objects.
+
+  A TerminationTracker incrementally determines whether the samples of a batch
+  are complete. It is updated with the newly generated tokens of a batch after
+  each sampling step, keeping running counts of the properties of each sample,
+  so that the cost of an update is independent of the length of the samples.
+
+  Once a sample is complete, the tracker must not be updated for it again.
+  """
+
+  def Update(self, rows: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Update the tracker with newly generated tokens.
+
+    Args:
+      rows: An array of shape (n,) of the samples in the batch to update.
+      indices: An array of shape (n, num_tokens) of the encoded tokens
+        generated for each of the samples.
+
+    Returns:
+      A boolean array of shape (n, num_tokens), where an element is True if
+      the sample would be complete after the corresponding token.
+    """
+    raise NotImplementedError("abstract class")
+
 
 class MaxlenTerminationCriterion(TerminationCriterionBase):
   """A termination criterion which limits the maximum length of a sample."""
@@ -119,6 +165,33 @@ class MaxlenTerminationCriterion(TerminationCriterionBase):
     """Determine whether to stop sampling."""
     return len(sample_in_progress) >= self.max_len
 
+  def CreateTracker(
+    self, encoded_start_text: np.ndarray, batch_size: int
+  ) -> "MaxlenTerminationTracker":
+    """Create a tracker for a batch of samples."""
+    return MaxlenTerminationTracker(self, encoded_start_text, batch_size)
+
+
+class MaxlenTerminationTracker(TerminationTrackerBase):
+  """A tracker for MaxlenTerminationCriterion, counting sample lengths."""
+
+  def __init__(
+    self,
+    criterion: MaxlenTerminationCriterion,
+    encoded_start_text: np.ndarray,
+    batch_size: int,
+  ):
+    self.max_len = criterion.max_len
+    self.lengths = np.full(batch_size, len(encoded_start_text), dtype=np.int64)
+
+  def Update(self, rows: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Update the tracker with newly generated tokens."""
+    num_tokens = indices.shape[1]
+    # The length of each sample after each of the new tokens.
+    lengths = self.lengths[rows, np.newaxis] + np.arange(1, num_tokens + 1)
+    self.lengths[rows] += num_tokens
+    return lengths >= self.max_len
+
 
 class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
   """A termination criterion which counts symmetrical token depth.
@@ -149,6 +222,9 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       raise errors.UserError(e)
     if self.left_token == self.right_token:
       raise errors.UserError("SymmetricalTokenDepth tokens must be different")
+    # Set in Specialize().
+    self.left_index = None
+    self.right_index = None
 
   def Specialize(self, atomizer: atomizers.AtomizerBase) -> None:
     """Specialize a termination criteria to a vocabulary.
@@ -173,6 +249,8 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
           "Sampler symmetrical depth tokens do not encode to a single "
           "token using the corpus vocabulary"
         )
+      self.left_index = int(left[0])
+      self.right_index = int(right[0])
     except errors.VocabError:
       raise errors.InvalidSymtokTokens(
         "Sampler symmetrical depth tokens cannot be encoded using the "
@@ -205,6 +283,80 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       return -1
     return left_token_count - right_token_count
 
+  def CreateTracker(
+    self, encoded_start_text: np.ndarray, batch_size: int
+  ) -> "SymmetricalTokenDepthTracker":
+    """Create a tracker for a batch of samples."""
+    return SymmetricalTokenDepthTracker(self, encoded_start_text, batch_size)
+
+
+class SymmetricalTokenDepthTracker(TerminationTrackerBase):
+  """A tracker for SymmetricalTokenDepthCriterion, counting depth tokens."""
+
+  def __init__(
+    self,
+    criterion: SymmetricalTokenDepthCriterion,
+    encoded_start_text: np.ndarray,
+    batch_size: int,
+  ):
+    self.left_index = criterion.left_index
+    self.right_index = criterion.right_index
+    self.left_counts = np.full(
+      batch_size,
+      np.count_nonzero(encoded_start_text == self.left_index),
+      dtype=np.int64,
+    )
+    self.right_counts = np.full(
+      batch_size,
+      np.count_nonzero(encoded_start_text == self.right_index),
+      dtype=np.int64,
+    )
+
+  def Update(self, rows: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Update the tracker with newly generated tokens."""
+    is_left = indices == self.left_index
+    is_right = indices == self.right_index
+    # The token counts of each sample after each of the new tokens.
+    left_counts = self.left_counts[rows, np.newaxis] + np.cumsum(
+      is_left, axis=1
+    )
+    right_counts = self.right_counts[rows, np.newaxis] + np.cumsum(
+      is_right, axis=1
+    )
+    self.left_counts[rows] += is_left.sum(axis=1)
+    self.right_counts[rows] += is_right.sum(axis=1)
+    # A sample is complete once a right token balances the left tokens, or if
+    # a right token is emitted before any left token. See GetTokenDepth().
+    return is_right & ((left_counts == 0) | (left_counts == right_counts))
+
+
+class SampleTerminationTracker(object):
+  """Incrementally determines when the samples of a batch are complete.
+
+  This combines the trackers of all of a sampler's termination criteria. A
+  sample is complete after the first token which completes any criterion.
+  """
+
+  def __init__(self, trackers: typing.List[TerminationTrackerBase]):
+    self.trackers = trackers
+
+  def Update(self, rows: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Update the tracker with newly generated tokens.
+
+    Args:
+      rows: An array of shape (n,) of the incomplete samples in the batch.
+      indices: An array of shape (n, num_tokens) of the encoded tokens
+        generated for each of the incomplete samples.
+
+    Returns:
+      An array of shape (n,) of the position in indices of the token which
+      completes each sample, or -1 if the sample is not complete.
+    """
+    complete = np.zeros(indices.shape, dtype=np.bool)
+    for tracker in self.trackers:
+      complete |= tracker.Update(rows, indices)
+    return np.where(complete.any(axis=1), complete.argmax(axis=1), -1)
+
 
 def GetTerminationCriteria(
   config: typing.List[sampler_pb2.SampleTerminationCriterion],
@@ -311,6 +463,30 @@ class Sampler(object):
     """
     return any(t.SampleIsComplete(sample_in_progress) for t in self.terminators)
 
+  def CreateTerminationTracker(
+    self, batch_size: int = None
+  ) -> SampleTerminationTracker:
+    """Create a tracker for incrementally determining when samples are done.
+
+    This is equivalent to calling SampleIsComplete() after every generated
+    token, but the cost of checking a token does not grow with the length of
+    the sample. This must be called after Specialize().
+
+    Args:
+      batch_size: The number of samples in the batch. If not provided, the
+        sampler batch size is used.
+
+    Returns:
+      A SampleTerminationTracker instance.
+    """
+    batch_size = batch_size or self.batch_size
+    return SampleTerminationTracker(
+      [
+        t.CreateTracker(self.encoded_start_text, batch_size)
+        for t in self.terminators
+      ]
+    )
+
   @staticmethod
   def _ComputeHash(config: sampler_pb2.Sampler) -> str:
     """Compute sampler hash.
@@ -20,6 +20,7 @@ import pytest
 
 from deeplearning.clgen import errors
 from deeplearning.clgen import samplers
+from deeplearning.clgen.corpuses import atomizers
 from deeplearning.clgen.proto import sampler_pb2
 from labm8.py import app
 from labm8.py import test
@@ -128,6 +129,21 @@ def test_MaxlenTerminationCriterion_SampleIsComplete():
   assert t.SampleIsComplete(["a", "b", "c", "d", "e"])
 
 
+def test_MaxlenTerminationTracker_Update():
+  """Test that the tracker counts sample lengths across updates."""
+  t = samplers.MaxlenTerminationCriterion(
+    sampler_pb2.MaxTokenLength(maximum_tokens_in_sample=4)
+  )
+  tracker = t.CreateTracker(np.array([0]), batch_size=2)
+  np.testing.assert_array_equal(
+    tracker.Update(np.array([0, 1]), np.array([[0, 0], [0, 0]])),
+    [[False, False], [False, False]],
+  )
+  np.testing.assert_array_equal(
+    tracker.Update(np.array([1]), np.array([[0, 0]])), [[True, True]]
+  )
+
+
 # SymmetricalTokenDepthCriterion tests.
 
 
@@ -212,6 +228,28 @@ def test_SymmetrcalTokenDepthCriterion_SampleIsComplete_reverse_order():
   assert t.SampleIsComplete(["-", "a", "b", "c", "+", "+", "-"])
 
 
+def test_SymmetricalTokenDepthTracker_Update():
+  """Test that the tracker counts depth tokens across updates."""
+  t = samplers.SymmetricalTokenDepthCriterion(
+    sampler_pb2.SymmetricalTokenDepth(
+      depth_increase_token="+", depth_decrease_token="-"
+    )
+  )
+  t.Specialize(atomizers.AsciiCharacterAtomizer.FromText("a+-"))
+  plus, minus = t.left_index, t.right_index
+  tracker = t.CreateTracker(np.array([plus]), batch_size=2)
+  # Depths 2 then 1, and 2 then 2.
+  np.testing.assert_array_equal(
+    tracker.Update(np.array([0, 1]), np.array([[plus, minus], [plus, 0]])),
+    [[False, False], [False, False]],
+  )
+  # Depths 0 then -1, and 1 then 2.
+  np.testing.assert_array_equal(
+    tracker.Update(np.array([0, 1]), np.array([[minus, minus], [minus, plus]])),
+    [[True, False], [False, False]],
+  )
+
+
 # Sampler tests.
 
 
@@ -304,5 +342,54 @@ def test_Sampler_Specialize_encoded_start_text(
   np.testing.assert_array_equal(np.array([1]), s.encoded_start_text)
 
 
+
+@test.Parametrize("tokens_per_update", [1, 3, 12])
+def test_Sampler_CreateTerminationTracker_sample_lengths(
+  tokens_per_update: int,
+):
+  """Test the generated token counts at which samples are complete."""
+  s = samplers.Sampler(
+    sampler_pb2.Sampler(
+      start_text="a+",
+      batch_size=5,
+      sequence_length=10,
+      termination_criteria=[
+        sampler_pb2.SampleTerminationCriterion(
+          maxlen=sampler_pb2.MaxTokenLength(maximum_tokens_in_sample=10)
+        ),
+        sampler_pb2.SampleTerminationCriterion(
+          symtok=sampler_pb2.SymmetricalTokenDepth(
+            depth_increase_token="+", depth_decrease_token="-"
+          )
+        ),
+      ],
+      temperature_micros=1000000,
+    )
+  )
+  atomizer = atomizers.AsciiCharacterAtomizer.FromText("a+-")
+  s.Specialize(atomizer)
+  samples = [
+    # Closes the depth of the start text.
+    "-aaaaaaaaaaa",
+    "a+--aaaaaaaa",
+    "+-a-aaaaaaaa",
+    # Reaches the maximum length, including the start text.
+    "aaaaaaaaaaaa",
+    "++--a-aaaaaa",
+  ]
+  indices = np.array([atomizer.AtomizeString(x) for x in samples])
+
+  tracker = s.CreateTerminationTracker()
+  lengths = np.zeros(s.batch_size, dtype=np.int64)
+  done = np.zeros(s.batch_size, dtype=np.bool)
+  for i in range(0, indices.shape[1], tokens_per_update):
+    rows = np.flatnonzero(~done)
+    ends = tracker.Update(rows, indices[rows, i : i + tokens_per_update])
+    lengths[rows] += np.where(ends < 0, tokens_per_update, ends + 1)
+    done[rows] = ends >= 0
+  assert done.all()
+  assert lengths.tolist() == [1, 4, 4, 8, 6]
+
+
 if __name__ == "__main__":
   test.Main()
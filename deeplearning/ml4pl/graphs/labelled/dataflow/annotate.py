@@ -37,15 +37,30 @@ and text format protocol buffers:
         --stdout_fmt=pbtxt \
         --n=5 \
         < /tmp/program_graph.pbtxt
+
+When run with --worker, this program instead annotates a stream of graphs. This
+is used by AnnotationWorker to enforce timeouts and memory limits on analyses
+without starting a new interpreter for every graph.
 """
+import enum
+import os
+import pickle
+import resource
+import select
 import signal
+import struct
 import subprocess
 import sys
+import time
+from typing import BinaryIO
 from typing import List
+from typing import Optional
+from typing import Type
 from typing import Union
 
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
+from deeplearning.ml4pl.graphs.labelled import graph_tuple as graph_tuple_lib
 from deeplearning.ml4pl.graphs.labelled.dataflow import data_flow_graphs
 from deeplearning.ml4pl.graphs.labelled.dataflow.alias_set import alias_set
 from deeplearning.ml4pl.graphs.labelled.dataflow.datadep import data_dependence
@@ -67,6 +82,13 @@ app.DEFINE_boolean(
   "list", False, "If true, list the available analyses and exit."
 )
 app.DEFINE_string("analysis", "", "The name of the analysis to run.")
+app.DEFINE_boolean(
+  "worker",
+  False,
+  "If true, run as a long-lived annotation worker, which reads a stream of "
+  "length-prefixed binary ProgramGraph protos from stdin and writes "
+  "length-prefixed results to stdout. See AnnotationWorker.",
+)
 app.DEFINE_integer(
   "n",
   10,
@@ -76,6 +98,25 @@ app.DEFINE_integer(
   "graphs.",
 )
 
+
+class DataFlowEngine(enum.Enum):
+  """The implementation to use for analyses which have more than one."""
+
+  # Analyses over networkx graphs.
+  NETWORKX = 1
+  # Analyses over CSR adjacency arrays and bitvectors.
+  CSR = 2
+
+
+app.DEFINE_enum(
+  "data_flow_engine",
+  DataFlowEngine,
+  DataFlowEngine.CSR,
+  "The implementation to use for analyses which have more than one. The csr "
+  "engine produces the same annotations as the networkx engine, but is faster "
+  "on large graphs.",
+)
+
 FLAGS = app.FLAGS
 
 # A map from analysis name to a callback which instantiates a
@@ -97,12 +138,29 @@ ANALYSES = {
   "test_empty": test_annotators.EmptyAnnotator,
 }
 
+# Array-based implementations of analyses, used in place of the networkx
+# annotators in ANALYSES when --data_flow_engine=csr.
+CSR_ANALYSES = {
+  "reachability": reachability.CsrReachabilityAnnotator,
+  "domtree": dominator_tree.CsrDominatorTreeAnnotator,
+  "liveness": liveness.CsrLivenessAnnotator,
+  "datadep": data_dependence.CsrDataDependencyAnnotator,
+}
+
 # A list of the available analyses. We filter out the test_xxx named annotators
 # for clarity.
 AVAILABLE_ANALYSES = sorted(
   analysis for analysis in ANALYSES if not analysis.startswith("test_")
 )
 
+# The flags of annotators which are forwarded to annotation workers, so that a
+# worker produces the same annotations as an in-process analysis.
+ANNOTATOR_FLAGS = [
+  "alias_set_min_size",
+  "expression_set_min_size",
+  "only_entry_blocks_for_liveness_root_nodes",
+]
+
 # The path of this script. Because a target cannot depend on itself, all calling
 # code must add this script to its `data` dependencies.
 SELF = bazelutil.DataPath(
@@ -118,94 +176,291 @@ E_INVALID_INPUT = 11
 E_ANALYSIS_FAILED = 12
 # Error writing stdout.
 E_INVALID_STDOUT = 13
+# The worker ran out of memory.
+E_OUT_OF_MEMORY = 14
 
 
-def _AnnotateInSubprocess(
+def GetAnnotatorClass(
   analysis: str,
-  graph: Union[programl_pb2.ProgramGraph, bytes],
-  n: int = 0,
-  timeout: int = 120,
-  binary_graph: bool = False,
-) -> programl_pb2.ProgramGraphs:
-  """Run this script in a subprocess.
+) -> Type[data_flow_graphs.DataFlowGraphAnnotator]:
+  """Return the annotator class for an analysis, selected using
+  --data_flow_engine.
+  """
+  engine = FLAGS.data_flow_engine()
+  if engine == DataFlowEngine.CSR and analysis in CSR_ANALYSES:
+    return CSR_ANALYSES[analysis]
+  return ANALYSES[analysis]
 
-  This is the most robust method for enforcing the timeout, but has a huge
-  overhead in starting up a new python interpreter for every invocation.
 
-  DISCLAIMER: Because a target cannot depend on itself, all calling code must
-  add //deeplearning/ml4pl/graphs/labelled/dataflow:annotate to its list of
-  data dependencies.
+# The header of messages exchanged with an annotation worker: the length of the
+# message payload, as a little-endian unsigned 64-bit integer.
+_MESSAGE_HEADER = struct.Struct("<Q")
+
+
+def _WriteMessage(f: BinaryIO, payload: bytes) -> None:
+  """Write a length-prefixed message to a binary file."""
+  f.write(_MESSAGE_HEADER.pack(len(payload)))
+  f.write(payload)
+  f.flush()
+
+
+def _ReadMessage(f: BinaryIO) -> Optional[bytes]:
+  """Read a length-prefixed message from a binary file.
+
+  Returns:
+    The message payload, or None if the file was closed before a complete
+    message could be read.
+  """
+  header = f.read(_MESSAGE_HEADER.size)
+  if len(header) != _MESSAGE_HEADER.size:
+    return None
+  (payload_length,) = _MESSAGE_HEADER.unpack(header)
+  payload = f.read(payload_length)
+  if len(payload) != payload_length:
+    return None
+  return payload
+
+
+def _ReadBytesFromFd(
+  fd: int, size: int, deadline: Optional[float] = None
+) -> Optional[bytes]:
+  """Read exactly size bytes from a file descriptor.
 
   Args:
-    analysis: The name of the analysis to run.
-    graph: The unlabelled ProgramGraph protocol buffer to to annotate, either
-      as a proto instance or as binary-encoded byte array.
-    n: The maximum number of labelled graphs to produce.
-    timeout: The maximum number of seconds to run the analysis for.
-    binary_graph: If true, treat the graph argument as a binary byte array.
+    fd: The file descriptor to read from.
+    size: The number of bytes to read.
+    deadline: If set, the time.monotonic() time by which all bytes must have
+      been read.
 
   Returns:
-    A ProgramGraphs protocol buffer.
+    The bytes, or None if the file was closed before they could be read.
 
   Raises:
-    IOError: If serializing the input or output protos fails.
-    ValueError: If an invalid analysis is requested.
-    data_flow_graphs.AnalysisFailed: If the analysis raised an error.
-    data_flow_graphs.AnalysisTimeout: If the analysis did not complete within
-      the requested timeout.
+    TimeoutError: If the bytes could not be read before the deadline.
+  """
+  chunks = []
+  while size:
+    if deadline is not None:
+      ready, _, _ = select.select(
+        [fd], [], [], max(deadline - time.monotonic(), 0)
+      )
+      if not ready:
+        raise TimeoutError()
+    chunk = os.read(fd, size)
+    if not chunk:
+      return None
+    chunks.append(chunk)
+    size -= len(chunk)
+  return b"".join(chunks)
+
+
+def _ReadMessageFromFd(
+  fd: int, deadline: Optional[float] = None
+) -> Optional[bytes]:
+  """Read a length-prefixed message from a file descriptor.
+
+  Unlike _ReadMessage(), the whole message must be read before the deadline.
+
+  Returns:
+    The message payload, or None if the file was closed before a complete
+    message could be read.
+
+  Raises:
+    TimeoutError: If the message could not be read before the deadline.
+  """
+  header = _ReadBytesFromFd(fd, _MESSAGE_HEADER.size, deadline)
+  if header is None:
+    return None
+  (payload_length,) = _MESSAGE_HEADER.unpack(header)
+  return _ReadBytesFromFd(fd, payload_length, deadline)
+
+
+class AnnotationWorker(object):
+  """A long-lived subprocess which runs an analysis on a stream of graphs.
+
+  This is a robust way of enforcing timeouts and memory limits on analyses
+  without paying the cost of starting a new python interpreter for every graph.
+  The worker is this script running with --worker. It reads serialized
+  ProgramGraph protos from stdin and writes pickled lists of
+  DataFlowGraphTuple to stdout. If an analysis exceeds its timeout, or the
+  worker dies, the worker is killed and a new one is started on the next call to
+  Annotate(). The flags in ANNOTATOR_FLAGS are forwarded to the worker.
+
+  DISCLAIMER: Because a target cannot depend on itself, all calling code must
+  add //deeplearning/ml4pl/graphs/labelled/dataflow:annotate to its list of
+  data dependencies.
   """
-  process = subprocess.Popen(
-    [
-      "timeout",
-      "-s9",
-      str(timeout),
-      str(SELF),
-      "--analysis",
-      analysis,
-      "--n",
-      str(n),
-      "--stdin_fmt",
-      "pb",
-      "--stdout_fmt",
-      "pb",
-    ],
-    stdin=subprocess.PIPE,
-    stdout=subprocess.PIPE,
-    stderr=subprocess.PIPE,
-  )
-
-  # Encode the input if required.
-  if binary_graph:
-    stdin = graph
-  else:
-    stdin = programl.ToBytes(graph, fmt=programl.InputOutputFormat.PB)
-
-  # Run this analysis script.
-  stdout, stderr = process.communicate(stdin)
-
-  if process.returncode == 9 or process.returncode == -9:
-    # Process was killed. We assume this is because of timeout, though it could
-    # be the user.
-    raise data_flow_graphs.AnalysisTimeout(timeout)
-  elif process.returncode == E_INVALID_INPUT:
-    raise IOError("Failed to serialize input graph")
-  elif process.returncode == E_INVALID_STDOUT:
-    raise IOError("Analysis failed to write stdout")
-  elif process.returncode:
-    raise data_flow_graphs.AnalysisFailed(
-      f"Analysis failed with returncode {process.returncode}: "
-      f"{stderr.decode('utf-8')}"
-    )
 
-  # Construct the protocol buffer from stdout.
-  output = programl.FromBytes(
-    stdout,
-    programl.InputOutputFormat.PB,
-    proto=programl_pb2.ProgramGraphs(),
-    empty_okay=True,
-  )
+  def __init__(
+    self,
+    analysis: str,
+    n: int = 0,
+    max_mem_size: Optional[int] = None,
+    startup_timeout: int = 60,
+  ):
+    """Constructor.
+
+    Args:
+      analysis: The name of the analysis to run.
+      n: The maximum number of labelled graphs to produce per graph.
+      max_mem_size: If set, the maximum size of the worker's address space, in
+        bytes. An analysis which exceeds this limit fails.
+      startup_timeout: The maximum number of seconds to wait for the worker to
+        become ready.
+
+    Raises:
+      ValueError: If an invalid analysis is requested.
+    """
+    if analysis not in ANALYSES:
+      raise ValueError(
+        f"Unknown analysis: {analysis}. "
+        f"Available analyses: {AVAILABLE_ANALYSES}",
+      )
+    self.analysis = analysis
+    self.n = n
+    self.max_mem_size = max_mem_size
+    self.startup_timeout = startup_timeout
+    self.process: Optional[subprocess.Popen] = None
+
+  def __enter__(self) -> "AnnotationWorker":
+    return self
+
+  def __exit__(self, *args):
+    self.Close()
+
+  def _SetMemoryLimit(self) -> None:
+    """Set the memory limit of the worker process."""
+    resource.setrlimit(
+      resource.RLIMIT_DATA, (self.max_mem_size, self.max_mem_size)
+    )
+    resource.setrlimit(
+      resource.RLIMIT_AS, (self.max_mem_size, self.max_mem_size)
+    )
 
-  return output
+  def Start(self) -> None:
+    """Start the worker process and wait until it is ready to annotate.
+
+    Raises:
+      OSError: If the worker fails to start, or is not ready within
+        startup_timeout.
+    """
+    self.process = subprocess.Popen(
+      [
+        str(SELF),
+        "--worker",
+        "--analysis",
+        self.analysis,
+        "--n",
+        str(self.n),
+        "--data_flow_engine",
+        FLAGS.data_flow_engine().name.lower(),
+      ]
+      + [FLAGS[flag].serialize() for flag in ANNOTATOR_FLAGS],
+      stdin=subprocess.PIPE,
+      stdout=subprocess.PIPE,
+      preexec_fn=self._SetMemoryLimit if self.max_mem_size else None,
+    )
+    # The worker writes an empty message once it has finished starting up, so
+    # that interpreter startup is not counted against the timeout of the first
+    # graph. Responses are read from the unbuffered file descriptor so that
+    # they can be read with a deadline.
+    try:
+      message = _ReadMessageFromFd(
+        self.process.stdout.fileno(),
+        deadline=time.monotonic() + self.startup_timeout,
+      )
+    except TimeoutError:
+      self.Kill()
+      raise OSError(
+        f"Annotation worker did not start within {self.startup_timeout} "
+        "seconds"
+      )
+    if message is None:
+      returncode = self.Kill()
+      raise OSError(f"Annotation worker failed with returncode {returncode}")
+
+  def Kill(self) -> Optional[int]:
+    """Kill the worker process, if running.
+
+    Returns:
+      The returncode of the worker process, or None if it was not running.
+    """
+    if self.process is None:
+      return None
+    process, self.process = self.process, None
+    process.kill()
+    process.wait()
+    process.stdin.close()
+    process.stdout.close()
+    return process.returncode
+
+  def Close(self) -> None:
+    """Shut down the worker process, if running."""
+    if self.process is None:
+      return
+    # Closing stdin signals the worker to exit.
+    try:
+      self.process.stdin.close()
+      self.process.wait(timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+      pass
+    self.Kill()
+
+  def Annotate(
+    self, serialized_graph: bytes, timeout: int = 120
+  ) -> List[graph_tuple_lib.DataFlowGraphTuple]:
+    """Run the analysis on a graph.
+
+    Args:
+      serialized_graph: The unlabelled ProgramGraph protocol buffer to annotate,
+        as a binary-encoded byte array.
+      timeout: The maximum number of seconds to run the analysis for.
+
+    Returns:
+      A list of annotated graph tuples.
+
+    Raises:
+      OSError: If the worker fails to start.
+      data_flow_graphs.AnalysisFailed: If the analysis raised an error, or the
+        worker died.
+      data_flow_graphs.AnalysisTimeout: If the analysis did not complete within
+        the requested timeout.
+    """
+    if self.process is None:
+      self.Start()
+
+    try:
+      _WriteMessage(self.process.stdin, serialized_graph)
+    except OSError as e:
+      returncode = self.Kill()
+      raise data_flow_graphs.AnalysisFailed(
+        f"Annotation worker failed with returncode {returncode}: {e}"
+      )
+
+    # The whole response must be read within the timeout, so that a worker
+    # which stalls part way through writing a response cannot block us.
+    try:
+      message = _ReadMessageFromFd(
+        self.process.stdout.fileno(), deadline=time.monotonic() + timeout
+      )
+    except TimeoutError:
+      self.Kill()
+      raise data_flow_graphs.AnalysisTimeout(timeout)
+
+    if message is None:
+      returncode = self.Kill()
+      if returncode == E_OUT_OF_MEMORY:
+        raise data_flow_graphs.AnalysisFailed(
+          "Annotation worker exceeded its memory limit"
+        )
+      raise data_flow_graphs.AnalysisFailed(
+        f"Annotation worker failed with returncode {returncode}"
+      )
+
+    ok, result = pickle.loads(message)
+    if not ok:
+      raise data_flow_graphs.AnalysisFailed(result)
+    return result
 
 
 def Annotate(
@@ -248,7 +503,7 @@ def Annotate(
 
   signal.signal(signal.SIGALRM, TimeoutHandler)
   signal.alarm(timeout)
-  annotator = ANALYSES[analysis](graph)
+  annotator = GetAnnotatorClass(analysis)(graph)
 
   try:
     annotated_graphs = annotator.MakeAnnotated(n)
@@ -258,12 +513,55 @@ def Annotate(
   return annotated_graphs
 
 
+def RunWorker(analysis: str, n: int) -> None:
+  """Run the worker loop of an AnnotationWorker.
+
+  Each message read from stdin is a binary-encoded ProgramGraph. For each, a
+  pickled (ok, result) tuple is written to stdout, where result is either a
+  list of DataFlowGraphTuple, or an error message. The loop terminates when
+  stdin is closed.
+  """
+  stdin = sys.stdin.buffer
+  stdout = sys.stdout.buffer
+  # Redirect any prints to stderr so that they cannot corrupt the output
+  # stream.
+  sys.stdout = sys.stderr
+
+  annotator_class = GetAnnotatorClass(analysis)
+
+  # Signal that the worker is ready.
+  _WriteMessage(stdout, b"")
+
+  while True:
+    serialized_graph = _ReadMessage(stdin)
+    if serialized_graph is None:
+      break
+
+    try:
+      graph = programl.FromBytes(
+        serialized_graph, programl.InputOutputFormat.PB
+      )
+      result = (True, annotator_class(graph).MakeAnnotated(n).graph_tuples)
+    except MemoryError:
+      # The heap may be in no state to continue, so exit and let the parent
+      # start a new worker.
+      sys.exit(E_OUT_OF_MEMORY)
+    except Exception as e:
+      result = (False, f"{type(e).__name__}: {e}")
+
+    _WriteMessage(stdout, pickle.dumps(result))
+
+
 def Main():
   """Main entry point."""
   if FLAGS.list:
     print(f"Available analyses: {AVAILABLE_ANALYSES}")
     return
 
+  if FLAGS.worker:
+    RunWorker(FLAGS.analysis, FLAGS.n)
+    return
+
   n = FLAGS.n
 
   try:
@@ -272,12 +570,12 @@ def Main():
     print(f"Error parsing stdin: {e}", file=sys.stderr)
     sys.exit(E_INVALID_INPUT)
 
-  annotator = ANALYSES[FLAGS.analysis](input_graph)
+  annotator = GetAnnotatorClass(FLAGS.analysis)(input_graph)
 
-  annotated_graphs: List[programl_pb2.ProgramGraph] = []
   try:
-    for annotated_graph in annotator.MakeAnnotated(n):
-      annotated_graphs.append(annotated_graph)
+    annotated_graphs: List[
+      programl_pb2.ProgramGraph
+    ] = annotator.MakeAnnotated(n).protos
   except Exception as e:
     print(f"{e}", file=sys.stderr)
     sys.exit(E_ANALYSIS_FAILED)
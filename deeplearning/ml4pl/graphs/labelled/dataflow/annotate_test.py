@@ -14,6 +14,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Test the annotate binary."""
+import os
+import time
+
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow import annotate
@@ -103,5 +106,127 @@ def test_annotate(analysis: str, real_proto: programl_pb2.ProgramGraph, n: int):
     pass
 
 
+def test_AnnotationWorker_invalid_analysis():
+  """Test that error is raised if the analysis is invalid."""
+  with test.Raises(ValueError) as e_ctx:
+    annotate.AnnotationWorker("invalid_analysis")
+  assert str(e_ctx.value).startswith("Unknown analysis: invalid_analysis. ")
+
+
+def test_AnnotationWorker_annotate(
+  analysis: str, one_proto: programl_pb2.ProgramGraph, n: int
+):
+  """Test that a worker produces the same graphs as in-process annotation."""
+  try:
+    expected = annotate.Annotate(analysis, one_proto, n, timeout=30)
+  except data_flow_graphs.AnalysisTimeout:
+    return
+
+  with annotate.AnnotationWorker(analysis, n=n) as worker:
+    # Annotate the same graph repeatedly to test that the worker is reused.
+    for _ in range(3):
+      annotated = worker.Annotate(one_proto.SerializeToString(), timeout=60)
+      assert len(annotated) == len(expected.graph_tuples)
+      # Root nodes are selected randomly, so only compare graph shapes.
+      for a, b in zip(annotated, expected.graph_tuples):
+        assert a.graph_tuple.node_count == b.graph_tuple.node_count
+        assert a.graph_tuple.edge_count == b.graph_tuple.edge_count
+
+
+def test_AnnotationWorker_timeout(one_proto: programl_pb2.ProgramGraph):
+  """Test that a worker is restarted after timing out."""
+  with annotate.AnnotationWorker("test_timeout") as worker:
+    for _ in range(2):
+      with test.Raises(data_flow_graphs.AnalysisTimeout):
+        worker.Annotate(one_proto.SerializeToString(), timeout=1)
+      assert worker.process is None
+
+
+def test_AnnotationWorker_startup_timeout():
+  """Test that a worker which is not ready in time is killed."""
+  worker = annotate.AnnotationWorker("test_pass_thru", startup_timeout=0)
+  with test.Raises(OSError) as e_ctx:
+    worker.Start()
+  assert "did not start within 0 seconds" in str(e_ctx.value)
+  assert worker.process is None
+
+
+def test_AnnotationWorker_error(one_proto: programl_pb2.ProgramGraph):
+  """Test that analysis errors are raised without restarting the worker."""
+  with annotate.AnnotationWorker("test_error") as worker:
+    with test.Raises(data_flow_graphs.AnalysisFailed) as e_ctx:
+      worker.Annotate(one_proto.SerializeToString())
+    assert "something went wrong!" in str(e_ctx.value)
+    process = worker.process
+    assert process is not None
+
+    with test.Raises(data_flow_graphs.AnalysisFailed):
+      worker.Annotate(one_proto.SerializeToString())
+    assert worker.process is process
+
+
+def test_AnnotationWorker_invalid_input():
+  """Test that a worker reports an error for an invalid input graph."""
+  with annotate.AnnotationWorker("test_pass_thru") as worker:
+    with test.Raises(data_flow_graphs.AnalysisFailed) as e_ctx:
+      worker.Annotate(b"")
+    assert "Program graph contains no nodes" in str(e_ctx.value)
+
+
+def test_AnnotationWorker_forwards_annotator_flags(
+  one_proto: programl_pb2.ProgramGraph,
+):
+  """Test that annotator flags are forwarded to the worker."""
+  assert len(annotate.Annotate("subexpressions", one_proto, 3).graph_tuples)
+
+  expression_set_min_size = FLAGS.expression_set_min_size
+  FLAGS.expression_set_min_size = 1000
+  try:
+    assert not annotate.Annotate("subexpressions", one_proto, 3).graph_tuples
+    with annotate.AnnotationWorker("subexpressions", n=3) as worker:
+      assert not worker.Annotate(one_proto.SerializeToString())
+      assert "--expression_set_min_size=1000" in worker.process.args
+  finally:
+    FLAGS.expression_set_min_size = expression_set_min_size
+
+
+def test_ReadMessageFromFd_partial_message_timeout():
+  """Test that the deadline applies to the whole message, not the header."""
+  read_fd, write_fd = os.pipe()
+  try:
+    os.write(write_fd, annotate._MESSAGE_HEADER.pack(10) + b"abc")
+    with test.Raises(TimeoutError):
+      annotate._ReadMessageFromFd(read_fd, deadline=time.monotonic() + 0.1)
+  finally:
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_ReadMessageFromFd_chunked_message():
+  """Test that a message written in chunks is read in full."""
+  read_fd, write_fd = os.pipe()
+  try:
+    os.write(write_fd, annotate._MESSAGE_HEADER.pack(6) + b"abc")
+    os.write(write_fd, b"def")
+    assert (
+      annotate._ReadMessageFromFd(read_fd, deadline=time.monotonic() + 10)
+      == b"abcdef"
+    )
+  finally:
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_ReadMessageFromFd_closed():
+  """Test that None is returned if the file is closed mid-message."""
+  read_fd, write_fd = os.pipe()
+  try:
+    os.write(write_fd, annotate._MESSAGE_HEADER.pack(6) + b"abc")
+    os.close(write_fd)
+    assert annotate._ReadMessageFromFd(read_fd) is None
+  finally:
+    os.close(read_fd)
+
+
 if __name__ == "__main__":
   test.Main()
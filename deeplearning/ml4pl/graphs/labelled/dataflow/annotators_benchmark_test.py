@@ -35,6 +35,13 @@ ANNOTATORS = {
   for analysis in annotate.AVAILABLE_ANALYSES
 }
 
+# The CSR annotators to test.
+CSR_ANNOTATORS = {
+  analysis: annotate.CSR_ANALYSES[analysis]
+  for analysis in annotate.AVAILABLE_ANALYSES
+  if analysis in annotate.CSR_ANALYSES
+}
+
 
 def AnnotatorBenchmark(annotator_class):
   """A micro-benchmark that runs annotator over a list of test graphs."""
@@ -57,5 +64,15 @@ def test_benchmark_nx_annotator(
   benchmark(AnnotatorBenchmark, annotator)
 
 
+@test.Parametrize(
+  "annotator", list(CSR_ANNOTATORS.values()), names=list(CSR_ANNOTATORS.keys())
+)
+def test_benchmark_csr_annotator(
+  benchmark, annotator: data_flow_graphs.CsrDataFlowGraphAnnotator,
+):
+  """Benchmark analysis."""
+  benchmark(AnnotatorBenchmark, annotator)
+
+
 if __name__ == "__main__":
   test.Main()
@@ -0,0 +1,197 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""This module defines a compressed sparse row (CSR) representation of program
+graphs for implementing data flow analyses over integer arrays.
+
+The neighbours of each node are ordered in the same way that networkx
+enumerates the edges of a MultiDiGraph constructed by
+programl.ProgramGraphToNetworkX(), so that array-based analyses can exactly
+reproduce the results of their networkx counterparts, including the order in
+which work lists are visited.
+"""
+import collections
+from typing import Dict
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+import numpy as np
+
+from deeplearning.ml4pl.graphs import programl_pb2
+from labm8.py import app
+
+
+FLAGS = app.FLAGS
+
+
+class CsrAdjacency(NamedTuple):
+  """The adjacency lists of a single edge flow type."""
+
+  # The offsets into the indices array of the neighbours of each node, where
+  # the neighbours of node n are indices[indptr[n]:indptr[n+1]].
+  # Shape (node_count + 1), dtype int64:
+  indptr: np.array
+
+  # The neighbouring nodes.
+  # Shape (edge_count), dtype int64:
+  indices: np.array
+
+  def Neighbours(self, node: int) -> np.array:
+    """Return the neighbours of a node, including duplicates for parallel
+    edges.
+    """
+    return self.indices[self.indptr[node] : self.indptr[node + 1]]
+
+  def NeighbourLists(self) -> List[List[int]]:
+    """Return the neighbours of every node as python lists, for algorithms
+    which visit nodes one at a time.
+    """
+    indptr = self.indptr.tolist()
+    indices = self.indices.tolist()
+    return [
+      indices[start:end] for start, end in zip(indptr[:-1], indptr[1:])
+    ]
+
+  @property
+  def degrees(self) -> np.array:
+    """Return the number of neighbours of each node.
+
+    Shape (node_count), dtype int64.
+    """
+    return np.diff(self.indptr)
+
+
+def BuildCsrAdjacency(
+  rows: np.array, columns: np.array, node_count: int
+) -> CsrAdjacency:
+  """Build a CSR adjacency from a list of (row, column) pairs. The relative
+  order of pairs with the same row is preserved.
+  """
+  order = np.argsort(rows, kind="stable")
+  indptr = np.zeros(node_count + 1, dtype=np.int64)
+  np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+  return CsrAdjacency(
+    indptr=indptr, indices=columns[order].astype(np.int64, copy=False)
+  )
+
+
+class CsrGraph(object):
+  """A program graph represented as per-flow CSR adjacency arrays.
+
+  The successors and predecessors of a node are ordered identically to
+  nx.MultiDiGraph.out_edges() and nx.MultiDiGraph.in_edges(): by the first
+  occurrence of each (src, dst) pair in the proto's edge list, with parallel
+  edges listed consecutively in insertion order.
+  """
+
+  def __init__(self, proto: programl_pb2.ProgramGraph):
+    self.node_count = len(proto.node)
+
+    # Shape (node_count), dtype int32:
+    self.node_type = np.array(
+      [node.type for node in proto.node], dtype=np.int32
+    )
+
+    # Nodes are grouped into functions by name, since that is how functions are
+    # compared in the networkx representation. Nodes outside of a function, or
+    # in a function with an empty name, have a function of -1.
+    function_names: Dict[str, int] = {}
+    function_ids = [
+      function_names.setdefault(function.name, len(function_names))
+      if function.name
+      else -1
+      for function in proto.function
+    ]
+    self.function_names: List[str] = list(function_names)
+    # Shape (node_count), dtype int32:
+    self.node_function = np.array(
+      [
+        function_ids[node.function] if node.HasField("function") else -1
+        for node in proto.node
+      ],
+      dtype=np.int32,
+    ).reshape(self.node_count)
+
+    # Shape (edge_count, 3), columns (flow, src, dst):
+    edges = np.array(
+      [
+        (edge.flow, edge.source_node, edge.destination_node)
+        for edge in proto.edge
+      ],
+      dtype=np.int64,
+    ).reshape(-1, 3)
+
+    # Order the edges by the first occurrence of their (src, dst) pair, then by
+    # insertion order.
+    pairs = edges[:, 1] * max(self.node_count, 1) + edges[:, 2]
+    _, first_occurrence, pair_ids = np.unique(
+      pairs, return_index=True, return_inverse=True
+    )
+    edges = edges[
+      np.lexsort((np.arange(len(edges)), first_occurrence[pair_ids]))
+    ]
+
+    # Build the adjacency lists for each flow type.
+    self.successors: List[CsrAdjacency] = []
+    self.predecessors: List[CsrAdjacency] = []
+    for flow in (
+      programl_pb2.Edge.CONTROL,
+      programl_pb2.Edge.DATA,
+      programl_pb2.Edge.CALL,
+    ):
+      flow_edges = edges[edges[:, 0] == flow]
+      self.successors.append(
+        BuildCsrAdjacency(flow_edges[:, 1], flow_edges[:, 2], self.node_count)
+      )
+      self.predecessors.append(
+        BuildCsrAdjacency(flow_edges[:, 2], flow_edges[:, 1], self.node_count)
+      )
+
+
+def BreadthFirstSearch(
+  neighbour_lists: List[List[int]], root_node: int
+) -> Tuple[np.array, int, int]:
+  """Run a breadth-first traversal from a root node.
+
+  This reproduces the behaviour of the networkx analyses, which mark nodes as
+  visited when they are dequeued, not when they are enqueued. In such a
+  traversal a node may be enqueued more than once, so the number of dequeues
+  can exceed the number of visited nodes.
+
+  Args:
+    neighbour_lists: The neighbours of each node, as returned by
+      CsrAdjacency.NeighbourLists().
+    root_node: The node to begin the traversal from.
+
+  Returns:
+    A tuple of <visited, step_count, dequeue_count>, where visited is a boolean
+    array of shape (node_count), step_count is the depth of the last dequeued
+    node (where the root has depth 1), and dequeue_count is the total number of
+    dequeues.
+  """
+  visited = [False] * len(neighbour_lists)
+  step_count = 0
+  dequeue_count = 0
+  q = collections.deque([(root_node, 1)])
+  while q:
+    node, step_count = q.popleft()
+    dequeue_count += 1
+    visited[node] = True
+    for neighbour in neighbour_lists[node]:
+      if not visited[neighbour]:
+        q.append((neighbour, step_count + 1))
+
+  return np.array(visited, dtype=bool), step_count, dequeue_count
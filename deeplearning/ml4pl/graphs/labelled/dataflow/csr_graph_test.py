@@ -0,0 +1,139 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/graphs/labelled/dataflow:csr_graph."""
+import networkx as nx
+import numpy as np
+
+from deeplearning.ml4pl.graphs import programl
+from deeplearning.ml4pl.graphs import programl_pb2
+from deeplearning.ml4pl.graphs.labelled.dataflow import csr_graph
+from deeplearning.ml4pl.testing import random_programl_generator
+from labm8.py import decorators
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+
+def test_CsrGraph_node_function():
+  """Test that nodes are grouped into functions by name."""
+  builder = programl.GraphBuilder()
+  fn = builder.AddFunction()
+  builder.AddNode(function=fn)
+  builder.AddNode()
+  builder.AddNode(function=fn)
+
+  graph = csr_graph.CsrGraph(builder.proto)
+
+  assert graph.node_count == 3
+  assert graph.node_function.tolist() == [0, -1, 0]
+  assert graph.function_names == [fn]
+
+
+def test_CsrGraph_neighbour_order():
+  """Test that neighbours are ordered by the first occurrence of each pair."""
+  proto = programl_pb2.ProgramGraph()
+  for _ in range(4):
+    proto.node.add(type=programl_pb2.Node.STATEMENT)
+  for src, dst in [(0, 3), (0, 1), (2, 1), (0, 3), (0, 2)]:
+    proto.edge.add(
+      flow=programl_pb2.Edge.CONTROL, source_node=src, destination_node=dst
+    )
+  proto.edge.add(flow=programl_pb2.Edge.DATA, source_node=3, destination_node=1)
+
+  graph = csr_graph.CsrGraph(proto)
+
+  control_successors = graph.successors[programl_pb2.Edge.CONTROL]
+  assert control_successors.Neighbours(0).tolist() == [3, 3, 1, 2]
+  assert control_successors.Neighbours(1).tolist() == []
+  assert control_successors.degrees.tolist() == [4, 0, 1, 0]
+  assert control_successors.NeighbourLists() == [[3, 3, 1, 2], [], [1], []]
+
+  control_predecessors = graph.predecessors[programl_pb2.Edge.CONTROL]
+  assert control_predecessors.Neighbours(1).tolist() == [0, 2]
+  assert control_predecessors.Neighbours(3).tolist() == [0, 0]
+
+  assert graph.successors[programl_pb2.Edge.DATA].Neighbours(3).tolist() == [1]
+  assert graph.successors[programl_pb2.Edge.CALL].indices.size == 0
+
+
+@decorators.loop_for(seconds=10)
+def test_fuzz_CsrGraph_neighbours_match_networkx():
+  """Test that neighbours are in the same order as networkx edges."""
+  proto = random_programl_generator.CreateRandomProto()
+  g = programl.ProgramGraphToNetworkX(proto)
+  graph = csr_graph.CsrGraph(proto)
+
+  for flow in range(3):
+    for node in g.nodes:
+      assert graph.successors[flow].Neighbours(node).tolist() == [
+        dst for _, dst, f in g.out_edges(node, data="flow") if f == flow
+      ]
+      assert graph.predecessors[flow].Neighbours(node).tolist() == [
+        src for src, _, f in g.in_edges(node, data="flow") if f == flow
+      ]
+
+
+def test_BreadthFirstSearch_counts_repeated_visits():
+  """Test a traversal in which a node is enqueued more than once."""
+  # 0 -> 1 -> 2, 0 -> 2.
+  adjacency = csr_graph.BuildCsrAdjacency(
+    np.array([0, 0, 1]), np.array([1, 2, 2]), 3
+  )
+
+  visited, step_count, dequeue_count = csr_graph.BreadthFirstSearch(
+    adjacency.NeighbourLists(), 0
+  )
+
+  assert visited.tolist() == [True, True, True]
+  # Node 2 is dequeued at depths 2 and 3.
+  assert step_count == 3
+  assert dequeue_count == 4
+
+
+@decorators.loop_for(seconds=10)
+def test_fuzz_BreadthFirstSearch():
+  """Test that traversals visit the descendants of the root node."""
+  proto = random_programl_generator.CreateRandomProto()
+  graph = csr_graph.CsrGraph(proto)
+
+  for adjacency in graph.successors + graph.predecessors:
+    neighbour_lists = adjacency.NeighbourLists()
+    g = nx.DiGraph()
+    g.add_nodes_from(range(graph.node_count))
+    g.add_edges_from(
+      (node, neighbour)
+      for node, neighbours in enumerate(neighbour_lists)
+      for neighbour in neighbours
+    )
+    root_node = np.random.randint(graph.node_count)
+
+    visited, step_count, dequeue_count = csr_graph.BreadthFirstSearch(
+      neighbour_lists, root_node
+    )
+
+    assert set(np.where(visited)[0].tolist()) == (
+      nx.descendants(g, root_node) | {root_node}
+    )
+    # Nodes may be dequeued at a greater depth than their shortest path.
+    assert step_count >= 1 + max(
+      nx.single_source_shortest_path_length(g, root_node).values()
+    )
+    assert dequeue_count >= visited.sum()
+
+
+if __name__ == "__main__":
+  test.Main()
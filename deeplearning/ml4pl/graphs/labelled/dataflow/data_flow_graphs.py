@@ -13,17 +13,24 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""This module defines a base class for implementing data flow analyses over
-networkx graphs.
+"""This module defines base classes for implementing data flow analyses over
+networkx graphs or CSR adjacency arrays.
 """
 import copy
 import random
+from typing import Any
+from typing import Dict
 from typing import List
+from typing import NamedTuple
+from typing import Optional
 
 import networkx as nx
+import numpy as np
 
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
+from deeplearning.ml4pl.graphs.labelled import graph_tuple as graph_tuple_lib
+from deeplearning.ml4pl.graphs.labelled.dataflow import csr_graph
 from labm8.py import app
 
 
@@ -49,6 +56,21 @@ class DataFlowGraphs(object):
     """Access the data flow graphs as protos."""
     raise NotImplementedError("abstract class")
 
+  @property
+  def graph_tuples(self) -> List[graph_tuple_lib.DataFlowGraphTuple]:
+    """Access the data flow graphs as graph tuples."""
+    return [
+      graph_tuple_lib.DataFlowGraphTuple(
+        graph_tuple=graph_tuple_lib.GraphTuple.CreateFromNetworkX(g),
+        data_flow_root_node=g.graph.get("data_flow_root_node"),
+        data_flow_steps=g.graph.get("data_flow_steps"),
+        data_flow_positive_node_count=g.graph.get(
+          "data_flow_positive_node_count"
+        ),
+      )
+      for g in self.graphs
+    ]
+
 
 class NetworkxDataFlowGraphs(DataFlowGraphs):
   """A set of data-flow annotated graphs."""
@@ -67,6 +89,219 @@ class NetworkxDataFlowGraphs(DataFlowGraphs):
     return [programl.NetworkXToProgramGraph(g) for g in self.graphs]
 
 
+class NetworkXAnnotation(NamedTuple):
+  """The changes made by annotating a networkx graph from one root node."""
+
+  # The values appended to the x list of every node, i.e. the root node
+  # selector.
+  # Shape (node_count, ?), dtype int64:
+  node_x_columns: np.array
+  # The y list of every node, or None if the nodes are unlabelled.
+  # Shape (node_count, node_y_dimensionality), dtype int64:
+  node_y: Optional[np.array]
+  # The graph-level attributes, e.g. data_flow_steps.
+  graph: Dict[str, Any]
+
+
+class NetworkXAnnotationDataFlowGraphs(DataFlowGraphs):
+  """A set of data-flow annotated graphs which are stored as a list of
+  annotations of a single unlabelled networkx graph.
+
+  Annotated graphs are only constructed when they are accessed. Graph tuples
+  share the adjacency lists and edge positions of a single unlabelled graph
+  tuple.
+  """
+
+  def __init__(
+    self, g: nx.MultiDiGraph, annotations: List[NetworkXAnnotation],
+  ):
+    self.g = g
+    self.annotations = annotations
+
+  @property
+  def graphs(self) -> List[nx.MultiDiGraph]:
+    """Construct annotated networkx graphs."""
+    annotated_graphs = []
+    for annotation in self.annotations:
+      # Note that a deep copy is required to ensure that lists in x/y attributes
+      # are duplicated.
+      annotated_graph = copy.deepcopy(self.g)
+      for node, data in annotated_graph.nodes(data=True):
+        data["x"].extend(annotation.node_x_columns[node].tolist())
+        if annotation.node_y is not None:
+          data["y"] = annotation.node_y[node].tolist()
+      annotated_graph.graph.update(annotation.graph)
+      annotated_graphs.append(annotated_graph)
+    return annotated_graphs
+
+  @property
+  def protos(self) -> List[programl_pb2.ProgramGraph]:
+    """Convert the networkx graphs to program graph protos."""
+    return [programl.NetworkXToProgramGraph(g) for g in self.graphs]
+
+  @property
+  def graph_tuples(self) -> List[graph_tuple_lib.DataFlowGraphTuple]:
+    """Construct annotated graph tuples from the unlabelled graph tuple."""
+    if not self.annotations:
+      return []
+
+    unlabelled = graph_tuple_lib.GraphTuple.CreateFromNetworkX(self.g)
+    graph_tuples = []
+    for annotation in self.annotations:
+      graph_x = annotation.graph.get("x")
+      graph_y = annotation.graph.get("y")
+      graph_tuple = graph_tuple_lib.GraphTuple(
+        adjacencies=unlabelled.adjacencies,
+        edge_positions=unlabelled.edge_positions,
+        node_x=np.hstack((unlabelled.node_x, annotation.node_x_columns)),
+        node_y=(
+          unlabelled.node_y if annotation.node_y is None else annotation.node_y
+        ),
+        graph_x=np.array(graph_x, dtype=np.int64) if graph_x else None,
+        graph_y=np.array(graph_y, dtype=np.int64) if graph_y else None,
+      )
+      graph_tuples.append(
+        graph_tuple_lib.DataFlowGraphTuple(
+          graph_tuple=graph_tuple,
+          data_flow_root_node=annotation.graph.get("data_flow_root_node"),
+          data_flow_steps=annotation.graph.get("data_flow_steps"),
+          data_flow_positive_node_count=annotation.graph.get(
+            "data_flow_positive_node_count"
+          ),
+        )
+      )
+    return graph_tuples
+
+
+class DataFlowAnnotation(NamedTuple):
+  """The result of running a data flow analysis from a single root node."""
+
+  # The root node of the analysis.
+  root_node: int
+  # The nodes which are labelled as positive.
+  # Shape (?), dtype int:
+  positive_nodes: np.array
+  # The number of steps that the analysis required.
+  data_flow_steps: int
+  # The value to record as data_flow_positive_node_count. This is not
+  # necessarily len(positive_nodes), as some analyses count nodes that are
+  # visited multiple times.
+  data_flow_positive_node_count: int
+
+
+class AnnotationDataFlowGraphs(DataFlowGraphs):
+  """A set of data-flow annotated graphs which are stored as a list of
+  annotations of a single unlabelled graph.
+
+  Annotated graphs are only constructed when they are accessed, in whichever
+  representation is requested.
+  """
+
+  def __init__(
+    self,
+    unlabelled_graph: programl_pb2.ProgramGraph,
+    annotations: List[DataFlowAnnotation],
+    negative_y: List[int],
+    positive_y: List[int],
+  ):
+    self.unlabelled_graph = unlabelled_graph
+    self.annotations = annotations
+    self.negative_y = negative_y
+    self.positive_y = positive_y
+
+  @property
+  def graphs(self) -> List[nx.MultiDiGraph]:
+    """Construct annotated networkx graphs."""
+    if not self.annotations:
+      return []
+
+    g = programl.ProgramGraphToNetworkX(self.unlabelled_graph)
+    annotated_graphs = []
+    for annotation in self.annotations:
+      # Note that a deep copy is required to ensure that lists in x/y attributes
+      # are duplicated.
+      annotated_graph = copy.deepcopy(g)
+      positive_nodes = set(annotation.positive_nodes.tolist())
+      for node, data in annotated_graph.nodes(data=True):
+        data["x"].append(ROOT_NODE_NO)
+        data["y"] = (
+          self.positive_y if node in positive_nodes else self.negative_y
+        )
+      annotated_graph.nodes[annotation.root_node]["x"][-1] = ROOT_NODE_YES
+
+      annotated_graph.graph["data_flow_root_node"] = annotation.root_node
+      annotated_graph.graph["data_flow_steps"] = annotation.data_flow_steps
+      annotated_graph.graph[
+        "data_flow_positive_node_count"
+      ] = annotation.data_flow_positive_node_count
+      annotated_graphs.append(annotated_graph)
+    return annotated_graphs
+
+  @property
+  def protos(self) -> List[programl_pb2.ProgramGraph]:
+    """Construct annotated program graph protos."""
+    annotated_protos = []
+    for annotation in self.annotations:
+      positive = np.zeros(len(self.unlabelled_graph.node), dtype=bool)
+      positive[annotation.positive_nodes] = True
+
+      proto = programl_pb2.ProgramGraph()
+      proto.CopyFrom(self.unlabelled_graph)
+      for node, is_positive in zip(proto.node, positive):
+        node.x.append(ROOT_NODE_NO)
+        node.y[:] = self.positive_y if is_positive else self.negative_y
+      proto.node[annotation.root_node].x[-1] = ROOT_NODE_YES
+
+      proto.data_flow_root_node = annotation.root_node
+      proto.data_flow_steps = annotation.data_flow_steps
+      proto.data_flow_positive_node_count = (
+        annotation.data_flow_positive_node_count
+      )
+      annotated_protos.append(proto)
+    return annotated_protos
+
+  @property
+  def graph_tuples(self) -> List[graph_tuple_lib.DataFlowGraphTuple]:
+    """Construct annotated graph tuples from the unlabelled graph tuple."""
+    if not self.annotations:
+      return []
+
+    unlabelled = graph_tuple_lib.GraphTuple.CreateFromProgramGraph(
+      self.unlabelled_graph
+    )
+    negative_y = np.array(self.negative_y, dtype=np.int64)
+    positive_y = np.array(self.positive_y, dtype=np.int64)
+
+    graph_tuples = []
+    for annotation in self.annotations:
+      root_node_x = np.full(
+        (unlabelled.node_count, 1), ROOT_NODE_NO, dtype=np.int64
+      )
+      root_node_x[annotation.root_node] = ROOT_NODE_YES
+      node_y = np.tile(negative_y, (unlabelled.node_count, 1))
+      node_y[annotation.positive_nodes] = positive_y
+
+      graph_tuple = graph_tuple_lib.GraphTuple(
+        adjacencies=unlabelled.adjacencies,
+        edge_positions=unlabelled.edge_positions,
+        node_x=np.hstack((unlabelled.node_x, root_node_x)),
+        node_y=node_y,
+        graph_x=unlabelled.graph_x,
+        graph_y=unlabelled.graph_y,
+      )
+      graph_tuples.append(
+        graph_tuple_lib.DataFlowGraphTuple(
+          graph_tuple=graph_tuple,
+          data_flow_root_node=annotation.root_node,
+          data_flow_steps=annotation.data_flow_steps,
+          data_flow_positive_node_count=(
+            annotation.data_flow_positive_node_count
+          ),
+        )
+      )
+    return graph_tuples
+
+
 ###############################################################################
 # Analysis errors.
 ###############################################################################
@@ -172,17 +407,115 @@ class NetworkXDataFlowGraphAnnotator(DataFlowGraphAnnotator):
     else:
       root_nodes = self.root_nodes
 
-    annotated_graphs = []
+    annotations = []
     for root_node in root_nodes:
-      # Note that a deep copy is required to ensure that lists in x/y attributes
-      # are duplicated.
-      annotated_graph = copy.deepcopy(self.g)
-      self.Annotate(annotated_graph, root_node)
+      annotation = self.AnnotateInPlace(root_node)
+      # Ignore graphs that require no data flow steps.
+      if annotation:
+        annotations.append(annotation)
+
+    return NetworkXAnnotationDataFlowGraphs(self.g, annotations)
+
+  def AnnotateInPlace(self, root_node: int) -> Optional[NetworkXAnnotation]:
+    """Annotate the unlabelled graph from the given root node, and record the
+    changes made.
+
+    Rather than annotating a copy of the unlabelled graph, the graph is
+    annotated in-place and then restored to its original state.
+
+    Returns:
+      The annotation, or None if the analysis required no data flow steps.
+    """
+    x_lengths = [len(x) for _, x in self.g.nodes(data="x")]
+    ys = [y for _, y in self.g.nodes(data="y")]
+    graph = dict(self.g.graph)
+    try:
+      self.Annotate(self.g, root_node)
+      annotated_graph = dict(self.g.graph)
+      if not annotated_graph.get("data_flow_steps"):
+        return None
+
+      node_x_columns = np.array(
+        [
+          x[x_length:]
+          for (_, x), x_length in zip(self.g.nodes(data="x"), x_lengths)
+        ],
+        dtype=np.int64,
+      )
+      node_y = [y for _, y in self.g.nodes(data="y")]
+      node_y = np.array(node_y, dtype=np.int64) if all(node_y) else None
+      return NetworkXAnnotation(
+        node_x_columns=node_x_columns, node_y=node_y, graph=annotated_graph
+      )
+    finally:
+      for (_, data), x_length, y in zip(self.g.nodes(data=True), x_lengths, ys):
+        del data["x"][x_length:]
+        data["y"] = y
+      self.g.graph.clear()
+      self.g.graph.update(graph)
+
+
+class CsrDataFlowGraphAnnotator(DataFlowGraphAnnotator):
+  """A data flow annotator which runs over CSR adjacency arrays.
+
+  Subclasses produce identical annotations to their networkx counterparts, but
+  build the adjacency lists of the graph only once and perform analyses on
+  integer arrays rather than networkx graphs. Annotated graphs are only
+  constructed on access.
+  """
+
+  # The node_y values for nodes which are labelled as negative and positive.
+  # Set by subclasses.
+  negative_y: List[int] = None
+  positive_y: List[int] = None
+
+  def __init__(self, *args, **kwargs):
+    super(CsrDataFlowGraphAnnotator, self).__init__(*args, **kwargs)
+    self.graph = csr_graph.CsrGraph(self.unlabelled_graph)
+    self.root_nodes = self.GetRootNodes().tolist()
+
+  def GetRootNodes(self) -> np.array:
+    """Return the nodes which can be used as a root node, in ascending order."""
+    raise NotImplementedError("abstract class")
+
+  def Annotate(self, root_node: int) -> DataFlowAnnotation:
+    """Run the analysis from the given root node."""
+    raise NotImplementedError("abstract class")
+
+  def MakeAnnotated(self, n: int = 0) -> DataFlowGraphs:
+    """Produce up to "n" annotated graphs.
+
+    Args:
+      n: The maximum number of annotated graphs to produce. Multiple graphs are
+        produced by selecting different root nodes for creating annotations.
+        If `n` is provided, the number of annotated graphs generated will be in
+        the range 1 <= x <= min(root_node_count, n). Else, the number of graphs
+        will be equal to root_node_count (i.e. one graph for each root node in
+        the input graph).
+
+    Returns:
+      An AnnotatedGraph instance.
+
+    Raises:
+      AnalysisFailed: If the analysis fails.
+      AnalysisTimeout: If the analysis times out.
+    """
+    if n and n < len(self.root_nodes):
+      random.shuffle(self.root_nodes)
+      root_nodes = self.root_nodes[:n]
+    else:
+      root_nodes = self.root_nodes
+
+    annotations = []
+    for root_node in root_nodes:
+      annotation = self.Annotate(root_node)
       # Ignore graphs that require no data flow steps.
-      if annotated_graph.graph["data_flow_steps"]:
-        annotated_graphs.append(annotated_graph)
+      if annotation.data_flow_steps:
+        annotations.append(annotation)
 
-    return NetworkxDataFlowGraphs(annotated_graphs)
+    return AnnotationDataFlowGraphs(
+      self.unlabelled_graph, annotations, self.negative_y, self.positive_y
+    )
 
 
 # The x value for specifying the root node for iterative data flow analyses
@@ -18,9 +18,11 @@ from typing import List
 from typing import Optional
 
 import networkx as nx
+import numpy as np
 
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
+from deeplearning.ml4pl.graphs.labelled import graph_tuple
 from deeplearning.ml4pl.graphs.labelled.dataflow import data_flow_graphs
 from labm8.py import test
 
@@ -60,6 +62,58 @@ class MockNetworkXDataFlowGraphAnnotator(
     g.graph["data_flow_steps"] = 1
 
 
+class MockCsrDataFlowGraphAnnotator(data_flow_graphs.CsrDataFlowGraphAnnotator):
+  """A mock CSR annotator for testing."""
+
+  negative_y = [1, 0]
+  positive_y = [0, 1]
+
+  def GetRootNodes(self) -> np.array:
+    """The root node type."""
+    return np.where(self.graph.node_type == programl_pb2.Node.STATEMENT)[0]
+
+  def Annotate(self, root_node: int) -> data_flow_graphs.DataFlowAnnotation:
+    """Label the root node as positive, and use the root node as the number of
+    data flow steps.
+    """
+    return data_flow_graphs.DataFlowAnnotation(
+      root_node=root_node,
+      positive_nodes=np.array([root_node]),
+      data_flow_steps=root_node,
+      data_flow_positive_node_count=1,
+    )
+
+
+def AssertGraphTupleEqualsNetworkX(
+  data_flow_graph_tuple: graph_tuple.DataFlowGraphTuple,
+  g: nx.MultiDiGraph,
+):
+  """Check that a data flow graph tuple is equal to a networkx graph."""
+  expected = graph_tuple.GraphTuple.CreateFromNetworkX(g)
+  actual = data_flow_graph_tuple.graph_tuple
+  for flow in range(3):
+    assert np.array_equal(actual.adjacencies[flow], expected.adjacencies[flow])
+    assert np.array_equal(
+      actual.edge_positions[flow], expected.edge_positions[flow]
+    )
+  for attr in ("node_x", "node_y", "graph_x", "graph_y"):
+    if getattr(expected, attr) is None:
+      assert getattr(actual, attr) is None
+    else:
+      assert np.array_equal(getattr(actual, attr), getattr(expected, attr))
+      assert getattr(actual, attr).dtype == getattr(expected, attr).dtype
+
+  assert data_flow_graph_tuple.data_flow_root_node == g.graph.get(
+    "data_flow_root_node"
+  )
+  assert data_flow_graph_tuple.data_flow_steps == g.graph.get(
+    "data_flow_steps"
+  )
+  assert data_flow_graph_tuple.data_flow_positive_node_count == g.graph.get(
+    "data_flow_positive_node_count"
+  )
+
+
 def test_IsValidRootNode():
   """Test that root nodes are correctly selected."""
   builder = programl.GraphBuilder()
@@ -162,5 +216,115 @@ def test_MakeAnnotated_graph_subset_of_root_nodes():
   assert len(annotated.protos) == 25
 
 
+def test_MakeAnnotated_unlabelled_graph_is_not_modified():
+  """Test that annotating does not modify the annotator's graph."""
+  builder = programl.GraphBuilder()
+  for _ in range(3):
+    builder.AddNode(x=[5])
+  builder.AddEdge(0, 1)
+  annotator = MockNetworkXDataFlowGraphAnnotator(builder.proto, node_y=[1, 2])
+  unlabelled = programl.ProgramGraphToNetworkX(builder.proto)
+
+  annotated = annotator.MakeAnnotated()
+  assert len(annotated.graphs) == 3
+
+  assert annotator.g.graph == unlabelled.graph
+  assert list(annotator.g.nodes(data=True)) == list(
+    unlabelled.nodes(data=True)
+  )
+
+
+@test.Parametrize("node_y", (None, [1, 2]), names=("unlabelled", "labelled"))
+def test_MakeAnnotated_graph_tuples(node_y: Optional[List[int]]):
+  """Test that graph tuples match the annotated networkx graphs."""
+  builder = programl.GraphBuilder()
+  for i in range(10):
+    builder.AddNode(x=[i, -1])
+  builder.AddEdge(0, 1, position=2)
+  builder.AddEdge(1, 2, flow=programl_pb2.Edge.DATA)
+  builder.AddEdge(0, 1)
+  annotator = MockNetworkXDataFlowGraphAnnotator(builder.proto, node_y=node_y)
+
+  annotated = annotator.MakeAnnotated()
+  assert len(annotated.graph_tuples) == 10
+  for data_flow_graph_tuple, g in zip(
+    annotated.graph_tuples, annotated.graphs
+  ):
+    AssertGraphTupleEqualsNetworkX(data_flow_graph_tuple, g)
+
+
+def test_AnnotationDataFlowGraphs_graphs_and_protos():
+  """Test that annotations produce equivalent networkx graphs and protos."""
+  builder = programl.GraphBuilder()
+  for _ in range(3):
+    builder.AddNode(x=[5])
+  builder.AddEdge(0, 1)
+  annotated = data_flow_graphs.AnnotationDataFlowGraphs(
+    builder.proto,
+    [
+      data_flow_graphs.DataFlowAnnotation(
+        root_node=1,
+        positive_nodes=np.array([1, 2]),
+        data_flow_steps=3,
+        data_flow_positive_node_count=4,
+      )
+    ],
+    negative_y=[1, 0],
+    positive_y=[0, 1],
+  )
+
+  assert len(annotated.graphs) == 1
+  graph = annotated.graphs[0]
+  assert [data["x"] for _, data in graph.nodes(data=True)] == [
+    [5, 0],
+    [5, 1],
+    [5, 0],
+  ]
+  assert [data["y"] for _, data in graph.nodes(data=True)] == [
+    [1, 0],
+    [0, 1],
+    [0, 1],
+  ]
+  assert graph.number_of_edges() == 1
+  assert graph.graph["data_flow_root_node"] == 1
+  assert graph.graph["data_flow_steps"] == 3
+  assert graph.graph["data_flow_positive_node_count"] == 4
+
+  assert len(annotated.protos) == 1
+  proto = annotated.protos[0]
+  assert [node.x for node in proto.node] == [[5, 0], [5, 1], [5, 0]]
+  assert [node.y for node in proto.node] == [[1, 0], [0, 1], [0, 1]]
+  assert len(proto.edge) == 1
+  assert proto.data_flow_root_node == 1
+  assert proto.data_flow_steps == 3
+  assert proto.data_flow_positive_node_count == 4
+
+  assert len(annotated.graph_tuples) == 1
+  AssertGraphTupleEqualsNetworkX(annotated.graph_tuples[0], graph)
+
+  # The unlabelled graph is not modified.
+  assert [node.x for node in builder.proto.node] == [[5], [5], [5]]
+
+
+def test_CsrDataFlowGraphAnnotator_MakeAnnotated():
+  """Test that annotations which require no data flow steps are ignored."""
+  builder = programl.GraphBuilder()
+  builder.AddNode(type=programl_pb2.Node.STATEMENT)
+  builder.AddNode(type=programl_pb2.Node.IDENTIFIER)
+  builder.AddNode(type=programl_pb2.Node.STATEMENT)
+  annotator = MockCsrDataFlowGraphAnnotator(builder.proto)
+  assert annotator.root_nodes == [0, 2]
+
+  annotated = annotator.MakeAnnotated()
+  assert len(annotated.graphs) == 1
+  assert len(annotated.protos) == 1
+  assert annotated.protos[0].data_flow_root_node == 2
+  assert [node.y for node in annotated.protos[0].node] == [
+    [1, 0],
+    [1, 0],
+    [0, 1],
+  ]
+
+
 if __name__ == "__main__":
   test.Main()
@@ -14,11 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/labelled/dataflow/datadep:data_dependence."""
+import random
+
 from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow import data_flow_graphs
 from deeplearning.ml4pl.graphs.labelled.dataflow.datadep import data_dependence
 from deeplearning.ml4pl.testing import random_programl_generator
+from deeplearning.ml4pl.testing import test_annotators
+from labm8.py import decorators
 from labm8.py import test
 
 FLAGS = test.FLAGS
@@ -90,5 +94,47 @@ def test_MakeAnnotated_real_protos(real_proto: programl_pb2.ProgramGraph,):
   assert len(annotated.graphs) <= 10
 
 
+def test_CsrDataDependencyAnnotator_Annotate():
+  builder = programl.GraphBuilder()
+  A = builder.AddNode(x=[-1])
+  B = builder.AddNode(x=[-1])
+  C = builder.AddNode(x=[-1])
+  D = builder.AddNode(x=[-1])
+  builder.AddEdge(A, B, flow=programl_pb2.Edge.DATA)
+  builder.AddEdge(A, C, flow=programl_pb2.Edge.DATA)
+  builder.AddEdge(C, D, flow=programl_pb2.Edge.DATA)
+
+  annotator = data_dependence.CsrDataDependencyAnnotator(builder.proto)
+  annotation = annotator.Annotate(D)
+
+  assert annotation.positive_nodes.tolist() == [A, C, D]
+  assert annotation.data_flow_steps == 3
+  assert annotation.data_flow_positive_node_count == 3
+
+
+def test_CsrDataDependencyAnnotator_equivalence_real_protos(
+  real_proto: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    real_proto,
+    data_dependence.DataDependencyAnnotator,
+    data_dependence.CsrDataDependencyAnnotator,
+    n=10,
+  )
+
+
+@decorators.loop_for(seconds=30)
+def test_fuzz_CsrDataDependencyAnnotator_equivalence():
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    random_programl_generator.CreateRandomProto(),
+    data_dependence.DataDependencyAnnotator,
+    data_dependence.CsrDataDependencyAnnotator,
+    n=random.randint(1, 20),
+    seed=random.randint(0, 1 << 16),
+  )
+
+
 if __name__ == "__main__":
   test.Main()
@@ -19,6 +19,7 @@ from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow.domtree import dominator_tree
 from deeplearning.ml4pl.testing import random_networkx_generator
 from deeplearning.ml4pl.testing import random_programl_generator
+from deeplearning.ml4pl.testing import test_annotators
 from labm8.py import test
 
 FLAGS = test.FLAGS
@@ -180,6 +181,52 @@ def test_MakeAnnotated_real_protos(real_proto: programl_pb2.ProgramGraph,):
   assert len(annotated.graphs) <= 10
 
 
+@test.Parametrize("root_node", (0, 1, 2, 3, 4))
+def test_CsrDominatorTreeAnnotator_Annotate_g2(
+  g2: programl_pb2.ProgramGraph, root_node: int
+):
+  """Test that the CSR annotator matches the networkx annotator for each root
+  node.
+  """
+  annotator = dominator_tree.DominatorTreeAnnotator(g2)
+  g = annotator.g
+  annotator.Annotate(g, root_node)
+
+  annotation = dominator_tree.CsrDominatorTreeAnnotator(g2).Annotate(root_node)
+
+  assert annotation.positive_nodes.tolist() == [
+    node for node, y in g.nodes(data="y") if y == dominator_tree.DOMINATED
+  ]
+  assert annotation.data_flow_steps == g.graph["data_flow_steps"]
+  assert (
+    annotation.data_flow_positive_node_count
+    == g.graph["data_flow_positive_node_count"]
+  )
+
+
+def test_CsrDominatorTreeAnnotator_equivalence_g1(
+  g1: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    g1,
+    dominator_tree.DominatorTreeAnnotator,
+    dominator_tree.CsrDominatorTreeAnnotator,
+  )
+
+
+def test_CsrDominatorTreeAnnotator_equivalence_real_protos(
+  real_proto: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    real_proto,
+    dominator_tree.DominatorTreeAnnotator,
+    dominator_tree.CsrDominatorTreeAnnotator,
+    n=10,
+  )
+
+
 # Note we can't fuzz domtree with randomly generated protos because domtree
 # uses nodes' functions to scope the set of predecessor that need to be
 # computed, and the random proto generator does not enforce that control edges
@@ -18,6 +18,7 @@ from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow.liveness import liveness
 from deeplearning.ml4pl.testing import random_programl_generator
+from deeplearning.ml4pl.testing import test_annotators
 from labm8.py import test
 
 FLAGS = test.FLAGS
@@ -578,5 +579,46 @@ def test_MakeAnnotated_real_graphs(real_graph: programl_pb2.ProgramGraph,):
     assert graph.graph["data_flow_steps"] >= 1
 
 
+def test_CsrLivenessAnnotator_equivalence_wiki(wiki: programl_pb2.ProgramGraph):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    wiki, liveness.LivenessAnnotator, liveness.CsrLivenessAnnotator
+  )
+
+
+def test_CsrLivenessAnnotator_equivalence_graph(
+  graph: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    graph, liveness.LivenessAnnotator, liveness.CsrLivenessAnnotator
+  )
+
+
+def test_CsrLivenessAnnotator_equivalence_while_loop(
+  while_loop: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    while_loop, liveness.LivenessAnnotator, liveness.CsrLivenessAnnotator
+  )
+
+
+def test_CsrLivenessAnnotator_equivalence_real_graphs(
+  real_graph: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    real_graph,
+    liveness.LivenessAnnotator,
+    liveness.CsrLivenessAnnotator,
+    n=10,
+  )
+
+
+# Note we don't fuzz liveness with randomly generated protos because the
+# networkx annotator may not terminate on graphs with arbitrary control flow.
+
+
 if __name__ == "__main__":
   test.Main()
@@ -16,20 +16,20 @@
 """This module prepares datasets for data flow analyses."""
 import multiprocessing
 import pathlib
-import resource
 import sys
 import time
 import traceback
 from typing import Iterable
 from typing import List
 from typing import NamedTuple
+from typing import Optional
 from typing import Tuple
 
 import psutil
 import sqlalchemy as sql
 
-from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_shards
 from deeplearning.ml4pl.graphs.labelled.dataflow import annotate
 from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
 from labm8.py import app
@@ -102,8 +102,8 @@ app.DEFINE_integer(
 app.DEFINE_boolean(
   "limit_worker_mem",
   False,
-  "Tuning parameter. If set, this adds an rlimit on the per-worker process "
-  "memory consumption.",
+  "Tuning parameter. If set, this adds an rlimit on the memory consumption of "
+  "each worker's annotation subprocess.",
 )
 app.DEFINE_float(
   "worker_mem_util",
@@ -189,11 +189,40 @@ class AnnotationResult(NamedTuple):
   graph_tuples: List[graph_tuple_database.GraphTuple]
 
 
+# The annotation worker of this process. This is created by the first call to
+# GetAnnotationWorker() and reused across all batches processed by this process.
+_annotation_worker: Optional[annotate.AnnotationWorker] = None
+
+
+def GetAnnotationWorker(
+  analysis: str, max_mem_size: Optional[int]
+) -> annotate.AnnotationWorker:
+  """Return the annotation worker of this process.
+
+  The worker subprocess enforces the timeout and memory limit of each analysis,
+  so that a misbehaving graph cannot take down the process pool worker.
+  """
+  global _annotation_worker
+  if _annotation_worker and (
+    _annotation_worker.analysis,
+    _annotation_worker.n,
+    _annotation_worker.max_mem_size,
+  ) != (analysis, FLAGS.n, max_mem_size):
+    _annotation_worker.Close()
+    _annotation_worker = None
+  if _annotation_worker is None:
+    _annotation_worker = annotate.AnnotationWorker(
+      analysis, n=FLAGS.n, max_mem_size=max_mem_size
+    )
+  return _annotation_worker
+
+
 def ProcessWorker(packed_args) -> AnnotationResult:
   """The process pool worker function.
 
   Accepts a batch of unlabelled graphs as inputs, labels them, and returns
-  a list of graph tuples.
+  a list of graph tuples. If --graph_tuple_shards_dir is set, the labelled
+  graph tuples are written to new shards before they are returned.
   """
   start_time = time.time()
 
@@ -206,12 +235,15 @@ def ProcessWorker(packed_args) -> AnnotationResult:
   program_graphs: List[ProgramGraphProto] = packed_args[3]
   ctx: progress.ProgressBarContext = packed_args[4]
 
-  # Set the hard limit on the memory size. Exceeding this limit will raise
-  # a MemoryError.
-  if FLAGS.limit_worker_mem:
-    resource.setrlimit(resource.RLIMIT_DATA, (max_mem_size, max_mem_size))
-    resource.setrlimit(resource.RLIMIT_AS, (max_mem_size, max_mem_size))
+  annotation_worker = GetAnnotationWorker(
+    analysis, max_mem_size if FLAGS.limit_worker_mem else None
+  )
 
+  shard_writer = (
+    graph_tuple_shards.ShardWriter(FLAGS.graph_tuple_shards_dir)
+    if FLAGS.graph_tuple_shards_dir
+    else None
+  )
   graph_tuples = []
 
   ctx.Log(
@@ -230,21 +262,17 @@ def ProcessWorker(packed_args) -> AnnotationResult:
   ):
     for i, program_graph in enumerate(program_graphs):
       try:
-        annotated_graphs = annotate.Annotate(
-          analysis,
-          programl.FromBytes(
-            program_graph.serialized_proto, programl.InputOutputFormat.PB
-          ),
-          n=FLAGS.n,
-          timeout=FLAGS.annotator_timeout,
+        annotated_graph_tuples = annotation_worker.Annotate(
+          program_graph.serialized_proto, timeout=FLAGS.annotator_timeout,
         )
-
-        if annotated_graphs.graphs:
+        if annotated_graph_tuples:
           # Record the annotated analysis results.
-          for annotated_graph in annotated_graphs.graphs:
+          for annotated_graph_tuple in annotated_graph_tuples:
             graph_tuples.append(
-              graph_tuple_database.GraphTuple.CreateFromNetworkX(
-                annotated_graph, ir_id=program_graph.ir_id
+              graph_tuple_database.GraphTuple.CreateFromDataFlowGraphTuple(
+                annotated_graph_tuple,
+                ir_id=program_graph.ir_id,
+                shard_writer=shard_writer,
               )
             )
         else:
@@ -274,6 +302,10 @@ def ProcessWorker(packed_args) -> AnnotationResult:
           graph_tuple_database.GraphTuple.CreateEmpty(ir_id=program_graph.ir_id)
         )
 
+    # Write the shards before returning the rows which point to them.
+    if shard_writer:
+      shard_writer.Flush()
+
   return AnnotationResult(
     runtime=time.time() - start_time,
     proto_count=len(program_graphs),
@@ -406,6 +438,9 @@ class DatasetGenerator(progress.Progress):
       humanize.BinaryPrefix(per_worker_memory, "B", precision=2),
     )
 
+    if FLAGS.graph_tuple_shards_dir:
+      self.output_db.SetShardsDirectory(FLAGS.graph_tuple_shards_dir)
+
     pool = multiprocessing.Pool(
       processes=FLAGS.nproc, maxtasksperchild=FLAGS.max_tasks_per_worker
     )
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/labelled/dataflow:make_data_flow_analysis_dataset."""
+import pathlib
+
 import sqlalchemy as sql
 
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
@@ -287,5 +289,35 @@ def test_empty_analysis(
     )
 
 
+def test_pass_thru_analysis_sharded(
+  proto_db: unlabelled_graph_database.Database,
+  graph_db: graph_tuple_database.Database,
+  tempdir: pathlib.Path,
+):
+  """Test that graph tuples are written to shards when a shards directory is
+  set."""
+  FLAGS.n = 1
+  FLAGS.graph_tuple_shards_dir = tempdir
+  try:
+    progress.Run(
+      make_data_flow_analysis_dataset.DatasetGenerator(
+        input_db=proto_db,
+        analysis="test_pass_thru",
+        output_db=graph_db,
+        order_by="in_order",
+      )
+    )
+  finally:
+    FLAGS.graph_tuple_shards_dir = None
+
+  with graph_db.Session() as session:
+    graph_tuples = session.query(graph_tuple_database.GraphTuple).all()
+    assert graph_tuples
+    for graph_tuple in graph_tuples:
+      assert graph_tuple.is_sharded
+      assert graph_tuple.tuple.node_count == graph_tuple.node_count
+    assert not session.query(graph_tuple_database.GraphTupleData).count()
+
+
 if __name__ == "__main__":
   test.Main()
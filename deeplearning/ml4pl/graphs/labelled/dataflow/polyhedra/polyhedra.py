@@ -18,11 +18,11 @@ import typing
 
 import networkx as nx
 import numpy as np
-import pydot
 
 from compilers.llvm import opt
 from compilers.llvm import opt_util
 from deeplearning.ml4pl.graphs.unlabelled.llvm2graph import graph_builder
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import dot_parser
 from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import llvm_util
 from labm8.py import app
 from labm8.py import decorators
@@ -31,24 +31,27 @@ from labm8.py import decorators
 FLAGS = app.FLAGS
 
 
-def RecursePydot(
-  subgraph: pydot.Dot,
-  func: typing.Callable[[pydot.Dot, typing.Any], None],
+def RecurseDot(
+  subgraph: dot_parser.DotGraph,
+  func: typing.Callable[[dot_parser.DotGraph, typing.Any], None],
   state: typing.Any,
 ):
   func(subgraph, state)
   for ss in subgraph.get_subgraphs():
-    RecursePydot(ss, func, state)
+    RecurseDot(ss, func, state)
 
 
-def SubNodes(subgraph: pydot.Dot, nodes: typing.List[typing.Any]):
+def SubNodes(subgraph: dot_parser.DotGraph, nodes: typing.List[typing.Any]):
   nodes.extend(subgraph.get_nodes())
 
 
-def GetSubgraph(subgraph: pydot.Dot, state: typing.Dict[pydot.Dot, typing.Any]):
+def GetSubgraph(
+  subgraph: dot_parser.DotGraph,
+  state: typing.Dict[dot_parser.DotGraph, typing.Any],
+):
   if subgraph.get("style") == "filled":
     nodes = []
-    RecursePydot(subgraph, SubNodes, nodes)
+    RecurseDot(subgraph, SubNodes, nodes)
     state[subgraph] = nodes
 
 
@@ -56,20 +59,17 @@ class PolyhedralRegionAnnotator(llvm_util.TagHook):
   """Tag hook that annotates polyhedral regions on the nodes (with the attribute
   `polyhedral=True`)"""
 
-  def OnGraphBegin(self, dot: pydot.Dot):
-    # Get polyhedral basic blocks from Polly and pydot
+  def OnGraphBegin(self, dot: dot_parser.DotGraph):
+    # Get polyhedral basic blocks from Polly
     # Obtain all basic blocks in polyhedral region (need to recurse into sub-subgraphs)
     self.regions = {}
-    RecursePydot(dot, GetSubgraph, self.regions)
-
-  def OnNode(self, node: pydot.Node) -> typing.Dict[str, typing.Any]:
-    for region in self.regions.values():
-      if node.get_name() in [
-        str(r)[:-1] for r in region
-      ]:  # Need to cut off semicolon
-        return {"polyhedral": True}
+    RecurseDot(dot, GetSubgraph, self.regions)
+    self.polyhedral_node_names = {
+      r.get_name() for region in self.regions.values() for r in region
+    }
 
-    return {"polyhedral": False}
+  def OnNode(self, node: dot_parser.DotNode) -> typing.Dict[str, typing.Any]:
+    return {"polyhedral": node.get_name() in self.polyhedral_node_names}
 
   def OnInstruction(
     self, node_attrs: typing.Dict[str, typing.Any], instruction: str
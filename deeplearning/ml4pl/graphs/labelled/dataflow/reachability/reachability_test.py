@@ -22,6 +22,7 @@ from deeplearning.ml4pl.graphs.labelled.dataflow.reachability import (
   reachability,
 )
 from deeplearning.ml4pl.testing import random_programl_generator
+from deeplearning.ml4pl.testing import test_annotators
 from labm8.py import decorators
 from labm8.py import test
 
@@ -120,5 +121,48 @@ def test_fuzz_MakeAnnotated():
   assert len(annotated.protos) <= 20
 
 
+def test_CsrReachabilityAnnotator_Annotate(graph: programl_pb2.ProgramGraph):
+  annotator = reachability.CsrReachabilityAnnotator(graph)
+  annotation = annotator.Annotate(1)
+  assert annotation.positive_nodes.tolist() == [1, 2, 3]
+  assert annotation.data_flow_steps == 3
+  assert annotation.data_flow_positive_node_count == 3
+
+
+def test_CsrReachabilityAnnotator_equivalence(
+  graph: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    graph,
+    reachability.ReachabilityAnnotator,
+    reachability.CsrReachabilityAnnotator,
+  )
+
+
+def test_CsrReachabilityAnnotator_equivalence_real_graphs(
+  real_graph: programl_pb2.ProgramGraph,
+):
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    real_graph,
+    reachability.ReachabilityAnnotator,
+    reachability.CsrReachabilityAnnotator,
+    n=10,
+  )
+
+
+@decorators.loop_for(seconds=30)
+def test_fuzz_CsrReachabilityAnnotator_equivalence():
+  """Test that the CSR annotator produces the same graphs as networkx."""
+  test_annotators.AssertAnnotatorsAreEquivalent(
+    random_programl_generator.CreateRandomProto(),
+    reachability.ReachabilityAnnotator,
+    reachability.CsrReachabilityAnnotator,
+    n=random.randint(1, 20),
+    seed=random.randint(0, 1 << 16),
+  )
+
+
 if __name__ == "__main__":
   test.Main()
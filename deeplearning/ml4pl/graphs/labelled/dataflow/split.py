@@ -14,7 +14,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Split a labelled graph database into {train,val,test} sets."""
-import sqlalchemy as sql
 
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.ir import ir_database
@@ -47,12 +46,10 @@ class TrainValTestSplitter(ir_split.TrainValTestSplitter):
         f"Set {split} split on {humanize.Plural(len(ir_ids), 'IR')}"
       ):
         for chunk in labtypes.Chunkify(ir_ids, 10000):
-          update = (
-            sql.update(graph_tuple_database.GraphTuple)
-            .where(graph_tuple_database.GraphTuple.ir_id.in_(chunk))
-            .values(split=split)
-          )
-          graph_db.engine.execute(update)
+          with graph_db.Session(commit=True) as session:
+            session.query(graph_tuple_database.GraphTuple).filter(
+              graph_tuple_database.GraphTuple.ir_id.in_(chunk)
+            ).update({"split": split}, synchronize_session=False)
 
 
 def CopySplits(
@@ -62,8 +59,10 @@ def CopySplits(
   """Propagate the `split` column from one database to another."""
   # Unset splits on output database.
   with prof.Profile(f"Unset splits on {output_db.graph_count} graphs"):
-    update = sql.update(graph_tuple_database.GraphTuple).values(split=None)
-    output_db.engine.execute(update)
+    with output_db.Session(commit=True) as session:
+      session.query(graph_tuple_database.GraphTuple).update(
+        {"split": None}, synchronize_session=False
+      )
 
   # Copy each split one at a time.
   for split in input_db.splits:
@@ -76,12 +75,10 @@ def CopySplits(
           ).filter(graph_tuple_database.GraphTuple.split == split)
         ]
 
-      update = (
-        sql.update(graph_tuple_database.GraphTuple)
-        .where(graph_tuple_database.GraphTuple.id.in_(ids_to_set))
-        .values(split=split)
-      )
-      output_db.engine.execute(update)
+      with output_db.Session(commit=True) as session:
+        session.query(graph_tuple_database.GraphTuple).filter(
+          graph_tuple_database.GraphTuple.id.in_(ids_to_set)
+        ).update({"split": split}, synchronize_session=False)
 
 
 def main():
@@ -17,7 +17,6 @@
 from typing import List
 
 import numpy as np
-import sqlalchemy as sql
 from sklearn import model_selection
 
 from deeplearning.ml4pl.graphs.labelled import graph_database_reader
@@ -79,12 +78,10 @@ class StratifiedGraphLabelKFold(object):
       with prof.Profile(
         f"Set {split} split on {humanize.Plural(len(ids), 'row')}"
       ):
-        update = (
-          sql.update(graph_tuple_database.GraphTuple)
-          .where(graph_tuple_database.GraphTuple.id.in_(ids))
-          .values(split=split)
-        )
-        db.engine.execute(update)
+        with db.Session(commit=True) as session:
+          session.query(graph_tuple_database.GraphTuple).filter(
+            graph_tuple_database.GraphTuple.id.in_(ids)
+          ).update({"split": split}, synchronize_session=False)
 
 
 def CopySplits(
@@ -94,8 +91,10 @@ def CopySplits(
   """Propagate the `split` column from one database to another."""
   # Unset splits on output database.
   with prof.Profile(f"Unset splits on {output_db.graph_count} graphs"):
-    update = sql.update(graph_tuple_database.GraphTuple).values(split=None)
-    output_db.engine.execute(update)
+    with output_db.Session(commit=True) as session:
+      session.query(graph_tuple_database.GraphTuple).update(
+        {"split": None}, synchronize_session=False
+      )
 
   # Copy each split one at a time.
   for split in input_db.splits:
@@ -108,12 +107,10 @@ def CopySplits(
           ).filter(graph_tuple_database.GraphTuple.split == split)
         ]
 
-      update = (
-        sql.update(graph_tuple_database.GraphTuple)
-        .where(graph_tuple_database.GraphTuple.id.in_(ids_to_set))
-        .values(split=split)
-      )
-      output_db.engine.execute(update)
+      with output_db.Session(commit=True) as session:
+        session.query(graph_tuple_database.GraphTuple).filter(
+          graph_tuple_database.GraphTuple.id.in_(ids_to_set)
+        ).update({"split": split}, synchronize_session=False)
 
 
 def main():
@@ -25,12 +25,16 @@ This can be executed as a script to dump graph tuples to file, example:
           --vmodule='*'=3
 """
 import pathlib
+from typing import Callable
+from typing import Dict
 from typing import Iterable
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 from deeplearning.ml4pl.graphs.labelled import graph_database_reader
 from deeplearning.ml4pl.graphs.labelled import graph_tuple
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from labm8.py import app
 from labm8.py import progress
 
@@ -53,6 +57,15 @@ app.DEFINE_integer(
   0,
   "The maximum number of nodes to include in a batch of graphs.",
 )
+app.DEFINE_integer(
+  "graph_batch_lookahead",
+  0,
+  "Tuning parameter. When batching by --graph_batch_node_count, the number of "
+  "graphs to hold in a lookahead window. Batches are packed from the window "
+  "using first-fit-decreasing, rather than filled in the order that graphs "
+  "are read, so that batches are closer to the node count budget. If zero, "
+  "batches are filled in order.",
+)
 app.DEFINE_string(
   "max_node_count_limit_handler",
   "error",
@@ -82,7 +95,9 @@ class GraphBatcher(object):
     exact_graph_count: int = 0,
     max_node_count: int = 0,
     max_node_count_limit_handler: str = "error",
+    lookahead: int = 0,
     ctx: progress.ProgressContext = progress.NullContext,
+    on_skip: Optional[Callable[[graph_tuple.GraphTuple], None]] = None,
   ):
     """Constructor.
 
@@ -100,19 +115,43 @@ class GraphBatcher(object):
         (skip the graph but print a warning), error (raise an error), or
         include (include the graph in the batch anyway). Has no effect when
         max_node_count is not set.
+      lookahead: The number of graphs to hold in a lookahead window when
+        batching by max_node_count. Each batch contains the oldest graph in the
+        window, plus as many other graphs from the window as fit, visited in
+        order of decreasing node count. The window is refilled as graphs are
+        batched. This produces batches which are closer to max_node_count than
+        filling in order, and no graph is delayed by more than lookahead
+        batches. If zero, or if max_node_count or
+        exact_graph_count are not set, batches are filled in order.
       ctx: A progress context.
+      on_skip: An optional callback which is called with every graph that is
+        skipped because it is larger than max_node_count.
     """
     self.graphs = graphs
     self.max_graph_count = max_graph_count
     self.exact_graph_count = exact_graph_count
     self.max_node_count = max_node_count
     self.max_node_count_limit_handler = max_node_count_limit_handler
+    self.lookahead = lookahead
     self.ctx = ctx
+    self.on_skip = on_skip
 
     # Hold onto the last read graph so that if we don't decide to include it in
     # a batch we may still include it in subsequent batches.
     self.last_graph: Optional[graph_tuple.GraphTuple] = None
 
+    # The lookahead window of graphs which have been read but not yet batched,
+    # in the order that they were read.
+    self.window: List[graph_tuple.GraphTuple] = []
+    self.graphs_exhausted = False
+
+    # The input graphs of the most recently returned batch.
+    self.batch_graphs: List[graph_tuple.GraphTuple] = []
+
+    # Counters used to compute the fill ratio of batches.
+    self.batch_count = 0
+    self.batched_node_count = 0
+
   def __iter__(self):
     return self
 
@@ -123,6 +162,39 @@ class GraphBatcher(object):
       A batch of graphs as a disjointed graph tuple. If there are no graphs to
       batch then None is returned.
     """
+    if self.lookahead and self.max_node_count and not self.exact_graph_count:
+      graphs = self._PackBatchFromWindow()
+    else:
+      graphs = self._FillBatchInOrder()
+
+    if self.exact_graph_count and len(graphs) != self.exact_graph_count:
+      # We require batches of an exact size, but we don't have that many
+      # graphs to return.
+      raise StopIteration
+    if graphs:
+      # We have graphs to batch.
+      self.batch_graphs = graphs
+      self.batch_count += 1
+      self.batched_node_count += sum(graph.node_count for graph in graphs)
+      return graph_tuple.GraphTuple.FromGraphTuples(graphs)
+    else:
+      raise StopIteration
+
+  @property
+  def fill_ratio(self) -> Optional[float]:
+    """The mean ratio of batch node counts to max_node_count.
+
+    Returns:
+      A ratio in the range [0, 1] (or greater, if graphs larger than
+      max_node_count are included), or None if max_node_count is not set or no
+      batches have been produced.
+    """
+    if not self.max_node_count or not self.batch_count:
+      return None
+    return self.batched_node_count / (self.batch_count * self.max_node_count)
+
+  def _FillBatchInOrder(self) -> List[graph_tuple.GraphTuple]:
+    """Fill a batch greedily with graphs in the order that they are read."""
     graphs: List[graph_tuple.GraphTuple] = []
     node_count = 0
 
@@ -158,27 +230,73 @@ class GraphBatcher(object):
       # Pop the last visited graph.
       self.last_graph = None
 
-    if self.exact_graph_count and len(graphs) != self.exact_graph_count:
-      # We require batches of an exact size, but we don't have that many
-      # graphs to return.
-      raise StopIteration
-    if graphs:
-      # We have graphs to batch.
-      return graph_tuple.GraphTuple.FromGraphTuples(graphs)
-    else:
-      raise StopIteration
+    return graphs
+
+  def _PackBatchFromWindow(self) -> List[graph_tuple.GraphTuple]:
+    """Pack a batch with graphs from the lookahead window."""
+    graphs: List[graph_tuple.GraphTuple] = []
+    node_count = 0
+
+    while True:
+      # Top up the lookahead window.
+      while len(self.window) < self.lookahead and not self.graphs_exhausted:
+        graph = self._ReadNextGraph()
+        if graph:
+          self.window.append(graph)
+
+      # Visit the window in order of decreasing node count, except for the
+      # oldest graph of the batch, which is always included so that no graph
+      # waits in the window for more than lookahead batches. Because the input
+      # graphs are read in a random order, this also preserves the randomness
+      # of batch composition. Python's sort is stable, so graphs of equal size
+      # are visited in the order that they were read.
+      order = sorted(
+        range(len(self.window)),
+        key=lambda i: self.window[i].node_count,
+        reverse=True,
+      )
+      if not graphs and self.window:
+        order.remove(0)
+        order.insert(0, 0)
+
+      # First-fit-decreasing.
+      batched = set()
+      for i in order:
+        if self.max_graph_count and len(graphs) >= self.max_graph_count:
+          break
+        graph = self.window[i]
+        if not graphs or node_count + graph.node_count <= self.max_node_count:
+          graphs.append(graph)
+          node_count += graph.node_count
+          batched.add(i)
+
+      # Stop once nothing in a full window fits in the batch.
+      if not batched:
+        break
+      self.window = [
+        graph for i, graph in enumerate(self.window) if i not in batched
+      ]
+
+    return graphs
 
   def _ReadNextGraph(self,) -> Optional[graph_tuple.GraphTuple]:
     """Read the next graph from graph iterable, or None if no more graphs.
 
+    Graphs which are skipped by the max_node_count_limit_handler are passed to
+    on_skip, and the following graph is read.
+
     Returns:
       A graph, or None.
 
     Raises:
       ValueError: If the graph is larger than permitted by the batch size.
     """
-    try:
-      graph = next(self.graphs)
+    while True:
+      try:
+        graph = next(self.graphs)
+      except StopIteration:  # We have run out of graphs.
+        self.graphs_exhausted = True
+        return None
       if self.max_node_count and graph.node_count > self.max_node_count:
         # Determine the behaviour when we find a graph that is larger than
         # the graph node limit.
@@ -188,7 +306,9 @@ class GraphBatcher(object):
         )
         if self.max_node_count_limit_handler == "skip":
           self.ctx.Warning("%s, skipping it", msg)
-          return None
+          if self.on_skip:
+            self.on_skip(graph)
+          continue
         if self.max_node_count_limit_handler == "error":
           raise ValueError(msg)
         elif self.max_node_count_limit_handler == "include":
@@ -199,14 +319,13 @@ class GraphBatcher(object):
             f"{self.max_node_count_limit_handler}"
           )
       return graph
-    except StopIteration:  # We have run out of graphs.
-      return None
 
   @classmethod
   def CreateFromFlags(
     cls,
     graphs: Iterable[graph_tuple.GraphTuple],
     ctx: progress.ProgressContext = progress.NullContext,
+    on_skip: Optional[Callable[[graph_tuple.GraphTuple], None]] = None,
   ):
     return cls(
       graphs,
@@ -214,9 +333,82 @@ class GraphBatcher(object):
       exact_graph_count=FLAGS.graph_batch_exact_size,
       max_node_count=FLAGS.graph_batch_node_count,
       max_node_count_limit_handler=FLAGS.max_node_count_limit_handler,
+      lookahead=FLAGS.graph_batch_lookahead,
       ctx=ctx,
+      on_skip=on_skip,
+    )
+
+
+class DatabaseGraphBatcher(object):
+  """A graph batcher over graph tuple database rows.
+
+  This batches the graph tuples of the rows using a GraphBatcher, and returns
+  the rows that each batch was made from. A GraphBatcher may hold graphs which
+  have been read but not yet batched, so a single DatabaseGraphBatcher must be
+  used for all of the batches read from an iterator, and a new one created for
+  every pass over the rows, e.g. once per epoch.
+  """
+
+  def __init__(
+    self,
+    graphs: Iterable[graph_tuple_database.GraphTuple],
+    ctx: progress.ProgressContext = progress.NullContext,
+  ):
+    """Constructor.
+
+    Args:
+      graphs: An iterator of graph tuple database rows to batch.
+      ctx: A progress context.
+    """
+    self.input_graphs = iter(graphs)
+    # A map from the graph tuples which have been read but not yet returned in
+    # a batch to their rows.
+    self.graphs_read: Dict[int, graph_tuple_database.GraphTuple] = {}
+    self.batcher = GraphBatcher.CreateFromFlags(
+      self._ReadGraphTuples(), ctx=ctx, on_skip=self._OnSkip
+    )
+
+  def _ReadGraphTuples(self) -> Iterable[graph_tuple.GraphTuple]:
+    for graph in self.input_graphs:
+      self.graphs_read[id(graph.tuple)] = graph
+      yield graph.tuple
+
+  def _OnSkip(self, graph: graph_tuple.GraphTuple) -> None:
+    """Forget the row of a graph which the batcher skipped."""
+    del self.graphs_read[id(graph)]
+
+  def __iter__(self):
+    return self
+
+  def __next__(
+    self,
+  ) -> Tuple[graph_tuple.GraphTuple, List[graph_tuple_database.GraphTuple]]:
+    """Construct a graph batch.
+
+    Returns:
+      A tuple of the batch of graphs as a disjoint graph tuple, and the rows of
+      the graphs in the batch.
+    """
+    disjoint_graph = next(self.batcher)
+    return (
+      disjoint_graph,
+      [
+        self.graphs_read.pop(id(graph))
+        for graph in self.batcher.batch_graphs
+      ],
     )
 
+  @property
+  def fill_ratio(self) -> Optional[float]:
+    """The mean ratio of batch node counts to --graph_batch_node_count."""
+    return self.batcher.fill_ratio
+
+  def Close(self) -> None:
+    """Close the input graphs, if they have a Close() method, such as a
+    BufferedGraphReader."""
+    if hasattr(self.input_graphs, "Close"):
+      self.input_graphs.Close()
+
 
 class WriteGraphsToFile(progress.Progress):
   """Write graphs in a graph database to pickled files.
@@ -246,6 +438,13 @@ class WriteGraphsToFile(progress.Progress):
       self.ctx.i += graph_tuple.disjoint_graph_count
       path = self.outdir / f"batched_graph_tuple_{i:08}.pickle"
       graph_tuple.ToFile(path)
+    if self.batcher.fill_ratio is not None:
+      self.ctx.Log(
+        1,
+        "Wrote %d batches with a fill ratio of %.1f%%",
+        self.batcher.batch_count,
+        self.batcher.fill_ratio * 100,
+      )
 
 
 def Main():
@@ -19,6 +19,7 @@ from typing import List
 
 from deeplearning.ml4pl.graphs.labelled import graph_batcher
 from deeplearning.ml4pl.graphs.labelled import graph_tuple
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.testing import random_graph_tuple_generator
 from labm8.py import decorators
 from labm8.py import test
@@ -101,6 +102,25 @@ def test_GraphBatcher_max_node_count_limit_handler_skip():
     pass
 
 
+def test_GraphBatcher_max_node_count_limit_handler_skip_continues():
+  """Test that batching continues after a skipped graph."""
+  big_graph = random_graph_tuple_generator.CreateRandomGraphTuple(node_count=10)
+  small_graph = random_graph_tuple_generator.CreateRandomGraphTuple(
+    node_count=3
+  )
+  skipped = []
+
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator([big_graph, small_graph]),
+    max_node_count=5,
+    max_node_count_limit_handler="skip",
+    on_skip=skipped.append,
+  )
+
+  assert next(batcher).node_count == 3
+  assert skipped == [big_graph]
+
+
 def test_GraphBatcher_divisible_node_count():
   """Test the number of batches returned with evenly divisible node counts."""
   batcher = graph_batcher.GraphBatcher(
@@ -156,6 +176,173 @@ def test_GraphBatcher_exact_graph_count():
   # graphs.
 
 
+def test_GraphBatcher_lookahead_packs_batches():
+  """Test that a lookahead window packs graphs into fewer batches."""
+  node_counts = [6, 6, 6, 4, 4, 4]
+  graphs = [
+    random_graph_tuple_generator.CreateRandomGraphTuple(node_count=node_count)
+    for node_count in node_counts
+  ]
+
+  # In order, every 6-node graph ends a batch.
+  batcher = graph_batcher.GraphBatcher(MockIterator(graphs), max_node_count=10)
+  assert len(list(batcher)) == 4
+
+  # With lookahead, each 6-node graph is paired with a 4-node graph.
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator(graphs), max_node_count=10, lookahead=6
+  )
+  batches = list(batcher)
+  assert len(batches) == 3
+  assert [b.node_count for b in batches] == [10, 10, 10]
+  assert batcher.fill_ratio == 1
+
+
+def test_GraphBatcher_lookahead_includes_oldest_graph():
+  """Test that the oldest graph in the window is always batched first."""
+  graphs = [
+    random_graph_tuple_generator.CreateRandomGraphTuple(node_count=node_count)
+    for node_count in [2, 9, 8, 7]
+  ]
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator(graphs), max_node_count=10, lookahead=4
+  )
+
+  next(batcher)
+  assert batcher.batch_graphs == [graphs[0], graphs[2]]
+  next(batcher)
+  assert batcher.batch_graphs == [graphs[1]]
+  next(batcher)
+  assert batcher.batch_graphs == [graphs[3]]
+  with test.Raises(StopIteration):
+    next(batcher)
+
+
+def test_GraphBatcher_lookahead_max_graph_count():
+  """Test that lookahead batches respect the maximum graph count."""
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator(
+      [
+        random_graph_tuple_generator.CreateRandomGraphTuple(node_count=2)
+        for _ in range(7)
+      ]
+    ),
+    max_node_count=100,
+    max_graph_count=3,
+    lookahead=5,
+  )
+
+  batches = list(batcher)
+  assert [b.disjoint_graph_count for b in batches] == [3, 3, 1]
+
+
+def test_GraphBatcher_fill_ratio_without_max_node_count():
+  """Test that fill ratio is not computed without a node count budget."""
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator([random_graph_tuple_generator.CreateRandomGraphTuple()])
+  )
+  list(batcher)
+  assert batcher.fill_ratio is None
+
+
+@test.Fixture(scope="function")
+def lookahead_flags():
+  """A test fixture which sets the graph batcher flags to batch by node count
+  using a lookahead window."""
+  node_count = FLAGS.graph_batch_node_count
+  lookahead = FLAGS.graph_batch_lookahead
+  FLAGS.graph_batch_node_count = 10
+  FLAGS.graph_batch_lookahead = 4
+  yield
+  FLAGS.graph_batch_node_count = node_count
+  FLAGS.graph_batch_lookahead = lookahead
+
+
+def CreateRows(node_counts: List[int]) -> List[graph_tuple_database.GraphTuple]:
+  """Create graph tuple database rows with the given node counts."""
+  return [
+    graph_tuple_database.GraphTuple.CreateFromGraphTuple(
+      random_graph_tuple_generator.CreateRandomGraphTuple(
+        node_count=node_count
+      ),
+      ir_id=i,
+    )
+    for i, node_count in enumerate(node_counts)
+  ]
+
+
+def test_DatabaseGraphBatcher_returns_rows(lookahead_flags):
+  """Test that each batch is returned with the rows that it was made from."""
+  rows = CreateRows([2, 9, 8, 7])
+  batcher = graph_batcher.DatabaseGraphBatcher(rows)
+
+  disjoint_graph, batch_rows = next(batcher)
+  assert batch_rows == [rows[0], rows[2]]
+  assert disjoint_graph.node_count == 10
+  assert [r for _, r in batcher] == [[rows[1]], [rows[3]]]
+  assert not batcher.graphs_read
+  assert batcher.fill_ratio == (10 + 9 + 7) / 30
+
+
+@test.Parametrize(
+  "make_iterable", (list, iter, lambda rows: (row for row in rows))
+)
+def test_DatabaseGraphBatcher_input_types(lookahead_flags, make_iterable):
+  """Test that lists, list iterators, and generators can be batched."""
+  rows = CreateRows([6, 6, 6, 4, 4, 4])
+  batcher = graph_batcher.DatabaseGraphBatcher(make_iterable(rows))
+  batched_rows = [row for _, batch_rows in batcher for row in batch_rows]
+  assert sorted(row.ir_id for row in batched_rows) == list(range(6))
+
+
+def test_DatabaseGraphBatcher_new_batcher_per_pass(lookahead_flags):
+  """Test that a new batcher over the same rows starts from the beginning."""
+  rows = CreateRows([6, 6, 6, 4, 4, 4])
+  a = [batch_rows for _, batch_rows in graph_batcher.DatabaseGraphBatcher(rows)]
+  b = [batch_rows for _, batch_rows in graph_batcher.DatabaseGraphBatcher(rows)]
+  assert a == b
+  assert len(a) == 3
+
+
+@test.Parametrize("lookahead", (0, 4))
+def test_DatabaseGraphBatcher_skipped_rows(lookahead_flags, lookahead: int):
+  """Test that the rows of skipped graphs are not held."""
+  FLAGS.graph_batch_lookahead = lookahead
+  handler = FLAGS.max_node_count_limit_handler
+  FLAGS.max_node_count_limit_handler = "skip"
+  try:
+    rows = CreateRows([2, 20, 3, 30])
+    batcher = graph_batcher.DatabaseGraphBatcher(rows)
+    assert [r for _, r in batcher] == [[rows[0], rows[2]]]
+    assert not batcher.graphs_read
+  finally:
+    FLAGS.max_node_count_limit_handler = handler
+
+
+def test_DatabaseGraphBatcher_Close(lookahead_flags):
+  """Test that closing a batcher closes its input graphs."""
+
+  class ClosableIterator(object):
+    def __init__(self, rows):
+      self.rows = iter(rows)
+      self.closed = False
+
+    def __iter__(self):
+      return self
+
+    def __next__(self):
+      return next(self.rows)
+
+    def Close(self):
+      self.closed = True
+
+  graphs = ClosableIterator(CreateRows([2, 2]))
+  batcher = graph_batcher.DatabaseGraphBatcher(graphs)
+  next(batcher)
+  batcher.Close()
+  assert graphs.closed
+
+
 @decorators.loop_for(seconds=5)
 @test.Parametrize("graph_count", (1, 10, 100))
 @test.Parametrize("max_node_count", (50, 100))
@@ -179,5 +366,38 @@ def test_fuzz_GraphBatcher(
   assert sum(b.disjoint_graph_count for b in batches) == graph_count
 
 
+@decorators.loop_for(seconds=5)
+@test.Parametrize("graph_count", (1, 10, 100))
+@test.Parametrize("max_node_count", (50, 100))
+@test.Parametrize("lookahead", (1, 10, 100))
+def test_fuzz_GraphBatcher_lookahead(
+  graph_count: int, max_node_count: int, lookahead: int
+):
+  """Fuzz the lookahead graph batcher with a range of parameter choices and
+  input sizes.
+  """
+  graphs = [
+    random_graph_tuple_generator.CreateRandomGraphTuple()
+    for _ in range(graph_count)
+  ]
+  batcher = graph_batcher.GraphBatcher(
+    MockIterator(graphs),
+    max_node_count=max_node_count,
+    max_node_count_limit_handler="include",
+    lookahead=lookahead,
+  )
+  batched_graphs = []
+  for batch in batcher:
+    assert batch.disjoint_graph_count == len(batcher.batch_graphs)
+    assert (
+      len(batcher.batch_graphs) == 1 or batch.node_count <= max_node_count
+    )
+    batched_graphs += batcher.batch_graphs
+
+  # Every graph is batched exactly once.
+  assert sorted(id(g) for g in batched_graphs) == sorted(id(g) for g in graphs)
+  assert batcher.fill_ratio > 0
+
+
 if __name__ == "__main__":
   test.Main()
@@ -16,7 +16,10 @@
 """A module for reaching graphs from graph databases."""
 import enum
 import pathlib
+import queue
 import random
+import threading
+import time
 from typing import Callable
 from typing import List
 from typing import Optional
@@ -45,6 +48,22 @@ app.DEFINE_integer(
   "megabytes. A larger buffer means fewer costly SQL queries, but requires "
   "more memory to store the results.",
 )
+app.DEFINE_integer(
+  "graph_reader_prefetch_buffer_count",
+  0,
+  "Tuning parameter. The number of graph buffers to read ahead on a "
+  "background thread, so that database reads overlap with the consumption of "
+  "graphs. If zero, buffers are read synchronously when the current buffer is "
+  "exhausted.",
+)
+app.DEFINE_integer(
+  "graph_reader_prefetch_mb",
+  512,
+  "Tuning parameter. The maximum total size of prefetched graph buffers, in "
+  "megabytes. This limits the number of buffers that are read ahead, so that "
+  "--graph_reader_prefetch_buffer_count x --graph_reader_buffer_size_mb does "
+  "not exceed this value.",
+)
 app.DEFINE_integer(
   "graph_reader_limit",
   None,
@@ -94,6 +113,8 @@ class BufferedGraphReader(object):
     order: BufferedGraphReaderOrder = BufferedGraphReaderOrder.IN_ORDER,
     eager_graph_loading: bool = True,
     limit: Optional[int] = None,
+    prefetch_buffer_count: int = 0,
+    prefetch_mb: Optional[int] = None,
     ctx: progress.ProgressContext = progress.NullContext,
   ):
     """Constructor.
@@ -109,6 +130,11 @@ class BufferedGraphReader(object):
         larger number reduces the number of queries, but increases the memory
         requirement.
       limit: Limit the total number of rows returned to this value.
+      prefetch_buffer_count: The number of buffers to read ahead on a
+        background thread. If zero, buffers are read synchronously.
+      prefetch_mb: The maximum total size of prefetched buffers, in megabytes.
+        If set, this limits the number of buffers read ahead. At least one
+        buffer is always read ahead when prefetching is enabled.
 
     Raises:
       ValueError: If the query with the given filters returns no results.
@@ -195,9 +221,53 @@ class BufferedGraphReader(object):
       self.buffer: List[graph_tuple_database.GraphTuple] = []
       self.buffer_i = 0
 
+    # Bound the number of prefetched buffers by the memory budget.
+    if prefetch_buffer_count and prefetch_mb:
+      prefetch_buffer_count = max(
+        min(prefetch_buffer_count, prefetch_mb // buffer_size_mb), 1
+      )
+    self.prefetch_buffer_count = prefetch_buffer_count
+    # The prefetch queue and thread are created on the first buffer read. The
+    # thread stops when the stop event is set by Close().
+    self._prefetch_queue: Optional[queue.Queue] = None
+    self._prefetch_thread: Optional[threading.Thread] = None
+    self._prefetch_stop = threading.Event()
+
+    # Prefetch counters. A stall is a buffer read which had to wait for the
+    # prefetch thread.
+    self.prefetch_stall_count = 0
+    self.prefetch_stall_time = 0.0
+    self.prefetch_queue_depth = 0
+
   def __iter__(self):
     return self
 
+  def __enter__(self) -> "BufferedGraphReader":
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.Close()
+
+  def Close(self) -> None:
+    """Stop the prefetch thread, if running, and wait for it to finish.
+
+    A reader which is abandoned before all graphs have been read must be closed,
+    else the prefetch thread remains blocked on a full queue.
+    """
+    if self._prefetch_thread is None:
+      return
+    self._prefetch_stop.set()
+    # Drain the queue to unblock the prefetch thread. It checks the stop event
+    # before reading every buffer, so it reads at most one more.
+    while self._prefetch_thread.is_alive():
+      try:
+        self._prefetch_queue.get(timeout=0.1)
+      except queue.Empty:
+        pass
+    self._prefetch_thread.join()
+    self._prefetch_thread = None
+    self._prefetch_queue = None
+
   def __next__(self) -> graph_tuple_database.GraphTuple:
     """Get the next graph."""
     if self.buffer_i < len(self.buffer):
@@ -210,7 +280,71 @@ class BufferedGraphReader(object):
       return self.buffer[0]
 
   def GetNextBuffer(self) -> List[graph_tuple_database.GraphTuple]:
-    """Fetch the next buffer of graphs from the database."""
+    """Fetch the next buffer of graphs.
+
+    Raises:
+      StopIteration: If there are no more graphs to read.
+    """
+    if self.prefetch_buffer_count:
+      return self._GetNextPrefetchedBuffer()
+    else:
+      return self._ReadNextBuffer()
+
+  def _GetNextPrefetchedBuffer(self) -> List[graph_tuple_database.GraphTuple]:
+    """Fetch the next buffer of graphs from the prefetch queue."""
+    if self._prefetch_stop.is_set():
+      raise StopIteration
+    if self._prefetch_thread is None:
+      self._prefetch_queue = queue.Queue(maxsize=self.prefetch_buffer_count)
+      self._prefetch_thread = threading.Thread(
+        target=self._PrefetchWorker, daemon=True
+      )
+      self._prefetch_thread.start()
+
+    self.prefetch_queue_depth = self._prefetch_queue.qsize()
+    start_time = time.time()
+    buffer = self._prefetch_queue.get(block=True)
+    if not self.prefetch_queue_depth:
+      self.prefetch_stall_count += 1
+      self.prefetch_stall_time += time.time() - start_time
+
+    if buffer is None:
+      # Re-queue the end-of-buffers marker so that subsequent reads also stop.
+      self._prefetch_queue.put(None)
+      self.ctx.Log(
+        3,
+        "Graph reader stalled %s times waiting for prefetched buffers, %.3fs "
+        "total",
+        self.prefetch_stall_count,
+        self.prefetch_stall_time,
+      )
+      raise StopIteration
+    elif isinstance(buffer, Exception):
+      raise buffer
+
+    self.ctx.Log(
+      5,
+      "Read buffer from prefetch queue of depth %s/%s",
+      self.prefetch_queue_depth,
+      self.prefetch_buffer_count,
+    )
+    return buffer
+
+  def _PrefetchWorker(self) -> None:
+    """The prefetch thread loop, which reads buffers into the prefetch queue.
+
+    The queue is terminated with a None value, or with the exception raised
+    while reading a buffer. The loop ends early if Close() is called.
+    """
+    try:
+      while self.i < self.n and not self._prefetch_stop.is_set():
+        self._prefetch_queue.put(self._ReadNextBuffer(), block=True)
+    except Exception as e:
+      self._prefetch_queue.put(e, block=True)
+    self._prefetch_queue.put(None, block=True)
+
+  def _ReadNextBuffer(self) -> List[graph_tuple_database.GraphTuple]:
+    """Read the next buffer of graphs from the database."""
     if self.i >= self.n:
       # We have run out of graphs to read.
       raise StopIteration
@@ -296,6 +430,9 @@ class BufferedGraphReader(object):
         --graph_db: The database.
         --graph_reader_order: The order of graphs read.
         --graph_reader_buffer_size_mb: The size of the buffer.
+        --graph_reader_prefetch_buffer_count: The number of buffers to read
+            ahead.
+        --graph_reader_prefetch_mb: The memory budget for buffers read ahead.
 
     Ars:
       graph_db: A graph database instance. If not given, one is created from
@@ -329,6 +466,8 @@ class BufferedGraphReader(object):
       eager_graph_loading=eager_graph_loading,
       buffer_size_mb=FLAGS.graph_reader_buffer_size_mb,
       limit=limit or FLAGS.graph_reader_limit,
+      prefetch_buffer_count=FLAGS.graph_reader_prefetch_buffer_count,
+      prefetch_mb=FLAGS.graph_reader_prefetch_mb,
       ctx=ctx,
     )
 
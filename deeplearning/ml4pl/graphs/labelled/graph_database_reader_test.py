@@ -203,5 +203,134 @@ def test_BufferedGraphReader_data_flow_steps_order(
   assert i + 1 == 10000
 
 
+@test.Parametrize("buffer_size_mb", READER_BUFFER_SIZES)
+@test.Parametrize("prefetch_buffer_count", [1, 3])
+def test_BufferedGraphReader_prefetch_values_in_order(
+  db_10000: graph_tuple_database.Database,
+  buffer_size_mb: int,
+  prefetch_buffer_count: int,
+):
+  """Test that prefetching returns the same graphs in the same order."""
+  graphs = list(
+    reader.BufferedGraphReader(
+      db_10000,
+      buffer_size_mb=buffer_size_mb,
+      prefetch_buffer_count=prefetch_buffer_count,
+    )
+  )
+  assert len(graphs) == 10000
+  assert all([g.ir_id == i for i, g in enumerate(graphs)])
+
+
+@test.Parametrize("order", ALL_READER_ORDERS)
+def test_BufferedGraphReader_prefetch_next(
+  db_10000: graph_tuple_database.Database,
+  order: reader.BufferedGraphReaderOrder,
+):
+  """Test that a prefetching reader keeps raising StopIteration."""
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=1, order=order, prefetch_buffer_count=2
+  )
+  for _ in range(10000):
+    next(db_reader)
+  with test.Raises(StopIteration):
+    next(db_reader)
+  with test.Raises(StopIteration):
+    next(db_reader)
+
+
+def test_BufferedGraphReader_prefetch_mb(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that the prefetch memory budget limits the prefetch count."""
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=4, prefetch_buffer_count=10, prefetch_mb=8
+  )
+  assert db_reader.prefetch_buffer_count == 2
+
+  # At least one buffer is prefetched.
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=4, prefetch_buffer_count=10, prefetch_mb=1
+  )
+  assert db_reader.prefetch_buffer_count == 1
+
+
+def test_BufferedGraphReader_prefetch_stall_count(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that the first prefetched buffer read is counted as a stall."""
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=1, prefetch_buffer_count=2
+  )
+  next(db_reader)
+  assert db_reader.prefetch_stall_count == 1
+  assert db_reader.prefetch_stall_time > 0
+
+
+def test_BufferedGraphReader_Close_stops_prefetch_thread(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that closing an abandoned reader stops its prefetch thread."""
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=1, prefetch_buffer_count=2
+  )
+  next(db_reader)
+  thread = db_reader._prefetch_thread
+  assert thread.is_alive()
+
+  db_reader.Close()
+  assert not thread.is_alive()
+  # A closed reader produces no more graphs.
+  with test.Raises(StopIteration):
+    for _ in range(10000):
+      next(db_reader)
+  # Closing is idempotent.
+  db_reader.Close()
+
+
+def test_BufferedGraphReader_context_manager(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that a reader is closed on leaving a with block."""
+  with reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=1, prefetch_buffer_count=2
+  ) as db_reader:
+    next(db_reader)
+    thread = db_reader._prefetch_thread
+  assert not thread.is_alive()
+
+
+def test_BufferedGraphReader_Close_generator(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that closing a generator which reads graphs closes the reader."""
+  db_reader = reader.BufferedGraphReader(
+    db_10000, buffer_size_mb=1, prefetch_buffer_count=2
+  )
+
+  def GraphIds():
+    try:
+      for graph in db_reader:
+        yield graph.id
+    finally:
+      db_reader.Close()
+
+  ids = GraphIds()
+  next(ids)
+  thread = db_reader._prefetch_thread
+  ids.close()
+  assert not thread.is_alive()
+
+
+def test_BufferedGraphReader_Close_without_prefetching(
+  db_10000: graph_tuple_database.Database,
+):
+  """Test that closing a reader which does not prefetch is a no-op."""
+  db_reader = reader.BufferedGraphReader(db_10000, buffer_size_mb=1)
+  next(db_reader)
+  db_reader.Close()
+  next(db_reader)
+
+
 if __name__ == "__main__":
   test.Main()
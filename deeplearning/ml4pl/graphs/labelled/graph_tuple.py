@@ -25,7 +25,6 @@ from typing import Tuple
 import networkx as nx
 import numpy as np
 
-from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from labm8.py import app
 
@@ -336,11 +335,83 @@ class GraphTuple(NamedTuple):
     )
 
   @classmethod
-  def CreateFromProgramGraph(cls, program_graph: programl_pb2.ProgramGraph):
-    # TODO(github.com/ChrisCummins/ProGraML/issues/31): Perform the conversion
-    # directly.
-    return cls.CreateFromNetworkX(
-      programl.ProgramGraphToNetworkX(program_graph)
+  def CreateFromProgramGraph(
+    cls, program_graph: programl_pb2.ProgramGraph
+  ) -> "GraphTuple":
+    """Construct a graph tuple from a program graph proto.
+
+    This reads the nodes and edges of the proto directly into arrays, without
+    the intermediate networkx graph. The result is identical to
+    CreateFromNetworkX(programl.ProgramGraphToNetworkX(program_graph)),
+    including the order of edges within each adjacency list.
+
+    Args:
+      program_graph: The program graph to convert.
+
+    Returns:
+      A GraphTuple instance.
+    """
+    node_count = len(program_graph.node)
+
+    # Read the edges into a single array.
+    # Shape (edge_count, 4), columns (flow, src, dst, position):
+    edges = np.array(
+      [
+        (edge.flow, edge.source_node, edge.destination_node, edge.position)
+        for edge in program_graph.edge
+      ],
+      dtype=np.int32,
+    ).reshape(-1, 4)
+
+    # Order the edges in the same way that networkx enumerates the edges of a
+    # MultiDiGraph: by source node, then by the first occurrence of each
+    # (src, dst) pair, then by insertion order for parallel edges.
+    pairs = edges[:, 1].astype(np.int64) * max(node_count, 1) + edges[:, 2]
+    _, first_occurrence, pair_ids = np.unique(
+      pairs, return_index=True, return_inverse=True
+    )
+    order = np.lexsort(
+      (np.arange(len(edges)), first_occurrence[pair_ids], edges[:, 1])
+    )
+    edges = edges[order]
+
+    # Split the edges by flow type. A stable sort preserves the order above.
+    edges = edges[np.argsort(edges[:, 0], kind="stable")]
+    flow_ends = np.searchsorted(edges[:, 0], [1, 2, 3])
+    flow_starts = [0, flow_ends[0], flow_ends[1]]
+
+    # Shape (edge_flow_count, edge_count, 2):
+    adjacencies = [
+      edges[start:end, 1:3].copy()
+      for start, end in zip(flow_starts, flow_ends)
+    ]
+    # Shape (edge_flow_count, edge_count):
+    edge_positions = [
+      edges[start:end, 3].copy() for start, end in zip(flow_starts, flow_ends)
+    ]
+
+    # Shape (node_count, node_x_dimensionality):
+    node_x = np.array([node.x for node in program_graph.node], dtype=np.int64)
+
+    # Node labels are optional, and are only set if every node has them.
+    node_y = [node.y for node in program_graph.node]
+    if all(node_y):
+      # Shape (node_count, node_y_dimensionality):
+      node_y = np.array(node_y, dtype=np.int64)
+    else:
+      node_y = None
+
+    # Get the optional graph-level features and labels.
+    graph_x = program_graph.x
+    graph_y = program_graph.y
+
+    return GraphTuple(
+      adjacencies=np.array(adjacencies),
+      edge_positions=np.array(edge_positions),
+      node_x=node_x,
+      node_y=node_y,
+      graph_x=np.array(graph_x, dtype=np.int64) if graph_x else None,
+      graph_y=np.array(graph_y, dtype=np.int64) if graph_y else None,
     )
 
   @classmethod
@@ -356,77 +427,69 @@ class GraphTuple(NamedTuple):
     Returns:
       A GraphTuple instance.
     """
-    adjacencies: List[List[Tuple[int, int]]] = [[], [], []]
-    edge_positions: List[List[int]] = [[], [], []]
-    disjoint_nodes_list: List[List[int]] = []
-
-    node_x: List[List[int]] = []
-    node_y: List[List[int]] = []
-    graph_x: List[List[int]] = []
-    graph_y: List[List[int]] = []
-
-    disjoint_graph_count = 0
-    node_count = 0
-
-    # Iterate over each graph, merging them.
-    for graph in graph_tuples:
-      disjoint_nodes_list.append(
-        np.full(
-          shape=[graph.node_count],
-          fill_value=disjoint_graph_count,
-          dtype=np.int32,
-        )
-      )
-
-      for edge_flow, (adjacency_list, position_list) in enumerate(
-        zip(graph.adjacencies, graph.edge_positions)
-      ):
+    graph_tuples = list(graph_tuples)
+    disjoint_graph_count = len(graph_tuples)
+
+    # Compute the offset of each graph's nodes in the merged node list.
+    # Shape (disjoint_graph_count), dtype int32:
+    node_counts = np.array([g.node_count for g in graph_tuples], dtype=np.int32)
+    node_offsets = np.cumsum(node_counts, dtype=np.int32) - node_counts
+
+    adjacencies: List[np.array] = []
+    edge_positions: List[np.array] = []
+    for edge_flow in range(3):
+      # Select the graphs with edges of this flow type.
+      adjacency_lists = []
+      position_lists = []
+      flow_node_offsets = []
+      for graph, node_offset in zip(graph_tuples, node_offsets):
+        adjacency_list = graph.adjacencies[edge_flow]
         if adjacency_list.size:
-          # Offset the adjacency list node indices.
-          offset = np.array((node_count, node_count), dtype=np.int32)
-          adjacencies[edge_flow].append(adjacency_list + offset)
-          edge_positions[edge_flow].append(position_list)
-
-      # Add features and labels.
-
-      # Shape (graph.node_count, node_x_dimensionality):
-      node_x.extend(graph.node_x)
-
-      if graph.has_node_y:
-        # Shape (graph.node_count, node_y_dimensionality):
-        node_y.extend(graph.node_y)
-
-      if graph.has_graph_x:
-        graph_x.append(graph.graph_x)
+          adjacency_lists.append(adjacency_list)
+          position_lists.append(graph.edge_positions[edge_flow])
+          flow_node_offsets.append(node_offset)
+
+      if adjacency_lists:
+        # Offset the adjacency list node indices of every graph in a single
+        # operation, by repeating each graph's node offset once per edge.
+        edge_counts = [len(a) for a in adjacency_lists]
+        offsets = np.repeat(
+          np.array(flow_node_offsets, dtype=np.int32), edge_counts
+        )
+        adjacencies.append(np.concatenate(adjacency_lists) + offsets[:, None])
+        edge_positions.append(np.concatenate(position_lists))
+      else:
+        adjacencies.append(np.zeros((0, 2), dtype=np.int32))
+        edge_positions.append(np.array([], dtype=np.int32))
 
-      if graph.has_graph_y:
-        graph_y.append(graph.graph_y)
+    # Add features and labels.
 
-      # Update the counters.
-      disjoint_graph_count += 1
-      node_count += graph.node_count
+    # Shape (node_count, node_x_dimensionality):
+    node_x = np.concatenate([g.node_x for g in graph_tuples]).astype(
+      np.int64, copy=False
+    )
 
-    # Concatenate and convert lists to numpy arrays.
-    for i in range(len(adjacencies)):
-      if len(adjacencies[i]):
-        adjacencies[i] = np.concatenate(adjacencies[i])
-      else:
-        adjacencies[i] = np.zeros((0, 2), dtype=np.int32)
+    # Shape (node_count, node_y_dimensionality):
+    node_y = [g.node_y for g in graph_tuples if g.has_node_y]
+    if node_y:
+      node_y = np.concatenate(node_y).astype(np.int64, copy=False)
+    else:
+      node_y = None
 
-      if len(edge_positions[i]):
-        edge_positions[i] = np.concatenate(edge_positions[i])
-      else:
-        edge_positions[i] = np.array([], dtype=np.int32)
+    graph_x = [g.graph_x for g in graph_tuples if g.has_graph_x]
+    graph_y = [g.graph_y for g in graph_tuples if g.has_graph_y]
 
     return cls(
       adjacencies=np.array(adjacencies),
       edge_positions=np.array(edge_positions),
-      node_x=np.array(node_x, dtype=np.int64),
-      node_y=np.array(node_y, dtype=np.int64) if node_y else None,
+      node_x=node_x,
+      node_y=node_y,
       graph_x=np.array(graph_x, dtype=np.int64) if graph_x else None,
       graph_y=np.array(graph_y, dtype=np.int64) if graph_y else None,
       disjoint_graph_count=disjoint_graph_count,
-      disjoint_nodes_list=np.concatenate(disjoint_nodes_list),
+      disjoint_nodes_list=np.repeat(
+        np.arange(disjoint_graph_count, dtype=np.int32), node_counts
+      ),
     )
 
   ##############################################################################
@@ -571,3 +634,12 @@ class GraphTuple(NamedTuple):
       )
 
       node_offset += graph_node_count
+
+
+class DataFlowGraphTuple(NamedTuple):
+  """A data-flow annotated graph tuple."""
+
+  graph_tuple: GraphTuple
+  data_flow_root_node: Optional[int]
+  data_flow_steps: Optional[int]
+  data_flow_positive_node_count: Optional[int]
@@ -0,0 +1,183 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks for //deeplearning/ml4pl/graphs/labelled:graph_tuple."""
+from typing import Iterable
+from typing import List
+
+import numpy as np
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple
+from deeplearning.ml4pl.testing import random_graph_tuple_generator
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+MODULE_UNDER_TEST = None
+
+
+def FromGraphTuplesReference(
+  graph_tuples: Iterable[graph_tuple.GraphTuple],
+) -> graph_tuple.GraphTuple:
+  """The original per-graph list-appending implementation of
+  GraphTuple.FromGraphTuples(), used as a baseline for comparison.
+  """
+  adjacencies = [[], [], []]
+  edge_positions = [[], [], []]
+  disjoint_nodes_list = []
+
+  node_x = []
+  node_y = []
+  graph_x = []
+  graph_y = []
+
+  disjoint_graph_count = 0
+  node_count = 0
+
+  for graph in graph_tuples:
+    disjoint_nodes_list.append(
+      np.full(
+        shape=[graph.node_count],
+        fill_value=disjoint_graph_count,
+        dtype=np.int32,
+      )
+    )
+
+    for edge_flow, (adjacency_list, position_list) in enumerate(
+      zip(graph.adjacencies, graph.edge_positions)
+    ):
+      if adjacency_list.size:
+        offset = np.array((node_count, node_count), dtype=np.int32)
+        adjacencies[edge_flow].append(adjacency_list + offset)
+        edge_positions[edge_flow].append(position_list)
+
+    node_x.extend(graph.node_x)
+    if graph.has_node_y:
+      node_y.extend(graph.node_y)
+    if graph.has_graph_x:
+      graph_x.append(graph.graph_x)
+    if graph.has_graph_y:
+      graph_y.append(graph.graph_y)
+
+    disjoint_graph_count += 1
+    node_count += graph.node_count
+
+  for i in range(len(adjacencies)):
+    if len(adjacencies[i]):
+      adjacencies[i] = np.concatenate(adjacencies[i])
+    else:
+      adjacencies[i] = np.zeros((0, 2), dtype=np.int32)
+
+    if len(edge_positions[i]):
+      edge_positions[i] = np.concatenate(edge_positions[i])
+    else:
+      edge_positions[i] = np.array([], dtype=np.int32)
+
+  return graph_tuple.GraphTuple(
+    adjacencies=np.array(adjacencies),
+    edge_positions=np.array(edge_positions),
+    node_x=np.array(node_x, dtype=np.int64),
+    node_y=np.array(node_y, dtype=np.int64) if node_y else None,
+    graph_x=np.array(graph_x, dtype=np.int64) if graph_x else None,
+    graph_y=np.array(graph_y, dtype=np.int64) if graph_y else None,
+    disjoint_graph_count=disjoint_graph_count,
+    disjoint_nodes_list=np.concatenate(disjoint_nodes_list),
+  )
+
+
+def CreateGraphTuples(
+  graph_count: int, node_y_dimensionality: int, graph_y_dimensionality: int
+) -> List[graph_tuple.GraphTuple]:
+  """Generate a list of random graph tuples to merge."""
+  return [
+    random_graph_tuple_generator.CreateRandomGraphTuple(
+      node_y_dimensionality=node_y_dimensionality,
+      graph_x_dimensionality=graph_y_dimensionality,
+      graph_y_dimensionality=graph_y_dimensionality,
+    )
+    for _ in range(graph_count)
+  ]
+
+
+@test.Fixture(scope="session", params=(0, 2), namer=lambda x: f"node_y:{x}")
+def node_y_dimensionality(request) -> int:
+  """Test fixture which enumerates node label dimensionalities."""
+  return request.param
+
+
+@test.Fixture(scope="session", params=(0, 2), namer=lambda x: f"graph_y:{x}")
+def graph_y_dimensionality(request) -> int:
+  """Test fixture which enumerates graph feature and label dimensionalities."""
+  return request.param
+
+
+@test.Fixture(scope="session", params=(10, 100, 1000), namer=lambda x: f"n:{x}")
+def graph_count(request) -> int:
+  """Test fixture which enumerates the number of graphs to merge."""
+  return request.param
+
+
+@test.Fixture(scope="session")
+def graph_tuples(
+  graph_count: int, node_y_dimensionality: int, graph_y_dimensionality: int
+) -> List[graph_tuple.GraphTuple]:
+  """Test fixture which returns a list of random graph tuples."""
+  return CreateGraphTuples(
+    graph_count, node_y_dimensionality, graph_y_dimensionality
+  )
+
+
+def test_FromGraphTuples_equals_reference(
+  graph_tuples: List[graph_tuple.GraphTuple],
+):
+  """Check that the merge produces the same disjoint graph as the original
+  implementation.
+  """
+  a = graph_tuple.GraphTuple.FromGraphTuples(graph_tuples)
+  b = FromGraphTuplesReference(graph_tuples)
+
+  assert a.disjoint_graph_count == b.disjoint_graph_count
+  assert np.array_equal(a.disjoint_nodes_list, b.disjoint_nodes_list)
+  assert a.disjoint_nodes_list.dtype == b.disjoint_nodes_list.dtype
+  for flow in range(3):
+    assert np.array_equal(a.adjacencies[flow], b.adjacencies[flow])
+    assert a.adjacencies[flow].dtype == b.adjacencies[flow].dtype
+    assert np.array_equal(a.edge_positions[flow], b.edge_positions[flow])
+    assert a.edge_positions[flow].dtype == b.edge_positions[flow].dtype
+  for attr in ("node_x", "node_y", "graph_x", "graph_y"):
+    if getattr(b, attr) is None:
+      assert getattr(a, attr) is None
+    else:
+      assert np.array_equal(getattr(a, attr), getattr(b, attr))
+      assert getattr(a, attr).dtype == getattr(b, attr).dtype
+
+
+def test_benchmark_FromGraphTuples(
+  benchmark, graph_tuples: List[graph_tuple.GraphTuple]
+):
+  """Benchmark the vectorized graph tuple merge."""
+  benchmark(graph_tuple.GraphTuple.FromGraphTuples, graph_tuples)
+
+
+def test_benchmark_FromGraphTuplesReference(
+  benchmark, graph_tuples: List[graph_tuple.GraphTuple]
+):
+  """Benchmark the original graph tuple merge."""
+  benchmark(FromGraphTuplesReference, graph_tuples)
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -21,6 +21,7 @@ from typing import Any
 from typing import Callable
 from typing import Dict
 from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Tuple
 
@@ -28,9 +29,11 @@ import networkx as nx
 import sqlalchemy as sql
 from sqlalchemy.dialects import sqlite
 
+from deeplearning.ml4pl import incremental_stats
 from deeplearning.ml4pl import run_id
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled import graph_tuple as graph_tuple_lib
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_shards
 from labm8.py import app
 from labm8.py import crypto
 from labm8.py import decorators
@@ -46,6 +49,12 @@ FLAGS = app.FLAGS
 
 Base = sql.ext.declarative.declarative_base()
 
+# The Meta table key which records the directory of graph tuple shards.
+SHARDS_DIRECTORY_META_KEY = "graph_tuple_shards_directory"
+
+# The Meta table key which stores the incrementally maintained database stats.
+GRAPH_TUPLE_STATS_META_KEY = "graph_tuple_stats"
+
 
 class Meta(Base, sqlutil.TablenameFromClassNameMixin):
   """A key-value database metadata store, with additional run ID."""
@@ -78,11 +87,14 @@ class Meta(Base, sqlutil.TablenameFromClassNameMixin):
 class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
   """A table of graph tuples.
 
-  For every GraphTuple, there should be a corresponding GraphTupleData row
-  containing the pickled graph tuple as a binary blob. The reason for dividing
-  the data horizontally across two tables is to enable fast scanning
-  of graph metadata, without needing to churn through a table of pickled binary
-  blobs.
+  For every GraphTuple, there should be either a corresponding GraphTupleData
+  row containing the pickled graph tuple as a binary blob, or a pointer into a
+  shard of graph tuple arrays. The reason for dividing the data horizontally
+  across two tables is to enable fast scanning of graph metadata, without
+  needing to churn through a table of pickled binary blobs.
+
+  See //deeplearning/ml4pl/graphs/labelled:graph_tuple_shards for the sharded
+  storage format.
   """
 
   id: int = sql.Column(sql.Integer, primary_key=True)
@@ -127,9 +139,18 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
     sql.Integer, default=0, nullable=False
   )
 
-  # The size of the pickled graph tuple in bytes.
+  # The size of the pickled graph tuple in bytes. For sharded graph tuples,
+  # this is the size of the graph tuple arrays in the shard.
   pickled_graph_tuple_size: int = sql.Column(sql.Integer, nullable=False)
 
+  # A pointer to the graph tuple data in a shard. If not null, the graph tuple
+  # has no corresponding GraphTupleData row.
+  shard_id: Optional[int] = sql.Column(sql.Integer, nullable=True)
+  shard_index: Optional[int] = sql.Column(sql.Integer, nullable=True)
+  # The sha1 of a sharded graph tuple, see graph_tuple_shards.GraphTupleSha1().
+  # Unsharded graph tuples store their sha1 in the GraphTupleData row.
+  shard_sha1: Optional[str] = sql.Column(sql.String(40), nullable=True)
+
   # A copy of attributes from the
   # deeplearning.ml4pl.graphs.labelled.data_flow_graphs.DataFlowAnnotatedGraph
   # tuple for storing metadata of data flow analysis graphs. If not relevant ,
@@ -145,6 +166,10 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
     "GraphTupleData", uselist=False, cascade="all, delete-orphan"
   )
 
+  # The reader for sharded graph tuples. This is not a column, it is set when
+  # the row is loaded from a Database which has a shards directory.
+  shards: Optional[graph_tuple_shards.ShardReader] = None
+
   @property
   def has_data_flow(self) -> bool:
     """Returns whether graph tuple has data flow columns."""
@@ -158,12 +183,39 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
 
   @property
   def sha1(self) -> str:
-    """Return the sha1 of the graph tuple."""
+    """Return the sha1 of the graph tuple.
+
+    For sharded graph tuples, this is the sha1 of the graph tuple arrays, else
+    it is the sha1 of the pickled graph tuple.
+    """
+    if self.is_sharded:
+      # Compute the sha1 of rows which were written without one.
+      return self.shard_sha1 or graph_tuple_shards.GraphTupleSha1(self.tuple)
     return self.data.sha1
 
+  @property
+  def is_sharded(self) -> bool:
+    """Return whether the graph tuple data is stored in a shard."""
+    return self.shard_id is not None
+
   @decorators.memoized_property
   def tuple(self) -> graph_tuple_lib.GraphTuple:
-    """Un-pickle the graph tuple and cache the binary results."""
+    """Load the graph tuple and cache the results.
+
+    Sharded graph tuples are read as zero-copy views of the memory-mapped shard,
+    else the pickled graph tuple is un-pickled.
+
+    Raises:
+      ValueError: If the graph tuple is sharded but was not loaded from a
+        database with a shards directory.
+    """
+    if self.is_sharded:
+      if self.shards is None:
+        raise ValueError(
+          f"Graph tuple {self.id} is stored in shard {self.shard_id} but no "
+          "shards directory is set"
+        )
+      return self.shards.Get(self.shard_id, self.shard_index)
     return pickle.loads(self.data.pickled_graph_tuple)
 
   def ToFile(self, path: pathlib.Path) -> None:
@@ -201,6 +253,7 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
     graph_tuple: graph_tuple_lib.GraphTuple,
     ir_id: int,
     split: Optional[int] = None,
+    shard_writer: Optional[graph_tuple_shards.ShardWriter] = None,
   ) -> "GraphTuple":
     """Create a mapped database instance from the given graph tuple.
 
@@ -212,11 +265,49 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
       graph_tuple: The graph tuple to map.
       ir_id: The intermediate representation ID.
       split: The split value of this graph.
+      shard_writer: If provided, the graph tuple is written to a shard rather
+        than pickled, and no GraphTupleData row is created.
 
     Returns:
       A GraphTuple instance.
     """
+    if shard_writer:
+      shard_id, shard_index = shard_writer.Add(graph_tuple)
+      mapped = cls._CreateMetadataFromGraphTuple(
+        graph_tuple,
+        ir_id=ir_id,
+        split=split,
+        pickled_graph_tuple_size=graph_tuple_shards.GraphTupleSize(
+          graph_tuple
+        ),
+      )
+      mapped.shard_id = shard_id
+      mapped.shard_index = shard_index
+      mapped.shard_sha1 = graph_tuple_shards.GraphTupleSha1(graph_tuple)
+      return mapped
+
     pickled_graph_tuple = pickle.dumps(graph_tuple)
+    mapped = cls._CreateMetadataFromGraphTuple(
+      graph_tuple,
+      ir_id=ir_id,
+      split=split,
+      pickled_graph_tuple_size=len(pickled_graph_tuple),
+    )
+    mapped.data = GraphTupleData(
+      sha1=crypto.sha1(pickled_graph_tuple),
+      pickled_graph_tuple=pickled_graph_tuple,
+    )
+    return mapped
+
+  @classmethod
+  def _CreateMetadataFromGraphTuple(
+    cls,
+    graph_tuple: graph_tuple_lib.GraphTuple,
+    ir_id: int,
+    split: Optional[int],
+    pickled_graph_tuple_size: int,
+  ) -> "GraphTuple":
+    """Create a mapped database instance with only the metadata columns set."""
     return GraphTuple(
       ir_id=ir_id,
       split=split,
@@ -229,11 +320,7 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
       node_y_dimensionality=graph_tuple.node_y_dimensionality,
       graph_x_dimensionality=graph_tuple.graph_x_dimensionality,
       graph_y_dimensionality=graph_tuple.graph_y_dimensionality,
-      pickled_graph_tuple_size=len(pickled_graph_tuple),
-      data=GraphTupleData(
-        sha1=crypto.sha1(pickled_graph_tuple),
-        pickled_graph_tuple=pickled_graph_tuple,
-      ),
+      pickled_graph_tuple_size=pickled_graph_tuple_size,
     )
 
   @classmethod
@@ -263,6 +350,40 @@ class GraphTuple(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
     )
     return mapped
 
+  @classmethod
+  def CreateFromDataFlowGraphTuple(
+    cls,
+    data_flow_graph_tuple: graph_tuple_lib.DataFlowGraphTuple,
+    ir_id: int,
+    split: Optional[int] = None,
+    shard_writer: Optional[graph_tuple_shards.ShardWriter] = None,
+  ) -> "GraphTuple":
+    """Create a mapped database instance from the given annotated graph tuple.
+
+    Args:
+      data_flow_graph_tuple: The data flow annotated graph tuple, as returned
+        by DataFlowGraphs.graph_tuples.
+      ir_id: The intermediate representation ID.
+      split: The split value of this graph.
+      shard_writer: If provided, the graph tuple is written to a shard rather
+        than pickled.
+
+    Returns:
+      A GraphTuple instance.
+    """
+    mapped = cls.CreateFromGraphTuple(
+      data_flow_graph_tuple.graph_tuple,
+      ir_id=ir_id,
+      split=split,
+      shard_writer=shard_writer,
+    )
+    mapped.data_flow_steps = data_flow_graph_tuple.data_flow_steps
+    mapped.data_flow_root_node = data_flow_graph_tuple.data_flow_root_node
+    mapped.data_flow_positive_node_count = (
+      data_flow_graph_tuple.data_flow_positive_node_count
+    )
+    return mapped
+
   @classmethod
   def CreateEmpty(cls, ir_id: int) -> "GraphTuple":
     """Create an "empty" graph tuple.
@@ -334,6 +455,208 @@ class GraphTupleData(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
   )
 
 
+@sql.event.listens_for(GraphTuple, "load")
+def _SetGraphTupleShardsOnLoad(graph_tuple: GraphTuple, context) -> None:
+  """Attach the shard reader of the loading session to a graph tuple."""
+  graph_tuple.shards = context.session.info.get("graph_tuple_shards")
+
+
+def _NonEmpty(value) -> incremental_stats.Value:
+  """Ignore the values of "empty" graphs in incremental stats.
+
+  Args:
+    value: A mapped column, or an incremental_stats.Value.
+  """
+  value = (
+    value
+    if isinstance(value, incremental_stats.Value)
+    else incremental_stats.ColumnValue(value)
+  )
+  return incremental_stats.Value(
+    lambda row: value.fn(row) if row.node_count > 1 else None,
+    sql.case([(GraphTuple.node_count > 1, value.sql)]),
+  )
+
+
+# The statistics of the graph tuples table, updated on every change to it. All
+# statistics except the "all_split" value counts ignore "empty" graphs.
+graph_tuple_table_stats = incremental_stats.TableStats(
+  table=GraphTuple,
+  meta_table=Meta,
+  key=GRAPH_TUPLE_STATS_META_KEY,
+  columns=[
+    "ir_id",
+    "split",
+    "node_count",
+    "control_edge_count",
+    "data_edge_count",
+    "call_edge_count",
+    "edge_position_max",
+    "node_x_dimensionality",
+    "node_y_dimensionality",
+    "graph_x_dimensionality",
+    "graph_y_dimensionality",
+    "pickled_graph_tuple_size",
+    "data_flow_steps",
+    "data_flow_positive_node_count",
+  ],
+  aggregates={
+    "node_count": _NonEmpty(GraphTuple.node_count),
+    "control_edge_count": _NonEmpty(GraphTuple.control_edge_count),
+    "data_edge_count": _NonEmpty(GraphTuple.data_edge_count),
+    "call_edge_count": _NonEmpty(GraphTuple.call_edge_count),
+    "edge_count": _NonEmpty(
+      incremental_stats.Value(
+        lambda row: row.control_edge_count
+        + row.data_edge_count
+        + row.call_edge_count,
+        GraphTuple.control_edge_count
+        + GraphTuple.data_edge_count
+        + GraphTuple.call_edge_count,
+      )
+    ),
+    "edge_position_max": _NonEmpty(GraphTuple.edge_position_max),
+    "pickled_graph_tuple_size": _NonEmpty(GraphTuple.pickled_graph_tuple_size),
+    "data_flow_steps": _NonEmpty(GraphTuple.data_flow_steps),
+    "data_flow_positive_node_count": _NonEmpty(
+      GraphTuple.data_flow_positive_node_count
+    ),
+  },
+  value_counts={
+    "split": _NonEmpty(GraphTuple.split),
+    "all_split": incremental_stats.ColumnValue(GraphTuple.split),
+    "node_x_dimensionality": _NonEmpty(GraphTuple.node_x_dimensionality),
+    "node_y_dimensionality": _NonEmpty(GraphTuple.node_y_dimensionality),
+    "graph_x_dimensionality": _NonEmpty(GraphTuple.graph_x_dimensionality),
+    "graph_y_dimensionality": _NonEmpty(GraphTuple.graph_y_dimensionality),
+  },
+  distinct={
+    "ir_id": incremental_stats.Distinct(
+      "ir_id", lambda row: row.node_count > 1, GraphTuple.node_count > 1
+    ),
+  },
+)
+
+
+class GraphTupleStats(NamedTuple):
+  """Aggregate statistics of the non-empty graph tuples in a database."""
+
+  # Graph and IR counts.
+  graph_count: int
+  ir_count: int
+  split_count: int
+  # Node and edge attribute sums.
+  node_count: int
+  control_edge_count: int
+  data_edge_count: int
+  call_edge_count: int
+  edge_count: int
+  # Node and edge attribute maximums.
+  node_count_max: int
+  control_edge_count_max: int
+  data_edge_count_max: int
+  call_edge_count_max: int
+  edge_count_max: int
+  edge_position_max: int
+  # Feature and label dimensionality counts. Each of these should be one,
+  # showing that there is a single value for all graph tuples.
+  node_x_dimensionality_count: int
+  node_y_dimensionality_count: int
+  graph_x_dimensionality_count: int
+  graph_y_dimensionality_count: int
+  # Feature and label dimensionalities.
+  node_x_dimensionality: Optional[int]
+  node_y_dimensionality: Optional[int]
+  graph_x_dimensionality: Optional[int]
+  graph_y_dimensionality: Optional[int]
+  # Graph tuple sizes.
+  graph_data_size: int
+  graph_data_size_min: Optional[int]
+  graph_data_size_avg: Optional[float]
+  graph_data_size_max: Optional[int]
+  # Data flow column non-null counts.
+  data_flow_steps_count: int
+  # Data flow step counts.
+  data_flow_steps_min: Optional[int]
+  data_flow_steps_avg: Optional[float]
+  data_flow_steps_max: Optional[int]
+  # Data flow positive node count.
+  data_flow_positive_node_count_min: Optional[int]
+  data_flow_positive_node_count_avg: Optional[float]
+  data_flow_positive_node_count_max: Optional[int]
+
+  @classmethod
+  def FromTableStats(cls, stats: incremental_stats.Stats) -> "GraphTupleStats":
+    """Construct from a snapshot of the graph tuple table stats."""
+    aggregates = stats.aggregates
+    dimensionalities = {
+      name: stats.value_counts[name]
+      for name in (
+        "node_x_dimensionality",
+        "node_y_dimensionality",
+        "graph_x_dimensionality",
+        "graph_y_dimensionality",
+      )
+    }
+    return cls(
+      graph_count=aggregates["node_count"].count,
+      ir_count=stats.distinct_counts["ir_id"],
+      split_count=len(stats.value_counts["split"]),
+      node_count=aggregates["node_count"].sum,
+      control_edge_count=aggregates["control_edge_count"].sum,
+      data_edge_count=aggregates["data_edge_count"].sum,
+      call_edge_count=aggregates["call_edge_count"].sum,
+      edge_count=aggregates["edge_count"].sum,
+      node_count_max=aggregates["node_count"].max,
+      control_edge_count_max=aggregates["control_edge_count"].max,
+      data_edge_count_max=aggregates["data_edge_count"].max,
+      call_edge_count_max=aggregates["call_edge_count"].max,
+      edge_count_max=aggregates["edge_count"].max,
+      edge_position_max=aggregates["edge_position_max"].max,
+      node_x_dimensionality_count=len(
+        dimensionalities["node_x_dimensionality"]
+      ),
+      node_y_dimensionality_count=len(
+        dimensionalities["node_y_dimensionality"]
+      ),
+      graph_x_dimensionality_count=len(
+        dimensionalities["graph_x_dimensionality"]
+      ),
+      graph_y_dimensionality_count=len(
+        dimensionalities["graph_y_dimensionality"]
+      ),
+      node_x_dimensionality=max(
+        dimensionalities["node_x_dimensionality"], default=None
+      ),
+      node_y_dimensionality=max(
+        dimensionalities["node_y_dimensionality"], default=None
+      ),
+      graph_x_dimensionality=max(
+        dimensionalities["graph_x_dimensionality"], default=None
+      ),
+      graph_y_dimensionality=max(
+        dimensionalities["graph_y_dimensionality"], default=None
+      ),
+      graph_data_size=aggregates["pickled_graph_tuple_size"].sum,
+      graph_data_size_min=aggregates["pickled_graph_tuple_size"].min,
+      graph_data_size_avg=aggregates["pickled_graph_tuple_size"].avg,
+      graph_data_size_max=aggregates["pickled_graph_tuple_size"].max,
+      data_flow_steps_count=aggregates["data_flow_steps"].count,
+      data_flow_steps_min=aggregates["data_flow_steps"].min,
+      data_flow_steps_avg=aggregates["data_flow_steps"].avg,
+      data_flow_steps_max=aggregates["data_flow_steps"].max,
+      data_flow_positive_node_count_min=aggregates[
+        "data_flow_positive_node_count"
+      ].min,
+      data_flow_positive_node_count_avg=aggregates[
+        "data_flow_positive_node_count"
+      ].avg,
+      data_flow_positive_node_count_max=aggregates[
+        "data_flow_positive_node_count"
+      ].max,
+    )
+
+
 # A registry of database statics, where each entry is a <name, property> tuple.
 database_statistics_registry: List[Tuple[str, Callable[["Database"], Any]]] = []
 
@@ -360,16 +683,51 @@ class Database(sqlutil.Database):
   ):
     super(Database, self).__init__(url, Base, must_exist=must_exist)
     self.ctx = ctx
+    self.shards: Optional[graph_tuple_shards.ShardReader] = None
+
+    # Open the graph tuple shards, if the database has any.
+    with self.Session() as session:
+      shards_directory = (
+        session.query(Meta)
+        .filter(Meta.key == SHARDS_DIRECTORY_META_KEY)
+        .order_by(Meta.id.desc())
+        .first()
+      )
+      if shards_directory:
+        self._SetShardReader(pathlib.Path(shards_directory.value))
+
+    # Maintain the database stats on every change to the graph tuples table.
+    graph_tuple_table_stats.Attach(self)
 
     # Lazily evaluated attributes.
     self._graph_tuple_stats = None
     self._splits = None
     self._split_counts = None
 
+  def SetShardsDirectory(self, root: pathlib.Path) -> None:
+    """Set the directory of graph tuple shards for this database.
+
+    The directory is recorded in the Meta table, so that subsequent Database
+    instances for the same URL resolve sharded graph tuples.
+
+    Args:
+      root: The directory of graph tuple shards.
+    """
+    root = pathlib.Path(root).absolute()
+    with self.Session(commit=True) as session:
+      session.add(Meta.Create(key=SHARDS_DIRECTORY_META_KEY, value=str(root)))
+    self._SetShardReader(root)
+
+  def _SetShardReader(self, root: pathlib.Path) -> None:
+    self.shards = graph_tuple_shards.ShardReader(root)
+    # Sessions make the shard reader available to the graph tuples they load.
+    self.MakeSession.configure(info={"graph_tuple_shards": self.shards})
+
   ##############################################################################
-  # Database stats. These are evaluated lazily and the results cached. There is
-  # no cache invalidation strategy - after modifying the database, you must
-  # manually call RefreshStats() to ensure that stale stats are re-computed.
+  # Database stats. These are read lazily from the incrementally maintained
+  # stats in the Meta table, and the results cached. There is no cache
+  # invalidation strategy - after modifying the database, you must manually call
+  # RefreshStats() to re-read the stats.
   ##############################################################################
 
   @database_statistic
@@ -552,8 +910,17 @@ class Database(sqlutil.Database):
       self.RefreshStats()
     return self._split_counts
 
-  def RefreshStats(self):
-    """Compute the database stats for access via the instance properties.
+  def RefreshStats(self, recompute: bool = False):
+    """Read the database stats for access via the instance properties.
+
+    The stats are maintained incrementally in the Meta table, so this is cheap.
+    A full table scan is only needed if there are no stored stats, e.g. for
+    databases created before the stats were maintained, or if they were
+    invalidated by a bulk update.
+
+    Args:
+      recompute: If true, re-compute the stats from scratch with a full table
+        scan, replacing the stored stats.
 
     Raises:
       ValueError: If the database contains invalid entries, e.g. inconsistent
@@ -562,108 +929,13 @@ class Database(sqlutil.Database):
     with self.ctx.Profile(
       2,
       lambda t: (
-        "Computed stats over "
+        "Read stats of "
         f"{humanize.BinaryPrefix(stats.graph_data_size, 'B')} database "
         f"({humanize.Plural(stats.graph_count, 'graph')})"
       ),
-    ), self.Session() as session:
-      query = session.query(
-        # Graph and IR counts.
-        sql.func.count(GraphTuple.id).label("graph_count"),
-        sql.func.count(sql.func.distinct(GraphTuple.ir_id)).label("ir_count"),
-        sql.func.count(sql.func.distinct(GraphTuple.split)).label(
-          "split_count"
-        ),
-        # Node and edge attribute sums.
-        sql.func.sum(GraphTuple.node_count).label("node_count"),
-        sql.func.sum(GraphTuple.control_edge_count).label("control_edge_count"),
-        sql.func.sum(GraphTuple.data_edge_count).label("data_edge_count"),
-        sql.func.sum(GraphTuple.call_edge_count).label("call_edge_count"),
-        sql.func.sum(
-          GraphTuple.control_edge_count
-          + GraphTuple.data_edge_count
-          + GraphTuple.call_edge_count
-        ).label("edge_count"),
-        # Node and edge attribute maximums.
-        sql.func.max(GraphTuple.node_count).label("node_count_max"),
-        sql.func.max(GraphTuple.control_edge_count).label(
-          "control_edge_count_max"
-        ),
-        sql.func.max(GraphTuple.data_edge_count).label("data_edge_count_max"),
-        sql.func.max(GraphTuple.call_edge_count).label("call_edge_count_max"),
-        sql.func.max(GraphTuple.call_edge_count).label("call_edge_count_max"),
-        sql.func.max(
-          GraphTuple.control_edge_count
-          + GraphTuple.data_edge_count
-          + GraphTuple.call_edge_count
-        ).label("edge_count_max"),
-        sql.func.max(GraphTuple.edge_position_max).label("edge_position_max"),
-        # Feature and label dimensionality counts. Each of these columns
-        # should be one, showing that there is a single value for all graph
-        # tuples.
-        sql.func.count(
-          sql.func.distinct(GraphTuple.node_x_dimensionality)
-        ).label("node_x_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(GraphTuple.node_y_dimensionality)
-        ).label("node_y_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(GraphTuple.graph_x_dimensionality)
-        ).label("graph_x_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(GraphTuple.graph_y_dimensionality)
-        ).label("graph_y_dimensionality_count"),
-        # Feature and label dimensionalities.
-        sql.func.max(GraphTuple.node_x_dimensionality).label(
-          "node_x_dimensionality"
-        ),
-        sql.func.max(GraphTuple.node_y_dimensionality).label(
-          "node_y_dimensionality"
-        ),
-        sql.func.max(GraphTuple.graph_x_dimensionality).label(
-          "graph_x_dimensionality"
-        ),
-        sql.func.max(GraphTuple.graph_y_dimensionality).label(
-          "graph_y_dimensionality"
-        ),
-        # Graph tuple sizes.
-        sql.func.sum(GraphTuple.pickled_graph_tuple_size).label(
-          "graph_data_size"
-        ),
-        sql.func.min(GraphTuple.pickled_graph_tuple_size).label(
-          "graph_data_size_min"
-        ),
-        sql.func.avg(GraphTuple.pickled_graph_tuple_size).label(
-          "graph_data_size_avg"
-        ),
-        sql.func.max(GraphTuple.pickled_graph_tuple_size).label(
-          "graph_data_size_max"
-        ),
-        # Data flow column null counts.
-        sql.func.count(GraphTuple.data_flow_steps).label(
-          "data_flow_steps_count"
-        ),
-        # Data flow step counts.
-        sql.func.min(GraphTuple.data_flow_steps).label("data_flow_steps_min"),
-        sql.func.avg(GraphTuple.data_flow_steps).label("data_flow_steps_avg"),
-        sql.func.max(GraphTuple.data_flow_steps).label("data_flow_steps_max"),
-        # Data flow positive node count.
-        sql.func.min(GraphTuple.data_flow_positive_node_count).label(
-          "data_flow_positive_node_count_min"
-        ),
-        sql.func.avg(GraphTuple.data_flow_positive_node_count).label(
-          "data_flow_positive_node_count_avg"
-        ),
-        sql.func.max(GraphTuple.data_flow_positive_node_count).label(
-          "data_flow_positive_node_count_max"
-        ),
-      )
-
-      # Ignore "empty" graphs.
-      query = query.filter(GraphTuple.node_count > 1)
-
-      # Compute the stats.
-      stats = query.one()
+    ), self.Session(commit=True) as session:
+      table_stats = graph_tuple_table_stats.Get(session, recompute=recompute)
+      stats = GraphTupleStats.FromTableStats(table_stats)
 
       # Check that databases have a consistent value for dimensionalities.
       if stats.node_x_dimensionality_count > 1:
@@ -699,29 +971,14 @@ class Database(sqlutil.Database):
         )
 
       self._graph_tuple_stats = stats
-
-      with self.Session() as session:
-        self._splits = sorted(
-          set(
-            [
-              row.split
-              for row in session.query(GraphTuple.split)
-              .filter(GraphTuple.split != None)
-              .group_by(GraphTuple.split)
-            ]
-          )
-        )
-
-        self._split_counts = {
-          split: session.query(sql.func.count(GraphTuple.id))
-          .filter(GraphTuple.split == split)
-          .scalar()
-          for split in self._splits
-        }
+      self._split_counts = dict(
+        sorted(table_stats.value_counts["all_split"].items())
+      )
+      self._splits = list(self._split_counts)
 
   @property
   def graph_tuple_stats(self):
-    """Fetch aggregate graph tuple stats, or compute them if not set."""
+    """Fetch aggregate graph tuple stats, or read them if not set."""
     if self._graph_tuple_stats is None:
       self.RefreshStats()
     return self._graph_tuple_stats
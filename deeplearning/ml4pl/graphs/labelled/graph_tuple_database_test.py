@@ -14,12 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/labelled:graph_tuple_database."""
+import pathlib
 import random
 
+import numpy as np
 import pytest
 import sqlalchemy as sql
 
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_shards
 from deeplearning.ml4pl.testing import random_graph_tuple_database_generator
 from deeplearning.ml4pl.testing import random_graph_tuple_generator
 from deeplearning.ml4pl.testing import random_networkx_generator
@@ -429,6 +432,121 @@ def test_database_stats(
     assert db.data_flow_positive_node_count_avg is None
 
 
+def test_incremental_stats_match_full_scan(
+  db_session: graph_tuple_database.Database.SessionType,
+):
+  """Test that stats maintained over inserts, updates, and deletes are equal to
+  stats computed by a full table scan."""
+  table_stats = graph_tuple_database.graph_tuple_table_stats
+
+  db_session.add_all(
+    [
+      random_graph_tuple_database_generator.CreateRandomGraphTuple(
+        with_data_flow=True, split_count=3
+      )
+      for _ in range(50)
+    ]
+  )
+  db_session.add(graph_tuple_database.GraphTuple.CreateEmpty(ir_id=1))
+  db_session.commit()
+
+  graph_tuples = db_session.query(graph_tuple_database.GraphTuple).all()
+  for graph_tuple in graph_tuples[:10]:
+    db_session.delete(graph_tuple)
+  for graph_tuple in graph_tuples[10:20]:
+    graph_tuple.split = 5
+  db_session.commit()
+
+  stats = graph_tuple_database.GraphTupleStats.FromTableStats(
+    table_stats.Get(db_session)
+  )
+  expected = graph_tuple_database.GraphTupleStats.FromTableStats(
+    table_stats.Compute(db_session)
+  )
+  assert stats == expected
+  assert stats.split_count == 4
+
+
+# Sharded graph tuple tests.
+
+
+def test_CreateFromGraphTuple_sharded(tempdir: pathlib.Path):
+  """Test that sharded graph tuples have no data row."""
+  graph_tuple = random_graph_tuple_generator.CreateRandomGraphTuple()
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    a = graph_tuple_database.GraphTuple.CreateFromGraphTuple(
+      graph_tuple, ir_id=1, shard_writer=writer
+    )
+  assert a.is_sharded
+  assert a.shard_id == 0
+  assert a.shard_index == 0
+  assert a.data is None
+  assert a.pickled_graph_tuple_size == graph_tuple_shards.GraphTupleSize(
+    graph_tuple
+  )
+  assert a.sha1 == graph_tuple_shards.GraphTupleSha1(graph_tuple)
+
+
+@test.Parametrize("db_url", testing_databases.GetDatabaseUrls())
+def test_sharded_graph_tuples_round_trip(tempdir: pathlib.Path, db_url: str):
+  """Test reading sharded graph tuples from a new database instance."""
+  graph_tuples = [
+    random_graph_tuple_generator.CreateRandomGraphTuple() for _ in range(10)
+  ]
+  with testing_databases.DatabaseContext(
+    graph_tuple_database.Database, db_url
+  ) as db:
+    with graph_tuple_shards.ShardWriter(tempdir) as writer:
+      rows = [
+        graph_tuple_database.GraphTuple.CreateFromGraphTuple(
+          t, ir_id=i, shard_writer=writer
+        )
+        for i, t in enumerate(graph_tuples)
+      ]
+    with db.Session(commit=True) as session:
+      session.add_all(rows)
+    db.SetShardsDirectory(tempdir)
+
+    # The shards directory is read from the database.
+    db = graph_tuple_database.Database(db.url)
+    assert db.shards.root == tempdir.absolute()
+    with db.Session() as session:
+      rows = session.query(graph_tuple_database.GraphTuple).all()
+      assert not session.query(graph_tuple_database.GraphTupleData).count()
+
+    # Sharded graph tuples can be read after the session has closed.
+    for row in rows:
+      assert np.array_equal(row.tuple.node_x, graph_tuples[row.ir_id].node_x)
+      assert row.sha1 == graph_tuple_shards.GraphTupleSha1(
+        graph_tuples[row.ir_id]
+      )
+    assert db.graph_count == 10
+
+
+def test_sharded_graph_tuple_sha1_without_shard_sha1(tempdir: pathlib.Path):
+  """Test that the sha1 of a sharded row without a stored sha1 is computed."""
+  graph_tuple = random_graph_tuple_generator.CreateRandomGraphTuple()
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    a = graph_tuple_database.GraphTuple.CreateFromGraphTuple(
+      graph_tuple, ir_id=1, shard_writer=writer
+    )
+  a.shard_sha1 = None
+  a.shards = graph_tuple_shards.ShardReader(tempdir)
+  assert a.sha1 == graph_tuple_shards.GraphTupleSha1(graph_tuple)
+
+
+def test_sharded_graph_tuple_without_shards_directory(tempdir: pathlib.Path):
+  """Test error when reading a sharded graph tuple without a shard reader."""
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    a = graph_tuple_database.GraphTuple.CreateFromGraphTuple(
+      random_graph_tuple_generator.CreateRandomGraphTuple(),
+      ir_id=1,
+      shard_writer=writer,
+    )
+  with test.Raises(ValueError):
+    a.tuple
+
+
 ###############################################################################
 # Fuzzers.
 ###############################################################################
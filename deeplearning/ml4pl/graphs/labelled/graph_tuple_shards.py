@@ -0,0 +1,404 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A sharded, columnar file store for graph tuples.
+
+Instead of pickling every graph tuple into a binary blob, graph tuples are
+concatenated into shards, where each shard is a directory of numpy arrays:
+
+    <root>/<shard_id>/index.npy           Shape (graph_count, 6), dtype int64.
+    <root>/<shard_id>/adjacencies.npy     Shape (edge_count, 2), dtype int32.
+    <root>/<shard_id>/edge_positions.npy  Shape (edge_count), dtype int32.
+    <root>/<shard_id>/node_x.npy          Shape (node_count, node_x_dim).
+    <root>/<shard_id>/node_y.npy          (optional) Shape (node_count, dim).
+    <root>/<shard_id>/graph_x.npy         (optional) Shape (graph_count, dim).
+    <root>/<shard_id>/graph_y.npy         (optional) Shape (graph_count, dim).
+
+The edges of each graph are stored contiguously, ordered by flow type. Each row
+of the index is a tuple of offsets into the concatenated arrays:
+
+    (node_start, node_end, edge_start, control_end, data_end, call_end)
+
+Shards are written once and never modified. A writer reserves the ID of a new
+shard by creating its directory, so concurrent writers never share a shard, and
+a shard is readable once its index.npy exists. Reading a shard memory-maps the
+arrays, so that graph tuples are returned as zero-copy views of the shard files
+and the cost of reading a graph is bounded by disk bandwidth rather than by
+de-serialization.
+"""
+import hashlib
+import pathlib
+import shutil
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple as graph_tuple_lib
+from labm8.py import app
+
+
+FLAGS = app.FLAGS
+
+app.DEFINE_output_path(
+  "graph_tuple_shards_dir",
+  None,
+  "The directory to write graph tuple shards to.",
+)
+app.DEFINE_integer(
+  "graph_tuple_shard_size_mb",
+  256,
+  "The approximate size of graph tuple shards, in megabytes. A shard is "
+  "written to disk once the graph tuples added to it exceed this size.",
+)
+
+# The number of columns in a shard index.
+INDEX_COLUMN_COUNT = 6
+
+
+def GraphTupleSize(graph_tuple: graph_tuple_lib.GraphTuple) -> int:
+  """Return the number of bytes a graph tuple occupies in a shard."""
+  size = sum(a.nbytes for a in graph_tuple.adjacencies)
+  size += sum(p.nbytes for p in graph_tuple.edge_positions)
+  size += graph_tuple.node_x.nbytes
+  for array in (graph_tuple.node_y, graph_tuple.graph_x, graph_tuple.graph_y):
+    if array is not None:
+      size += array.nbytes
+  return size + INDEX_COLUMN_COUNT * 8
+
+
+def GraphTupleSha1(graph_tuple: graph_tuple_lib.GraphTuple) -> str:
+  """Return the sha1 of a graph tuple's arrays, as they are stored in a shard.
+
+  A graph tuple has the same sha1 before it is written to a shard and after it
+  is read back.
+  """
+  sha1 = hashlib.sha1()
+  arrays = [
+    np.array(a, dtype=np.int32).reshape(-1, 2) for a in graph_tuple.adjacencies
+  ]
+  arrays += [np.array(p, dtype=np.int32) for p in graph_tuple.edge_positions]
+  arrays += [
+    graph_tuple.node_x,
+    graph_tuple.node_y,
+    graph_tuple.graph_x,
+    graph_tuple.graph_y,
+  ]
+  for array in arrays:
+    if array is None:
+      sha1.update(b"None")
+      continue
+    array = np.ascontiguousarray(array)
+    sha1.update(f"{array.dtype.str}{array.shape}".encode("utf-8"))
+    sha1.update(array.tobytes())
+  return sha1.hexdigest()
+
+
+def ShardPath(root: pathlib.Path, shard_id: int) -> pathlib.Path:
+  """Return the path of a shard directory."""
+  return root / f"{shard_id:06d}"
+
+
+def _ArrayOfArrays(arrays: List[np.array]) -> np.array:
+  """Pack a list of arrays into an object array without copying them."""
+  array = np.empty(len(arrays), dtype=object)
+  for i, a in enumerate(arrays):
+    array[i] = a
+  return array
+
+
+class Shard(object):
+  """A memory-mapped shard of graph tuples."""
+
+  def __init__(self, path: pathlib.Path):
+    """Constructor.
+
+    Args:
+      path: The path of the shard directory.
+
+    Raises:
+      FileNotFoundError: If the shard does not exist.
+    """
+    if not (path / "index.npy").is_file():
+      raise FileNotFoundError(f"Graph tuple shard not found: {path}")
+    self.path = path
+    self.index = self._Load("index")
+    self.adjacencies = self._Load("adjacencies")
+    self.edge_positions = self._Load("edge_positions")
+    self.node_x = self._Load("node_x")
+    self.node_y = self._Load("node_y")
+    self.graph_x = self._Load("graph_x")
+    self.graph_y = self._Load("graph_y")
+
+  def _Load(self, name: str) -> Optional[np.array]:
+    path = self.path / f"{name}.npy"
+    if path.is_file():
+      return np.load(str(path), mmap_mode="r")
+
+  @property
+  def graph_count(self) -> int:
+    return self.index.shape[0]
+
+  def __len__(self) -> int:
+    return self.graph_count
+
+  def __getitem__(self, shard_index: int) -> graph_tuple_lib.GraphTuple:
+    """Return the graph tuple at the given index in the shard.
+
+    The arrays of the returned graph tuple are read-only views of the
+    memory-mapped shard.
+    """
+    (
+      node_start,
+      node_end,
+      edge_start,
+      control_end,
+      data_end,
+      call_end,
+    ) = self.index[shard_index]
+    flow_offsets = (edge_start, control_end, data_end, call_end)
+
+    return graph_tuple_lib.GraphTuple(
+      adjacencies=_ArrayOfArrays(
+        [
+          self.adjacencies[flow_offsets[i] : flow_offsets[i + 1]]
+          for i in range(3)
+        ]
+      ),
+      edge_positions=_ArrayOfArrays(
+        [
+          self.edge_positions[flow_offsets[i] : flow_offsets[i + 1]]
+          for i in range(3)
+        ]
+      ),
+      node_x=self.node_x[node_start:node_end],
+      node_y=(
+        None if self.node_y is None else self.node_y[node_start:node_end]
+      ),
+      graph_x=None if self.graph_x is None else self.graph_x[shard_index],
+      graph_y=None if self.graph_y is None else self.graph_y[shard_index],
+    )
+
+
+class ShardReader(object):
+  """Read graph tuples from a directory of shards.
+
+  Shards are memory-mapped lazily on first access.
+  """
+
+  def __init__(self, root: pathlib.Path):
+    self.root = pathlib.Path(root)
+    self._shards: Dict[int, Shard] = {}
+
+  def GetShard(self, shard_id: int) -> Shard:
+    """Return the memory-mapped shard with the given ID."""
+    shard = self._shards.get(shard_id)
+    if shard is None:
+      shard = Shard(ShardPath(self.root, shard_id))
+      self._shards[shard_id] = shard
+    return shard
+
+  def Get(self, shard_id: int, shard_index: int) -> graph_tuple_lib.GraphTuple:
+    """Return a graph tuple from the store.
+
+    Args:
+      shard_id: The ID of the shard containing the graph tuple.
+      shard_index: The index of the graph tuple in the shard.
+
+    Returns:
+      A graph tuple, where arrays are views of the memory-mapped shard.
+    """
+    return self.GetShard(shard_id)[shard_index]
+
+  def __repr__(self) -> str:
+    return f"ShardReader({self.root})"
+
+
+class ShardWriter(object):
+  """Write graph tuples to a directory of shards.
+
+  Graph tuples are buffered in memory until the size of the buffer exceeds
+  shard_size_mb, at which point the buffer is written to a new shard. Use this
+  class as a context manager to ensure that the final shard is written, even if
+  an exception is raised:
+
+    with ShardWriter(root) as writer:
+      for graph_tuple in graph_tuples:
+        shard_id, shard_index = writer.Add(graph_tuple)
+
+  Multiple writers, in any number of processes, may write to the same root.
+  """
+
+  def __init__(self, root: pathlib.Path, shard_size_mb: Optional[int] = None):
+    """Constructor.
+
+    Args:
+      root: The directory to write shards to. Shards are appended to any
+        existing shards in this directory.
+      shard_size_mb: The approximate size of each shard, in megabytes. If not
+        provided, --graph_tuple_shard_size_mb is used.
+    """
+    self.root = pathlib.Path(root)
+    self.root.mkdir(parents=True, exist_ok=True)
+    self.max_shard_size = (
+      shard_size_mb or FLAGS.graph_tuple_shard_size_mb
+    ) * 1024 * 1024
+
+    # Append new shards after any existing shards.
+    existing_shard_ids = [
+      int(path.name) for path in self.root.iterdir() if path.name.isdigit()
+    ]
+    self._next_shard_id = (
+      max(existing_shard_ids) + 1 if existing_shard_ids else 0
+    )
+    # The reserved ID of the shard that the buffer is written to, or None if
+    # the buffer is empty.
+    self.shard_id: Optional[int] = None
+
+    self.buffer: List[graph_tuple_lib.GraphTuple] = []
+    self.buffer_size = 0
+
+  def __enter__(self) -> "ShardWriter":
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb):
+    del exc_type
+    del exc_val
+    del exc_tb
+    # Flush even if an exception was raised, since the pointers to the buffered
+    # graph tuples may already have been committed.
+    self.Flush()
+
+  def _ReserveShardId(self) -> int:
+    """Reserve the ID of a new shard by creating its directory.
+
+    Directory creation is atomic, so a shard ID which is reserved by another
+    writer is skipped.
+    """
+    while True:
+      shard_id = self._next_shard_id
+      self._next_shard_id += 1
+      try:
+        ShardPath(self.root, shard_id).mkdir()
+        return shard_id
+      except FileExistsError:
+        pass
+
+  def Add(self, graph_tuple: graph_tuple_lib.GraphTuple) -> Tuple[int, int]:
+    """Add a graph tuple to the store.
+
+    Args:
+      graph_tuple: A non-disjoint graph tuple.
+
+    Returns:
+      A <shard_id, shard_index> tuple which points to the graph tuple. The shard
+      is not readable until the writer has been flushed.
+
+    Raises:
+      TypeError: If the graph tuple is disjoint.
+    """
+    if graph_tuple.is_disjoint_graph:
+      raise TypeError("Cannot add a disjoint graph tuple to a shard")
+
+    # Flush a full buffer before adding, so that the returned pointer is valid.
+    if self.buffer_size >= self.max_shard_size:
+      self.Flush()
+
+    if self.shard_id is None:
+      self.shard_id = self._ReserveShardId()
+    pointer = (self.shard_id, len(self.buffer))
+    self.buffer.append(graph_tuple)
+    self.buffer_size += GraphTupleSize(graph_tuple)
+    return pointer
+
+  def Flush(self) -> None:
+    """Write the buffered graph tuples to their reserved shard."""
+    if not self.buffer:
+      return
+
+    path = ShardPath(self.root, self.shard_id)
+    # Write to a temporary directory and then rename it over the empty reserved
+    # directory, so that partially written shards are never visible to readers.
+    tmp_path = self.root / f"{path.name}.tmp"
+    if tmp_path.is_dir():
+      shutil.rmtree(tmp_path)
+    tmp_path.mkdir()
+
+    for name, array in self._Concatenate().items():
+      if array is not None:
+        np.save(str(tmp_path / f"{name}.npy"), array)
+    tmp_path.rename(path)
+
+    self.shard_id = None
+    self.buffer = []
+    self.buffer_size = 0
+
+  def _Concatenate(self) -> Dict[str, Optional[np.array]]:
+    """Concatenate the buffered graph tuples into shard arrays."""
+    graphs = self.buffer
+
+    node_counts = np.array([g.node_count for g in graphs], dtype=np.int64)
+    # Shape (graph_count, 3), the number of edges of each flow type.
+    flow_counts = np.array(
+      [[len(a) for a in g.adjacencies] for g in graphs], dtype=np.int64
+    ).reshape(len(graphs), 3)
+
+    node_ends = np.cumsum(node_counts)
+    flow_ends = np.cumsum(flow_counts.ravel()).reshape(len(graphs), 3)
+
+    index = np.empty((len(graphs), INDEX_COLUMN_COUNT), dtype=np.int64)
+    index[:, 0] = node_ends - node_counts
+    index[:, 1] = node_ends
+    index[:, 2] = flow_ends[:, 0] - flow_counts[:, 0]
+    index[:, 3:] = flow_ends
+
+    adjacencies = [a.reshape(-1, 2) for g in graphs for a in g.adjacencies]
+    edge_positions = [p for g in graphs for p in g.edge_positions]
+
+    return {
+      "index": index,
+      "adjacencies": (
+        np.concatenate(adjacencies).astype(np.int32)
+        if adjacencies
+        else np.zeros((0, 2), dtype=np.int32)
+      ),
+      "edge_positions": (
+        np.concatenate(edge_positions).astype(np.int32)
+        if edge_positions
+        else np.zeros(0, dtype=np.int32)
+      ),
+      "node_x": np.concatenate([g.node_x for g in graphs]),
+      "node_y": self._ConcatenateOptional(graphs, "node_y", np.concatenate),
+      "graph_x": self._ConcatenateOptional(graphs, "graph_x", np.vstack),
+      "graph_y": self._ConcatenateOptional(graphs, "graph_y", np.vstack),
+    }
+
+  @staticmethod
+  def _ConcatenateOptional(graphs, attr: str, concatenate) -> Optional[np.array]:
+    """Concatenate an optional graph tuple attribute, which must be set for
+    either all or none of the graph tuples in a shard.
+    """
+    arrays = [getattr(g, attr) for g in graphs]
+    set_count = sum(a is not None for a in arrays)
+    if not set_count:
+      return None
+    elif set_count != len(arrays):
+      raise ValueError(
+        f"{len(arrays) - set_count} of {len(arrays)} graph tuples in shard "
+        f"have no {attr} value"
+      )
+    return concatenate(arrays)
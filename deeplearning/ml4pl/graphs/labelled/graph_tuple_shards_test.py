@@ -0,0 +1,204 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/graphs/labelled:graph_tuple_shards."""
+import pathlib
+
+import numpy as np
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_shards
+from deeplearning.ml4pl.testing import random_graph_tuple_generator
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+
+def AssertGraphTuplesAreEqual(
+  a: graph_tuple.GraphTuple, b: graph_tuple.GraphTuple
+):
+  """Check that two graph tuples have the same values."""
+  assert len(a.adjacencies) == len(b.adjacencies) == 3
+  for flow in range(3):
+    assert np.array_equal(
+      np.array(a.adjacencies[flow]).reshape(-1, 2),
+      np.array(b.adjacencies[flow]).reshape(-1, 2),
+    )
+    assert np.array_equal(a.edge_positions[flow], b.edge_positions[flow])
+  assert np.array_equal(a.node_x, b.node_x)
+  for attr in ("node_y", "graph_x", "graph_y"):
+    if getattr(a, attr) is None:
+      assert getattr(b, attr) is None
+    else:
+      assert np.array_equal(getattr(a, attr), getattr(b, attr))
+
+
+@test.Parametrize("node_y_dimensionality", (0, 3))
+@test.Parametrize("graph_x_dimensionality", (0, 2))
+@test.Parametrize("graph_y_dimensionality", (0, 4))
+def test_ShardWriter_ShardReader_round_trip(
+  tempdir: pathlib.Path,
+  node_y_dimensionality: int,
+  graph_x_dimensionality: int,
+  graph_y_dimensionality: int,
+):
+  """Test that graph tuples read from a shard equal those written."""
+  graph_tuples = [
+    random_graph_tuple_generator.CreateRandomGraphTuple(
+      node_y_dimensionality=node_y_dimensionality,
+      graph_x_dimensionality=graph_x_dimensionality,
+      graph_y_dimensionality=graph_y_dimensionality,
+    )
+    for _ in range(20)
+  ]
+
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    pointers = [writer.Add(t) for t in graph_tuples]
+
+  reader = graph_tuple_shards.ShardReader(tempdir)
+  for t, (shard_id, shard_index) in zip(graph_tuples, pointers):
+    AssertGraphTuplesAreEqual(t, reader.Get(shard_id, shard_index))
+
+
+def test_ShardWriter_multiple_shards(tempdir: pathlib.Path):
+  """Test that a full shard is flushed and a new shard started."""
+  graph_tuples = [
+    random_graph_tuple_generator.CreateRandomGraphTuple() for _ in range(10)
+  ]
+
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    # Force a new shard for every graph.
+    writer.max_shard_size = 1
+    pointers = [writer.Add(t) for t in graph_tuples]
+
+  assert [shard_id for shard_id, _ in pointers] == list(range(10))
+  assert [shard_index for _, shard_index in pointers] == [0] * 10
+  assert len(list(tempdir.iterdir())) == 10
+
+  reader = graph_tuple_shards.ShardReader(tempdir)
+  for t, (shard_id, shard_index) in zip(graph_tuples, pointers):
+    AssertGraphTuplesAreEqual(t, reader.Get(shard_id, shard_index))
+
+
+def test_ShardWriter_appends_to_existing_shards(tempdir: pathlib.Path):
+  """Test that a new writer does not overwrite existing shards."""
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    writer.Add(random_graph_tuple_generator.CreateRandomGraphTuple())
+
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    assert writer.Add(random_graph_tuple_generator.CreateRandomGraphTuple()) == (
+      1,
+      0,
+    )
+
+  assert graph_tuple_shards.ShardReader(tempdir).GetShard(0).graph_count == 1
+  assert graph_tuple_shards.ShardReader(tempdir).GetShard(1).graph_count == 1
+
+
+def test_ShardWriter_concurrent_writers(tempdir: pathlib.Path):
+  """Test that concurrent writers to the same directory use distinct shards."""
+  a = graph_tuple_shards.ShardWriter(tempdir)
+  b = graph_tuple_shards.ShardWriter(tempdir)
+  a_tuple = random_graph_tuple_generator.CreateRandomGraphTuple(node_count=10)
+  b_tuple = random_graph_tuple_generator.CreateRandomGraphTuple(node_count=11)
+
+  assert a.Add(a_tuple) == (0, 0)
+  assert b.Add(b_tuple) == (1, 0)
+  b.Flush()
+  a.Flush()
+
+  reader = graph_tuple_shards.ShardReader(tempdir)
+  AssertGraphTuplesAreEqual(reader.Get(0, 0), a_tuple)
+  AssertGraphTuplesAreEqual(reader.Get(1, 0), b_tuple)
+
+
+def test_ShardWriter_flushes_on_exception(tempdir: pathlib.Path):
+  """Test that buffered graph tuples are written if an exception is raised."""
+  graph_tuple = random_graph_tuple_generator.CreateRandomGraphTuple()
+  with test.Raises(OSError):
+    with graph_tuple_shards.ShardWriter(tempdir) as writer:
+      writer.Add(graph_tuple)
+      raise OSError("error")
+
+  AssertGraphTuplesAreEqual(
+    graph_tuple_shards.ShardReader(tempdir).Get(0, 0), graph_tuple
+  )
+
+
+def test_ShardWriter_disjoint_graph_tuple(tempdir: pathlib.Path):
+  """Test that disjoint graph tuples are rejected."""
+  writer = graph_tuple_shards.ShardWriter(tempdir)
+  with test.Raises(TypeError):
+    writer.Add(
+      random_graph_tuple_generator.CreateRandomGraphTuple(
+        disjoint_graph_count=2
+      )
+    )
+
+
+def test_ShardWriter_inconsistent_node_y(tempdir: pathlib.Path):
+  """Test that node labels must be set for all or none of a shard."""
+  writer = graph_tuple_shards.ShardWriter(tempdir)
+  writer.Add(
+    random_graph_tuple_generator.CreateRandomGraphTuple(node_y_dimensionality=2)
+  )
+  writer.Add(random_graph_tuple_generator.CreateRandomGraphTuple())
+  with test.Raises(ValueError):
+    writer.Flush()
+
+
+def test_ShardReader_returns_memory_mapped_views(tempdir: pathlib.Path):
+  """Test that graph tuple arrays are not copied into memory."""
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    writer.Add(random_graph_tuple_generator.CreateRandomGraphTuple())
+
+  t = graph_tuple_shards.ShardReader(tempdir).Get(0, 0)
+  assert isinstance(t.node_x, np.memmap)
+  assert isinstance(t.adjacencies[0], np.memmap)
+  assert not t.node_x.flags.writeable
+
+
+def test_GraphTupleSha1_round_trip(tempdir: pathlib.Path):
+  """Test that a graph tuple read from a shard has the same sha1."""
+  graph_tuples = [
+    random_graph_tuple_generator.CreateRandomGraphTuple() for _ in range(5)
+  ]
+  with graph_tuple_shards.ShardWriter(tempdir) as writer:
+    pointers = [writer.Add(t) for t in graph_tuples]
+  reader = graph_tuple_shards.ShardReader(tempdir)
+  for t, (shard_id, shard_index) in zip(graph_tuples, pointers):
+    assert graph_tuple_shards.GraphTupleSha1(
+      reader.Get(shard_id, shard_index)
+    ) == graph_tuple_shards.GraphTupleSha1(t)
+
+
+def test_GraphTupleSha1_different_graph_tuples():
+  """Test that different graph tuples have different sha1s."""
+  a = random_graph_tuple_generator.CreateRandomGraphTuple(node_count=10)
+  b = random_graph_tuple_generator.CreateRandomGraphTuple(node_count=11)
+  assert graph_tuple_shards.GraphTupleSha1(
+    a
+  ) != graph_tuple_shards.GraphTupleSha1(b)
+
+
+def test_ShardReader_shard_not_found(tempdir: pathlib.Path):
+  """Test error when reading a shard that does not exist."""
+  with test.Raises(FileNotFoundError):
+    graph_tuple_shards.ShardReader(tempdir).Get(0, 0)
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -21,10 +21,12 @@ from typing import Tuple
 import networkx as nx
 import numpy as np
 
+from deeplearning.ml4pl.graphs import programl
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled import graph_tuple
 from deeplearning.ml4pl.testing import random_graph_tuple_generator
 from deeplearning.ml4pl.testing import random_networkx_generator
+from deeplearning.ml4pl.testing import random_programl_generator
 from labm8.py import app
 from labm8.py import decorators
 from labm8.py import fs
@@ -206,6 +208,104 @@ def test_CreateFromNetworkX_not_disjoint(graph: nx.MultiDiGraph):
   assert d.disjoint_graph_count == 1
 
 
+# ProgramGraph -> GraphTuple.
+
+
+def AssertGraphTuplesAreEqual(
+  a: graph_tuple.GraphTuple, b: graph_tuple.GraphTuple
+):
+  """Check that two graph tuples have the same values and types."""
+  assert a.adjacencies.shape == b.adjacencies.shape
+  assert a.edge_positions.shape == b.edge_positions.shape
+  for flow in range(3):
+    assert a.adjacencies[flow].dtype == b.adjacencies[flow].dtype
+    assert np.array_equal(a.adjacencies[flow], b.adjacencies[flow])
+    assert a.edge_positions[flow].dtype == b.edge_positions[flow].dtype
+    assert np.array_equal(a.edge_positions[flow], b.edge_positions[flow])
+  for attr in ("node_x", "node_y", "graph_x", "graph_y"):
+    if getattr(b, attr) is None:
+      assert getattr(a, attr) is None
+    else:
+      assert getattr(a, attr).dtype == getattr(b, attr).dtype
+      assert np.array_equal(getattr(a, attr), getattr(b, attr))
+
+
+@test.Fixture(
+  scope="session", params=list(random_programl_generator.EnumerateTestSet()),
+)
+def real_proto(request) -> programl_pb2.ProgramGraph:
+  return request.param
+
+
+def test_CreateFromProgramGraph_on_real_graph(
+  real_proto: programl_pb2.ProgramGraph,
+):
+  """Test that direct conversion matches conversion through networkx."""
+  AssertGraphTuplesAreEqual(
+    graph_tuple.GraphTuple.CreateFromProgramGraph(real_proto),
+    graph_tuple.GraphTuple.CreateFromNetworkX(
+      programl.ProgramGraphToNetworkX(real_proto)
+    ),
+  )
+
+
+def test_CreateFromProgramGraph_edge_order():
+  """Test that edges are ordered in the same way as networkx enumerates them,
+  including parallel edges.
+  """
+  proto = programl_pb2.ProgramGraph()
+  for i in range(4):
+    proto.node.add(type=programl_pb2.Node.STATEMENT, x=[i])
+  for src, dst, position in [
+    (2, 3, 0),
+    (0, 1, 0),
+    (2, 0, 0),
+    (0, 3, 0),
+    (2, 3, 1),
+    (0, 1, 1),
+  ]:
+    proto.edge.add(
+      flow=programl_pb2.Edge.CONTROL,
+      source_node=src,
+      destination_node=dst,
+      position=position,
+    )
+
+  t = graph_tuple.GraphTuple.CreateFromProgramGraph(proto)
+
+  assert np.array_equal(
+    t.adjacencies[programl_pb2.Edge.CONTROL],
+    np.array([(0, 1), (0, 1), (0, 3), (2, 3), (2, 3), (2, 0)]),
+  )
+  assert np.array_equal(
+    t.edge_positions[programl_pb2.Edge.CONTROL], np.array([0, 1, 0, 0, 1, 0])
+  )
+  AssertGraphTuplesAreEqual(
+    t,
+    graph_tuple.GraphTuple.CreateFromNetworkX(
+      programl.ProgramGraphToNetworkX(proto)
+    ),
+  )
+
+
+@decorators.loop_for(seconds=10)
+def test_fuzz_CreateFromProgramGraph():
+  """Fuzz direct conversion against conversion through networkx."""
+  proto = random_programl_generator.CreateRandomProto(
+    node_x_dimensionality=random.randint(1, 3),
+    node_y_dimensionality=random.randint(0, 3),
+    graph_x_dimensionality=random.randint(0, 3),
+    graph_y_dimensionality=random.randint(0, 3),
+  )
+
+  AssertGraphTuplesAreEqual(
+    graph_tuple.GraphTuple.CreateFromProgramGraph(proto),
+    graph_tuple.GraphTuple.CreateFromNetworkX(
+      programl.ProgramGraphToNetworkX(proto)
+    ),
+  )
+
+
 # GraphTuple -> nx.MultiDiGraph tests.
 
 
@@ -476,6 +576,55 @@ def test_FromGraphTuples_two_tuples(
     raise
 
 
+def test_FromGraphTuples_node_offsets():
+  """Test the edges, features and node segments of a disjoint graph."""
+  a = graph_tuple.GraphTuple(
+    adjacencies=[
+      np.array([[0, 1], [1, 2]], dtype=np.int32),
+      np.array([[2, 0]], dtype=np.int32),
+      np.zeros((0, 2), dtype=np.int32),
+    ],
+    edge_positions=[
+      np.array([0, 0], dtype=np.int32),
+      np.array([1], dtype=np.int32),
+      np.array([], dtype=np.int32),
+    ],
+    node_x=np.array([[1], [2], [3]], dtype=np.int32),
+  )
+  b = graph_tuple.GraphTuple(
+    adjacencies=[
+      np.array([[0, 1]], dtype=np.int32),
+      np.zeros((0, 2), dtype=np.int32),
+      np.array([[1, 0]], dtype=np.int32),
+    ],
+    edge_positions=[
+      np.array([0], dtype=np.int32),
+      np.array([], dtype=np.int32),
+      np.array([2], dtype=np.int32),
+    ],
+    node_x=np.array([[4], [5]], dtype=np.int32),
+  )
+
+  d = graph_tuple.GraphTuple.FromGraphTuples([a, b])
+
+  assert d.disjoint_graph_count == 2
+  assert d.disjoint_nodes_list.tolist() == [0, 0, 0, 1, 1]
+  assert d.node_x.tolist() == [[1], [2], [3], [4], [5]]
+  assert [adjacency_list.tolist() for adjacency_list in d.adjacencies] == [
+    [[0, 1], [1, 2], [3, 4]],
+    [[2, 0]],
+    [[4, 3]],
+  ]
+  assert [positions.tolist() for positions in d.edge_positions] == [
+    [0, 0, 0],
+    [1],
+    [2],
+  ]
+  assert d.node_y is None
+  assert d.graph_x is None
+  assert d.graph_y is None
+
+
 @decorators.loop_for(seconds=3)
 @test.Parametrize("dimensionalities", ((0, 2), (2, 0)))
 @test.Parametrize("copy", (False, True))
@@ -0,0 +1,136 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Move the pickled graph tuples of a graph database into shards.
+
+This migrates a graph tuple database in-place. Each pickled graph tuple is
+written to a shard, the GraphTuple row is updated to point to it, and the
+GraphTupleData row is deleted. Graphs which are already sharded are skipped, so
+this can be re-run to shard graphs added since the last migration.
+"""
+import pathlib
+from typing import List
+from typing import Tuple
+
+import sqlalchemy as sql
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_shards
+from labm8.py import app
+from labm8.py import humanize
+from labm8.py import progress
+
+
+FLAGS = app.FLAGS
+
+
+class ShardGraphTuples(progress.Progress):
+  """Move pickled graph tuples into shards."""
+
+  def __init__(
+    self,
+    graph_db: graph_tuple_database.Database,
+    shards_dir: pathlib.Path,
+    shard_size_mb: int,
+  ):
+    self.graph_db = graph_db
+    self.shards_dir = shards_dir
+    self.shard_size_mb = shard_size_mb
+    self.max_shard_size = shard_size_mb * 1024 * 1024
+
+    with graph_db.Session() as session:
+      query = (
+        session.query(
+          graph_tuple_database.GraphTuple.id,
+          graph_tuple_database.GraphTuple.pickled_graph_tuple_size,
+        )
+        .filter(graph_tuple_database.GraphTuple.shard_id == None)
+        .filter(graph_tuple_database.GraphTuple.node_count > 1)
+        .order_by(graph_tuple_database.GraphTuple.id)
+      )
+      self.ids_and_sizes: List[Tuple[int, int]] = [
+        (row.id, row.pickled_graph_tuple_size) for row in query
+      ]
+
+    super(ShardGraphTuples, self).__init__(
+      "shard", i=0, n=len(self.ids_and_sizes), unit="graphs"
+    )
+
+  def Run(self):
+    """Run the migration."""
+    self.graph_db.SetShardsDirectory(self.shards_dir)
+    writer = graph_tuple_shards.ShardWriter(
+      self.shards_dir, shard_size_mb=self.shard_size_mb
+    )
+
+    # Group the graphs into chunks which are written as a single shard. The
+    # shard is flushed before the chunk's pointers are committed, so that a
+    # failed migration never leaves rows pointing to a missing shard.
+    chunk = []
+    chunk_size = 0
+    for graph_id, size in self.ids_and_sizes:
+      chunk.append(graph_id)
+      chunk_size += size
+      if chunk_size >= self.max_shard_size:
+        self.ShardChunk(writer, chunk)
+        chunk = []
+        chunk_size = 0
+    if chunk:
+      self.ShardChunk(writer, chunk)
+
+  def ShardChunk(
+    self, writer: graph_tuple_shards.ShardWriter, ids: List[int]
+  ) -> None:
+    """Move a chunk of graph tuples into a new shard."""
+    with self.ctx.Profile(
+      2, f"Sharded {humanize.Plural(len(ids), 'graph tuple')}"
+    ), self.graph_db.Session(commit=True) as session:
+      graphs = (
+        session.query(graph_tuple_database.GraphTuple)
+        .options(sql.orm.joinedload(graph_tuple_database.GraphTuple.data))
+        .filter(graph_tuple_database.GraphTuple.id.in_(ids))
+        .order_by(graph_tuple_database.GraphTuple.id)
+        .all()
+      )
+      for graph in graphs:
+        graph_tuple = graph.tuple
+        graph.shard_id, graph.shard_index = writer.Add(graph_tuple)
+        graph.pickled_graph_tuple_size = graph_tuple_shards.GraphTupleSize(
+          graph_tuple
+        )
+        # Orphaning the data row deletes it.
+        graph.data = None
+      writer.Flush()
+    self.ctx.i += len(ids)
+
+
+def Main():
+  """Main entry point."""
+  if not FLAGS.graph_tuple_shards_dir:
+    raise app.UsageError("--graph_tuple_shards_dir must be set")
+  graph_db: graph_tuple_database.Database = FLAGS.graph_db()
+  progress.Run(
+    ShardGraphTuples(
+      graph_db,
+      FLAGS.graph_tuple_shards_dir,
+      FLAGS.graph_tuple_shard_size_mb,
+    )
+  )
+  graph_db.RefreshStats()
+  print(f"Sharded {graph_db}")
+
+
+if __name__ == "__main__":
+  app.Run(Main)
@@ -18,9 +18,9 @@ import typing
 from typing import List
 
 import networkx as nx
-import pydot
 import pyparsing
 
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import dot_parser
 from labm8.py import app
 from labm8.py import labtypes
 
@@ -43,8 +43,8 @@ def CallGraphFromDotSource(dot_source: str) -> nx.MultiDiGraph:
     ValueError: If dotfile could not be interpretted / is malformed.
   """
   try:
-    parsed_dots = pydot.graph_from_dot_data(dot_source)
-  except TypeError as e:
+    parsed_dots = dot_parser.ParseDotGraphs(dot_source)
+  except dot_parser.DotParseError as e:
     raise pyparsing.ParseException("Failed to parse dot source") from e
 
   if len(parsed_dots) != 1:
@@ -52,9 +52,17 @@ def CallGraphFromDotSource(dot_source: str) -> nx.MultiDiGraph:
 
   dot = parsed_dots[0]
 
-  graph = nx.drawing.nx_pydot.from_pydot(dot)
-
-  # Nodes are given a fairly arbitrary name by pydot, instead, we want to name
+  # Build the graph from the node and edge statements. Nodes which are only
+  # referenced by edges are added without attributes.
+  graph = nx.MultiDiGraph(name=dot.name.strip('"'))
+  for node in dot.nodes:
+    graph.add_node(node.name.strip('"'), **node.attributes)
+  for edge in dot.edges:
+    graph.add_edge(
+      edge.source.strip('"'), edge.destination.strip('"'), **edge.attributes
+    )
+
+  # Nodes are given a fairly arbitrary name by opt, instead, we want to name
   # the nodes by their label, which, for all except the magic "external node"
   # node, is the name of a function.
   node_name_to_label = {}
@@ -0,0 +1,353 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A fast parser for the dot graphs produced by LLVM's opt.
+
+The -dot-cfg, -dot-callgraph, and polly -dot-scops passes produce a small and
+regular subset of the dot language. This module implements a streaming
+tokenizer and recursive descent parser for that subset, which is much faster
+than parsing using pydot's general purpose pyparsing grammar.
+
+The parsed graphs provide the subset of the pydot interface that is needed to
+build graphs, e.g. get_name(), get_attributes(), and get_nodes(). As with
+pydot, names and attribute values are returned verbatim from the dot source,
+so quoted strings retain their quotes and escape sequences.
+
+Unsupported dot features: HTML strings, string concatenation using '+', and
+edges to or from subgraphs.
+"""
+import re
+import typing
+
+from labm8.py import app
+
+
+FLAGS = app.FLAGS
+
+
+class DotParseError(ValueError):
+  """Error raised if a dot source cannot be parsed."""
+
+  pass
+
+
+class DotNode(object):
+  """A node statement in a dot graph, e.g. `Node0x1 [shape=record];`."""
+
+  __slots__ = ("name", "attributes")
+
+  def __init__(self, name: str, attributes: typing.Dict[str, str]):
+    self.name = name
+    self.attributes = attributes
+
+  def get_name(self) -> str:
+    return self.name
+
+  def get_attributes(self) -> typing.Dict[str, str]:
+    return self.attributes
+
+  def get(self, name: str) -> typing.Optional[str]:
+    return self.attributes.get(name)
+
+  def __repr__(self) -> str:
+    return f"DotNode({self.name})"
+
+
+class DotEdge(object):
+  """An edge in a dot graph, e.g. `Node0x1:s0 -> Node0x2;`.
+
+  Source and destination names include the port, if any.
+  """
+
+  __slots__ = ("source", "destination", "attributes")
+
+  def __init__(
+    self, source: str, destination: str, attributes: typing.Dict[str, str]
+  ):
+    self.source = source
+    self.destination = destination
+    self.attributes = attributes
+
+  def get_source(self) -> str:
+    return self.source
+
+  def get_destination(self) -> str:
+    return self.destination
+
+  def get_attributes(self) -> typing.Dict[str, str]:
+    return self.attributes
+
+  def __repr__(self) -> str:
+    return f"DotEdge({self.source} -> {self.destination})"
+
+
+class DotGraph(object):
+  """A dot graph or subgraph.
+
+  Nodes only include explicit node statements, in the order that they appear.
+  Nodes which are only referenced by edges are not included, and node, edge,
+  and graph default attribute statements are stored separately.
+  """
+
+  __slots__ = (
+    "graph_type",
+    "strict",
+    "name",
+    "attributes",
+    "node_defaults",
+    "edge_defaults",
+    "nodes",
+    "edges",
+    "subgraphs",
+  )
+
+  def __init__(self, graph_type: str, name: str = "", strict: bool = False):
+    self.graph_type = graph_type
+    self.strict = strict
+    self.name = name
+    self.attributes: typing.Dict[str, str] = {}
+    self.node_defaults: typing.Dict[str, str] = {}
+    self.edge_defaults: typing.Dict[str, str] = {}
+    self.nodes: typing.List[DotNode] = []
+    self.edges: typing.List[DotEdge] = []
+    self.subgraphs: typing.List["DotGraph"] = []
+
+  def get_name(self) -> str:
+    return self.name
+
+  def get_type(self) -> str:
+    return self.graph_type
+
+  def get_strict(self) -> bool:
+    return self.strict
+
+  def get_attributes(self) -> typing.Dict[str, str]:
+    return self.attributes
+
+  def get(self, name: str) -> typing.Optional[str]:
+    return self.attributes.get(name)
+
+  def get_nodes(self) -> typing.List[DotNode]:
+    return self.nodes
+
+  def get_edges(self) -> typing.List[DotEdge]:
+    return self.edges
+
+  def get_subgraphs(self) -> typing.List["DotGraph"]:
+    return self.subgraphs
+
+  def __repr__(self) -> str:
+    return f"DotGraph({self.graph_type} {self.name})"
+
+
+# The tokens of the dot language. Whitespace and comments are matched by the
+# unnamed group so that the tokenizer can check that every character of the
+# input is consumed.
+_TOKEN_RE = re.compile(
+  r"""
+  (?:\s+|//[^\n]*|/\*.*?\*/)
+  |(?P<ID>
+    "(?:[^"\\]|\\.)*"
+    |[^\W\d]\w*
+    |-?(?:\.\d+|\d+(?:\.\d*)?)
+  )
+  |(?P<OP>->|--|[{}\[\];,=:])
+  """,
+  re.VERBOSE | re.DOTALL,
+)
+
+# Keywords are case-insensitive, and are only keywords when unquoted.
+_KEYWORDS = {"strict", "graph", "digraph", "subgraph", "node", "edge"}
+
+# A token is a tuple of <kind, text>. The kind of identifiers is "ID", the kind
+# of keywords is the lower-case keyword, and the kind of operators is the
+# operator.
+Token = typing.Tuple[str, str]
+
+_EOF: Token = ("EOF", "")
+
+
+def _Tokenize(source: str) -> typing.Iterator[Token]:
+  """Produce the tokens of a dot source."""
+  position = 0
+  for match in _TOKEN_RE.finditer(source):
+    if match.start() != position:
+      raise DotParseError(
+        f"Unexpected character {source[position]!r} at offset {position}"
+      )
+    position = match.end()
+
+    kind = match.lastgroup
+    if kind == "ID":
+      text = match.group()
+      keyword = text.lower()
+      if keyword in _KEYWORDS:
+        yield keyword, text
+      else:
+        yield "ID", text
+    elif kind == "OP":
+      text = match.group()
+      yield text, text
+
+  if position != len(source):
+    raise DotParseError(
+      f"Unexpected character {source[position]!r} at offset {position}"
+    )
+
+
+class _Parser(object):
+  """A recursive descent parser which consumes a stream of tokens."""
+
+  def __init__(self, source: str):
+    self._tokens = _Tokenize(source)
+    self._lookahead: typing.Optional[Token] = None
+
+  def _Next(self) -> Token:
+    if self._lookahead is not None:
+      token, self._lookahead = self._lookahead, None
+      return token
+    return next(self._tokens, _EOF)
+
+  def _Peek(self) -> str:
+    """Return the kind of the next token without consuming it."""
+    if self._lookahead is None:
+      self._lookahead = next(self._tokens, _EOF)
+    return self._lookahead[0]
+
+  def _Expect(self, expected_kind: str) -> str:
+    kind, text = self._Next()
+    if kind != expected_kind:
+      raise DotParseError(f"Expected `{expected_kind}`, found `{text or kind}`")
+    return text
+
+  def ParseGraphs(self) -> typing.List[DotGraph]:
+    graphs = []
+    while self._Peek() != "EOF":
+      graphs.append(self._ParseGraph())
+    return graphs
+
+  def _ParseGraph(self) -> DotGraph:
+    kind, text = self._Next()
+    strict = kind == "strict"
+    if strict:
+      kind, text = self._Next()
+    if kind not in {"graph", "digraph"}:
+      raise DotParseError(f"Expected `graph` or `digraph`, found `{text}`")
+
+    graph = DotGraph(kind, strict=strict)
+    if self._Peek() == "ID":
+      graph.name = self._Next()[1]
+    self._Expect("{")
+    self._ParseStatements(graph)
+    return graph
+
+  def _ParseStatements(self, graph: DotGraph) -> None:
+    """Parse statements up to and including the closing brace of a graph."""
+    while True:
+      kind, text = self._Next()
+      if kind == "ID":
+        if self._Peek() == "=":
+          # A graph attribute, e.g. `label="CFG for 'main' function";`.
+          self._Next()
+          graph.attributes[text] = self._Expect("ID")
+        else:
+          self._ParseNodeOrEdgeStatement(graph, text)
+      elif kind == ";":
+        continue
+      elif kind == "}":
+        return
+      elif kind == "subgraph" or kind == "{":
+        graph.subgraphs.append(self._ParseSubgraph(kind))
+        if self._Peek() in {"->", "--"}:
+          raise DotParseError("Edges from subgraphs are not supported")
+      elif kind == "graph":
+        graph.attributes.update(self._ParseAttributes())
+      elif kind == "node":
+        graph.node_defaults.update(self._ParseAttributes())
+      elif kind == "edge":
+        graph.edge_defaults.update(self._ParseAttributes())
+      elif kind == "EOF":
+        raise DotParseError("Unexpected end of dot source")
+      else:
+        raise DotParseError(f"Unexpected `{text}`")
+
+  def _ParseSubgraph(self, kind: str) -> DotGraph:
+    subgraph = DotGraph("subgraph")
+    if kind == "subgraph":
+      if self._Peek() == "ID":
+        subgraph.name = self._Next()[1]
+      self._Expect("{")
+    self._ParseStatements(subgraph)
+    return subgraph
+
+  def _ParseNodeId(self, name: str) -> str:
+    """Parse the optional port and compass point of a node ID."""
+    while self._Peek() == ":":
+      self._Next()
+      name = f"{name}:{self._Expect('ID')}"
+    return name
+
+  def _ParseNodeOrEdgeStatement(self, graph: DotGraph, name: str) -> None:
+    name = self._ParseNodeId(name)
+
+    if self._Peek() not in {"->", "--"}:
+      graph.nodes.append(DotNode(name, self._ParseAttributes()))
+      return
+
+    # An edge statement, which may be a chain of edges, e.g. `A -> B -> C;`.
+    endpoints = [name]
+    while self._Peek() in {"->", "--"}:
+      self._Next()
+      if self._Peek() != "ID":
+        raise DotParseError("Edges to subgraphs are not supported")
+      endpoints.append(self._ParseNodeId(self._Next()[1]))
+    attributes = self._ParseAttributes()
+    for src, dst in zip(endpoints, endpoints[1:]):
+      graph.edges.append(DotEdge(src, dst, dict(attributes)))
+
+  def _ParseAttributes(self) -> typing.Dict[str, str]:
+    """Parse zero or more attribute lists, e.g. `[shape=record,label="{}"]`."""
+    attributes = {}
+    while self._Peek() == "[":
+      self._Next()
+      while True:
+        kind, text = self._Next()
+        if kind == "]":
+          break
+        elif kind == "," or kind == ";":
+          continue
+        elif kind != "ID":
+          raise DotParseError(f"Expected attribute name, found `{text or kind}`")
+        if self._Peek() == "=":
+          self._Next()
+          attributes[text] = self._Expect("ID")
+        else:
+          attributes[text] = "true"
+    return attributes
+
+
+def ParseDotGraphs(dot_source: str) -> typing.List[DotGraph]:
+  """Parse the graphs in a dot source.
+
+  Args:
+    dot_source: The dot source, as produced by opt.
+
+  Returns:
+    A list of graphs, in the order that they appear in the source.
+
+  Raises:
+    DotParseError: If the dot source cannot be parsed.
+  """
+  return _Parser(dot_source).ParseGraphs()
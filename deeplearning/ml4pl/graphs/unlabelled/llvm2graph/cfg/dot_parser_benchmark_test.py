@@ -0,0 +1,174 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmarks for //deeplearning/ml4pl/graphs/unlabelled/llvm2graph/cfg:dot_parser.
+
+The benchmarks parse the dot graphs of the bytecode regression tests, comparing
+the dot parser against pydot.
+"""
+from typing import List
+
+import networkx as nx
+import pydot
+
+from compilers.llvm import llvm
+from compilers.llvm import opt_util
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph import call_graph
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import dot_parser
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import llvm_util
+from labm8.py import bazelutil
+from labm8.py import fs
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+MODULE_UNDER_TEST = None
+
+REGRESSION_TESTS = bazelutil.DataPath(
+  "phd/deeplearning/ml4pl/testing/data/bytecode_regression_tests"
+)
+
+
+def CallGraphFromDotSourceReference(dot_source: str) -> nx.MultiDiGraph:
+  """The original pydot implementation of CallGraphFromDotSource(), used as a
+  baseline for comparison.
+  """
+  dot = pydot.graph_from_dot_data(dot_source)[0]
+  graph = nx.drawing.nx_pydot.from_pydot(dot)
+
+  node_name_to_label = {}
+  nodes_to_delete = []
+  for node, data in graph.nodes(data=True):
+    if "label" not in data:
+      nodes_to_delete.append(node)
+      continue
+    node_name_to_label[node] = data["label"][2:-2]
+    del data["shape"]
+    del data["label"]
+
+  for node in nodes_to_delete:
+    graph.remove_node(node)
+
+  nx.relabel_nodes(graph, node_name_to_label, copy=False)
+  return graph
+
+
+@test.Fixture(scope="session")
+def dots() -> List[str]:
+  """Test fixture which returns the call graph and CFG dots of the bytecode
+  regression tests.
+  """
+  dots = []
+  for path in sorted(REGRESSION_TESTS.iterdir()):
+    if path.suffix != ".ll":
+      continue
+    try:
+      (
+        call_graph_dot,
+        cfg_dots,
+      ) = opt_util.DotCallGraphAndControlFlowGraphsFromBytecode(fs.Read(path))
+    except (llvm.LlvmError, UnicodeDecodeError):
+      # Some of the regression tests are for bytecodes that opt rejects.
+      continue
+    dots.append(call_graph_dot)
+    dots += cfg_dots
+  assert dots
+  return dots
+
+
+@test.Fixture(scope="session")
+def cfg_dots(dots: List[str]) -> List[str]:
+  """Test fixture which returns the CFG dots of the bytecode regression tests.
+
+  Dots which do not produce valid CFGs, e.g. for functions without exit blocks,
+  are excluded.
+  """
+  cfg_dots = []
+  for dot in dots:
+    if dot.startswith('digraph "Call graph'):
+      continue
+    try:
+      llvm_util.ControlFlowGraphFromDotSource(dot)
+      cfg_dots.append(dot)
+    except ValueError:
+      pass
+  return cfg_dots
+
+
+@test.Fixture(scope="session")
+def call_graph_dots(dots: List[str]) -> List[str]:
+  """Test fixture which returns the call graph dots of the bytecode regression
+  tests.
+  """
+  return [dot for dot in dots if dot.startswith('digraph "Call graph')]
+
+
+def test_ParseDotGraphs_equals_pydot(dots: List[str]):
+  """Check that the parsed nodes and edges match those parsed by pydot."""
+  for dot in dots:
+    (a,) = dot_parser.ParseDotGraphs(dot)
+    (b,) = pydot.graph_from_dot_data(dot)
+    assert a.get_name() == b.get_name()
+    assert a.get_attributes() == b.get_attributes()
+    assert [(n.get_name(), n.get_attributes()) for n in a.get_nodes()] == [
+      (n.get_name(), n.get_attributes()) for n in b.get_nodes()
+    ]
+    assert [(e.get_source(), e.get_destination()) for e in a.get_edges()] == [
+      (e.get_source(), e.get_destination()) for e in b.get_edges()
+    ]
+
+
+def test_CallGraphFromDotSource_equals_reference(call_graph_dots: List[str]):
+  """Check that call graphs match those built using pydot."""
+  for dot in call_graph_dots:
+    a = call_graph.CallGraphFromDotSource(dot)
+    b = CallGraphFromDotSourceReference(dot)
+    assert list(a.nodes(data=True)) == list(b.nodes(data=True))
+    assert list(a.edges(keys=True, data=True)) == list(
+      b.edges(keys=True, data=True)
+    )
+
+
+def test_benchmark_ParseDotGraphs(benchmark, dots: List[str]):
+  """Benchmark the dot parser."""
+  benchmark(lambda: [dot_parser.ParseDotGraphs(dot) for dot in dots])
+
+
+def test_benchmark_pydot(benchmark, dots: List[str]):
+  """Benchmark pydot's parser."""
+  benchmark(lambda: [pydot.graph_from_dot_data(dot) for dot in dots])
+
+
+def test_benchmark_ControlFlowGraphFromDotSource(
+  benchmark, cfg_dots: List[str]
+):
+  """Benchmark control flow graph construction."""
+  benchmark(
+    lambda: [llvm_util.ControlFlowGraphFromDotSource(dot) for dot in cfg_dots]
+  )
+
+
+def test_benchmark_CallGraphFromDotSource(
+  benchmark, call_graph_dots: List[str]
+):
+  """Benchmark call graph construction."""
+  benchmark(
+    lambda: [call_graph.CallGraphFromDotSource(dot) for dot in call_graph_dots]
+  )
+
+
+if __name__ == "__main__":
+  test.Main()
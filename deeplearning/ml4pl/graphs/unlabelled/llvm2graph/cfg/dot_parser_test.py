@@ -0,0 +1,246 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/graphs/unlabelled/llvm2graph/cfg:dot_parser."""
+import pydot
+
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph import call_graph
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import dot_parser
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+# A CFG produced by opt -dot-cfg. I converted tabs to spaces.
+CFG_DOT = """
+digraph "CFG for 'FizzBuzz' function" {
+  label="CFG for 'FizzBuzz' function";
+
+  Node0x7f8d5f507570 [shape=record,label="{%1:\\l  %2 = alloca i32, align 4\\l  %5 = srem i32 %4, 15\\l  %6 = icmp eq i32 %5, 0\\l  br i1 %6, label %7, label %8\\l|{<s0>T|<s1>F}}"];
+  Node0x7f8d5f507570:s0 -> Node0x7f8d5f507930;
+  Node0x7f8d5f507570:s1 -> Node0x7f8d5f5079c0;
+  Node0x7f8d5f507930 [shape=record,label="{%7:\\l\\l  store i32 1, i32* %2, align 4\\l  br label %9\\l}"];
+  Node0x7f8d5f507930 -> Node0x7f8d5f507b50;
+  Node0x7f8d5f5079c0 [shape=record,color="#b70d28ff", style=filled, fillcolor="#b70d2870",label="{%8:\\l\\l  store i32 0, i32* %2, align 4\\l  br label %9\\l}"];
+  Node0x7f8d5f5079c0 -> Node0x7f8d5f507b50;
+  Node0x7f8d5f507b50 [shape=record,label="{%9:\\l\\l  %10 = load i32, i32* %2, align 4\\l  ret i32 %10\\l}"];
+}
+"""
+
+# A CFG produced by polly -dot-scops, with nested region subgraphs.
+SCOPS_DOT = """
+digraph "Scop Graph for 'foo' function" {
+  label="Scop Graph for 'foo' function";
+
+  Node0x1 [shape=record,label="{%1:\\l  br label %2\\l}"];
+  Node0x1 -> Node0x2;
+  Node0x2 [shape=record,label="{%2:\\l  br label %3\\l}"];
+  Node0x2 -> Node0x3;
+  Node0x3 [shape=record,label="{%3:\\l  ret void\\l}"];
+  colorscheme = "paired12"
+  subgraph cluster_0x10 {
+    label = "";
+    style = solid;
+    color = 1
+    subgraph cluster_0x11 {
+      label = "Region can be optimized";
+      style = filled;
+      color = 3
+      Node0x2;
+    }
+    Node0x1;
+    Node0x3;
+  }
+}
+"""
+
+
+def test_ParseDotGraphs_cfg_graph():
+  """Test the attributes of a parsed CFG."""
+  (graph,) = dot_parser.ParseDotGraphs(CFG_DOT)
+  assert graph.get_type() == "digraph"
+  assert graph.get_name() == "\"CFG for 'FizzBuzz' function\""
+  assert graph.get("label") == "\"CFG for 'FizzBuzz' function\""
+
+
+def test_ParseDotGraphs_cfg_nodes():
+  """Test the nodes of a parsed CFG."""
+  (graph,) = dot_parser.ParseDotGraphs(CFG_DOT)
+  assert [n.get_name() for n in graph.get_nodes()] == [
+    "Node0x7f8d5f507570",
+    "Node0x7f8d5f507930",
+    "Node0x7f8d5f5079c0",
+    "Node0x7f8d5f507b50",
+  ]
+  node = graph.get_nodes()[1]
+  assert node.get("shape") == "record"
+  assert node.get("label") == (
+    '"{%7:\\l\\l  store i32 1, i32* %2, align 4\\l  br label %9\\l}"'
+  )
+  assert graph.get_nodes()[2].get("style") == "filled"
+
+
+def test_ParseDotGraphs_cfg_edges():
+  """Test that edge sources include their ports."""
+  (graph,) = dot_parser.ParseDotGraphs(CFG_DOT)
+  assert [(e.get_source(), e.get_destination()) for e in graph.get_edges()] == [
+    ("Node0x7f8d5f507570:s0", "Node0x7f8d5f507930"),
+    ("Node0x7f8d5f507570:s1", "Node0x7f8d5f5079c0"),
+    ("Node0x7f8d5f507930", "Node0x7f8d5f507b50"),
+    ("Node0x7f8d5f5079c0", "Node0x7f8d5f507b50"),
+  ]
+
+
+def test_ParseDotGraphs_subgraphs():
+  """Test that nested subgraphs are parsed."""
+  (graph,) = dot_parser.ParseDotGraphs(SCOPS_DOT)
+  assert len(graph.get_nodes()) == 3
+  assert graph.get("colorscheme") == '"paired12"'
+
+  (outer,) = graph.get_subgraphs()
+  assert outer.get_name() == "cluster_0x10"
+  assert outer.get("style") == "solid"
+  assert [n.get_name() for n in outer.get_nodes()] == ["Node0x1", "Node0x3"]
+
+  (inner,) = outer.get_subgraphs()
+  assert inner.get("style") == "filled"
+  assert inner.get("color") == "3"
+  assert [n.get_name() for n in inner.get_nodes()] == ["Node0x2"]
+
+
+def test_ParseDotGraphs_edge_chain():
+  """Test that a chain of edges produces an edge for each pair."""
+  (graph,) = dot_parser.ParseDotGraphs("digraph { a -> b -> c [w=1]; }")
+  assert [(e.source, e.destination, e.attributes) for e in graph.edges] == [
+    ("a", "b", {"w": "1"}),
+    ("b", "c", {"w": "1"}),
+  ]
+  assert not graph.nodes
+
+
+def test_ParseDotGraphs_defaults_are_not_nodes():
+  """Test that node and edge default attributes are not parsed as nodes."""
+  (graph,) = dot_parser.ParseDotGraphs(
+    "digraph G { node [shape=record]; edge [color=red]; a; }"
+  )
+  assert graph.node_defaults == {"shape": "record"}
+  assert graph.edge_defaults == {"color": "red"}
+  assert [n.name for n in graph.nodes] == ["a"]
+
+
+def test_ParseDotGraphs_comments():
+  """Test that comments are ignored."""
+  (graph,) = dot_parser.ParseDotGraphs(
+    "/* A graph. */ digraph G {\n  // A node.\n  a;\n}"
+  )
+  assert [n.name for n in graph.nodes] == ["a"]
+
+
+def test_ParseDotGraphs_multiple_graphs():
+  assert len(dot_parser.ParseDotGraphs("digraph a {} digraph b {}")) == 2
+  assert dot_parser.ParseDotGraphs("") == []
+
+
+@test.Parametrize(
+  "dot_source",
+  (
+    "invalid dot source!",
+    "digraph {",
+    'digraph { a [label="unterminated]; }',
+    "digraph { a -> { b }; }",
+    "digraph { a [label=<b>] }",
+  ),
+)
+def test_ParseDotGraphs_invalid_source(dot_source: str):
+  """Test that an error is raised for invalid or unsupported dot sources."""
+  with test.Raises(dot_parser.DotParseError):
+    dot_parser.ParseDotGraphs(dot_source)
+
+
+@test.Parametrize("dot_source", (CFG_DOT, SCOPS_DOT))
+def test_ParseDotGraphs_equals_pydot(dot_source: str):
+  """Test that the parsed graph matches the graph parsed by pydot."""
+  (graph,) = dot_parser.ParseDotGraphs(dot_source)
+  (pydot_graph,) = pydot.graph_from_dot_data(dot_source)
+
+  def Compare(a: dot_parser.DotGraph, b: pydot.Dot):
+    assert a.get_name() == b.get_name()
+    assert a.get_attributes() == b.get_attributes()
+    assert [(n.get_name(), n.get_attributes()) for n in a.get_nodes()] == [
+      (n.get_name(), n.get_attributes()) for n in b.get_nodes()
+    ]
+    assert [
+      (e.get_source(), e.get_destination(), e.get_attributes())
+      for e in a.get_edges()
+    ] == [
+      (e.get_source(), e.get_destination(), e.get_attributes())
+      for e in b.get_edges()
+    ]
+    assert len(a.get_subgraphs()) == len(b.get_subgraphs())
+    for a_subgraph, b_subgraph in zip(a.get_subgraphs(), b.get_subgraphs()):
+      Compare(a_subgraph, b_subgraph)
+
+  Compare(graph, pydot_graph)
+
+
+
+# A call graph produced by opt -dot-callgraph. The unlabelled node is the
+# "calls external node".
+CALL_GRAPH_DOT = """
+digraph "Call graph" {
+  label="Call graph";
+
+  Node0x1 [shape=record,label="{external node}"];
+  Node0x1 -> Node0x2;
+  Node0x1 -> Node0x3;
+  Node0x1 -> Node0x4;
+  Node0x2 [shape=record,label="{main}"];
+  Node0x2 -> Node0x3;
+  Node0x2 -> Node0x3;
+  Node0x2 -> Node0x4;
+  Node0x3 [shape=record,label="{foo}"];
+  Node0x4 [shape=record,label="{printf}"];
+  Node0x4 -> Node0x5;
+}
+"""
+
+
+def test_CallGraphFromDotSource_graph():
+  """Test the call graph built from a parsed dot graph."""
+  graph = call_graph.CallGraphFromDotSource(CALL_GRAPH_DOT)
+  assert graph.name == "Call graph"
+  assert sorted(graph.nodes(data=True)) == [
+    ("external node", {}),
+    ("foo", {}),
+    ("main", {}),
+    ("printf", {}),
+  ]
+  assert sorted(graph.edges()) == [
+    ("external node", "foo"),
+    ("external node", "main"),
+    ("external node", "printf"),
+    ("main", "foo"),
+    ("main", "foo"),
+    ("main", "printf"),
+  ]
+  assert call_graph.CallGraphToFunctionCallCounts(graph) == {
+    "main": 0,
+    "foo": 2,
+    "printf": 1,
+  }
+
+
+if __name__ == "__main__":
+  test.Main()
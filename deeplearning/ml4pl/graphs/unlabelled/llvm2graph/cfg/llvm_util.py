@@ -14,18 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Utility code for creating CFGs and FFGs from LLVM bytecodes."""
+import itertools
 import multiprocessing
 import re
 import typing
+from concurrent import futures
+from concurrent.futures import process
 
 import networkx as nx
-import pydot
 import pyparsing
 
 from compilers.llvm import opt_util
 from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import (
   control_flow_graph as cfg,
 )
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import dot_parser
 from labm8.py import app
 from labm8.py import humanize
 
@@ -80,11 +83,11 @@ class TagHook(object):
   """An object that is called while parsing an LLVM dot graph to a CFG. Used, e.g., 
   for annotation. """
 
-  def OnGraphBegin(self, dot: pydot.Dot):
+  def OnGraphBegin(self, dot: dot_parser.DotGraph):
     """Called upon first encounter of a dot graph."""
     pass
 
-  def OnNode(self, node: pydot.Node) -> typing.Dict[str, typing.Any]:
+  def OnNode(self, node: dot_parser.DotNode) -> typing.Dict[str, typing.Any]:
     """Called when a node is encountered. Returns additional attributes to encountered node."""
     pass
 
@@ -318,8 +321,8 @@ def ControlFlowGraphFromDotSource(
     ValueError: If dotfile could not be interpretted / is malformed.
   """
   try:
-    parsed_dots = pydot.graph_from_dot_data(dot_source)
-  except TypeError as e:
+    parsed_dots = dot_parser.ParseDotGraphs(dot_source)
+  except dot_parser.DotParseError as e:
     raise pyparsing.ParseException("Failed to parse dot source") from e
 
   if len(parsed_dots) != 1:
@@ -330,9 +333,9 @@ def ControlFlowGraphFromDotSource(
   if tag_hook:
     tag_hook.OnGraphBegin(dot)
 
-  function_name_match = re.match(_DOT_CFG_FUNCTION_NAME_RE, dot.get_name())
+  function_name_match = re.match(_DOT_CFG_FUNCTION_NAME_RE, dot.name)
   if not function_name_match:
-    raise ValueError(f"Could not interpret graph name '{dot.get_name()}'")
+    raise ValueError(f"Could not interpret graph name '{dot.name}'")
 
   # Create the ControlFlowGraph instance.
   graph = LlvmControlFlowGraph(
@@ -343,29 +346,27 @@ def ControlFlowGraphFromDotSource(
   # nodes simple integer names.
   # Create the nodes and build a map from node names to indices.
   node_name_to_index_map = {}
-  for i, node in enumerate(dot.get_nodes()):
-    if node.get_name() in node_name_to_index_map:
-      raise ValueError(f"Duplicate node name: '{node.get_name()}'")
-    node_name_to_index_map[node.get_name()] = i
+  for i, node in enumerate(dot.nodes):
+    if node.name in node_name_to_index_map:
+      raise ValueError(f"Duplicate node name: '{node.name}'")
+    node_name_to_index_map[node.name] = i
     if tag_hook:
       other_attrs = tag_hook.OnNode(node) or {}
     else:
       other_attrs = {}
     graph.add_node(
-      i, **NodeAttributesToBasicBlock(node.get_attributes()), **other_attrs
+      i, **NodeAttributesToBasicBlock(node.attributes), **other_attrs
     )
 
   # Create edges and encode their position. The position is an integer starting
   # at zero and increasing for each outgoing edge, e.g. a switch with `n` cases
   # will have 0..(n-1) unique positions.
-  for edge in dot.get_edges():
+  for edge in dot.edges:
     # In the dot file, an edge looks like this:
     #     Node0x7f86c670c590:s0 -> Node0x7f86c65001a0;
-    src_components = edge.get_source().split(":")
+    src_components = edge.source.split(":")
     if len(src_components) > 2:
-      raise ValueError(
-        f"Cannot interpret edge source name `{edge.get_source()}`"
-      )
+      raise ValueError(f"Cannot interpret edge source name `{edge.source}`")
     elif len(src_components) == 2:
       # Case: Node0x7f87aaf14520:s0
       src_name, position_name = src_components
@@ -375,7 +376,7 @@ def ControlFlowGraphFromDotSource(
       src_name, position = src_components[0], 0
 
     src = node_name_to_index_map[src_name]
-    dst = node_name_to_index_map[edge.get_destination()]
+    dst = node_name_to_index_map[edge.destination]
     graph.add_edge(src, dst, position=position)
 
   # Optionally remove blocks without predecessors (except the entry block).
@@ -444,76 +445,93 @@ class ControlFlowGraphFromDotSourceError(ValueError):
     self.error = error
 
 
-def _DotControlFlowGraphsFromBytecodeToQueue(
-  bytecode: str, queue: multiprocessing.Queue
-) -> None:
-  """Process a bytecode and submit the dot source or the exception."""
-  try:
-    queue.put(list(opt_util.DotControlFlowGraphsFromBytecode(bytecode)))
-  except Exception as e:
-    queue.put(DotControlFlowGraphsFromBytecodeError(bytecode, e))
-
-
-def _ControlFlowGraphFromDotSourceToQueue(
-  dot: str, queue: multiprocessing.Queue
-) -> None:
-  """Process a dot source and submit the CFG or the exception."""
+def _ControlFlowGraphsFromBytecode(
+  bytecode: str,
+) -> typing.List[typing.Union[LlvmControlFlowGraph, ValueError]]:
+  """Create the CFGs for a bytecode, returning errors in place of the CFGs."""
   try:
-    queue.put(ControlFlowGraphFromDotSource(dot))
+    dots = list(opt_util.DotControlFlowGraphsFromBytecode(bytecode))
   except Exception as e:
-    queue.put(ControlFlowGraphFromDotSourceError(dot, e))
+    return [DotControlFlowGraphsFromBytecodeError(bytecode, e)]
 
-
-class ExceptionBuffer(Exception):
-  """A meta-exception that is used to buffer multiple errors to be raised."""
-
-  def __init__(self, errors):
-    self.errors = errors
+  results = []
+  for dot in dots:
+    try:
+      results.append(ControlFlowGraphFromDotSource(dot))
+    except Exception as e:
+      results.append(ControlFlowGraphFromDotSourceError(dot, e))
+  return results
 
 
 def ControlFlowGraphsFromBytecodes(
-  bytecodes: typing.Iterator[str],
-) -> typing.Iterator[cfg.ControlFlowGraph]:
-  """A parallelised implementation of bytecode->CFG function."""
-  dot_processes = []
-  dot_queue = multiprocessing.Queue()
-  for bytecode in bytecodes:
-    process = multiprocessing.Process(
-      target=_DotControlFlowGraphsFromBytecodeToQueue,
-      args=(bytecode, dot_queue),
-    )
-    process.start()
-    dot_processes.append(process)
-
-  cfg_processes = []
-  cfg_queue = multiprocessing.Queue()
+  bytecodes: typing.Iterable[str],
+  nproc: typing.Optional[int] = None,
+  max_pending_count: typing.Optional[int] = None,
+) -> typing.Iterator[typing.Union[LlvmControlFlowGraph, ValueError]]:
+  """A parallelised implementation of bytecode->CFG function.
+
+  Bytecodes are processed by a fixed size pool of worker processes. The input
+  iterator is consumed lazily, so that no more than max_pending_count
+  bytecodes are in flight at a time. If a worker process dies, e.g. because it
+  is killed by the OOM killer, every job which was in flight fails, and the
+  remaining bytecodes are processed by a new pool.
 
-  e = ExceptionBuffer([])
-
-  for _ in range(len(dot_processes)):
-    dots = dot_queue.get()
-    if isinstance(dots, Exception):
-      e.errors.append(dots)
-    else:
-      for dot in dots:
-        process = multiprocessing.Process(
-          target=_ControlFlowGraphFromDotSourceToQueue, args=(dot, cfg_queue)
-        )
-        process.start()
-        cfg_processes.append(process)
-
-  # Get the graphs generated by the CFG processes.
-  for _ in range(len(cfg_processes)):
-    graph = cfg_queue.get()
-    if isinstance(graph, Exception):
-      e.errors.append(graph)
-    else:
-      yield graph
+  Args:
+    bytecodes: The bytecodes to create CFGs from.
+    nproc: The number of worker processes. Defaults to the number of CPUs.
+    max_pending_count: The maximum number of bytecodes to process
+      concurrently. Defaults to twice the number of worker processes.
 
-  # Make sure that all processes have terminated. They will have, but best to
-  # check.
-  [p.join() for p in dot_processes]
-  [p.join() for p in cfg_processes]
+  Returns:
+    An iterator of CFGs, in the order that they are completed. If a bytecode
+    cannot be processed, a DotControlFlowGraphsFromBytecodeError is returned in
+    place of its CFGs. If a CFG cannot be created, a
+    ControlFlowGraphFromDotSourceError is returned in its place.
+  """
+  nproc = nproc or multiprocessing.cpu_count()
+  max_pending_count = max_pending_count or 2 * nproc
+
+  bytecodes = iter(bytecodes)
+  # Unlike a multiprocessing.Pool, which silently replaces a dead worker and
+  # never completes its job, a ProcessPoolExecutor fails the jobs of a dead
+  # worker with a BrokenProcessPool error.
+  executor = futures.ProcessPoolExecutor(max_workers=nproc)
+  # A mapping from the futures of in-flight jobs to their bytecodes and the
+  # executor that they were submitted to.
+  pending: typing.Dict[
+    futures.Future, typing.Tuple[str, futures.ProcessPoolExecutor]
+  ] = {}
+
+  def Submit():
+    for bytecode in itertools.islice(
+      bytecodes, max_pending_count - len(pending)
+    ):
+      future = executor.submit(_ControlFlowGraphsFromBytecode, bytecode)
+      pending[future] = (bytecode, executor)
 
-  if e.errors:
-    raise e
+  try:
+    Submit()
+    while pending:
+      done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+      results = []
+      for future in done:
+        bytecode, job_executor = pending.pop(future)
+        try:
+          results += future.result()
+        except Exception as e:
+          if (
+            isinstance(e, process.BrokenProcessPool)
+            and job_executor is executor
+          ):
+            # The pool cannot run any more jobs, so start a new one.
+            executor.shutdown(wait=False)
+            executor = futures.ProcessPoolExecutor(max_workers=nproc)
+          results.append(DotControlFlowGraphsFromBytecodeError(bytecode, e))
+      # Keep the workers busy while the caller consumes the results.
+      Submit()
+      yield from results
+  finally:
+    # Cancel the queued jobs if the caller stops iterating.
+    for future in pending:
+      future.cancel()
+    executor.shutdown(wait=False)
@@ -14,6 +14,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/unlabelled/llvm2graph/cfg:llvm_util."""
+import os
+
 import pyparsing
 
 from compilers.llvm import opt
@@ -286,26 +288,67 @@ def test_ControlFlowGraphsFromBytecodes_num_graphs():
 
 
 def test_ControlFlowGraphsFromBytecodes_one_failure():
-  """Errors during construction of CFGs are buffered until complete."""
+  """Errors during construction of CFGs are returned in place of the CFGs."""
   # The middle job of the three will throw an opt.optException.
+  results = list(
+    llvm_util.ControlFlowGraphsFromBytecodes(
+      [SIMPLE_C_BYTECODE, "Invalid bytecode!", SIMPLE_C_BYTECODE,]
+    )
+  )
+
+  # We still get all of the valid CFGs out of input[0] and input[2], and the
+  # exception from input[1], along with the input that caused it.
+  assert len(results) == 5
+  errors = [r for r in results if isinstance(r, Exception)]
+  assert len(errors) == 1
+  assert isinstance(errors[0], llvm_util.DotControlFlowGraphsFromBytecodeError)
+  assert errors[0].input == "Invalid bytecode!"
+  assert isinstance(errors[0].error, opt.OptException)
+
+
+def test_ControlFlowGraphsFromBytecodes_lazy_input():
+  """Test that the input iterator is consumed as jobs complete."""
+  consumed_count = 0
+
+  def Bytecodes():
+    nonlocal consumed_count
+    for _ in range(10):
+      consumed_count += 1
+      yield SIMPLE_C_BYTECODE
+
   generator = llvm_util.ControlFlowGraphsFromBytecodes(
-    [SIMPLE_C_BYTECODE, "Invalid bytecode!", SIMPLE_C_BYTECODE,]
+    Bytecodes(), nproc=1, max_pending_count=2
+  )
+  assert isinstance(next(generator), llvm_util.LlvmControlFlowGraph)
+  assert consumed_count == 3
+  assert len(list(generator)) == 19
+
+
+def _ExitOnInvalidBytecode(bytecode: str):
+  """A worker function which kills its worker process on invalid input."""
+  if bytecode == "Invalid bytecode!":
+    os._exit(1)
+  return [bytecode]
+
+
+def test_ControlFlowGraphsFromBytecodes_worker_dies(monkeypatch):
+  """Test that the death of a worker process fails its jobs rather than
+  blocking forever, and that the remaining bytecodes are processed."""
+  monkeypatch.setattr(
+    llvm_util, "_ControlFlowGraphsFromBytecode", _ExitOnInvalidBytecode
+  )
+  results = list(
+    llvm_util.ControlFlowGraphsFromBytecodes(
+      ["a", "Invalid bytecode!"] + [str(i) for i in range(10)],
+      nproc=1,
+      max_pending_count=1,
+    )
   )
 
-  g = []
-  # We can still get all of the valid CFGs out of input[0] and input[2]. The
-  # exception from input[1] is will be raised once all processes have completed.
-  g.append(next(generator))
-  g.append(next(generator))
-  g.append(next(generator))
-  g.append(next(generator))
-  # Instead of StopIteration, an ExceptionBuffer will be thrown, which contains
-  # all the that were thrown, along with the inputs that caused the exception.
-  with test.Raises(llvm_util.ExceptionBuffer) as e_ctx:
-    next(generator)
-  assert len(e_ctx.value.errors) == 1
-  assert e_ctx.value.errors[0].input == "Invalid bytecode!"
-  assert isinstance(e_ctx.value.errors[0].error, opt.OptException)
+  assert results[0] == "a"
+  assert isinstance(results[1], llvm_util.DotControlFlowGraphsFromBytecodeError)
+  assert results[1].input == "Invalid bytecode!"
+  assert results[2:] == [str(i) for i in range(10)]
 
 
 # LLVM-generated dot file for a FizzBuzz() function.
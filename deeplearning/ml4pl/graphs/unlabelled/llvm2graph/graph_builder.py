@@ -18,11 +18,12 @@
 A ProGraML graph is a directed multigraph which is the union a control flow,
 data flow, and call graphs.
 """
-import signal
+import time
 import typing
 
 import networkx as nx
 
+from compilers.llvm import llvm
 from compilers.llvm import opt_util
 from deeplearning.ml4pl.graphs import nx_utils
 from deeplearning.ml4pl.graphs import programl_pb2
@@ -66,57 +67,122 @@ class ProGraMLGraphBuilder(object):
   ) -> nx.MultiDiGraph:
     """Construct a ProGraML from the given bytecode.
 
+    This method is thread safe.
+
     Args:
       bytecode: The bytecode to construct the graph from.
       tag_hook: An optional object that can tag specific nodes in the graph
                 according to some logic.
-      timeout_seconds: The maximum number of seconds to run before terminating.
+      timeout_seconds: The maximum number of seconds to allow graph
+        construction to run for, including opt.
 
     Returns:
       A networkx graph.
-    """
 
-    def _RaiseTimoutError(signum, frame):
-      del signum
-      del frame
-      raise TimeoutError(
-        f"Graph construction did not complete within {timeout_seconds} seconds"
+    Raises:
+      TimeoutError: If graph construction does not complete within
+        timeout_seconds.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    try:
+      dots = opt_util.DotCallGraphAndControlFlowGraphsFromBytecode(
+        bytecode, opt_path=self.opt, timeout_seconds=timeout_seconds
       )
+    except llvm.LlvmTimeout:
+      raise self._TimeoutError(timeout_seconds)
+    return self._Build(dots, tag_hook, deadline, timeout_seconds)
+
+  def BuildMany(
+    self,
+    bytecodes: typing.Iterable[str],
+    tag_hook: typing.Optional[llvm_util.TagHook] = None,
+    timeout_seconds: int = 120,
+  ) -> typing.Iterator[typing.Union[nx.MultiDiGraph, Exception]]:
+    """Construct ProGraML graphs from many bytecodes.
 
-    # Register a function to raise a TimeoutError on the signal.
-    signal.signal(signal.SIGALRM, _RaiseTimoutError)
-    signal.alarm(timeout_seconds)
+    The opt invocations for the bytecodes are distributed across the pooled
+    workers of the process-wide opt_util.DotGraphExtractor, so they run
+    concurrently on all cores.
 
-    try:
-      return self._Build(bytecode, tag_hook)
-    except TimeoutError as e:
-      raise e
-    finally:
-      # Unregister the signal so it won't be triggered
-      # if the timeout is not reached.
-      signal.signal(signal.SIGALRM, signal.SIG_IGN)
-
-  def _Build(self, bytecode: str, tag_hook: llvm_util.TagHook):
-    """Private implementation of Build function."""
-    # First construct the control flow graphs using opt.
-    (
-      call_graph_dot,
-      cfg_dots,
-    ) = opt_util.DotCallGraphAndControlFlowGraphsFromBytecode(
-      bytecode, opt_path=self.opt
+    Args:
+      bytecodes: The bytecodes to construct graphs from.
+      tag_hook: An optional object that can tag specific nodes in the graph
+                according to some logic.
+      timeout_seconds: The maximum number of seconds to allow opt to run for,
+        and to construct the graph from its output, per bytecode.
+
+    Returns:
+      An iterator of graphs, in the order of the input bytecodes. If a graph
+      cannot be constructed, the exception that was raised is returned in its
+      place.
+    """
+    for dots in opt_util.GetDotGraphExtractor().Map(
+      bytecodes, opt_path=self.opt, timeout_seconds=timeout_seconds
+    ):
+      if isinstance(dots, llvm.LlvmTimeout):
+        yield self._TimeoutError(timeout_seconds)
+      elif isinstance(dots, Exception):
+        yield dots
+      else:
+        try:
+          graph = self._Build(
+            dots, tag_hook, time.monotonic() + timeout_seconds, timeout_seconds
+          )
+        except Exception as e:
+          graph = e
+        yield graph
+
+  @staticmethod
+  def _TimeoutError(timeout_seconds: int) -> TimeoutError:
+    return TimeoutError(
+      f"Graph construction did not complete within {timeout_seconds} seconds"
     )
 
-    # Then construct the call graph dot using opt.
+  def _Build(
+    self,
+    dots: typing.Tuple[str, typing.List[str]],
+    tag_hook: llvm_util.TagHook,
+    deadline: float,
+    timeout_seconds: int,
+  ):
+    """Private implementation of Build function.
+
+    The deadline is checked before each per-function step, since a signal
+    cannot interrupt graph construction off the main thread.
+
+    Args:
+      dots: The call graph and control flow graph dots produced by opt.
+      tag_hook: An optional object that can tag specific nodes in the graph.
+      deadline: The time.monotonic() value by which to complete.
+      timeout_seconds: The timeout that the deadline was computed from.
+
+    Raises:
+      TimeoutError: If the deadline passes.
+    """
+
+    def CheckDeadline() -> None:
+      if time.monotonic() > deadline:
+        raise self._TimeoutError(timeout_seconds)
+
+    call_graph_dot, cfg_dots = dots
+
+    # Construct the call graph from the call graph dot.
     call_graph = cg.CallGraphFromDotSource(call_graph_dot)
     # Construct NetworkX control flow graphs from the dot graphs.
-    cfgs = [
-      llvm_util.ControlFlowGraphFromDotSource(cfg_dot, tag_hook=tag_hook)
-      for cfg_dot in cfg_dots
-    ]
+    cfgs = []
+    for cfg_dot in cfg_dots:
+      CheckDeadline()
+      cfgs.append(
+        llvm_util.ControlFlowGraphFromDotSource(cfg_dot, tag_hook=tag_hook)
+      )
 
     # Add data flow elements to control flow graphs.
-    graphs = [self.CreateControlAndDataFlowUnion(cfg) for cfg in cfgs]
+    graphs = []
+    for cfg in cfgs:
+      CheckDeadline()
+      graphs.append(self.CreateControlAndDataFlowUnion(cfg))
     # Finally, compose the per-function graphs into a whole-module graph.
+    CheckDeadline()
     return self.ComposeGraphs(graphs, call_graph)
 
   def CreateControlAndDataFlowUnion(
@@ -14,11 +14,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/graphs/unlabelled/llvm2graph:graph_builder."""
+import time
+
 import networkx as nx
 
 from deeplearning.ml4pl.graphs import nx_utils
 from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.unlabelled.llvm2graph import graph_builder
+from deeplearning.ml4pl.graphs.unlabelled.llvm2graph.cfg import llvm_util
 from labm8.py import app
 from labm8.py import test
 
@@ -113,6 +116,67 @@ def test_every_node_has_x(simple_bytecode: str):
     ), f"Invalid x attribute for node {graph.nodes[node]}"
 
 
+class SlowTagHook(llvm_util.TagHook):
+  """A tag hook which takes a second to process each graph."""
+
+  def OnGraphBegin(self, dot):
+    time.sleep(1)
+
+
+def test_Build_timeout_covers_graph_construction(simple_bytecode: str):
+  """Test that the timeout bounds graph construction, not just opt."""
+  builder = graph_builder.ProGraMLGraphBuilder()
+  with test.Raises(TimeoutError):
+    builder.Build(simple_bytecode, tag_hook=SlowTagHook(), timeout_seconds=1)
+
+
+def test_BuildMany_timeout_covers_graph_construction(simple_bytecode: str):
+  """Test that a timeout during graph construction is returned in place of a
+  graph."""
+  builder = graph_builder.ProGraMLGraphBuilder()
+  graphs = list(
+    builder.BuildMany(
+      [simple_bytecode], tag_hook=SlowTagHook(), timeout_seconds=1
+    )
+  )
+  assert len(graphs) == 1
+  assert isinstance(graphs[0], TimeoutError)
+
+
+def test_BuildMany_matches_Build(simple_bytecode: str):
+  """Test that BuildMany() produces the same graphs as Build()."""
+  builder = graph_builder.ProGraMLGraphBuilder()
+  graphs = list(builder.BuildMany([simple_bytecode] * 3))
+  assert len(graphs) == 3
+  expected = builder.Build(simple_bytecode)
+  for graph in graphs:
+    assert isinstance(graph, nx.MultiDiGraph)
+    assert sorted(graph.nodes(data="text")) == sorted(
+      expected.nodes(data="text")
+    )
+    assert sorted(graph.edges(data="flow")) == sorted(
+      expected.edges(data="flow")
+    )
+
+
+def test_BuildMany_invalid_bytecode(simple_bytecode: str):
+  """Test that an exception is returned in place of an invalid bytecode."""
+  builder = graph_builder.ProGraMLGraphBuilder()
+  graphs = list(
+    builder.BuildMany([simple_bytecode, "invalid bytecode!", simple_bytecode])
+  )
+  assert len(graphs) == 3
+  assert isinstance(graphs[0], nx.MultiDiGraph)
+  assert isinstance(graphs[1], Exception)
+  assert isinstance(graphs[2], nx.MultiDiGraph)
+
+
+def test_BuildMany_empty():
+  """Test that no graphs are produced for no bytecodes."""
+  builder = graph_builder.ProGraMLGraphBuilder()
+  assert list(builder.BuildMany([])) == []
+
+
 @test.XFail(reason="TODO(github.com/ChrisCummins/ProGraML/issues/2)")
 def test_ComposeGraphs_undefined():
   """Test that function graph is inserted for call to undefined function."""
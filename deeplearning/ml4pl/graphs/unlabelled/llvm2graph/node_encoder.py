@@ -65,20 +65,16 @@ class GraphNodeEncoder(object):
     Args:
       g: The graph to encode the nodes of. We assume the nodes to have 'text', i.e. lines of LLVM code.
     """
-    # get the 'text' for all statement nodes.
-    lines = [
-      [data["text"]]
-      for _, data in g.nodes(data=True)
-      if data["type"] == programl_pb2.Node.STATEMENT
-    ]
-    # clean the lines
-    preprocessed_lines, _ = inst2vec_preprocess.preprocess(lines)
-    # canonicalize the lines by removing identifier names etc.
-    preprocessed_texts = [
-      # maybe lines were cleaned away completely, so test for ''
-      inst2vec_preprocess.PreprocessStatement(x[0] if len(x) else "")
-      for x in preprocessed_lines
-    ]
+    # clean the 'text' for all statement nodes, and canonicalize the lines by
+    # removing identifier names etc. Lines which are cleaned away completely
+    # are normalized to ''.
+    preprocessed_texts = inst2vec_preprocess.NormalizeStatements(
+      [
+        data["text"]
+        for _, data in g.nodes(data=True)
+        if data["type"] == programl_pb2.Node.STATEMENT
+      ]
+    )
     # write canonicalized texts back to the nx graph
     for (node, data), text in zip(g.nodes(data=True), preprocessed_texts):
       if text:
@@ -14,7 +14,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Split a graph database using IR IDs for training/validation/testing."""
-import sqlalchemy as sql
 
 from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
 from deeplearning.ml4pl.ir import ir_database
@@ -35,22 +34,20 @@ def ApplySplit(
   """Split the IR database and apply the split to the graph database."""
   # Unset all splits.
   with prof.Profile(f"Unset splits on {proto_db.proto_count} protos"):
-    update = sql.update(unlabelled_graph_database.ProgramGraph).values(
-      split=None
-    )
-    proto_db.engine.execute(update)
+    with proto_db.Session(commit=True) as session:
+      session.query(unlabelled_graph_database.ProgramGraph).update(
+        {"split": None}, synchronize_session=False
+      )
 
   # Split the IR database and assign the splits to the unlabelled graphs.
   for split, ir_ids in enumerate(splitter.Split(ir_db)):
     with prof.Profile(
       f"Set {split} split on {humanize.Plural(len(ir_ids), 'IR ID')}"
     ):
-      update = (
-        sql.update(unlabelled_graph_database.ProgramGraph)
-        .where(unlabelled_graph_database.ProgramGraph.ir_id.in_(ir_ids))
-        .values(split=split)
-      )
-      proto_db.engine.execute(update)
+      with proto_db.Session(commit=True) as session:
+        session.query(unlabelled_graph_database.ProgramGraph).filter(
+          unlabelled_graph_database.ProgramGraph.ir_id.in_(ir_ids)
+        ).update({"split": split}, synchronize_session=False)
 
 
 def Main():
@@ -20,11 +20,13 @@ from typing import Any
 from typing import Callable
 from typing import Dict
 from typing import List
+from typing import NamedTuple
 from typing import Optional
 from typing import Tuple
 
 import sqlalchemy as sql
 
+from deeplearning.ml4pl import incremental_stats
 from deeplearning.ml4pl import run_id
 from deeplearning.ml4pl.graphs import programl_pb2
 from labm8.py import app
@@ -253,6 +255,116 @@ class ProgramGraphData(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
   )
 
 
+# The Meta table key which stores the incrementally maintained database stats.
+PROGRAM_GRAPH_STATS_META_KEY = "program_graph_stats"
+
+# The statistics of the program graphs table, updated on every change to it.
+program_graph_table_stats = incremental_stats.TableStats(
+  table=ProgramGraph,
+  meta_table=Meta,
+  key=PROGRAM_GRAPH_STATS_META_KEY,
+  columns=[
+    "split",
+    "node_count",
+    "edge_count",
+    "edge_position_max",
+    "node_type_count",
+    "edge_flow_count",
+    "node_unique_text_count",
+    "node_unique_preprocessed_text_count",
+    "graph_x_dimensionality",
+    "serialized_proto_size",
+  ],
+  aggregates={
+    column: incremental_stats.ColumnValue(getattr(ProgramGraph, column))
+    for column in [
+      "node_count",
+      "edge_count",
+      "edge_position_max",
+      "node_type_count",
+      "edge_flow_count",
+      "node_unique_text_count",
+      "node_unique_preprocessed_text_count",
+      "serialized_proto_size",
+    ]
+  },
+  value_counts={
+    "split": incremental_stats.ColumnValue(ProgramGraph.split),
+    "graph_x_dimensionality": incremental_stats.ColumnValue(
+      ProgramGraph.graph_x_dimensionality
+    ),
+  },
+)
+
+
+class ProgramGraphStats(NamedTuple):
+  """Aggregate statistics of the program graphs in a database."""
+
+  proto_count: int
+  split_count: int
+  # Node and edge attribute sums.
+  node_count: int
+  edge_count: int
+  # Node and edge attribute maximums.
+  node_count_max: Optional[int]
+  edge_count_max: Optional[int]
+  edge_position_max: Optional[int]
+  # Type counts.
+  node_type_count_max: Optional[int]
+  edge_flow_count_max: Optional[int]
+  # Node unique text counts.
+  node_unique_text_count_avg: Optional[float]
+  node_unique_text_count_max: Optional[int]
+  node_unique_preprocessed_text_count_avg: Optional[float]
+  node_unique_preprocessed_text_count_max: Optional[int]
+  # Dimensionality counts.
+  node_x_dimensionality_count: int
+  node_y_dimensionality_count: int
+  graph_x_dimensionality_count: int
+  graph_y_dimensionality_count: int
+  # Proto sizes.
+  proto_data_size: int
+  proto_data_size_min: Optional[int]
+  proto_data_size_avg: Optional[float]
+  proto_data_size_max: Optional[int]
+
+  @classmethod
+  def FromTableStats(
+    cls, stats: incremental_stats.Stats
+  ) -> "ProgramGraphStats":
+    """Construct from a snapshot of the program graph table stats."""
+    aggregates = stats.aggregates
+    # All of the dimensionality counts are of the graph x dimensionality.
+    dimensionality_count = len(stats.value_counts["graph_x_dimensionality"])
+    return cls(
+      proto_count=aggregates["node_count"].count,
+      split_count=len(stats.value_counts["split"]),
+      node_count=aggregates["node_count"].sum,
+      edge_count=aggregates["edge_count"].sum,
+      node_count_max=aggregates["node_count"].max,
+      edge_count_max=aggregates["edge_count"].max,
+      edge_position_max=aggregates["edge_position_max"].max,
+      node_type_count_max=aggregates["node_type_count"].max,
+      edge_flow_count_max=aggregates["edge_flow_count"].max,
+      node_unique_text_count_avg=aggregates["node_unique_text_count"].avg,
+      node_unique_text_count_max=aggregates["node_unique_text_count"].max,
+      node_unique_preprocessed_text_count_avg=aggregates[
+        "node_unique_preprocessed_text_count"
+      ].avg,
+      node_unique_preprocessed_text_count_max=aggregates[
+        "node_unique_preprocessed_text_count"
+      ].max,
+      node_x_dimensionality_count=dimensionality_count,
+      node_y_dimensionality_count=dimensionality_count,
+      graph_x_dimensionality_count=dimensionality_count,
+      graph_y_dimensionality_count=dimensionality_count,
+      proto_data_size=aggregates["serialized_proto_size"].sum,
+      proto_data_size_min=aggregates["serialized_proto_size"].min,
+      proto_data_size_avg=aggregates["serialized_proto_size"].avg,
+      proto_data_size_max=aggregates["serialized_proto_size"].max,
+    )
+
+
 # A registry of database statics, where each entry is a <name, property> tuple.
 database_statistics_registry: List[Tuple[str, Callable[["Database"], Any]]] = []
 
@@ -280,6 +392,9 @@ class Database(sqlutil.Database):
     super(Database, self).__init__(url, Base, must_exist=must_exist)
     self.ctx = ctx
 
+    # Maintain the database stats on every change to the program graphs table.
+    program_graph_table_stats.Attach(self)
+
     # Attributes evaluated lazily.
     self._db_stats = None
 
@@ -388,77 +503,33 @@ class Database(sqlutil.Database):
     """The node x dimensionality of all graph protos."""
     return int(self.db_stats.proto_data_size_max or 0)
 
-  def RefreshStats(self) -> None:
-    """Compute the database stats for access via the instance properties."""
+  def RefreshStats(self, recompute: bool = False) -> None:
+    """Read the database stats for access via the instance properties.
+
+    The stats are maintained incrementally in the Meta table, so this is cheap
+    unless there are no stored stats, in which case they are computed by a
+    full table scan.
+
+    Args:
+      recompute: If true, re-compute the stats from scratch with a full table
+        scan, replacing the stored stats.
+    """
     with self.ctx.Profile(
       2,
       lambda t: (
-        "Computed stats over "
+        "Read stats of "
         f"{humanize.BinaryPrefix(stats.proto_data_size, 'B')} database "
         f"({humanize.Plural(stats.proto_count, 'protocol buffer')})"
       ),
-    ), self.Session() as session:
-      # Compute the stats.
-      stats = session.query(
-        sql.func.count(ProgramGraph.ir_id).label("proto_count"),
-        sql.func.count(sql.func.distinct(ProgramGraph.split)).label(
-          "split_count"
-        ),
-        # Node and edge attribute sums.
-        sql.func.sum(ProgramGraph.node_count).label("node_count"),
-        sql.func.sum(ProgramGraph.edge_count).label("edge_count"),
-        # Node and edge attribute maximums.
-        sql.func.max(ProgramGraph.node_count).label("node_count_max"),
-        sql.func.max(ProgramGraph.edge_count).label("edge_count_max"),
-        sql.func.max(ProgramGraph.edge_position_max).label("edge_position_max"),
-        # Type counts.
-        sql.func.max(ProgramGraph.node_type_count).label("node_type_count_max"),
-        sql.func.max(ProgramGraph.edge_flow_count).label("edge_flow_count_max"),
-        # Node unique text counts.
-        sql.func.avg(ProgramGraph.node_unique_text_count).label(
-          "node_unique_text_count_avg"
-        ),
-        sql.func.max(ProgramGraph.node_unique_text_count).label(
-          "node_unique_text_count_max"
-        ),
-        sql.func.avg(ProgramGraph.node_unique_preprocessed_text_count).label(
-          "node_unique_preprocessed_text_count_avg"
-        ),
-        sql.func.max(ProgramGraph.node_unique_preprocessed_text_count).label(
-          "node_unique_preprocessed_text_count_max"
-        ),
-        # Dimensionality counts.
-        sql.func.count(
-          sql.func.distinct(ProgramGraph.graph_x_dimensionality)
-        ).label("node_x_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(ProgramGraph.graph_x_dimensionality)
-        ).label("node_y_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(ProgramGraph.graph_x_dimensionality)
-        ).label("graph_x_dimensionality_count"),
-        sql.func.count(
-          sql.func.distinct(ProgramGraph.graph_x_dimensionality)
-        ).label("graph_y_dimensionality_count"),
-        # Proto sizes.
-        sql.func.sum(ProgramGraph.serialized_proto_size).label(
-          "proto_data_size"
-        ),
-        sql.func.min(ProgramGraph.serialized_proto_size).label(
-          "proto_data_size_min"
-        ),
-        sql.func.avg(ProgramGraph.serialized_proto_size).label(
-          "proto_data_size_avg"
-        ),
-        sql.func.max(ProgramGraph.serialized_proto_size).label(
-          "proto_data_size_max"
-        ),
-      ).one()
+    ), self.Session(commit=True) as session:
+      stats = ProgramGraphStats.FromTableStats(
+        program_graph_table_stats.Get(session, recompute=recompute)
+      )
       self._db_stats = stats
 
   @property
   def db_stats(self):
-    """Fetch aggregate database stats, or compute them if not set."""
+    """Fetch aggregate database stats, or read them if not set."""
     if self._db_stats is None:
       self.RefreshStats()
     return self._db_stats
@@ -151,6 +151,34 @@ def test_fuzz_database_stats_on_empty_db(
   assert db.stats_json
 
 
+def test_database_stats_after_delete(db: unlabelled_graph_database.Database):
+  """Test that the incrementally maintained stats are updated by deletes."""
+  with db.Session(commit=True) as session:
+    session.add_all(
+      [
+        unlabelled_graph_database.ProgramGraph.Create(
+          proto=random_programl_generator.CreateRandomProto(),
+          ir_id=i,
+          split=i % 3,
+        )
+        for i in range(10)
+      ]
+    )
+
+  with db.Session(commit=True) as session:
+    for program_graph in session.query(
+      unlabelled_graph_database.ProgramGraph
+    ).filter(unlabelled_graph_database.ProgramGraph.ir_id < 4):
+      session.delete(program_graph)
+
+  db.RefreshStats()
+  stats = db.db_stats
+  assert db.proto_count == 6
+  assert db.split_count == 3
+  db.RefreshStats(recompute=True)
+  assert db.db_stats == stats
+
+
 # Global counter for test_fuzz_ProgramGraph_Create() to generate unique values.
 ir_id = 0
 
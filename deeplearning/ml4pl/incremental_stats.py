@@ -0,0 +1,689 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Aggregate table statistics which are maintained incrementally.
+
+Computing statistics over a large table using aggregate queries requires a
+full table scan, which for multi-hundred gigabyte databases takes minutes.
+Instead, a TableStats instance stores a pickled Stats snapshot in a key-value
+Meta table. The ORM inserts, updates, and deletes of the table's rows are
+accumulated by each session as it flushes, and applied to the snapshot once,
+when the session commits. Reading the stats is then a single row lookup.
+
+Usage:
+
+  stats = incremental_stats.TableStats(
+    table=MyTable,
+    meta_table=Meta,
+    key="my_table_stats",
+    columns=["size", "split"],
+    aggregates={"size": incremental_stats.ColumnValue(MyTable.size)},
+    value_counts={"split": incremental_stats.ColumnValue(MyTable.split)},
+  )
+
+  db = sqlutil.Database(url, Base)
+  stats.Attach(db)
+
+  with db.Session() as session:
+    print(stats.Get(session).aggregates["size"].avg)
+
+Bulk Query.update() calls which only set columns that are used by value
+counts, such as the split of a row, are applied as changes to the counts.
+Other updates which are not tracked by the ORM session (bulk updates of other
+columns, bulk Query.delete() calls, or modified columns whose previous value
+was never loaded) discard the stored stats, which are then re-computed with
+aggregate queries when next read. So do tables which were created before the
+TableStats.
+
+The Meta row is locked only while a session commits, so concurrent writers
+are serialized for the duration of the stats update, not of their
+transactions. The changes to distinct counts are looked up while holding the
+lock.
+"""
+import collections
+import decimal
+import pickle
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+
+import sqlalchemy as sql
+from sqlalchemy.orm import persistence
+from sqlalchemy.sql import visitors
+
+from labm8.py import labtypes
+from labm8.py import sqlutil
+
+
+class Aggregate(object):
+  """Mergeable running aggregates of a sequence of values: count, sum, min, and
+  max.
+
+  The min and max values are tracked along with the number of times that they
+  occur, so that removing a value keeps the aggregate exact unless it is the
+  last occurrence of an extremum. In that case the new extremum can only be
+  found by a scan, so the aggregate is marked as stale.
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.sum = 0
+    self.min = None
+    self.min_count = 0
+    self.max = None
+    self.max_count = 0
+    self.stale = False
+
+  @property
+  def avg(self) -> Optional[float]:
+    """The mean value, or None if the aggregate is empty."""
+    if self.count:
+      return self.sum / self.count
+
+  def Add(self, value) -> None:
+    """Add a value to the aggregate."""
+    self.count += 1
+    self.sum += value
+    if self.min is None or value < self.min:
+      self.min, self.min_count = value, 1
+    elif value == self.min:
+      self.min_count += 1
+    if self.max is None or value > self.max:
+      self.max, self.max_count = value, 1
+    elif value == self.max:
+      self.max_count += 1
+
+  def Remove(self, value) -> None:
+    """Remove a value that was previously added to the aggregate."""
+    self.count -= 1
+    if not self.count:
+      # An empty aggregate is exact, regardless of what was removed.
+      self.__init__()
+      return
+    self.sum -= value
+    if value == self.min:
+      self.min_count -= 1
+      self.stale |= not self.min_count
+    if value == self.max:
+      self.max_count -= 1
+      self.stale |= not self.max_count
+
+  def Merge(self, other: "Aggregate") -> None:
+    """Merge the values of another aggregate into this one."""
+    self.count += other.count
+    self.sum += other.sum
+    if other.min is not None:
+      if self.min is None or other.min < self.min:
+        self.min, self.min_count = other.min, other.min_count
+      elif other.min == self.min:
+        self.min_count += other.min_count
+    if other.max is not None:
+      if self.max is None or other.max > self.max:
+        self.max, self.max_count = other.max, other.max_count
+      elif other.max == self.max:
+        self.max_count += other.max_count
+    self.stale |= other.stale
+
+
+class Stats(object):
+  """A snapshot of the statistics of a table.
+
+  Attributes:
+    aggregates: A map from name to running aggregate.
+    value_counts: A map from name to a counter of values.
+    distinct_counts: A map from name to the number of distinct column values.
+  """
+
+  def __init__(self):
+    self.aggregates: Dict[str, Aggregate] = collections.defaultdict(Aggregate)
+    self.value_counts: Dict[
+      str, Dict[Hashable, int]
+    ] = collections.defaultdict(collections.Counter)
+    self.distinct_counts: Dict[str, int] = collections.defaultdict(int)
+
+  @property
+  def stale(self) -> bool:
+    """Return whether any of the aggregates must be re-computed."""
+    return any(aggregate.stale for aggregate in self.aggregates.values())
+
+  def Merge(self, other: "Stats") -> None:
+    """Merge the statistics of a disjoint set of rows into this snapshot.
+
+    Distinct counts are only mergeable if the two sets of rows have no values
+    in common, so the caller is responsible for their correctness.
+    """
+    for name, aggregate in other.aggregates.items():
+      self.aggregates[name].Merge(aggregate)
+    for name, counter in other.value_counts.items():
+      self.value_counts[name].update(counter)
+    for name, count in other.distinct_counts.items():
+      self.distinct_counts[name] += count
+
+
+class Value(NamedTuple):
+  """A value of a row which is aggregated or counted. Rows for which the value
+  is None are ignored.
+  """
+
+  # A function which returns the value of a row.
+  fn: Callable[[Any], Any]
+  # The equivalent SQL expression, which is NULL for ignored rows.
+  sql: Any
+
+
+def ColumnValue(column) -> Value:
+  """Return the value of a mapped column."""
+  return Value(lambda row: getattr(row, column.key), column)
+
+
+class Distinct(NamedTuple):
+  """The number of distinct values of a column, over rows matching a filter.
+
+  Maintaining a distinct count requires an indexed lookup of the changed values
+  on every commit, so this should only be used for indexed columns.
+  """
+
+  # The name of the column.
+  column: str
+  # A predicate on rows which selects the rows to count values of, and the
+  # equivalent SQL filter expression.
+  where: Callable[[Any], bool] = lambda row: True
+  sql_where: Optional[Any] = None
+
+
+class _PendingChanges(object):
+  """The changes to a table which a session has flushed but not committed."""
+
+  def __init__(self):
+    # The stats of the rows which have been added.
+    self.added = Stats()
+    # The rows which have been removed.
+    self.removed: List[Any] = []
+    # The changes to the value counts made by bulk updates.
+    self.value_count_deltas: Dict[
+      str, Dict[Hashable, int]
+    ] = collections.defaultdict(collections.Counter)
+    # The change in the number of rows of each distinct counted value.
+    self.distinct_value_deltas: Dict[
+      str, Dict[Hashable, int]
+    ] = collections.defaultdict(collections.Counter)
+    # Whether the changes could not be tracked, and the stats must be discarded.
+    self.invalidate = False
+
+
+class TableStats(object):
+  """Statistics of a table which are updated with every change to its rows."""
+
+  def __init__(
+    self,
+    table,
+    meta_table,
+    key: str,
+    columns: List[str],
+    aggregates: Optional[Dict[str, Value]] = None,
+    value_counts: Optional[Dict[str, Value]] = None,
+    distinct: Optional[Dict[str, Distinct]] = None,
+  ):
+    """Constructor.
+
+    Args:
+      table: The mapped class of the table.
+      meta_table: The mapped class of a key-value table with `key` and
+        `pickled_value` columns, and a `Create(key, value)` class method.
+      key: The key of the Meta row which stores the stats.
+      columns: The names of the columns which the statistics are computed
+        from. The rows passed to the callbacks have these attributes.
+      aggregates: A map from name to the value of a row to aggregate.
+      value_counts: A map from name to the value of a row to count.
+      distinct: A map from name to distinct column value counts.
+    """
+    self.table = table
+    self.meta_table = meta_table
+    self.key = key
+    self.columns = columns
+    self.aggregates = aggregates or {}
+    self.value_counts = value_counts or {}
+    self.distinct = distinct or {}
+    self.Row = collections.namedtuple(f"{table.__name__}StatsRow", columns)
+    # The session classes of the databases that the stats are attached to.
+    self._session_classes = ()
+
+    # Store an empty snapshot when the table is created, so that the stats of
+    # new databases never need to be computed by a scan.
+    sql.event.listen(
+      table.__table__.metadata, "after_create", self._OnCreateTables
+    )
+    # Bulk updates are compiled by the query, not the session.
+    sql.event.listen(
+      sql.orm.Query, "before_compile_update", self._OnBeforeCompileUpdate
+    )
+
+  def Attach(self, db: sqlutil.Database) -> None:
+    """Maintain the stats for all sessions of the given database.
+
+    This does not access the database.
+    """
+    self._session_classes += (db.MakeSession.class_,)
+    sql.event.listen(db.MakeSession, "before_flush", self._OnBeforeFlush)
+    sql.event.listen(db.MakeSession, "before_commit", self._OnBeforeCommit)
+    sql.event.listen(
+      db.MakeSession, "after_transaction_end", self._OnTransactionEnd
+    )
+    sql.event.listen(db.MakeSession, "after_bulk_update", self._OnBulkUpdate)
+    sql.event.listen(db.MakeSession, "after_bulk_delete", self._OnBulkDelete)
+
+  def Get(self, session: sqlutil.Session, recompute: bool = False) -> Stats:
+    """Read the stats.
+
+    Args:
+      session: A database session. If the stats must be re-computed, the new
+        snapshot is added to this session, and the caller must commit it.
+      recompute: If true, ignore the stored snapshot and re-compute the stats
+        with aggregate queries.
+
+    Returns:
+      The table stats.
+    """
+    meta = self._GetMetaRow(session)
+    if meta is not None and not recompute:
+      stats = meta.value
+      if not stats.stale:
+        return stats
+
+    stats = self.Compute(session)
+    # The computed stats include any changes that the session has flushed.
+    session.info.pop(self._pending_key, None)
+    self.Invalidate(session)
+    session.add(self.meta_table.Create(key=self.key, value=stats))
+    return stats
+
+  def Compute(self, session: sqlutil.Session) -> Stats:
+    """Compute the stats from scratch, using aggregate queries."""
+    stats = Stats()
+
+    if self.aggregates:
+      values = [_Clause(value.sql) for value in self.aggregates.values()]
+      row = session.query(
+        *[
+          aggregate_fn(value)
+          for value in values
+          for aggregate_fn in (
+            sql.func.count,
+            sql.func.sum,
+            sql.func.min,
+            sql.func.max,
+          )
+        ]
+      ).one()
+      for i, name in enumerate(self.aggregates):
+        aggregate = stats.aggregates[name]
+        aggregate.count, aggregate.sum, aggregate.min, aggregate.max = [
+          _FromSql(x) for x in row[i * 4 : i * 4 + 4]
+        ]
+        if not aggregate.count:
+          aggregate.sum = 0
+
+      # Count the occurrences of the extrema, now that they are known.
+      nonempty = [
+        (name, value)
+        for name, value in zip(self.aggregates, values)
+        if stats.aggregates[name].count
+      ]
+      if nonempty:
+        row = session.query(
+          *[
+            sql.func.sum(sql.case([(value == extremum, 1)], else_=0))
+            for name, value in nonempty
+            for extremum in (
+              stats.aggregates[name].min,
+              stats.aggregates[name].max,
+            )
+          ]
+        ).one()
+        for i, (name, _) in enumerate(nonempty):
+          aggregate = stats.aggregates[name]
+          aggregate.min_count = _FromSql(row[i * 2])
+          aggregate.max_count = _FromSql(row[i * 2 + 1])
+
+    for name, value in self.value_counts.items():
+      value = _Clause(value.sql).label("value")
+      query = (
+        session.query(value, sql.func.count())
+        .filter(value.isnot(None))
+        .group_by(value)
+      )
+      stats.value_counts[name].update(dict(query))
+
+    for name, distinct in self.distinct.items():
+      query = session.query(
+        sql.func.count(sql.func.distinct(getattr(self.table, distinct.column)))
+      )
+      if distinct.sql_where is not None:
+        query = query.filter(distinct.sql_where)
+      stats.distinct_counts[name] = query.scalar()
+
+    return stats
+
+  def FromRows(self, rows: Iterable[Any]) -> Stats:
+    """Compute the aggregates and value counts of a set of rows.
+
+    Distinct counts are not computed.
+    """
+    stats = Stats()
+    for row in rows:
+      for name, value in self.aggregates.items():
+        value = value.fn(row)
+        if value is not None:
+          stats.aggregates[name].Add(value)
+      for name, value in self.value_counts.items():
+        value = value.fn(row)
+        if value is not None:
+          stats.value_counts[name][value] += 1
+    return stats
+
+  def Invalidate(self, session: sqlutil.Session) -> None:
+    """Discard the stored stats, so that they are re-computed when next read."""
+    session.query(self.meta_table).filter(
+      self.meta_table.key == self.key
+    ).delete(synchronize_session=False)
+
+  def _Remove(self, stats: Stats, row) -> None:
+    """Remove the values of a row from the stats."""
+    for name, value in self.aggregates.items():
+      value = value.fn(row)
+      if value is not None:
+        stats.aggregates[name].Remove(value)
+    for name, value in self.value_counts.items():
+      value = value.fn(row)
+      if value is not None:
+        _UpdateCounter(stats.value_counts[name], {value: -1})
+
+  def _GetMetaRow(self, session: sqlutil.Session, lock: bool = False):
+    query = (
+      session.query(self.meta_table)
+      .filter(self.meta_table.key == self.key)
+      .order_by(self.meta_table.id.desc())
+    )
+    if lock:
+      query = query.with_for_update()
+    return query.first()
+
+  def _RowFromObject(self, obj):
+    return self.Row(*[getattr(obj, column) for column in self.columns])
+
+  def _PreviousRowFromObject(self, obj):
+    """Return the row of a modified object as it was before the modification,
+    or None if a modified column was not loaded before it was modified.
+    """
+    attrs = sql.inspect(obj).attrs
+    values = []
+    for column in self.columns:
+      history = attrs[column].history
+      if history.deleted:
+        values.append(history.deleted[0])
+      elif history.added:
+        return None
+      else:
+        values.append(getattr(obj, column))
+    return self.Row(*values)
+
+  def _DistinctCountDelta(
+    self,
+    session: sqlutil.Session,
+    distinct: Distinct,
+    value_deltas: Dict[Hashable, int],
+  ) -> int:
+    """Compute the change in the number of distinct values of a column.
+
+    Args:
+      session: A database session which has flushed its changes.
+      distinct: The distinct count.
+      value_deltas: The change in the number of rows of each value.
+
+    Returns:
+      The change in the distinct count.
+    """
+    values = [
+      value
+      for value, delta in value_deltas.items()
+      if delta and value is not None
+    ]
+
+    # Look up the number of rows of each value, including the changes.
+    counts = {}
+    column = getattr(self.table, distinct.column)
+    for chunk in labtypes.Chunkify(values, 512):
+      query = session.query(column, sql.func.count()).filter(column.in_(chunk))
+      if distinct.sql_where is not None:
+        query = query.filter(distinct.sql_where)
+      counts.update(dict(query.group_by(column)))
+
+    delta = 0
+    for value in values:
+      count = counts.get(value, 0)
+      delta += (count > 0) - (count - value_deltas[value] > 0)
+    return delta
+
+  def _ColumnsRequiringScan(self) -> Set[str]:
+    """Return the names of the columns which the aggregates and distinct counts
+    depend on. A bulk update of these columns discards the stats."""
+    expressions = [value.sql for value in self.aggregates.values()]
+    for distinct in self.distinct.values():
+      expressions.append(getattr(self.table, distinct.column))
+      if distinct.sql_where is not None:
+        expressions.append(distinct.sql_where)
+    return set().union(*[_ColumnNames(e) for e in expressions])
+
+  @property
+  def _pending_key(self):
+    """The key of the pending changes in the info dictionary of a session."""
+    return ("incremental_stats", self.key)
+
+  def _OnCreateTables(self, metadata, connection, tables=(), **kwargs) -> None:
+    """Store an empty snapshot if the table has just been created."""
+    if self.table.__table__ in tables:
+      connection.execute(
+        self.meta_table.__table__.insert().values(
+          key=self.key, pickled_value=pickle.dumps(Stats())
+        )
+      )
+
+  def _OnBeforeFlush(self, session: sqlutil.Session, flush_context, instances):
+    """Accumulate the pending changes to the table."""
+    added, removed = [], []
+    invalidate = False
+
+    for obj in session.new:
+      if isinstance(obj, self.table):
+        added.append(self._RowFromObject(obj))
+
+    with session.no_autoflush:
+      for obj in session.deleted:
+        if isinstance(obj, self.table):
+          removed.append(self._RowFromObject(obj))
+
+      for obj in session.dirty:
+        if isinstance(obj, self.table) and session.is_modified(obj):
+          previous = self._PreviousRowFromObject(obj)
+          if previous is None:
+            invalidate = True
+            break
+          current = self._RowFromObject(obj)
+          if previous != current:
+            removed.append(previous)
+            added.append(current)
+
+      if not (added or removed or invalidate):
+        return
+
+      pending = session.info.setdefault(self._pending_key, _PendingChanges())
+      if invalidate or pending.invalidate:
+        pending.invalidate = True
+        return
+
+      for name, distinct in self.distinct.items():
+        value_deltas = pending.distinct_value_deltas[name]
+        for row in added:
+          if distinct.where(row):
+            value_deltas[getattr(row, distinct.column)] += 1
+        for row in removed:
+          if distinct.where(row):
+            value_deltas[getattr(row, distinct.column)] -= 1
+      pending.added.Merge(self.FromRows(added))
+      pending.removed += removed
+
+  def _OnBeforeCommit(self, session: sqlutil.Session) -> None:
+    """Apply the pending changes of the session to the stored stats."""
+    # Flush the remaining changes, which are otherwise flushed after this hook.
+    session.flush()
+    pending = session.info.pop(self._pending_key, None)
+    if pending is None:
+      return
+
+    with session.no_autoflush:
+      meta = self._GetMetaRow(session, lock=True)
+      if meta is None:
+        # There are no stats to maintain. They will be computed when next read.
+        return
+      if pending.invalidate:
+        self.Invalidate(session)
+        return
+
+      stats = meta.value
+      if stats.stale:
+        return
+
+      # Merge the added rows first, since a removed row may have been added by
+      # the same session.
+      stats.Merge(pending.added)
+      for row in pending.removed:
+        self._Remove(stats, row)
+      for name, deltas in pending.value_count_deltas.items():
+        _UpdateCounter(stats.value_counts[name], deltas)
+      # The distinct counts depend on the rows of other sessions, so they must
+      # be looked up while holding the lock.
+      for name, value_deltas in pending.distinct_value_deltas.items():
+        stats.distinct_counts[name] += self._DistinctCountDelta(
+          session, self.distinct[name], value_deltas
+        )
+
+      meta.pickled_value = pickle.dumps(stats)
+
+  def _OnTransactionEnd(self, session: sqlutil.Session, transaction) -> None:
+    """Discard the pending changes of a session when its transaction ends."""
+    if transaction.parent is None:
+      session.info.pop(self._pending_key, None)
+
+  def _OnBeforeCompileUpdate(
+    self, query, update_context: persistence.BulkUpdate
+  ) -> None:
+    """Accumulate the changes to the value counts made by a bulk update.
+
+    This is called before the update is executed, so the matching rows still
+    have their previous values.
+    """
+    if update_context.mapper.class_ is not self.table or not isinstance(
+      query.session, self._session_classes
+    ):
+      return
+    values = dict(update_context._resolved_values_keys_as_propnames)
+    if set(values) & self._ColumnsRequiringScan():
+      # The stats are discarded after the update.
+      return
+    pending = query.session.info.setdefault(
+      self._pending_key, _PendingChanges()
+    )
+    if pending.invalidate:
+      return
+
+    def _ReplaceUpdatedColumn(element):
+      """Replace an updated column with its new value."""
+      if (
+        isinstance(element, sql.Column)
+        and element.table is self.table.__table__
+        and element.key in values
+      ):
+        return _Clause(values[element.key])
+
+    for name, value in self.value_counts.items():
+      value = _Clause(value.sql)
+      if not _ColumnNames(value) & set(values):
+        continue
+      new_value = visitors.replacement_traverse(
+        value, {}, _ReplaceUpdatedColumn
+      )
+      counts = query.with_entities(
+        value.label("value"), new_value.label("new_value"), sql.func.count()
+      ).group_by("value", "new_value")
+      deltas = pending.value_count_deltas[name]
+      for value, new_value, count in counts:
+        if value is not None:
+          deltas[value] -= count
+        if new_value is not None:
+          deltas[new_value] += count
+
+  def _OnBulkUpdate(self, context) -> None:
+    """Invalidate the stats after a bulk update of the columns which the
+    aggregates or distinct counts depend on."""
+    if context.mapper.class_ is self.table:
+      values = dict(context._resolved_values_keys_as_propnames)
+      if set(values) & self._ColumnsRequiringScan():
+        with context.session.no_autoflush:
+          self.Invalidate(context.session)
+
+  def _OnBulkDelete(self, context) -> None:
+    """Invalidate the stats after a bulk delete of the table."""
+    if context.mapper.class_ is self.table:
+      with context.session.no_autoflush:
+        self.Invalidate(context.session)
+
+
+def _Clause(expression):
+  """Return the SQL expression of a mapped attribute, column, or value."""
+  if hasattr(expression, "__clause_element__"):
+    return expression.__clause_element__()
+  if isinstance(expression, sql.sql.expression.ClauseElement):
+    return expression
+  return sql.literal(expression)
+
+
+def _ColumnNames(expression) -> Set[str]:
+  """Return the names of the columns used by an SQL expression."""
+  return {
+    element.key
+    for element in visitors.iterate(_Clause(expression), {})
+    if isinstance(element, sql.Column)
+  }
+
+
+def _FromSql(value):
+  """Convert a number returned by an aggregate query to an int or float."""
+  if isinstance(value, decimal.Decimal):
+    return int(value) if value == value.to_integral_value() else float(value)
+  return value
+
+
+def _UpdateCounter(counter: Dict[Hashable, int], deltas: Dict[Hashable, int]):
+  """Add changes to a value counter, removing the values with no count."""
+  for value, delta in deltas.items():
+    counter[value] += delta
+    if counter[value] <= 0:
+      del counter[value]
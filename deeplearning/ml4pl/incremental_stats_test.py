@@ -0,0 +1,436 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl:incremental_stats."""
+import pathlib
+import pickle
+import random
+from typing import Optional
+
+import sqlalchemy as sql
+
+from deeplearning.ml4pl import incremental_stats
+from labm8.py import sqlutil
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+Base = sql.ext.declarative.declarative_base()
+
+
+class Meta(Base):
+  """A key-value table."""
+
+  __tablename__ = "meta"
+  id: int = sql.Column(sql.Integer, primary_key=True)
+  key: str = sql.Column(sql.String(128), index=True)
+  pickled_value: bytes = sql.Column(sql.LargeBinary(), nullable=False)
+
+  @property
+  def value(self):
+    return pickle.loads(self.pickled_value)
+
+  @classmethod
+  def Create(cls, key: str, value):
+    return Meta(key=key, pickled_value=pickle.dumps(value))
+
+
+class Item(Base):
+  """A table to compute stats of."""
+
+  __tablename__ = "items"
+  id: int = sql.Column(sql.Integer, primary_key=True)
+  group: int = sql.Column(sql.Integer, nullable=False, index=True)
+  size: int = sql.Column(sql.Integer, nullable=False)
+  split: Optional[int] = sql.Column(sql.Integer, nullable=True)
+
+
+ITEM_STATS = incremental_stats.TableStats(
+  table=Item,
+  meta_table=Meta,
+  key="item_stats",
+  columns=["group", "size", "split"],
+  aggregates={
+    "size": incremental_stats.ColumnValue(Item.size),
+    "big_size": incremental_stats.Value(
+      lambda row: row.size if row.size > 5 else None,
+      sql.case([(Item.size > 5, Item.size)]),
+    ),
+  },
+  value_counts={
+    "split": incremental_stats.ColumnValue(Item.split),
+    "big_split": incremental_stats.Value(
+      lambda row: row.split if row.size > 5 else None,
+      sql.case([(Item.size > 5, Item.split)]),
+    ),
+  },
+  distinct={
+    "group": incremental_stats.Distinct("group"),
+    "big_group": incremental_stats.Distinct(
+      "group", lambda row: row.size > 5, Item.size > 5
+    ),
+  },
+)
+
+
+@test.Fixture(scope="function")
+def db(tempdir: pathlib.Path) -> sqlutil.Database:
+  db = sqlutil.Database(f"sqlite:///{tempdir}/db", Base)
+  ITEM_STATS.Attach(db)
+  return db
+
+
+def AssertStatsEqual(
+  a: incremental_stats.Stats, b: incremental_stats.Stats
+) -> None:
+  """Check that two stats snapshots are equal."""
+  for name in ("size", "big_size"):
+    assert vars(a.aggregates[name]) == vars(b.aggregates[name])
+  for name in ("split", "big_split"):
+    assert dict(a.value_counts[name]) == dict(b.value_counts[name])
+  for name in ("group", "big_group"):
+    assert a.distinct_counts[name] == b.distinct_counts[name]
+
+
+def test_Aggregate_add_remove():
+  aggregate = incremental_stats.Aggregate()
+  for value in [3, 1, 5, 1, 5]:
+    aggregate.Add(value)
+  assert aggregate.count == 5
+  assert aggregate.sum == 15
+  assert aggregate.avg == 3
+  assert (aggregate.min, aggregate.min_count) == (1, 2)
+  assert (aggregate.max, aggregate.max_count) == (5, 2)
+
+  # Removing one of several occurrences of an extremum is exact.
+  aggregate.Remove(1)
+  assert (aggregate.min, aggregate.min_count) == (1, 1)
+  assert not aggregate.stale
+
+  # Removing the last occurrence is not.
+  aggregate.Remove(1)
+  assert aggregate.stale
+
+
+def test_Aggregate_remove_all_values():
+  aggregate = incremental_stats.Aggregate()
+  aggregate.Add(3)
+  aggregate.Remove(3)
+  assert aggregate.count == 0
+  assert aggregate.min is None
+  assert aggregate.avg is None
+  assert not aggregate.stale
+
+
+def test_Aggregate_merge():
+  values = [random.randint(0, 10) for _ in range(100)]
+  expected = incremental_stats.Aggregate()
+  a = incremental_stats.Aggregate()
+  b = incremental_stats.Aggregate()
+  for i, value in enumerate(values):
+    expected.Add(value)
+    (a if i % 3 else b).Add(value)
+  a.Merge(b)
+  assert vars(a) == vars(expected)
+
+
+def test_TableStats_empty_table(db: sqlutil.Database):
+  with db.Session() as session:
+    # An empty snapshot is stored when the table is created.
+    assert ITEM_STATS._GetMetaRow(session) is not None
+    stats = ITEM_STATS.Get(session)
+    assert stats.aggregates["size"].count == 0
+
+
+def test_TableStats_Attach_is_read_only(
+  db: sqlutil.Database, tempdir: pathlib.Path
+):
+  """Test that attaching the stats to an existing database does not access
+  it."""
+  with db.Session(commit=True) as session:
+    session.add(Item(group=1, size=3))
+    ITEM_STATS.Invalidate(session)
+
+  db = sqlutil.Database(f"sqlite:///{tempdir}/db", Base)
+  statements = []
+  sql.event.listen(
+    db.engine,
+    "before_cursor_execute",
+    lambda conn, cursor, statement, *args: statements.append(statement),
+  )
+  ITEM_STATS.Attach(db)
+  assert not statements
+  with db.Session() as session:
+    assert ITEM_STATS._GetMetaRow(session) is None
+
+
+def test_TableStats_inserts(db: sqlutil.Database):
+  with db.Session(commit=True) as session:
+    session.add_all(
+      [
+        Item(group=1, size=3, split=0),
+        Item(group=1, size=10, split=1),
+        Item(group=2, size=4),
+      ]
+    )
+
+  with db.Session() as session:
+    stats = ITEM_STATS.Get(session)
+    assert stats.aggregates["size"].sum == 17
+    assert stats.aggregates["size"].max == 10
+    assert stats.aggregates["big_size"].count == 1
+    assert stats.value_counts["split"] == {0: 1, 1: 1}
+    assert stats.distinct_counts["group"] == 2
+    assert stats.distinct_counts["big_group"] == 1
+    AssertStatsEqual(stats, ITEM_STATS.Compute(session))
+
+
+def test_TableStats_Compute_matches_FromRows(db: sqlutil.Database):
+  """Test that the aggregate queries compute the same stats as the rows."""
+  random.seed(0)
+  with db.Session(commit=True) as session:
+    session.add_all(
+      [
+        Item(
+          group=random.randint(0, 5),
+          size=random.randint(0, 10),
+          split=random.choice([None, 0, 1, 2]),
+        )
+        for _ in range(100)
+      ]
+    )
+
+  with db.Session() as session:
+    stats = ITEM_STATS.Compute(session)
+    expected = ITEM_STATS.FromRows(session.query(Item))
+    expected.distinct_counts["group"] = len(
+      {item.group for item in session.query(Item)}
+    )
+    expected.distinct_counts["big_group"] = len(
+      {item.group for item in session.query(Item) if item.size > 5}
+    )
+    AssertStatsEqual(stats, expected)
+
+
+def test_TableStats_Compute_empty_table(db: sqlutil.Database):
+  with db.Session() as session:
+    AssertStatsEqual(ITEM_STATS.Compute(session), incremental_stats.Stats())
+
+
+def test_TableStats_rollback(db: sqlutil.Database):
+  with db.Session() as session:
+    session.add(Item(group=1, size=3))
+    session.flush()
+    session.rollback()
+
+  with db.Session() as session:
+    assert ITEM_STATS.Get(session).aggregates["size"].count == 0
+
+
+def test_TableStats_flushes_are_applied_on_commit(db: sqlutil.Database):
+  """Test that the stored stats are locked and updated once per commit, not on
+  every flush."""
+  locks = []
+  get_meta_row = ITEM_STATS._GetMetaRow
+
+  def _GetMetaRow(session, lock: bool = False):
+    locks.append(lock)
+    return get_meta_row(session, lock=lock)
+
+  ITEM_STATS._GetMetaRow = _GetMetaRow
+  try:
+    with db.Session(commit=True) as session:
+      for i in range(3):
+        session.add(Item(group=i, size=i))
+        session.flush()
+      item = session.query(Item).filter(Item.group == 0).one()
+      session.delete(item)
+      statements = []
+      sql.event.listen(
+        session.bind,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+      )
+      session.flush()
+      # The distinct counts are not looked up when flushing.
+      assert len(statements) == 1
+      assert statements[0].startswith("DELETE")
+      assert not any(locks)
+      assert get_meta_row(session).value.aggregates["size"].count == 0
+    assert locks == [True]
+  finally:
+    ITEM_STATS._GetMetaRow = get_meta_row
+
+  with db.Session() as session:
+    stats = ITEM_STATS.Get(session)
+    assert stats.aggregates["size"].count == 2
+    assert stats.distinct_counts["group"] == 2
+    AssertStatsEqual(stats, ITEM_STATS.Compute(session))
+
+
+def test_TableStats_Get_recompute_with_pending_changes(db: sqlutil.Database):
+  """Test that recomputing the stats in a session which has flushed changes
+  does not apply the changes twice."""
+  with db.Session(commit=True) as session:
+    session.add_all([Item(group=1, size=3), Item(group=2, size=4)])
+    session.flush()
+    assert ITEM_STATS.Get(session, recompute=True).aggregates["size"].count == 2
+    session.add(Item(group=3, size=5))
+
+  with db.Session() as session:
+    stats = ITEM_STATS.Get(session)
+    assert stats.aggregates["size"].count == 3
+    AssertStatsEqual(stats, ITEM_STATS.Compute(session))
+
+
+def test_TableStats_random_changes(db: sqlutil.Database):
+  """Test that incremental stats match a full scan after random changes."""
+  random.seed(0)
+  for _ in range(20):
+    with db.Session(commit=True) as session:
+      items = session.query(Item).all()
+      for item in random.sample(items, min(len(items), 3)):
+        session.delete(item)
+      for item in random.sample(items, min(len(items), 3)):
+        if item not in session.deleted:
+          item.size = random.randint(0, 10)
+          item.split = random.choice([None, 0, 1])
+      session.add_all(
+        [
+          Item(
+            group=random.randint(0, 5),
+            size=random.randint(0, 10),
+            split=random.choice([None, 0, 1, 2]),
+          )
+          for _ in range(random.randint(0, 10))
+        ]
+      )
+
+    with db.Session(commit=True) as session:
+      expected = ITEM_STATS.Compute(session)
+      # Check the stored snapshot, unless removing an extremum made it stale.
+      stats = ITEM_STATS._GetMetaRow(session).value
+      if not stats.stale:
+        AssertStatsEqual(stats, expected)
+      AssertStatsEqual(ITEM_STATS.Get(session), expected)
+
+
+def test_TableStats_bulk_update_of_value_counts(db: sqlutil.Database):
+  """Test that bulk updates of value counted columns update the counts."""
+  with db.Session(commit=True) as session:
+    session.add_all(
+      [
+        Item(group=1, size=3),
+        Item(group=1, size=10, split=0),
+        Item(group=2, size=4),
+        Item(group=2, size=8, split=1),
+      ]
+    )
+
+  with db.Session(commit=True) as session:
+    session.query(Item).filter(Item.group == 1).update(
+      {"split": 2}, synchronize_session=False
+    )
+    session.query(Item).filter(Item.split == None).update(
+      {Item.split: 3}, synchronize_session=False
+    )
+    session.query(Item).filter(Item.size == 8).update(
+      {"split": None}, synchronize_session=False
+    )
+
+  with db.Session() as session:
+    stats = ITEM_STATS._GetMetaRow(session).value
+    assert stats.value_counts["split"] == {2: 2, 3: 1}
+    assert stats.value_counts["big_split"] == {2: 1}
+    AssertStatsEqual(stats, ITEM_STATS.Compute(session))
+
+
+def test_TableStats_bulk_update_rollback(db: sqlutil.Database):
+  with db.Session(commit=True) as session:
+    session.add(Item(group=1, size=3))
+
+  with db.Session() as session:
+    session.query(Item).update({"split": 2}, synchronize_session=False)
+    session.rollback()
+
+  with db.Session(commit=True) as session:
+    session.add(Item(group=1, size=3))
+
+  with db.Session() as session:
+    assert ITEM_STATS.Get(session).value_counts["split"] == {}
+
+
+def test_TableStats_bulk_update_invalidates(db: sqlutil.Database):
+  """Test that bulk updates of aggregated columns discard the stats."""
+  with db.Session(commit=True) as session:
+    session.add_all([Item(group=1, size=3), Item(group=2, size=4)])
+
+  with db.Session(commit=True) as session:
+    session.query(Item).filter(Item.group == 1).update(
+      {"size": 2}, synchronize_session=False
+    )
+    assert ITEM_STATS._GetMetaRow(session) is None
+
+  with db.Session(commit=True) as session:
+    assert ITEM_STATS.Get(session).aggregates["size"].min == 2
+  with db.Session() as session:
+    assert ITEM_STATS._GetMetaRow(session) is not None
+
+
+def test_TableStats_bulk_delete_invalidates(db: sqlutil.Database):
+  with db.Session(commit=True) as session:
+    session.add_all([Item(group=1, size=3), Item(group=2, size=4)])
+
+  with db.Session(commit=True) as session:
+    session.query(Item).filter(Item.group == 1).delete()
+    assert ITEM_STATS._GetMetaRow(session) is None
+
+  with db.Session() as session:
+    assert ITEM_STATS.Get(session).aggregates["size"].count == 1
+
+
+def test_TableStats_delete_many_rows(db: sqlutil.Database):
+  """Test that the distinct counts are maintained when deleting more rows than
+  SQLite supports query parameters."""
+  with db.Session(commit=True) as session:
+    session.add_all([Item(group=i % 2000, size=1) for i in range(4000)])
+
+  with db.Session(commit=True) as session:
+    for item in session.query(Item).filter(Item.id <= 3000):
+      session.delete(item)
+
+  with db.Session() as session:
+    stats = ITEM_STATS._GetMetaRow(session).value
+    assert stats.distinct_counts["group"] == 1000
+    AssertStatsEqual(stats, ITEM_STATS.Compute(session))
+
+
+def test_TableStats_Get_recompute(db: sqlutil.Database):
+  with db.Session(commit=True) as session:
+    session.add(Item(group=1, size=3))
+
+  # Tamper with the stored stats.
+  with db.Session(commit=True) as session:
+    meta = ITEM_STATS._GetMetaRow(session)
+    meta.pickled_value = pickle.dumps(incremental_stats.Stats())
+
+  with db.Session(commit=True) as session:
+    assert ITEM_STATS.Get(session).aggregates["size"].count == 0
+    assert ITEM_STATS.Get(session, recompute=True).aggregates["size"].count == 1
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -26,10 +26,12 @@ from typing import Any
 from typing import Callable
 from typing import Dict
 from typing import List
+from typing import NamedTuple
 from typing import Tuple
 
 import sqlalchemy as sql
 
+from deeplearning.ml4pl import incremental_stats
 from deeplearning.ml4pl import run_id as run_id_lib
 from labm8.py import app
 from labm8.py import crypto
@@ -242,6 +244,68 @@ class IntermediateRepresentation(
     )
 
 
+# The Meta table key which stores the incrementally maintained database stats.
+IR_STATS_META_KEY = "ir_stats"
+
+
+def _Succeeded(column) -> incremental_stats.Value:
+  """Ignore the values of "empty" IRs in incremental stats."""
+  return incremental_stats.Value(
+    lambda row: getattr(row, column.key) if row.compilation_succeeded else None,
+    sql.case(
+      [(IntermediateRepresentation.compilation_succeeded == True, column)]
+    ),
+  )
+
+
+# The statistics of the IR table, updated on every change to it.
+ir_table_stats = incremental_stats.TableStats(
+  table=IntermediateRepresentation,
+  meta_table=Meta,
+  key=IR_STATS_META_KEY,
+  columns=[
+    "compilation_succeeded",
+    "ir_sha1",
+    "binary_ir_size",
+    "char_count",
+    "line_count",
+  ],
+  aggregates={
+    "binary_ir_size": _Succeeded(IntermediateRepresentation.binary_ir_size),
+    "char_count": _Succeeded(IntermediateRepresentation.char_count),
+    "line_count": _Succeeded(IntermediateRepresentation.line_count),
+  },
+  distinct={
+    "ir_sha1": incremental_stats.Distinct(
+      "ir_sha1",
+      lambda row: row.compilation_succeeded,
+      IntermediateRepresentation.compilation_succeeded == True,
+    ),
+  },
+)
+
+
+class IrStats(NamedTuple):
+  """Aggregate statistics of the non-empty IRs in a database."""
+
+  ir_count: int
+  unique_ir_count: int
+  ir_data_size: int
+  char_count: int
+  line_count: int
+
+  @classmethod
+  def FromTableStats(cls, stats: incremental_stats.Stats) -> "IrStats":
+    """Construct from a snapshot of the IR table stats."""
+    return cls(
+      ir_count=stats.aggregates["binary_ir_size"].count,
+      unique_ir_count=stats.distinct_counts["ir_sha1"],
+      ir_data_size=stats.aggregates["binary_ir_size"].sum,
+      char_count=stats.aggregates["char_count"].sum,
+      line_count=stats.aggregates["line_count"].sum,
+    )
+
+
 # A registry of database statics, where each entry is a <name, property> tuple.
 database_statistics_registry: List[Tuple[str, Callable[["Database"], Any]]] = []
 
@@ -269,6 +333,9 @@ class Database(sqlutil.Database):
     super(Database, self).__init__(url, Base, must_exist=must_exist)
     self.ctx = ctx
 
+    # Maintain the database stats on every change to the IR table.
+    ir_table_stats.Attach(self)
+
     # Lazily evaluated attributes.
     self._db_stats = None
 
@@ -297,46 +364,33 @@ class Database(sqlutil.Database):
     """The sum of non-empty IR line counts."""
     return self.db_stats.line_count or 0
 
-  def RefreshStats(self):
-    """Compute the database stats for access via the instance properties.
+  def RefreshStats(self, recompute: bool = False):
+    """Read the database stats for access via the instance properties.
 
-    Raises:
-      ValueError: If the database contains invalid entries, e.g. inconsistent
-        vector dimensionalities.
+    The stats are maintained incrementally in the Meta table, so this is cheap
+    unless there are no stored stats, in which case they are computed by a
+    full table scan.
+
+    Args:
+      recompute: If true, re-compute the stats from scratch with a full table
+        scan, replacing the stored stats.
     """
     with self.ctx.Profile(
       2,
       lambda t: (
-        "Computed stats over "
+        "Read stats of "
         f"{humanize.BinaryPrefix(stats.ir_data_size or 0, 'B')} database "
         f"({humanize.Plural(stats.ir_count, 'intermediate representation')})"
       ),
-    ), self.Session() as session:
-      query = session.query(
-        sql.func.count(IntermediateRepresentation.id).label("ir_count"),
-        sql.func.count(
-          sql.func.distinct(IntermediateRepresentation.ir_sha1)
-        ).label("unique_ir_count"),
-        sql.func.sum(IntermediateRepresentation.binary_ir_size).label(
-          "ir_data_size"
-        ),
-        sql.func.sum(IntermediateRepresentation.char_count).label("char_count"),
-        sql.func.sum(IntermediateRepresentation.line_count).label("line_count"),
-      )
-
-      # Ignore "empty" IRs.
-      query = query.filter(
-        IntermediateRepresentation.compilation_succeeded == True
+    ), self.Session(commit=True) as session:
+      stats = IrStats.FromTableStats(
+        ir_table_stats.Get(session, recompute=recompute)
       )
-
-      # Compute the stats.
-      stats = query.one()
-
       self._db_stats = stats
 
   @property
   def db_stats(self):
-    """Fetch aggregate database stats, or compute them if not set."""
+    """Fetch aggregate database stats, or read them if not set."""
     if self._db_stats is None:
       self.RefreshStats()
     return self._db_stats
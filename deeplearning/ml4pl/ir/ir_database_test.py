@@ -70,5 +70,38 @@ def test_fuzz_database_stats_on_empty_db(
   assert db.line_count == 0
 
 
+def test_database_stats_unique_ir_count(db: ir_database.Database):
+  """Test that unique IR counts are maintained over inserts and deletes."""
+  with db.Session(commit=True) as session:
+    session.add_all(
+      [
+        ir_database.IntermediateRepresentation.CreateFromText(
+          source="foo",
+          relpath=str(i),
+          source_language=ir_database.SourceLanguage.C,
+          type=ir_database.IrType.LLVM_6_0,
+          cflags="",
+          text=f"ir {i % 2}\n",
+        )
+        for i in range(4)
+      ]
+    )
+
+  db.RefreshStats()
+  assert db.ir_count == 4
+  assert db.unique_ir_count == 2
+
+  # Delete both IRs with the same text.
+  with db.Session(commit=True) as session:
+    for ir in session.query(ir_database.IntermediateRepresentation).filter(
+      ir_database.IntermediateRepresentation.relpath.in_(["0", "2"])
+    ):
+      session.delete(ir)
+
+  db.RefreshStats()
+  assert db.ir_count == 2
+  assert db.unique_ir_count == 1
+
+
 if __name__ == "__main__":
   test.Main()
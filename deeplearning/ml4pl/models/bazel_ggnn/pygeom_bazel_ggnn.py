@@ -227,50 +227,35 @@ class Ggnn(classifier_base.ClassifierBase):
   ) -> batches.Data:
     """Create a mini-batch of data from an iterator of graphs.
 
+    If graphs is a DatabaseGraphBatcher, as created by BatchIterator(), the
+    batch is read from it. Otherwise a new batcher is created for this batch,
+    and any graphs which it reads but does not batch are discarded.
+
     Returns:
       A single batch of data for feeding into RunBatch(). A batch consists of a
       list of graph IDs and a model-defined blob of data. If the list of graph
       IDs is empty, the batch is discarded and not fed into RunBatch().
     """
-    # TODO(github.com/ChrisCummins/ProGraML/issues/24): The new graph batcher
-    # implementation is not well suited for reading the graph IDs, hence this
-    # somewhat clumsy iterator wrapper. A neater approach would be to create
-    # a graph batcher which returns a list of graphs in the batch.
-    class GraphIterator(object):
-      """A wrapper around a graph iterator which records graph IDs."""
-
-      def __init__(self, graphs: Iterable[graph_tuple_database.GraphTuple]):
-        self.input_graphs = graphs
-        self.graphs_read: List[graph_tuple_database.GraphTuple] = []
-
-      def __iter__(self):
-        return self
-
-      def __next__(self):
-        graph: graph_tuple_database.GraphTuple = next(self.input_graphs)
-        self.graphs_read.append(graph)
-        return graph.tuple
-
-    graph_iterator = GraphIterator(graphs)
-
-    # Create a disjoint graph out of one or more input graphs.
-    batcher = graph_batcher.GraphBatcher.CreateFromFlags(
-      graph_iterator, ctx=ctx
-    )
+    # BatchIterator() passes the batcher for the epoch. Otherwise, create a
+    # batcher for this batch only.
+    if isinstance(graphs, graph_batcher.DatabaseGraphBatcher):
+      batcher = graphs
+    else:
+      batcher = graph_batcher.DatabaseGraphBatcher(graphs, ctx=ctx)
 
     try:
-      disjoint_graph = next(batcher)
+      disjoint_graph, graphs = next(batcher)
     except StopIteration:
       # We have run out of graphs.
+      if batcher.fill_ratio is not None:
+        ctx.Log(
+          2,
+          "%s batch fill ratio: %.1f%%",
+          epoch_type.name.capitalize(),
+          batcher.fill_ratio * 100,
+        )
       return batches.EndOfBatches()
 
-    # Workaround for the fact that graph batcher may read one more graph than
-    # actually gets included in the batch.
-    if batcher.last_graph:
-      graphs = graph_iterator.graphs_read[:-1]
-    else:
-      graphs = graph_iterator.graphs_read
-
     # Discard single-graph batches during training when there are graph
     # features. This is because we use batch normalization on incoming features,
     # and batch normalization requires > 1 items to normalize.
@@ -286,6 +271,21 @@ class Ggnn(classifier_base.ClassifierBase):
       data=GgnnBatchData(disjoint_graph=disjoint_graph, graphs=graphs),
     )
 
+  def BatchIterator(
+    self,
+    epoch_type: epoch.Type,
+    graphs: Iterable[graph_tuple_database.GraphTuple],
+    ctx: progress.ProgressContext = progress.NullContext,
+  ) -> Iterable[batches.Data]:
+    """Generate model batches from a iterator of graphs.
+
+    A single graph batcher is used for every batch of the epoch, since it may
+    hold graphs which have been read but not yet batched.
+    """
+    return super(Ggnn, self).BatchIterator(
+      epoch_type, graph_batcher.DatabaseGraphBatcher(graphs, ctx=ctx), ctx=ctx
+    )
+
   def GraphReader(
     self,
     epoch_type: epoch.Type,
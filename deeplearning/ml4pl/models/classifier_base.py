@@ -330,6 +330,10 @@ class ClassifierBase(object):
   ) -> Iterable[batches.Data]:
     """Generate model batches from a iterator of graphs.
 
+    If graphs has a Close() method, such as a BufferedGraphReader, it is
+    called when the iterator is exhausted or closed, so that graphs which are
+    being read in the background are not leaked by abandoned iterators.
+
     Args:
       epoch_type: The type of epoch that batches are being constructed for.
       graphs: The graphs to construct batches from.
@@ -338,21 +342,25 @@ class ClassifierBase(object):
     Returns:
       A batch iterator.
     """
-    while True:
-      with ctx.Profile(
-        4,
-        lambda t: (
-          f"Constructed batch of "
-          f"{humanize.Plural(batch.graph_count, f'{epoch_type.name.lower()} graph')}"
-        ),
-      ):
-        batch = self.MakeBatch(epoch_type, graphs)
-
-      # We have reached the end of the inputs.
-      if batch.end_of_batches:
-        break
-
-      yield batch
+    try:
+      while True:
+        with ctx.Profile(
+          4,
+          lambda t: (
+            f"Constructed batch of "
+            f"{humanize.Plural(batch.graph_count, f'{epoch_type.name.lower()} graph')}"
+          ),
+        ):
+          batch = self.MakeBatch(epoch_type, graphs)
+
+        # We have reached the end of the inputs.
+        if batch.end_of_batches:
+          break
+
+        yield batch
+    finally:
+      if hasattr(graphs, "Close"):
+        graphs.Close()
 
   def Initialize(self) -> None:
     """Initialize an untrained model."""
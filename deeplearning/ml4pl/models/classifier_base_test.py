@@ -390,5 +390,19 @@ def test_empty_batches_is_not_error(
   assert results.batch_count >= 1
 
 
+def test_BatchIterator_close_closes_graph_reader(
+  model: MockModel, graph_db: graph_tuple_database.Database
+):
+  """Test that closing a batch iterator stops the graph reader prefetching."""
+  graph_reader = graph_database_reader.BufferedGraphReader(
+    graph_db, buffer_size_mb=1, prefetch_buffer_count=2
+  )
+  batch_iterator = model.BatchIterator(epoch.Type.TRAIN, graph_reader)
+  next(batch_iterator)
+  thread = graph_reader._prefetch_thread
+  batch_iterator.close()
+  assert not thread.is_alive()
+
+
 if __name__ == "__main__":
   test.Main()
@@ -92,6 +92,9 @@ class GGNN_POJ104_Config(ProGraMLBaseConfig):
         # Aggregate by mean or by sum
         self.msg_mean_aggregation: bool = True
         self.backward_edges: bool = True
+        # Compute messages for all edge types with one gather and one scatter.
+        # Set to False for the reference implementation with one per edge type.
+        self.fused_message_layer: bool = True
 
         ###############
         # Regularization
@@ -0,0 +1,92 @@
+"""Benchmark the fused GGNNMessageLayer against the per-edge-type reference
+implementation on CPU. Their equivalence is tested in modeling_test.py.
+
+Usage:
+    python message_layer_benchmark.py [--nodes N] [--edges M] [--steps T] [--repeats R]
+"""
+from pathlib import Path
+import argparse
+import sys, os
+import time
+
+# make this file executable from anywhere
+full_path = os.path.realpath(__file__)
+REPO_ROOT = full_path.rsplit('ProGraML', maxsplit=1)[0] + 'ProGraML'
+#insert at 1, 0 is the script path (or '' in REPL)
+sys.path.insert(1, REPO_ROOT)
+REPO_ROOT = Path(REPO_ROOT)
+
+import torch
+
+from deeplearning.ml4pl.models.ggnn.configs import GGNN_POJ104_Config
+from deeplearning.ml4pl.models.ggnn.modeling import GGNNMessageLayer
+
+
+def random_batch(config, num_nodes, num_edges):
+    """Random typed edge lists (with backward edges) and positions, as fed to
+    the message layer by GGNNEncoder."""
+    edge_lists, pos_lists = [], []
+    for _ in range(config.edge_type_count):
+        edge_lists.append(torch.randint(num_nodes, (num_edges // config.edge_type_count, 2)))
+        pos_lists.append(torch.randint(32, (num_edges // config.edge_type_count,)))
+    if config.backward_edges:
+        edge_lists.extend([x.flip([1]) for x in edge_lists])
+        pos_lists.extend(pos_lists)
+    node_states = torch.randn(num_nodes, config.hidden_size, requires_grad=True)
+    return edge_lists, pos_lists, node_states
+
+
+def run(layer, edge_lists, pos_lists, node_states, steps, fused):
+    """Run `steps` message passing timesteps, as GGNNEncoder does for a batch,
+    and backpropagate through them."""
+    layer.fused = fused
+    if fused:
+        edge_lists = layer.fuse_edge_lists(edge_lists, node_states.size(0), pos_lists)
+    states = node_states
+    for _ in range(steps):
+        states = layer(edge_lists, states, pos_lists)
+    states.sum().backward()
+    return states
+
+
+def benchmark(layer, batch, steps, repeats, fused):
+    times = []
+    for _ in range(repeats):
+        layer.zero_grad()
+        start = time.time()
+        run(layer, *batch, steps, fused)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--nodes', type=int, default=20000)
+    parser.add_argument('--edges', type=int, default=60000)
+    parser.add_argument('--steps', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    for position_embeddings in [False, True]:
+        for msg_mean_aggregation in [False, True]:
+            config = GGNN_POJ104_Config.from_dict({
+                'position_embeddings': position_embeddings,
+                'msg_mean_aggregation': msg_mean_aggregation,
+            })
+            layer = GGNNMessageLayer(config)
+            batch = random_batch(config, args.nodes, args.edges)
+
+            per_edge_type = benchmark(layer, batch, args.steps, args.repeats, fused=False)
+            fused = benchmark(layer, batch, args.steps, args.repeats, fused=True)
+            print(f"position_embeddings={position_embeddings!s:5} msg_mean_aggregation={msg_mean_aggregation!s:5}  "
+                  f"per-edge-type {per_edge_type * 1000:8.1f}ms  fused {fused * 1000:8.1f}ms  "
+                  f"speedup {per_edge_type / fused:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,8 @@
 # limitations under the License.
 """Modules that make up the pytorch GNN models."""
 import math
+from typing import NamedTuple, Optional
+
 import torch
 import torch.nn.functional as F
 from torch import nn
@@ -285,6 +287,10 @@ class GGNNEncoder(nn.Module):
         #        messages = self.message[layer_idx](edge_lists, node_states, pos_lists)
         #        node_states = self.update[layer_idx](messages, node_states, node_types)
 
+        # the message layers share a config, so one can prepare the edges for all.
+        if self.message[0].fused:
+            edge_lists = self.message[0].fuse_edge_lists(edge_lists, node_states.size(0), pos_lists)
+
         for i in range(self.gnn_layers):
             m_idx = i // self.message_weight_sharing
             u_idx = i // self.update_weight_sharing
@@ -720,6 +726,15 @@ class TypedSelfAttentionMessageLayer(SelfAttentionMessageLayer):
         return messages
 
 
+class FusedEdgeLists(NamedTuple):
+    """The edges of all types of a batch, prepared by
+    GGNNMessageLayer.fuse_edge_lists()."""
+    sources: torch.Tensor   # <M>, indices into the chunked propagated states
+    targets: torch.Tensor   # <M>
+    pos_embs: Optional[torch.Tensor]  # <M, D>
+    divisor: Optional[torch.Tensor]   # <N, 1>, the mean aggregation normalizer
+
+
 class GGNNMessageLayer(nn.Module):
     """Implements the MLP message function of the GGNN architecture,
     optionally with position information embedded on edges.
@@ -739,6 +754,8 @@ class GGNNMessageLayer(nn.Module):
         )
         self.msg_mean_aggregation = config.msg_mean_aggregation
         self.dim = config.hidden_size
+        # use one gather and one scatter across all edge types.
+        self.fused = getattr(config, 'fused_message_layer', True)
 
         self.transform = LinearNet(
             self.dim,
@@ -769,8 +786,68 @@ class GGNNMessageLayer(nn.Module):
                 dropout=config.edge_weight_dropout,
             )
 
+    def fuse_edge_lists(self, edge_lists, num_nodes, pos_lists=None):
+        """Concatenate the typed edge lists of a batch for the fused forward pass.
+
+        Everything here depends only on the edges, not on the node states, so
+        it is computed once per batch and reused across timesteps.
+
+        Args:
+            edge_lists      (for each edge type) <M_i, 2>
+            num_nodes       N
+            pos_lists       (for each edge type) <M_i> (optionally)
+        Returns:
+            FusedEdgeLists"""
+        # index into propagated_states viewed as <N * edge_type_count, D>,
+        # where row (n * edge_type_count + i) is propagated_states[i][n].
+        sources = torch.cat([
+            edge_list[:, 0] * self.edge_type_count + i
+            for i, edge_list in enumerate(edge_lists)
+        ])                                                        # <M>
+        targets = torch.cat([edge_list[:, 1] for edge_list in edge_lists])  # <M>
+
+        pos_embs = None
+        if self.pos_transform:
+            positions = torch.cat(pos_lists).to(dtype=torch.get_default_dtype())
+            pos_embs = self.position_embs(positions, self.emb_size, dpad=self.selector_size)  # <M, D>
+
+        divisor = None
+        if self.msg_mean_aggregation:
+            bincount = targets.bincount(minlength=num_nodes)
+            divisor = bincount.float()
+            divisor[bincount == 0] = 1.0  # avoid div by zero for lonely nodes
+            divisor.unsqueeze_(1)                                 # <N, 1>
+
+        return FusedEdgeLists(sources, targets, pos_embs, divisor)
+
     def forward(self, edge_lists, node_states, pos_lists=None):
-        """edge_lists: [<M_i, 2>, ...]"""
+        """edge_lists: [<M_i, 2>, ...], or FusedEdgeLists"""
+        if not self.fused:
+            return self.forward_per_edge_type(edge_lists, node_states, pos_lists)
+
+        if not isinstance(edge_lists, FusedEdgeLists):
+            edge_lists = self.fuse_edge_lists(edge_lists, node_states.size(0), pos_lists)
+
+        # all edge types are handled in one matrix, so a single gather
+        # selects the message of each edge from its type's chunk.
+        propagated_states = self.transform(node_states).view(-1, self.dim)  # <N * edge_type_count, D>
+        messages_by_source = torch.index_select(propagated_states, dim=0, index=edge_lists.sources)
+
+        if self.pos_transform:
+            pos_gating_by_source = 2 * torch.sigmoid(self.pos_transform(edge_lists.pos_embs))
+            messages_by_source = messages_by_source * pos_gating_by_source
+
+        messages_by_targets = torch.zeros_like(node_states)
+        messages_by_targets.index_add_(0, edge_lists.targets, messages_by_source)
+
+        if self.msg_mean_aggregation:
+            messages_by_targets = messages_by_targets / edge_lists.divisor + SMALL_NUMBER
+
+        return messages_by_targets
+
+    def forward_per_edge_type(self, edge_lists, node_states, pos_lists=None):
+        """The reference implementation of forward(), one pass per edge type.
+        edge_lists: [<M_i, 2>, ...]"""
 
         # all edge types are handled in one matrix, but we
         # let propagated_states[i] be equal to the case with only edge_type i
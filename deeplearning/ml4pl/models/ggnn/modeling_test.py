@@ -0,0 +1,130 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/models/ggnn:modeling."""
+import itertools
+
+import torch
+
+from deeplearning.ml4pl.models.ggnn import configs
+from deeplearning.ml4pl.models.ggnn import modeling
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+# The size of the random batches.
+NODE_COUNT = 50
+EDGE_COUNT = 150
+
+
+@test.Fixture(
+  scope="function",
+  params=list(itertools.product((False, True), (False, True), (False, True))),
+)
+def config(request) -> configs.GGNN_POJ104_Config:
+  """A test fixture which returns message layer configs, parametrized by
+  whether to use position embeddings, mean aggregation, and backward edges."""
+  position_embeddings, msg_mean_aggregation, backward_edges = request.param
+  return configs.GGNN_POJ104_Config.from_dict(
+    {
+      "position_embeddings": position_embeddings,
+      "msg_mean_aggregation": msg_mean_aggregation,
+      "backward_edges": backward_edges,
+    }
+  )
+
+
+@test.Fixture(scope="function")
+def layer(config: configs.GGNN_POJ104_Config) -> modeling.GGNNMessageLayer:
+  """A test fixture which returns a message layer."""
+  torch.manual_seed(0)
+  return modeling.GGNNMessageLayer(config)
+
+
+@test.Fixture(scope="function")
+def batch(config: configs.GGNN_POJ104_Config):
+  """A test fixture which returns random typed edge lists and positions, as
+  fed to the message layer by GGNNEncoder, and random node states."""
+  torch.manual_seed(0)
+  edge_lists, pos_lists = [], []
+  for _ in range(config.edge_type_count):
+    edge_count = EDGE_COUNT // config.edge_type_count
+    edge_lists.append(torch.randint(NODE_COUNT, (edge_count, 2)))
+    pos_lists.append(torch.randint(32, (edge_count,)))
+  if config.backward_edges:
+    edge_lists.extend([x.flip([1]) for x in edge_lists])
+    pos_lists.extend(pos_lists)
+  node_states = torch.randn(NODE_COUNT, config.hidden_size)
+  return edge_lists, pos_lists, node_states
+
+
+def _Run(layer, edge_lists, pos_lists, node_states, fused: bool, steps: int):
+  """Run message passing timesteps, as GGNNEncoder does for a batch, and
+  backpropagate through them. Returns the final states and the gradient of
+  the input states."""
+  layer.fused = fused
+  node_states = node_states.clone().requires_grad_()
+  if fused:
+    edge_lists = layer.fuse_edge_lists(
+      edge_lists, node_states.size(0), pos_lists
+    )
+  states = node_states
+  for _ in range(steps):
+    states = layer(edge_lists, states, pos_lists)
+  states.sum().backward()
+  return states, node_states.grad
+
+
+def test_GGNNMessageLayer_fused_matches_per_edge_type(layer, batch):
+  """Test that the fused layer produces the same states and gradients as the
+  per-edge-type reference implementation."""
+  expected, expected_grad = _Run(layer, *batch, fused=False, steps=3)
+  actual, actual_grad = _Run(layer, *batch, fused=True, steps=3)
+
+  assert torch.allclose(actual, expected, rtol=1e-5, atol=1e-6)
+  assert torch.allclose(actual_grad, expected_grad, rtol=1e-4, atol=1e-6)
+
+
+def test_GGNNMessageLayer_fuses_unprepared_edge_lists(layer, batch):
+  """Test that the fused layer accepts typed edge lists as well as
+  FusedEdgeLists."""
+  edge_lists, pos_lists, node_states = batch
+  fused_edge_lists = layer.fuse_edge_lists(
+    edge_lists, node_states.size(0), pos_lists
+  )
+
+  expected = layer(fused_edge_lists, node_states, pos_lists)
+  actual = layer(edge_lists, node_states, pos_lists)
+
+  assert torch.equal(actual, expected)
+
+
+def test_GGNNMessageLayer_node_without_incoming_edges(layer, batch):
+  """Test that a node with no incoming edges receives no message."""
+  edge_lists, pos_lists, node_states = batch
+  # Node 0 has no incoming edges.
+  for edge_list in edge_lists:
+    edge_list[edge_list[:, 1] == 0, 1] = 1
+
+  messages = layer(edge_lists, node_states, pos_lists)
+
+  assert torch.all(torch.isfinite(messages))
+  assert torch.allclose(
+    messages[0], torch.zeros_like(messages[0]), atol=modeling.SMALL_NUMBER
+  )
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -40,7 +40,7 @@ from docopt import docopt
 import tqdm
 import numpy as np
 import torch
-from torch_geometric.data import Data, InMemoryDataset, DataLoader # (see below)
+from torch_geometric.data import Data, InMemoryDataset
 
 # make this file executable from anywhere
 #if __name__ == '__main__':
@@ -52,7 +52,7 @@ print(REPO_ROOT)
 sys.path.insert(1, REPO_ROOT)
 REPO_ROOT = Path(REPO_ROOT)
 
-from deeplearning.ml4pl.poj104.dataloader import NodeLimitedDataLoader
+from deeplearning.ml4pl.poj104.dataloader import DataLoader, NodeLimitedDataLoader
 
 from deeplearning.ml4pl.models.ggnn.modeling import (
     GGNNModel,
@@ -331,14 +331,19 @@ class Learner(object):
 
         edge_lists = []
         edge_positions = [] if getattr(self.config, 'position_embeddings', False) else None
+        offsets = getattr(batch, 'edge_flow_offsets', None)
         for i in range(3):
-            # mask by edge type
-            mask = batch.edge_attr[:, 0] == i          # <M_i>
-            edge_list = batch.edge_index[:, mask].t()  # <et, M_i>
+            if offsets is not None:
+                # edges are grouped by type by the dataloader, so slice
+                edge_slice = slice(offsets[i], offsets[i + 1])
+            else:
+                # mask by edge type
+                edge_slice = batch.edge_attr[:, 0] == i    # <M_i>
+            edge_list = batch.edge_index[:, edge_slice].t()  # <et, M_i>
             edge_lists.append(edge_list)
 
             if getattr(self.config, 'position_embeddings', False):
-                edge_pos = batch.edge_attr[mask, 1]    # <M_i>
+                edge_pos = batch.edge_attr[edge_slice, 1]  # <M_i>
                 edge_positions.append(edge_pos)
 
         inputs = {
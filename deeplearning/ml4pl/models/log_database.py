@@ -18,6 +18,7 @@ import codecs
 import datetime
 import enum
 import pickle
+import struct
 from typing import Any
 from typing import Callable
 from typing import Dict
@@ -56,6 +57,13 @@ app.DEFINE_boolean(
   "When //deeplearning/ml4pl/models:log_database is executed as a script, "
   "using this flag will prune any runs that do not have a checkpoint.",
 )
+app.DEFINE_boolean(
+  "backfill_epoch_stats",
+  False,
+  "When //deeplearning/ml4pl/models:log_database is executed as a script, "
+  "using this flag will compute the per-epoch stats of any runs which were "
+  "logged before the epoch_stats table was introduced.",
+)
 app.DEFINE_list(
   "rm",
   [],
@@ -78,7 +86,7 @@ Base = declarative.declarative_base()
 
 class RunId(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
   """A run ID. This single-column table enables one-to-many foreign key
-  relationships to {parameters,batches,checkpoints}.
+  relationships to {parameters,batches,epoch_stats,checkpoints}.
 
   Deleting a run ID then cascades to all other tables.
 
@@ -109,6 +117,16 @@ class RunId(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
     back_populates="run_id_relationship",
     cascade="all, delete-orphan",
   )
+  epoch_stats: "EpochStats" = sql.orm.relationship(
+    "EpochStats",
+    back_populates="run_id_relationship",
+    cascade="all, delete-orphan",
+  )
+  open_epochs: "OpenEpoch" = sql.orm.relationship(
+    "OpenEpoch",
+    back_populates="run_id_relationship",
+    cascade="all, delete-orphan",
+  )
 
   def __repr__(self):
     return str(self.run_id)
@@ -369,19 +387,82 @@ class Batch(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
 
   @property
   def graph_ids(self) -> List[int]:
-    return pickle.loads(self.details.binary_graph_ids)
+    return self.details.graph_ids.tolist()
 
   @property
-  def true_y(self) -> Any:
-    return pickle.loads(codecs.decode(self.details.binary_true_y, "zlib"))
+  def true_y(self) -> np.array:
+    return self.details.true_y
 
   @property
-  def predictions(self) -> Any:
-    return pickle.loads(self.details.binary_predictions)
+  def predictions(self) -> np.array:
+    return self.details.predictions
+
+
+# The magic prefix of arrays encoded by ArrayToBytes(). This distinguishes them
+# from pickled values, which begin with the byte 0x80, and zlib-compressed
+# values, which begin with the byte 0x78.
+ARRAY_MAGIC = b"\x93ARR"
+
+
+def ArrayToBytes(array: np.array, dtype: Optional[np.dtype] = None) -> bytes:
+  """Encode an array as bytes with a dtype and shape header.
+
+  The encoded array can be decoded using BytesToArray() without copying the
+  array data.
+
+  Args:
+    array: The array to encode.
+    dtype: An optional dtype to cast the array values to.
+
+  Returns:
+    The encoded array.
+  """
+  array = np.asarray(array, dtype=dtype, order="C")
+  dtype_str = array.dtype.str.encode("ascii")
+  header = struct.pack(
+    f"<B{len(dtype_str)}sB{array.ndim}Q",
+    len(dtype_str),
+    dtype_str,
+    array.ndim,
+    *array.shape,
+  )
+  # Pad the header so that the array data is 8-byte aligned.
+  padding = b"\0" * (-(len(ARRAY_MAGIC) + len(header)) % 8)
+  return ARRAY_MAGIC + header + padding + array.tobytes()
+
+
+def BytesToArray(data: bytes) -> np.array:
+  """Decode an array that was encoded using ArrayToBytes().
+
+  The returned array is a read-only view of the given bytes.
+
+  Raises:
+    ValueError: If the bytes are not an encoded array.
+  """
+  if not data.startswith(ARRAY_MAGIC):
+    raise ValueError("Bytes are not an encoded array")
+  offset = len(ARRAY_MAGIC)
+  (dtype_len,) = struct.unpack_from("<B", data, offset)
+  dtype_str, ndim = struct.unpack_from(f"<{dtype_len}sB", data, offset + 1)
+  offset += 2 + dtype_len
+  shape = struct.unpack_from(f"<{ndim}Q", data, offset)
+  offset += 8 * ndim
+  offset += -offset % 8
+  return np.frombuffer(
+    data,
+    dtype=np.dtype(dtype_str.decode("ascii")),
+    count=int(np.prod(shape)),
+    offset=offset,
+  ).reshape(shape)
 
 
 class BatchDetails(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
-  """The per-instance results of a batch."""
+  """The per-instance results of a batch.
+
+  The columns are arrays encoded using ArrayToBytes(). Details logged before
+  the introduction of the array encoding are pickled, and are decoded
+  transparently.
+  """
 
   id: int = sql.Column(
     sql.Integer,
@@ -389,15 +470,16 @@ class BatchDetails(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
     primary_key=True,
   )
 
-  # A pickled array of
+  # An array of
   # deeplearning.ml4pl.graphs.labelled.graph_tuple_database.GraphTuple.id
-  # values.
+  # values, of shape (graph_count), dtype int32.
   binary_graph_ids: bytes = sql.Column(
     sqlutil.ColumnTypes.LargeBinary(), nullable=False
   )
 
-  # A pickled array of labels, of shape (target_count), dtype int32. The number
-  # of targets per instance will depend on the type of classification problem.
+  # An array of labels, of shape (target_count). The dtype is the smallest
+  # unsigned integer type that can represent the label values. The number of
+  # targets per instance will depend on the type of classification problem.
   # For graph-level classification, there is graph_count values.
   # For node-level classification, there are
   # sum(graph.node_count for graph in batch.data) targets.
@@ -405,24 +487,218 @@ class BatchDetails(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
     sqlutil.ColumnTypes.LargeBinary(), nullable=False
   )
 
-  # A pickled array of 1-hot model predictions, of shape
-  # (target_count, y_dimensionality), dtype float32. See binary_true_y for a
-  # description of target_count.
+  # An array of 1-hot model predictions, of shape
+  # (target_count, y_dimensionality), dtype float32 or float16. See
+  # binary_true_y for a description of target_count.
   binary_predictions: bytes = sql.Column(
     sqlutil.ColumnTypes.LargeBinary(), nullable=False
   )
 
+  @property
+  def graph_ids(self) -> np.array:
+    return self.DecodeColumn(self.binary_graph_ids)
+
+  @property
+  def true_y(self) -> np.array:
+    return self.DecodeColumn(self.binary_true_y, zlib_compressed=True)
+
+  @property
+  def predictions(self) -> np.array:
+    return self.DecodeColumn(self.binary_predictions)
+
+  @staticmethod
+  def DecodeColumn(data: bytes, zlib_compressed: bool = False) -> np.array:
+    """Decode an array column.
+
+    Args:
+      data: The column value.
+      zlib_compressed: Whether legacy pickled values of this column are zlib
+        compressed.
+
+    Returns:
+      An array.
+    """
+    if data.startswith(ARRAY_MAGIC):
+      return BytesToArray(data)
+    if zlib_compressed:
+      data = codecs.decode(data, "zlib")
+    return np.asarray(pickle.loads(data))
+
   @classmethod
-  def Create(cls, data: batches.Data, results: batches.Results):
+  def Create(
+    cls,
+    data: batches.Data,
+    results: batches.Results,
+    predictions_dtype: np.dtype = np.float32,
+  ):
+    """Construct the details of a batch.
+
+    Args:
+      data: The batch data.
+      results: The batch results.
+      predictions_dtype: The dtype to store the model predictions as, e.g.
+        np.float16 to halve the size of the predictions at the expense of
+        precision.
+    """
     return cls(
-      binary_graph_ids=pickle.dumps(data.graph_ids),
-      binary_true_y=codecs.encode(
-        pickle.dumps(np.argmax(results.targets, axis=1)), "zlib"
+      binary_graph_ids=ArrayToBytes(data.graph_ids, dtype=np.int32),
+      binary_true_y=ArrayToBytes(
+        np.argmax(results.targets, axis=1),
+        dtype=np.min_scalar_type(max(results.targets.shape[1] - 1, 0)),
+      ),
+      binary_predictions=ArrayToBytes(
+        results.predictions, dtype=predictions_dtype
       ),
-      binary_predictions=pickle.dumps(results.predictions),
     )
 
 
+class BatchDetailsArrays(NamedTuple):
+  """The concatenated details of a sequence of batches."""
+
+  # The Batch.id values, of shape (batch_count).
+  batch_ids: np.array
+  # The number of graphs in each batch, of shape (batch_count). Use this to
+  # split the graph_ids array into per-batch values.
+  graph_counts: np.array
+  # The number of targets in each batch, of shape (batch_count). Use this to
+  # split the true_y and predictions arrays into per-batch values.
+  target_counts: np.array
+  # The concatenated graph IDs, of shape (sum(graph_counts)).
+  graph_ids: np.array
+  # The concatenated labels, of shape (sum(target_counts)).
+  true_y: np.array
+  # The concatenated predictions, of shape
+  # (sum(target_counts), y_dimensionality).
+  predictions: np.array
+
+
+###############################################################################
+# Epochs.
+###############################################################################
+
+
+class EpochStats(Base, sqlutil.TablenameFromCamelCapsClassNameMixin):
+  """A pre-aggregated rollup of the batches of an epoch.
+
+  The metrics are stored as sums weighted by the batch target count, so that
+  Database.GetWeightedEpochStats() can compute per-epoch results without
+  aggregating over the batches table. Rows are written by the logger at the
+  end of each epoch, and can be recomputed from the batches table using
+  Database.UpdateEpochStats().
+  """
+
+  # A string to uniquely identify the given experiment run.
+  run_id: str = sql.Column(
+    run_id_lib.RunId.SqlStringColumnType(),
+    sql.ForeignKey("run_ids.run_id", onupdate="CASCADE", ondelete="CASCADE"),
+    primary_key=True,
+  )
+  run_id_relationship: RunId = sql.orm.relationship(
+    "RunId", back_populates="epoch_stats", uselist=False,
+  )
+
+  # The epoch number, >= 1.
+  epoch_num: int = sql.Column(sql.Integer, primary_key=True)
+
+  # The numeric value of the epoch type.
+  epoch_type_num: int = sql.Column(sql.Integer, primary_key=True)
+
+  # The timestamp of the first batch in the epoch.
+  timestamp: datetime.datetime = sqlutil.ColumnFactory.MillisecondDatetime()
+
+  # Sums of the batch counts.
+  batch_count: int = sql.Column(sql.Integer, nullable=False)
+  graph_count: int = sql.Column(sql.Integer, nullable=False)
+  target_count: int = sql.Column(sql.Integer, nullable=False)
+
+  # Sums of the batch metrics, weighted by target count. The learning rate and
+  # loss may be null, so the number of batches with non-null values is
+  # recorded.
+  weighted_iteration_count: float = sql.Column(sql.Float, nullable=False)
+  weighted_model_converged: float = sql.Column(sql.Float, nullable=False)
+  weighted_learning_rate: float = sql.Column(sql.Float, nullable=True)
+  learning_rate_count: int = sql.Column(sql.Integer, nullable=False)
+  weighted_loss: float = sql.Column(sql.Float, nullable=True)
+  loss_count: int = sql.Column(sql.Integer, nullable=False)
+  weighted_accuracy: float = sql.Column(sql.Float, nullable=False)
+  weighted_precision: float = sql.Column(sql.Float, nullable=False)
+  weighted_recall: float = sql.Column(sql.Float, nullable=False)
+  weighted_f1: float = sql.Column(sql.Float, nullable=False)
+
+  # The sum of batch elapsed times, unweighted and weighted by target count.
+  runtime_ms: int = sql.Column(sql.Integer, nullable=False)
+  weighted_runtime_ms: float = sql.Column(sql.Float, nullable=False)
+
+  @property
+  def epoch_type(self) -> epoch.Type:
+    return epoch.Type(self.epoch_type_num)
+
+  @staticmethod
+  def AggregateBatchesQuery(
+    session: sqlutil.Database.SessionType,
+  ) -> sql.orm.Query:
+    """Return a query which aggregates batches into rows of this table.
+
+    The columns of the query match the columns of this table, in order, and
+    are labelled with the column names.
+    """
+    weight = Batch.target_count
+    columns = [
+      Batch.run_id,
+      Batch.epoch_num,
+      Batch.epoch_type_num,
+      sql.func.min(Batch.timestamp),
+      sql.func.count(Batch.id),
+      sql.func.sum(Batch.graph_count),
+      sql.func.sum(Batch.target_count),
+      sql.func.sum(Batch.iteration_count * weight),
+      # The model_converged column is boolean, so set the type of the sum.
+      sql.func.sum(Batch.model_converged * weight, type_=sql.Float),
+      sql.func.sum(Batch.learning_rate * weight),
+      sql.func.count(Batch.learning_rate),
+      sql.func.sum(Batch.loss * weight),
+      sql.func.count(Batch.loss),
+      sql.func.sum(Batch.accuracy * weight),
+      sql.func.sum(Batch.precision * weight),
+      sql.func.sum(Batch.recall * weight),
+      sql.func.sum(Batch.f1 * weight),
+      sql.func.sum(Batch.elapsed_time_ms),
+      sql.func.sum(Batch.elapsed_time_ms * weight),
+    ]
+    return session.query(
+      *[
+        column.label(table_column.name)
+        for column, table_column in zip(columns, EpochStats.__table__.columns)
+      ]
+    ).group_by(Batch.run_id, Batch.epoch_num, Batch.epoch_type_num)
+
+
+class OpenEpoch(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
+  """An epoch which has batches but no EpochStats row.
+
+  Rows are written by the logger before the first batch of an epoch, and are
+  removed when the EpochStats row of the epoch is written. This lets
+  Database.GetWeightedEpochStats() aggregate the batches of only these epochs,
+  rather than searching the batches table for epochs which have no rollup.
+  """
+
+  # A string to uniquely identify the given experiment run.
+  run_id: str = sql.Column(
+    run_id_lib.RunId.SqlStringColumnType(),
+    sql.ForeignKey("run_ids.run_id", onupdate="CASCADE", ondelete="CASCADE"),
+    primary_key=True,
+  )
+  run_id_relationship: RunId = sql.orm.relationship(
+    "RunId", back_populates="open_epochs", uselist=False,
+  )
+
+  # The epoch number, >= 1.
+  epoch_num: int = sql.Column(sql.Integer, primary_key=True)
+
+  # The numeric value of the epoch type.
+  epoch_type_num: int = sql.Column(sql.Integer, primary_key=True)
+
+
 ###############################################################################
 # Checkpoints.
 ###############################################################################
@@ -606,6 +882,74 @@ class Database(sqlutil.Database):
       pdutil.RewriteColumn(df, "value", lambda x: pickle.loads(x))
       return df
 
+  def GetBatchDetails(
+    self,
+    run_id: run_id_lib.RunId,
+    epoch_num: Optional[int] = None,
+    epoch_type: Optional[epoch.Type] = None,
+    session: Optional[sqlutil.Database.SessionType] = None,
+  ) -> BatchDetailsArrays:
+    """Read the details of a run's batches as concatenated arrays.
+
+    This is much faster than accessing the details of each batch through the
+    Batch properties, as only the detail columns are read and no ORM objects
+    are constructed.
+
+    Args:
+      run_id: The run ID.
+      epoch_num: If set, return only the details of this epoch.
+      epoch_type: If set, return only the details of this epoch type.
+      session: A session object to re-use.
+
+    Returns:
+      The details of the batches, ordered by epoch number, epoch type, and
+      batch number.
+    """
+    with self.Session(session=session) as session:
+      query = (
+        session.query(
+          Batch.id,
+          BatchDetails.binary_graph_ids,
+          BatchDetails.binary_true_y,
+          BatchDetails.binary_predictions,
+        )
+        .join(BatchDetails, BatchDetails.id == Batch.id)
+        .filter(Batch.run_id == str(run_id))
+        .order_by(Batch.epoch_num, Batch.epoch_type_num, Batch.batch_num)
+      )
+      if epoch_num is not None:
+        query = query.filter(Batch.epoch_num == epoch_num)
+      if epoch_type is not None:
+        query = query.filter(Batch.epoch_type_num == epoch_type.value)
+
+      batch_ids, graph_ids, true_y, predictions = [], [], [], []
+      for row in query:
+        batch_ids.append(row.id)
+        graph_ids.append(BatchDetails.DecodeColumn(row.binary_graph_ids))
+        true_y.append(
+          BatchDetails.DecodeColumn(row.binary_true_y, zlib_compressed=True)
+        )
+        predictions.append(BatchDetails.DecodeColumn(row.binary_predictions))
+
+    if not batch_ids:
+      return BatchDetailsArrays(
+        batch_ids=np.zeros(0, dtype=np.int64),
+        graph_counts=np.zeros(0, dtype=np.int64),
+        target_counts=np.zeros(0, dtype=np.int64),
+        graph_ids=np.zeros(0, dtype=np.int32),
+        true_y=np.zeros(0, dtype=np.int64),
+        predictions=np.zeros((0, 0), dtype=np.float32),
+      )
+
+    return BatchDetailsArrays(
+      batch_ids=np.array(batch_ids, dtype=np.int64),
+      graph_counts=np.array([len(x) for x in graph_ids], dtype=np.int64),
+      target_counts=np.array([len(x) for x in true_y], dtype=np.int64),
+      graph_ids=np.concatenate(graph_ids),
+      true_y=np.concatenate(true_y),
+      predictions=np.concatenate(predictions),
+    )
+
   def GetBestResults(
     self,
     run_id: run_id_lib.RunId,
@@ -673,15 +1017,25 @@ class Database(sqlutil.Database):
       if not session.query(RunId).filter(RunId.run_id == str(run_id)).scalar():
         raise ValueError(f"Run not found: {run_id}")
 
-      df = self.GetWeightedEpochStats(
-        batch_filters=[
-          lambda: Batch.run_id == str(run_id),
-          lambda: Batch.epoch_num == epoch_num,
-          lambda: Batch.epoch_type_num == epoch_type.value,
-        ],
-        weight=weight,
-        session=session,
-      )
+      if weight is Batch.target_count:
+        df = self.GetWeightedEpochStats(
+          epoch_filters=[
+            lambda table: table.run_id == str(run_id),
+            lambda table: table.epoch_num == epoch_num,
+            lambda table: table.epoch_type_num == epoch_type.value,
+          ],
+          session=session,
+        )
+      else:
+        df = self.GetWeightedEpochStats(
+          batch_filters=[
+            lambda: Batch.run_id == str(run_id),
+            lambda: Batch.epoch_num == epoch_num,
+            lambda: Batch.epoch_type_num == epoch_type.value,
+          ],
+          weight=weight,
+          session=session,
+        )
       # Check that a single match was made.
       if not len(df):
         raise ValueError(
@@ -711,6 +1065,7 @@ class Database(sqlutil.Database):
     self,
     batch_filters: List[Callable[[], bool]] = None,
     weight: sql.Column = Batch.target_count,
+    epoch_filters: List[Callable[[Base], bool]] = None,
     session: Optional[sqlutil.Database.SessionType] = None,
   ) -> pd.DataFrame:
     """Compute a table of per-epoch results.
@@ -721,15 +1076,127 @@ class Database(sqlutil.Database):
     Use this method to aggregate over the batches table with a consistent
     weighting strategy, don't roll your own implementation.
 
+    When weighting by target count without batch filters, the results are read
+    from the pre-aggregated EpochStats table. The batches of epochs which are
+    still in progress, as recorded in the OpenEpoch table, and of runs which
+    have not been backfilled, are aggregated from the batches table. Otherwise,
+    the batches table is aggregated.
+
     Args:
       batch_filters: An optional list of callbacks which return filters on the
         Batch table.
       weight: The weighting strategy. By default, weight by target count.
+      epoch_filters: An optional list of callbacks which take a table, either
+        EpochStats or Batch, and return a filter on its run_id, epoch_num, or
+        epoch_type_num columns. Cannot be used with batch_filters or a custom
+        weight.
       session: An optional database session to re-use.
 
     Returns:
       A data frame consisting of per-epoch metrics.
     """
+    if batch_filters or weight is not Batch.target_count:
+      if epoch_filters:
+        raise TypeError(
+          "epoch_filters cannot be used with batch_filters or a custom weight"
+        )
+      return self._GetWeightedEpochStatsFromBatches(
+        batch_filters=batch_filters, weight=weight, session=session
+      )
+
+    epoch_filters = epoch_filters or []
+    with self.Session(session=session) as session:
+      query = session.query(*EpochStats.__table__.columns)
+      for filter in epoch_filters:
+        query = query.filter(filter(EpochStats))
+
+      rollups = [pdutil.QueryToDataFrame(session, query)]
+
+      # Aggregate the batches of epochs which have not been rolled up.
+      open_epochs = EpochStats.AggregateBatchesQuery(session).join(
+        OpenEpoch,
+        sql.and_(
+          OpenEpoch.run_id == Batch.run_id,
+          OpenEpoch.epoch_num == Batch.epoch_num,
+          OpenEpoch.epoch_type_num == Batch.epoch_type_num,
+        ),
+      )
+      for filter in epoch_filters:
+        open_epochs = open_epochs.filter(filter(Batch))
+      rollups.append(pdutil.QueryToDataFrame(session, open_epochs))
+
+      # Aggregate the batches of runs which have not been backfilled.
+      runs_without_rollups = [
+        row.run_id
+        for row in session.query(RunId.run_id).filter(
+          ~RunId.epoch_stats.any(), ~RunId.open_epochs.any()
+        )
+      ]
+      if runs_without_rollups:
+        runs = EpochStats.AggregateBatchesQuery(session).filter(
+          Batch.run_id.in_(runs_without_rollups)
+        )
+        for filter in epoch_filters:
+          runs = runs.filter(filter(Batch))
+        rollups.append(pdutil.QueryToDataFrame(session, runs))
+
+      rollup = pd.concat(
+        [df for df in rollups if len(df)] or rollups[:1], ignore_index=True
+      )
+
+    # Normalize the metrics by their weight. As in
+    # _GetWeightedEpochStatsFromBatches(), the iteration count, model converged,
+    # learning rate, and loss metrics are the average of the weighted values.
+    with np.errstate(divide="ignore", invalid="ignore"):
+      weight = rollup["target_count"].values.astype(np.float64)
+      weight[weight == 0] = np.nan
+      batch_count = rollup["batch_count"].values.astype(np.float64)
+      learning_rate_count = rollup["learning_rate_count"].values.astype(
+        np.float64
+      )
+      learning_rate_count[learning_rate_count == 0] = np.nan
+      loss_count = rollup["loss_count"].values.astype(np.float64)
+      loss_count[loss_count == 0] = np.nan
+
+      def Weighted(column: str, count=1) -> np.array:
+        return rollup[column].values.astype(np.float64) / count / weight
+
+      df = pd.DataFrame(
+        {
+          "run_id": rollup["run_id"],
+          "epoch_num": rollup["epoch_num"],
+          "epoch_type": rollup["epoch_type_num"],
+          "timestamp": rollup["timestamp"],
+          "batch_count": rollup["batch_count"],
+          "graph_count": rollup["graph_count"],
+          "target_count": rollup["target_count"],
+          "iteration_count": Weighted("weighted_iteration_count", batch_count),
+          "model_converged": Weighted("weighted_model_converged", batch_count),
+          "learning_rate": Weighted(
+            "weighted_learning_rate", learning_rate_count
+          ),
+          "loss": Weighted("weighted_loss", loss_count),
+          "accuracy": Weighted("weighted_accuracy"),
+          "precision": Weighted("weighted_precision"),
+          "recall": Weighted("weighted_recall"),
+          "f1": Weighted("weighted_f1"),
+          "runtime": rollup["runtime_ms"],
+          "weighted_runtime": rollup["weighted_runtime_ms"],
+        }
+      )
+
+    return self._FinalizeWeightedEpochStats(df)
+
+  def _GetWeightedEpochStatsFromBatches(
+    self,
+    batch_filters: List[Callable[[], bool]] = None,
+    weight: sql.Column = Batch.target_count,
+    session: Optional[sqlutil.Database.SessionType] = None,
+  ) -> pd.DataFrame:
+    """Compute a table of per-epoch results by aggregating the batches table.
+
+    See GetWeightedEpochStats().
+    """
     batch_filters = batch_filters or []
     with self.Session(session=session) as session:
       # Compute per-epoch weighted metrics.
@@ -807,6 +1274,11 @@ class Database(sqlutil.Database):
 
       df = pdutil.QueryToDataFrame(session, query)
 
+    return self._FinalizeWeightedEpochStats(df)
+
+  @staticmethod
+  def _FinalizeWeightedEpochStats(df: pd.DataFrame) -> pd.DataFrame:
+    """Rewrite the columns of a table of per-epoch results."""
     # Rewrite the epoch_type column to use the native enum type.
     pdutil.RewriteColumn(df, "epoch_type", lambda x: epoch.Type(x))
 
@@ -821,6 +1293,122 @@ class Database(sqlutil.Database):
 
     return df
 
+  def MarkEpochOpen(
+    self,
+    run_id: run_id_lib.RunId,
+    epoch_num: int,
+    epoch_type: epoch.Type,
+    session: Optional[sqlutil.Database.SessionType] = None,
+  ) -> None:
+    """Record that an epoch has started, so that its batches are aggregated
+    until UpdateEpochStats() writes its EpochStats row.
+
+    Args:
+      run_id: The run ID.
+      epoch_num: The epoch num.
+      epoch_type: The epoch type.
+      session: A session object to re-use.
+    """
+    with self.Session(session=session, commit=True) as session:
+      session.merge(
+        OpenEpoch(
+          run_id=str(run_id),
+          epoch_num=epoch_num,
+          epoch_type_num=epoch_type.value,
+        )
+      )
+
+  def UpdateEpochStats(
+    self,
+    run_id: run_id_lib.RunId,
+    epoch_num: Optional[int] = None,
+    epoch_type: Optional[epoch.Type] = None,
+    session: Optional[sqlutil.Database.SessionType] = None,
+  ) -> None:
+    """Recompute the EpochStats rows of a run from its batches.
+
+    The updated epochs are no longer open.
+
+    Args:
+      run_id: The run ID.
+      epoch_num: If set, update only the rows of this epoch.
+      epoch_type: If set, update only the rows of this epoch type.
+      session: A session object to re-use.
+    """
+    with self.Session(session=session, commit=True) as session:
+      stale = session.query(EpochStats).filter(
+        EpochStats.run_id == str(run_id)
+      )
+      open_epochs = session.query(OpenEpoch).filter(
+        OpenEpoch.run_id == str(run_id)
+      )
+      rollup = EpochStats.AggregateBatchesQuery(session).filter(
+        Batch.run_id == str(run_id)
+      )
+      if epoch_num is not None:
+        stale = stale.filter(EpochStats.epoch_num == epoch_num)
+        open_epochs = open_epochs.filter(OpenEpoch.epoch_num == epoch_num)
+        rollup = rollup.filter(Batch.epoch_num == epoch_num)
+      if epoch_type is not None:
+        stale = stale.filter(EpochStats.epoch_type_num == epoch_type.value)
+        open_epochs = open_epochs.filter(
+          OpenEpoch.epoch_type_num == epoch_type.value
+        )
+        rollup = rollup.filter(Batch.epoch_type_num == epoch_type.value)
+
+      stale.delete(synchronize_session=False)
+      open_epochs.delete(synchronize_session=False)
+      session.execute(
+        sql.insert(EpochStats.__table__).from_select(
+          [column.name for column in EpochStats.__table__.columns],
+          rollup.statement,
+        )
+      )
+
+  def BackfillEpochStats(
+    self, run_ids: Optional[Iterable[Union[run_id_lib.RunId, str]]] = None
+  ) -> int:
+    """Compute the EpochStats rows of runs from their batches.
+
+    Use this to backfill the rows of runs that were logged before the
+    EpochStats table was introduced. Each run is updated in its own
+    transaction.
+
+    Args:
+      run_ids: The runs to update. If not provided, all runs which have batches
+        but no EpochStats rows are updated.
+
+    Returns:
+      The number of runs that were updated.
+    """
+    if run_ids is None:
+      with self.Session() as session:
+        runs_with_batches = {
+          row.run_id
+          for row in session.query(
+            sql.func.distinct(Batch.run_id).label("run_id")
+          )
+        }
+        runs_with_epoch_stats = {
+          row.run_id
+          for row in session.query(
+            sql.func.distinct(EpochStats.run_id).label("run_id")
+          )
+        }
+      run_ids = sorted(runs_with_batches - runs_with_epoch_stats)
+
+    run_ids = [str(run_id) for run_id in run_ids]
+    for i, run_id in enumerate(run_ids):
+      app.Log(
+        1,
+        "Updating epoch stats of run %s (%d of %d)",
+        run_id,
+        i + 1,
+        len(run_ids),
+      )
+      self.UpdateEpochStats(run_id)
+    return len(run_ids)
+
   ############################################################################
   # Properties.
   ############################################################################
@@ -860,6 +1448,12 @@ class Database(sqlutil.Database):
     with self.Session() as session:
       return session.query(sql.func.count(BatchDetails.id)).scalar()
 
+  @database_statistic
+  def epoch_stats_count(self) -> int:
+    """Returns the number of epoch stats in the database."""
+    with self.Session() as session:
+      return session.query(sql.func.count(EpochStats.run_id)).scalar()
+
   @database_statistic
   def checkpoint_count(self) -> int:
     """Returns the number of checkpoints in the database."""
@@ -964,6 +1558,12 @@ class Database(sqlutil.Database):
         .filter(Batch.run_id.in_(run_id_strings))
         .options(sql.orm.joinedload(Batch.details))
       )
+      src_epoch_stats = src.query(EpochStats).filter(
+        EpochStats.run_id.in_(run_id_strings)
+      )
+      src_open_epochs = src.query(OpenEpoch).filter(
+        OpenEpoch.run_id.in_(run_id_strings)
+      )
       src_checkpoints = (
         src.query(Checkpoint)
         .filter(Checkpoint.run_id.in_(run_id_strings))
@@ -991,6 +1591,8 @@ class Database(sqlutil.Database):
       row_count += Copy(src_run_ids, dst)
       row_count += Copy(src_params, dst)
       row_count += Copy(src_batches, dst)
+      row_count += Copy(src_epoch_stats, dst)
+      row_count += Copy(src_open_epochs, dst)
       row_count += Copy(src_checkpoints, dst)
 
     return row_count
@@ -1127,12 +1729,12 @@ class Database(sqlutil.Database):
       #########################################################################
 
       if run_ids:
-        batch_filters = [
-          lambda: Batch.run_id.in_([str(run_id) for run_id in run_ids])
+        epoch_filters = [
+          lambda table: table.run_id.in_([str(run_id) for run_id in run_ids])
         ]
       else:
-        batch_filters = None
-      per_epoch_df = self.GetWeightedEpochStats(batch_filters=batch_filters)
+        epoch_filters = None
+      per_epoch_df = self.GetWeightedEpochStats(epoch_filters=epoch_filters)
 
       # Flatten the {train,val,test} rows into an array of columns.
       rows = []
@@ -1295,6 +1897,10 @@ def Main():
   if FLAGS.prune_logs:
     log_db.Prune()
 
+  # Compute the per-epoch stats of old runs.
+  if FLAGS.backfill_epoch_stats:
+    log_db.BackfillEpochStats()
+
   # Delete logs as requested.
   with log_db.Session(commit=True) as session:
     run_ids_to_remove = log_db.SelectRunIds(
@@ -14,9 +14,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Unit tests for //deeplearning/ml4pl/models:log_database."""
+import codecs
+import pickle
 import random
 from typing import List
 from typing import NamedTuple
+from typing import Optional
 from typing import Tuple
 
 import numpy as np
@@ -25,6 +28,7 @@ import sqlalchemy as sql
 
 from deeplearning.ml4pl import run_id
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.models import epoch
 from deeplearning.ml4pl.models import log_database
 from deeplearning.ml4pl.testing import random_graph_tuple_database_generator
 from deeplearning.ml4pl.testing import random_log_database_generator
@@ -195,6 +199,42 @@ def test_Parameter_CreateManyFromDict(
   empty_db_session.commit()
 
 
+@test.Parametrize(
+  "array",
+  (
+    np.arange(10, dtype=np.int32),
+    np.random.rand(5, 3).astype(np.float16),
+    np.zeros((0, 2), dtype=np.float32),
+    np.array(5, dtype=np.uint8),
+  ),
+  namer=lambda x: f"{x.dtype}_{'x'.join(str(d) for d in x.shape)}",
+)
+def test_ArrayToBytes_BytesToArray_round_trip(array: np.array):
+  """Test that arrays are decoded with the same dtype, shape, and values."""
+  decoded = log_database.BytesToArray(log_database.ArrayToBytes(array))
+  assert decoded.dtype == array.dtype
+  assert decoded.shape == array.shape
+  assert np.array_equal(decoded, array)
+
+
+def test_BytesToArray_invalid_bytes():
+  """Test that an error is raised for bytes that are not an encoded array."""
+  with test.Raises(ValueError):
+    log_database.BytesToArray(pickle.dumps(np.arange(10)))
+
+
+def test_BatchDetails_legacy_pickled_columns():
+  """Test that details logged as pickled values can be decoded."""
+  details = log_database.BatchDetails(
+    binary_graph_ids=pickle.dumps([1, 2, 3]),
+    binary_true_y=codecs.encode(pickle.dumps(np.array([0, 1, 1])), "zlib"),
+    binary_predictions=pickle.dumps(np.eye(3, 2, dtype=np.float32)),
+  )
+  assert details.graph_ids.tolist() == [1, 2, 3]
+  assert details.true_y.tolist() == [0, 1, 1]
+  assert details.predictions.tolist() == np.eye(3, 2).tolist()
+
+
 def test_Batch_cascaded_delete(two_run_id_session: DatabaseSessionWithRunLogs):
   """Test cascaded delete of detailed batch logs."""
   session = two_run_id_session.session
@@ -296,6 +336,58 @@ def test_GetRunLogs_invalid_run_id(populated_log_db: DatabaseAndRunIds):
     populated_log_db.db.GetRunLogs("foo")
 
 
+@test.Parametrize("epoch_num", (None, 1))
+def test_GetBatchDetails(
+  populated_log_db: DatabaseAndRunIds, epoch_num: Optional[int]
+):
+  """Test that the concatenated details match the details of each batch."""
+  run_id = random.choice(populated_log_db.run_ids)
+  details = populated_log_db.db.GetBatchDetails(run_id, epoch_num=epoch_num)
+
+  with populated_log_db.db.Session() as session:
+    query = (
+      session.query(log_database.Batch)
+      .options(sql.orm.joinedload(log_database.Batch.details))
+      .join(log_database.BatchDetails)
+      .filter(log_database.Batch.run_id == str(run_id))
+      .order_by(
+        log_database.Batch.epoch_num,
+        log_database.Batch.epoch_type_num,
+        log_database.Batch.batch_num,
+      )
+    )
+    if epoch_num is not None:
+      query = query.filter(log_database.Batch.epoch_num == epoch_num)
+    batches = query.all()
+
+    assert details.batch_ids.tolist() == [batch.id for batch in batches]
+    assert details.graph_counts.tolist() == [
+      batch.graph_count for batch in batches
+    ]
+    assert details.target_counts.tolist() == [
+      batch.target_count for batch in batches
+    ]
+    assert details.graph_ids.tolist() == sum(
+      [batch.graph_ids for batch in batches], []
+    )
+    if batches:
+      assert np.array_equal(
+        details.true_y, np.concatenate([batch.true_y for batch in batches])
+      )
+      assert np.array_equal(
+        details.predictions,
+        np.concatenate([batch.predictions for batch in batches]),
+      )
+
+
+def test_GetBatchDetails_no_details(populated_log_db: DatabaseAndRunIds):
+  """Test that empty arrays are returned for a run without details."""
+  details = populated_log_db.db.GetBatchDetails("foo")
+  assert details.batch_ids.shape == (0,)
+  assert details.graph_ids.shape == (0,)
+  assert details.predictions.shape == (0, 0)
+
+
 def test_GetRunParameters(populated_log_db: DatabaseAndRunIds):
   """Test that parameters are returned."""
   run_id = random.choice(populated_log_db.run_ids)
@@ -411,6 +503,195 @@ def test_GetWeightedEpochStats_filter_all_results(
   )
 
 
+def SortEpochStats(df: pd.DataFrame) -> pd.DataFrame:
+  """Sort a table of per-epoch results by run, epoch number, and type."""
+  return (
+    df.assign(epoch_type_num=[t.value for t in df["epoch_type"]])
+    .sort_values(["run_id", "epoch_num", "epoch_type_num"])
+    .drop(columns="epoch_type_num")
+    .reset_index(drop=True)
+  )
+
+
+def test_GetWeightedEpochStats_equals_batches_aggregate(
+  populated_log_db: DatabaseAndRunIds,
+):
+  """Test that the epoch stats rollup matches aggregating the batches."""
+  columns = ["run_id", "epoch_num", "epoch_type"]
+  rollup = SortEpochStats(populated_log_db.db.GetWeightedEpochStats())
+  # A batch filter selects aggregation over the batches table.
+  batches = SortEpochStats(
+    populated_log_db.db.GetWeightedEpochStats(
+      batch_filters=[lambda: log_database.Batch.epoch_num >= 0]
+    )
+  )
+
+  assert len(rollup) == len(batches)
+  assert rollup[columns].equals(batches[columns])
+  for column in [
+    "batch_count",
+    "graph_count",
+    "target_count",
+    "iteration_count",
+    "model_converged",
+    "learning_rate",
+    "loss",
+    "accuracy",
+    "precision",
+    "recall",
+    "f1",
+    "runtime",
+    "weighted_runtime",
+    "throughput",
+  ]:
+    test.Log("column=%s", column)
+    assert np.allclose(
+      rollup[column].values.astype(np.float64),
+      batches[column].values.astype(np.float64),
+      equal_nan=True,
+    )
+
+
+def test_GetWeightedEpochStats_epoch_filters(
+  populated_log_db: DatabaseAndRunIds,
+):
+  """Test filtering the epoch stats rollup."""
+  run_id = populated_log_db.run_ids[0]
+  df = populated_log_db.db.GetWeightedEpochStats(
+    epoch_filters=[lambda table: table.run_id == str(run_id)]
+  )
+  assert len(df)
+  assert set(df.run_id) == {str(run_id)}
+
+
+def test_GetWeightedEpochStats_epoch_filters_with_batch_filters(
+  populated_log_db: DatabaseAndRunIds,
+):
+  """Test that epoch filters cannot be combined with batch filters."""
+  with test.Raises(TypeError):
+    populated_log_db.db.GetWeightedEpochStats(
+      batch_filters=[lambda: log_database.Batch.epoch_num < -1],
+      epoch_filters=[lambda table: table.epoch_num < -1],
+    )
+
+
+def test_GetWeightedEpochStats_run_without_epoch_stats(
+  disposable_populated_log_db: DatabaseAndRunIds,
+):
+  """Test that the epochs of a run which has not been backfilled are
+  aggregated from the batches table."""
+  db = disposable_populated_log_db.db
+  run_id = disposable_populated_log_db.run_ids[0]
+  expected = db.GetWeightedEpochStats()
+  with db.Session(commit=True) as session:
+    session.query(log_database.EpochStats).filter(
+      log_database.EpochStats.run_id == str(run_id)
+    ).delete()
+
+  actual = db.GetWeightedEpochStats()
+  assert SortEpochStats(actual).equals(SortEpochStats(expected))
+
+  # The fallback respects epoch filters.
+  df = db.GetWeightedEpochStats(
+    epoch_filters=[lambda table: table.run_id == str(run_id)]
+  )
+  assert len(df) == len(expected[expected.run_id == str(run_id)])
+  assert set(df.run_id) == {str(run_id)}
+
+
+def test_GetWeightedEpochStats_epoch_in_progress(
+  disposable_populated_log_db: DatabaseAndRunIds,
+):
+  """Test that an epoch which has batches but has not ended is included."""
+  db = disposable_populated_log_db.db
+  expected = db.GetWeightedEpochStats()
+  row = expected.iloc[0]
+  # Epoch stats are written at the end of the epoch.
+  with db.Session(commit=True) as session:
+    session.query(log_database.EpochStats).filter(
+      log_database.EpochStats.run_id == row.run_id,
+      log_database.EpochStats.epoch_num == int(row.epoch_num),
+      log_database.EpochStats.epoch_type_num == row.epoch_type.value,
+    ).delete()
+  db.MarkEpochOpen(row.run_id, int(row.epoch_num), row.epoch_type)
+
+  actual = db.GetWeightedEpochStats()
+  assert SortEpochStats(actual).equals(SortEpochStats(expected))
+  results = db.GetEpochResults(row.run_id, int(row.epoch_num), row.epoch_type)
+  assert results.batch_count == row.batch_count
+
+  # Ending the epoch closes it.
+  db.UpdateEpochStats(
+    row.run_id, epoch_num=int(row.epoch_num), epoch_type=row.epoch_type
+  )
+  with db.Session() as session:
+    assert not session.query(log_database.OpenEpoch).count()
+  actual = db.GetWeightedEpochStats()
+  assert SortEpochStats(actual).equals(SortEpochStats(expected))
+
+
+def test_GetWeightedEpochStats_epoch_not_open(
+  disposable_populated_log_db: DatabaseAndRunIds,
+):
+  """Test that the batches of an epoch which is neither open nor rolled up,
+  in a run which has epoch stats, are not aggregated."""
+  db = disposable_populated_log_db.db
+  expected = db.GetWeightedEpochStats()
+  row = expected.iloc[0]
+  with db.Session(commit=True) as session:
+    session.query(log_database.EpochStats).filter(
+      log_database.EpochStats.run_id == row.run_id,
+      log_database.EpochStats.epoch_num == int(row.epoch_num),
+      log_database.EpochStats.epoch_type_num == row.epoch_type.value,
+    ).delete()
+
+  actual = db.GetWeightedEpochStats()
+  assert len(actual) == len(expected) - 1
+
+
+def test_GetTables_without_epoch_stats(
+  disposable_populated_log_db: DatabaseAndRunIds,
+):
+  """Test that runs which have not been backfilled are included in tables."""
+  db = disposable_populated_log_db.db
+  expected = {name: df for name, df in db.GetTables()}
+  with db.Session(commit=True) as session:
+    session.query(log_database.EpochStats).delete()
+
+  actual = {name: df for name, df in db.GetTables()}
+  assert actual.keys() == expected.keys()
+  for name in expected:
+    assert actual[name].equals(expected[name])
+
+
+def test_BackfillEpochStats(disposable_populated_log_db: DatabaseAndRunIds):
+  """Test that backfilling restores deleted epoch stats."""
+  db = disposable_populated_log_db.db
+  expected = db.GetWeightedEpochStats()
+  with db.Session(commit=True) as session:
+    session.query(log_database.EpochStats).delete()
+  assert not db.epoch_stats_count
+
+  assert db.BackfillEpochStats() == len(disposable_populated_log_db.run_ids)
+  # Runs that already have epoch stats are not updated.
+  assert db.BackfillEpochStats() == 0
+
+  actual = db.GetWeightedEpochStats()
+  assert SortEpochStats(actual).equals(SortEpochStats(expected))
+
+
+def test_UpdateEpochStats_is_idempotent(
+  disposable_populated_log_db: DatabaseAndRunIds,
+):
+  """Test that recomputing the stats of an epoch replaces the old row."""
+  db = disposable_populated_log_db.db
+  run_id = disposable_populated_log_db.run_ids[0]
+  epoch_stats_count = db.epoch_stats_count
+  db.UpdateEpochStats(run_id, epoch_num=1, epoch_type=epoch.Type.TRAIN)
+  db.UpdateEpochStats(run_id)
+  assert db.epoch_stats_count == epoch_stats_count
+
+
 def test_run_ids_list(disposable_populated_log_db: DatabaseAndRunIds,):
   """Test that the correct run IDs are returned."""
   assert set(disposable_populated_log_db.db.run_ids) == set(
@@ -19,6 +19,7 @@ TODO: Detailed explanation of the file.
 """
 from typing import Optional
 
+import numpy as np
 import pandas as pd
 import sqlalchemy as sql
 
@@ -50,6 +51,12 @@ app.DEFINE_list(
   [],
   "The types of epochs to keep detailed batch logs for.",
 )
+app.DEFINE_boolean(
+  "detailed_batch_float16_predictions",
+  False,
+  "Store the model predictions of detailed batch logs as float16 values. This "
+  "halves the size of the detailed batch logs, at the expense of precision.",
+)
 app.DEFINE_enum(
   "keep_detailed_batches",
   schedules.KeepDetailedBatches,
@@ -124,6 +131,10 @@ class Logger(object):
           "Unknown --detailed_batch_types: " f"'{detailed_batch_type}'"
         )
 
+    # The <run_id, epoch_type, epoch_num> tuples of the epochs which have
+    # batches but have not ended.
+    self._open_epochs = set()
+
   def __enter__(self):
     return self
 
@@ -195,10 +206,28 @@ class Logger(object):
     results: batch.Results,
   ):
     if epoch_type in self.detailed_batch_epoch_types:
-      details = log_database.BatchDetails.Create(data=data, results=results)
+      details = log_database.BatchDetails.Create(
+        data=data,
+        results=results,
+        predictions_dtype=(
+          np.float16
+          if FLAGS.detailed_batch_float16_predictions
+          else np.float32
+        ),
+      )
     else:
       details = None
 
+    # Mark the epoch as open before its first batch is written, so that its
+    # batches are aggregated until the epoch ends.
+    if (run_id, epoch_type, epoch_num) not in self._open_epochs:
+      self._open_epochs.add((run_id, epoch_type, epoch_num))
+      self._writer.AddLambdaOp(
+        lambda session: self.db.MarkEpochOpen(
+          run_id, epoch_num=epoch_num, epoch_type=epoch_type, session=session
+        )
+      )
+
     self._writer.AddOne(
       log_database.Batch.Create(
         run_id=run_id,
@@ -219,8 +248,16 @@ class Logger(object):
     epoch_num: epoch.Type,
     results: epoch.Results,
   ):
-    del epoch_type
     del results
+    self._open_epochs.discard((run_id, epoch_type, epoch_num))
+
+    # Write the rollup of the epoch's batches. The buffered batches are
+    # committed before lambda ops are executed.
+    self._writer.AddLambdaOp(
+      lambda session: self.db.UpdateEpochStats(
+        run_id, epoch_num=epoch_num, epoch_type=epoch_type, session=session
+      )
+    )
 
     schedule = FLAGS.keep_detailed_batches()
 
@@ -5,6 +5,41 @@ from torch_geometric.data import Data, Batch
 from torch._six import container_abcs, string_classes, int_classes
 
 
+def split_edges_by_flow(batch):
+    r"""Regroups the edges of a collated batch by flow type.
+
+    Graphs that were created with
+    :func:`deeplearning.ml4pl.poj104.dataset.sort_edges_by_flow` store their
+    edges sorted by flow, so after collation the edges of each type form one
+    contiguous run per graph. This reorders the edges with a single gather so
+    that each type forms one contiguous run over the whole batch, and sets
+    `batch.edge_flow_offsets` so that the edges of type i are
+    `edge_index[:, offsets[i]:offsets[i + 1]]`.
+
+    Batches without `edge_flow_counts` are returned unchanged.
+    """
+    if getattr(batch, 'edge_flow_counts', None) is None:
+        return batch
+
+    counts = batch.edge_flow_counts                                  # <num_graphs, num_flows>
+    # start of each run in the collated (graph-major) edge order.
+    flat_counts = counts.reshape(-1)
+    graph_major_starts = torch.cumsum(flat_counts, 0) - flat_counts
+    # the same runs, in type-major order.
+    run_starts = graph_major_starts.view_as(counts).t().reshape(-1)
+    run_lengths = counts.t().reshape(-1)
+    # position of each run in the output.
+    run_offsets = torch.cumsum(run_lengths, 0) - run_lengths
+
+    edge_count = batch.edge_index.size(1)
+    perm = torch.arange(edge_count) + torch.repeat_interleave(run_starts - run_offsets, run_lengths)
+
+    batch.edge_index = batch.edge_index[:, perm]
+    batch.edge_attr = batch.edge_attr[perm]
+    batch.edge_flow_offsets = [0] + torch.cumsum(counts.sum(0), 0).tolist()
+    return batch
+
+
 class DataLoader(torch.utils.data.DataLoader):
     r"""Data loader which merges data objects from a
     :class:`torch_geometric.data.dataset` to a mini-batch.
@@ -23,7 +58,7 @@ class DataLoader(torch.utils.data.DataLoader):
         def collate(batch):
             elem = batch[0]
             if isinstance(elem, Data):
-                return Batch.from_data_list(batch, follow_batch)
+                return split_edges_by_flow(Batch.from_data_list(batch, follow_batch))
             elif isinstance(elem, float):
                 return torch.tensor(batch, dtype=torch.float)
             elif isinstance(elem, int_classes):
@@ -81,9 +116,9 @@ class NodeLimitedDataLoader(torch.utils.data.DataLoader):
                         if warn_on_limit:
                             print(f"dropped {len(batch) - len(limited_batch)} graphs from batch!")
                     assert limited_batch != [], f'limited batch is empty! original batch was {batch}'
-                    return Batch.from_data_list(limited_batch, follow_batch)
+                    return split_edges_by_flow(Batch.from_data_list(limited_batch, follow_batch))
                 else:
-                    return Batch.from_data_list(batch, follow_batch)
+                    return split_edges_by_flow(Batch.from_data_list(batch, follow_batch))
             elif isinstance(elem, float):
                 return torch.tensor(batch, dtype=torch.float)
             elif isinstance(elem, int_classes):
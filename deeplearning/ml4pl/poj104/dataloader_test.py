@@ -0,0 +1,174 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/poj104:dataloader."""
+import random
+from typing import List
+
+import torch
+from torch_geometric.data import Batch
+from torch_geometric.data import Data
+
+from deeplearning.ml4pl.poj104 import dataloader
+from deeplearning.ml4pl.poj104 import dataset
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+
+def _RandomGraph(node_count: int, edge_count: int, flows=(0, 1, 2)) -> Data:
+  """Return a random graph with edges of the given flow types, sorted by
+  flow."""
+  data = Data(
+    x=torch.randint(100, (node_count, 2)),
+    edge_index=torch.randint(node_count, (2, edge_count)),
+    edge_attr=torch.stack(
+      [
+        torch.tensor([random.choice(flows) for _ in range(edge_count)]),
+        torch.randint(32, (edge_count,)),
+      ],
+      dim=1,
+    ),
+  )
+  return dataset.sort_edges_by_flow(data)
+
+
+def _RandomGraphs(graph_count: int) -> List[Data]:
+  """Return random graphs, some of which lack edges of one flow type."""
+  random.seed(0)
+  torch.manual_seed(0)
+  return [
+    _RandomGraph(
+      random.randint(5, 20),
+      random.randint(1, 50),
+      flows=(0, 1, 2) if i % 3 else (0, 2),
+    )
+    for i in range(graph_count)
+  ]
+
+
+def _EdgesByFlowWithMasks(batch: Batch):
+  """Split the edges of a batch by flow type using masks, as
+  Learner.data2input does for batches without edge_flow_offsets."""
+  edges = []
+  for i in range(dataset.NUM_EDGE_FLOWS):
+    mask = batch.edge_attr[:, 0] == i
+    edges.append((batch.edge_index[:, mask], batch.edge_attr[mask]))
+  return edges
+
+
+def _EdgesByFlowWithOffsets(batch: Batch):
+  """Split the edges of a batch by flow type using edge_flow_offsets."""
+  offsets = batch.edge_flow_offsets
+  edges = []
+  for i in range(dataset.NUM_EDGE_FLOWS):
+    edge_slice = slice(offsets[i], offsets[i + 1])
+    edges.append((batch.edge_index[:, edge_slice], batch.edge_attr[edge_slice]))
+  return edges
+
+
+def _AssertEdgesEqual(actual, expected):
+  assert len(actual) == len(expected)
+  for (actual_index, actual_attr), (expected_index, expected_attr) in zip(
+    actual, expected
+  ):
+    assert torch.equal(actual_index, expected_index)
+    assert torch.equal(actual_attr, expected_attr)
+
+
+@test.Parametrize("graph_count", (1, 3, 10))
+def test_split_edges_by_flow_matches_masking(graph_count: int):
+  """Test that slicing the regrouped edges gives the same per-type edge lists
+  and positions as masking."""
+  batch = Batch.from_data_list(_RandomGraphs(graph_count))
+  expected = _EdgesByFlowWithMasks(batch)
+
+  batch = dataloader.split_edges_by_flow(batch)
+
+  _AssertEdgesEqual(_EdgesByFlowWithOffsets(batch), expected)
+  _AssertEdgesEqual(_EdgesByFlowWithMasks(batch), expected)
+
+
+def test_split_edges_by_flow_edge_flow_offsets():
+  """Test that the offsets delimit the edges of each flow type."""
+  batch = dataloader.split_edges_by_flow(
+    Batch.from_data_list(_RandomGraphs(5))
+  )
+  flows = batch.edge_attr[:, 0]
+  counts = flows.bincount(minlength=dataset.NUM_EDGE_FLOWS).tolist()
+
+  assert batch.edge_flow_offsets == [
+    0,
+    counts[0],
+    counts[0] + counts[1],
+    batch.edge_index.size(1),
+  ]
+  assert torch.equal(flows, flows.sort().values)
+
+
+def test_split_edges_by_flow_without_edge_flow_counts():
+  """Test that batches of graphs without edge_flow_counts are unchanged."""
+  graphs = _RandomGraphs(3)
+  for graph in graphs:
+    del graph.edge_flow_counts
+  batch = Batch.from_data_list(graphs)
+  edge_index = batch.edge_index.clone()
+
+  batch = dataloader.split_edges_by_flow(batch)
+
+  assert torch.equal(batch.edge_index, edge_index)
+  assert getattr(batch, "edge_flow_offsets", None) is None
+
+
+def test_DataLoader_groups_edges_by_flow():
+  """Test that batches are regrouped by flow type."""
+  graphs = _RandomGraphs(10)
+  loader = dataloader.DataLoader(graphs, batch_size=4)
+  batches = list(loader)
+
+  assert len(batches) == 3
+  for i, batch in enumerate(batches):
+    expected = _EdgesByFlowWithMasks(
+      Batch.from_data_list(graphs[i * 4 : (i + 1) * 4])
+    )
+    _AssertEdgesEqual(_EdgesByFlowWithOffsets(batch), expected)
+
+
+def test_NodeLimitedDataLoader_groups_edges_by_flow():
+  """Test that batches which are limited by node count are regrouped by flow
+  type."""
+  graphs = _RandomGraphs(10)
+  max_num_nodes = sum(graph.num_nodes for graph in graphs[:2])
+  loader = dataloader.NodeLimitedDataLoader(
+    graphs, batch_size=5, max_num_nodes=max_num_nodes
+  )
+  batches = list(loader)
+
+  assert len(batches) == 2
+  for i, batch in enumerate(batches):
+    # The graphs that the loader greedily keeps within the node limit.
+    limited_graphs = []
+    for graph in graphs[i * 5 : (i + 1) * 5]:
+      if sum(g.num_nodes for g in limited_graphs) + graph.num_nodes <= (
+        max_num_nodes
+      ):
+        limited_graphs.append(graph)
+    assert batch.num_graphs == len(limited_graphs)
+    expected = _EdgesByFlowWithMasks(Batch.from_data_list(limited_graphs))
+    _AssertEdgesEqual(_EdgesByFlowWithOffsets(batch), expected)
+
+
+if __name__ == "__main__":
+  test.Main()
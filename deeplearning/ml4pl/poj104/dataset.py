@@ -34,6 +34,31 @@ def load(file):
     return data
 
 
+# the number of edge flow types: control, data and call.
+NUM_EDGE_FLOWS = 3
+
+
+def sort_edges_by_flow(data):
+    r"""Sorts the edges of a :class:`torch_geometric.data.Data` instance by flow
+    type and records the number of edges of each type as `edge_flow_counts`.
+
+    The sort is stable, so edges of the same type keep their relative order.
+    This lets the collate function of the dataloaders in
+    //deeplearning/ml4pl/poj104:dataloader split a batch into per-type edge lists
+    by slicing, rather than by masking on every training step.
+
+    Args:
+        data    (Data): A graph with `edge_index` and `edge_attr`, where
+                        edge_attr[:, 0] is the edge flow.
+    """
+    flows = data.edge_attr[:, 0]
+    order = torch.from_numpy(np.argsort(flows.numpy(), kind='stable'))
+    data.edge_index = data.edge_index[:, order].contiguous()
+    data.edge_attr = data.edge_attr[order].contiguous()
+    data.edge_flow_counts = torch.bincount(flows, minlength=NUM_EDGE_FLOWS).view(1, NUM_EDGE_FLOWS)  # <1, 3>
+    return data
+
+
 def nx2data(nx_graph, class_label=None, ignore_profile_info=True):
     r"""Converts a :obj:`networkx.Graph` or :obj:`networkx.DiGraph` to a
     :class:`torch_geometric.data.Data` instance.
@@ -116,7 +141,7 @@ def nx2data(nx_graph, class_label=None, ignore_profile_info=True):
     # make Data
     data = Data(**data_dict)
 
-    return data
+    return sort_edges_by_flow(data)
 
 
 class BranchPredictionDataset(InMemoryDataset):
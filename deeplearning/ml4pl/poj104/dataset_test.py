@@ -0,0 +1,68 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/poj104:dataset."""
+import networkx as nx
+import torch
+from torch_geometric.data import Data
+
+from deeplearning.ml4pl.poj104 import dataset
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+
+def test_sort_edges_by_flow_edge_flow_counts():
+  """Test that the number of edges of each flow type is recorded."""
+  data = Data(
+    edge_index=torch.tensor([[0, 1, 2, 3], [1, 2, 3, 0]]),
+    edge_attr=torch.tensor([[2, 0], [0, 1], [2, 0], [0, 2]]),
+  )
+  data = dataset.sort_edges_by_flow(data)
+  assert data.edge_flow_counts.tolist() == [[2, 0, 2]]
+
+
+def test_sort_edges_by_flow_is_stable():
+  """Test that edges are sorted by flow, and edges of the same flow keep their
+  relative order."""
+  data = Data(
+    edge_index=torch.tensor([[0, 1, 2, 3, 4], [1, 2, 3, 4, 0]]),
+    edge_attr=torch.tensor([[1, 0], [0, 1], [1, 2], [0, 3], [2, 0]]),
+  )
+  data = dataset.sort_edges_by_flow(data)
+  assert data.edge_index.tolist() == [[1, 3, 0, 2, 4], [2, 4, 1, 3, 0]]
+  assert data.edge_attr.tolist() == [[0, 1], [0, 3], [1, 0], [1, 2], [2, 0]]
+  assert data.edge_flow_counts.tolist() == [[2, 2, 1]]
+
+
+def test_nx2data_sorts_edges_by_flow():
+  """Test that converted graphs have their edges sorted by flow."""
+  g = nx.MultiDiGraph()
+  for i in range(3):
+    g.add_node(i, type=0, x=[i])
+  g.add_edge(0, 1, flow=2, position=0)
+  g.add_edge(0, 2, flow=1, position=2)
+  g.add_edge(1, 2, flow=1, position=1)
+  g.add_edge(2, 0, flow=0, position=0)
+
+  data = dataset.nx2data(g)
+
+  assert data.edge_index.tolist() == [[2, 0, 1, 0], [0, 2, 2, 1]]
+  assert data.edge_attr.tolist() == [[0, 0], [1, 2], [1, 1], [2, 0]]
+  assert data.edge_flow_counts.tolist() == [[1, 2, 1]]
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -30,9 +30,11 @@ from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
 from deeplearning.ml4pl.seq import graph2seq_pb2
 from deeplearning.ml4pl.seq import ir2seq
+from deeplearning.ml4pl.seq import sequence_database
 from labm8.py import app
 from labm8.py import bazelutil
 from labm8.py import humanize
+from labm8.py import labtypes
 from labm8.py import pbutil
 from labm8.py import progress
 
@@ -49,6 +51,13 @@ app.DEFINE_integer(
   120,
   "The number of seconds to permit the graph encoder to run before terminating.",
 )
+app.DEFINE_integer(
+  "graph_encoder_job_size",
+  64,
+  "The number of graphs to send to the graph encoder per job. Jobs are "
+  "pipelined, so that the graph encoder encodes one job while the results of "
+  "the previous job are decoded.",
+)
 
 GRAPH_ENCODER_WORKER = bazelutil.DataPath(
   "phd/deeplearning/ml4pl/seq/graph_encoder_worker"
@@ -60,12 +69,17 @@ LLVM_VOCAB = bazelutil.DataPath("phd/deeplearning/ml4pl/seq/llvm_vocab.json")
 
 
 class EncoderBase(object):
-  """Base class for performing graph-to-encoded sequence translation."""
+  """Base class for performing graph-to-encoded sequence translation.
+
+  Encoded sequences are cached in two levels: an in-memory LRU cache, and an
+  optional sequence database which persists encoded sequences across runs.
+  """
 
   def __init__(
     self,
     graph_db: graph_tuple_database.Database,
     cache_size: Optional[int] = None,
+    sequence_db: Optional[sequence_database.Database] = None,
   ):
     self.graph_db = graph_db
 
@@ -74,6 +88,13 @@ class EncoderBase(object):
     cache_size = cache_size or FLAGS.graph2seq_cache_entries
     self.ir_id_to_encoded: Dict[int, np.array] = lru.LRU(cache_size)
 
+    # The persistent sequence database. The ID of this encoder in the database
+    # is resolved lazily on first use.
+    if sequence_db is None and FLAGS.sequence_db:
+      sequence_db = FLAGS.sequence_db()
+    self.sequence_db = sequence_db
+    self._sequence_encoder_id: Optional[int] = None
+
   def Encode(
     self,
     graphs: List[graph_tuple_database.GraphTuple],
@@ -98,6 +119,25 @@ class EncoderBase(object):
         ir_id for ir_id in unique_ids if ir_id not in id_to_encoded
       }
 
+      # Read through to the sequence database, fetching all of the unknown IRs
+      # in bulk.
+      if self.sequence_db:
+        stored = self.sequence_db.GetSequences(
+          self.sequence_encoder_id, unknown_ir_ids
+        )
+        ctx.Log(
+          5,
+          "Read %s of %s from sequence database",
+          len(stored),
+          humanize.Plural(len(unknown_ir_ids), "encoded graph"),
+        )
+        for ir_id, sequence in stored.items():
+          encoded = self.FromSequence(sequence)
+          id_to_encoded[ir_id] = encoded
+          self.ir_id_to_encoded[ir_id] = encoded
+        unknown_ir_ids -= stored.keys()
+
+    if len(id_to_encoded) != len(unique_ids):
       # Encode the unknown IRs.
       sorted_ir_ids_to_encode = sorted(unknown_ir_ids)
       sorted_encoded_sequences = self.EncodeIds(sorted_ir_ids_to_encode, ctx)
@@ -110,6 +150,17 @@ class EncoderBase(object):
         id_to_encoded[ir_id] = encoded
         self.ir_id_to_encoded[ir_id] = encoded
 
+      if self.sequence_db:
+        self.sequence_db.AddSequences(
+          self.sequence_encoder_id,
+          [
+            self.ToSequence(ir_id, encoded)
+            for ir_id, encoded in zip(
+              sorted_ir_ids_to_encode, sorted_encoded_sequences
+            )
+          ],
+        )
+
     # Assemble the list of encoded graphs.
     encoded = [id_to_encoded[graph.ir_id] for graph in graphs]
 
@@ -121,6 +172,44 @@ class EncoderBase(object):
     """Encode a list of graph IDs and return the sequences in the same order."""
     raise NotImplementedError("abstract class")
 
+  def ToSequence(
+    self, ir_id: int, encoded: Union[np.array, graph2seq_pb2.ProgramGraphSeq]
+  ) -> sequence_database.Sequence:
+    """Convert an encoded sequence to a sequence database row."""
+    raise NotImplementedError("abstract class")
+
+  def FromSequence(
+    self, sequence: sequence_database.Sequence
+  ) -> Union[np.array, graph2seq_pb2.ProgramGraphSeq]:
+    """Convert a sequence database row to an encoded sequence."""
+    raise NotImplementedError("abstract class")
+
+  @property
+  def name(self) -> str:
+    """Return the name of the encoder."""
+    return type(self).__name__
+
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    raise NotImplementedError("abstract class")
+
+  @property
+  def sequence_encoder(self) -> sequence_database.SequenceEncoder:
+    """Return a sequence database entry describing this encoder."""
+    return sequence_database.SequenceEncoder.Create(
+      name=self.name, vocab=self.vocabulary
+    )
+
+  @property
+  def sequence_encoder_id(self) -> int:
+    """Return the ID of this encoder in the sequence database."""
+    if self._sequence_encoder_id is None:
+      self._sequence_encoder_id = self.sequence_db.GetEncoderId(
+        self.sequence_encoder
+      )
+    return self._sequence_encoder_id
+
   @property
   def max_encoded_length(self) -> int:
     """Return an upper bound on the length of the encoded sequences."""
@@ -144,8 +233,9 @@ class GraphEncoder(EncoderBase):
     graph_db: graph_tuple_database.Database,
     ir2seq_encoder: ir2seq.EncoderBase,
     cache_size: Optional[int] = None,
+    sequence_db: Optional[sequence_database.Database] = None,
   ):
-    super(GraphEncoder, self).__init__(graph_db, cache_size)
+    super(GraphEncoder, self).__init__(graph_db, cache_size, sequence_db)
     self.ir2seq_encoder = ir2seq_encoder
 
   @property
@@ -158,6 +248,29 @@ class GraphEncoder(EncoderBase):
     """Get the size of the vocabulary, including the unknown-vocab element."""
     return self.ir2seq_encoder.vocabulary_size
 
+  @property
+  def name(self) -> str:
+    """Return the name of the encoder."""
+    return f"{type(self).__name__}:{type(self.ir2seq_encoder).__name__}"
+
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    return self.ir2seq_encoder.vocabulary
+
+  def ToSequence(
+    self, ir_id: int, encoded: np.array
+  ) -> sequence_database.Sequence:
+    """Convert an encoded sequence to a sequence database row."""
+    return sequence_database.Sequence.Create(ir_id=ir_id, encoded=encoded)
+
+  def FromSequence(self, sequence: sequence_database.Sequence) -> np.array:
+    """Convert a sequence database row to an encoded sequence.
+
+    The returned array is a read-only view of the stored buffer.
+    """
+    return sequence.encoded
+
   def EncodeIds(
     self, ir_ids: List[int], ctx: progress.ProgressContext
   ) -> List[np.array]:
@@ -192,20 +305,79 @@ class StatementEncoder(EncoderBase):
     max_encoded_length: int,
     max_nodes: int,
     cache_size: Optional[int] = None,
+    sequence_db: Optional[sequence_database.Database] = None,
   ):
-    super(StatementEncoder, self).__init__(graph_db, cache_size)
+    super(StatementEncoder, self).__init__(graph_db, cache_size, sequence_db)
     self.proto_db = proto_db
 
     with open(LLVM_VOCAB) as f:
       data_to_load = json.load(f)
-    self.vocabulary = data_to_load["vocab"]
+    self._vocabulary = data_to_load["vocab"]
     self._max_encoded_length = max_encoded_length
     self.max_nodes = max_nodes
 
+    # A long-running graph encoder, which receives the vocabulary once when it
+    # is started rather than with every job.
+    self.graph_encoder_worker = pbutil.ProtoWorkerProcess(
+      [str(GRAPH_ENCODER_WORKER), "--stream"],
+      init_message=graph2seq_pb2.GraphEncoderJob(vocabulary=self.vocabulary),
+    )
+
   @property
   def max_encoded_length(self) -> int:
     return self._max_encoded_length
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    return self._vocabulary
+
+  def Encode(
+    self,
+    graphs: List[graph_tuple_database.GraphTuple],
+    ctx: progress.ProgressContext = progress.NullContext,
+  ) -> List[graph2seq_pb2.ProgramGraphSeq]:
+    """Translate a list of graphs to encoded sequences.
+
+    Sequences are cached at their full length, so that the cache can be shared
+    by encoders with different maximum lengths. The sequences are squeezed down
+    to the maximum lengths allowed here. Sequences which must be squeezed are
+    copied, since the originals are owned by the cache.
+    """
+    encoded = super(StatementEncoder, self).Encode(graphs, ctx=ctx)
+    for i, seq in enumerate(encoded):
+      if (
+        len(seq.encoded) > self.max_encoded_length
+        or len(seq.node) > self.max_nodes
+      ):
+        encoded[i] = graph2seq_pb2.ProgramGraphSeq()
+        encoded[i].CopyFrom(seq)
+        del encoded[i].encoded[self.max_encoded_length :]
+        del encoded[i].encoded_node_length[self.max_nodes :]
+        del encoded[i].node[self.max_nodes :]
+    return encoded
+
+  def ToSequence(
+    self, ir_id: int, encoded: graph2seq_pb2.ProgramGraphSeq
+  ) -> sequence_database.Sequence:
+    """Convert an encoded sequence to a sequence database row."""
+    return sequence_database.Sequence.Create(
+      ir_id=ir_id,
+      encoded=encoded.encoded,
+      encoded_node_length=encoded.encoded_node_length,
+      node=encoded.node,
+    )
+
+  def FromSequence(
+    self, sequence: sequence_database.Sequence
+  ) -> graph2seq_pb2.ProgramGraphSeq:
+    """Convert a sequence database row to an encoded sequence."""
+    return graph2seq_pb2.ProgramGraphSeq(
+      encoded=sequence.encoded.tolist(),
+      encoded_node_length=sequence.encoded_node_length.tolist(),
+      node=sequence.node.tolist(),
+    )
+
   def EncodeIds(
     self, ir_ids: List[int], ctx: progress.ProgressContext
   ) -> List[graph2seq_pb2.ProgramGraphSeq]:
@@ -286,12 +458,6 @@ class StatementEncoder(EncoderBase):
         f"Graph encoder failed to encode IRs: {ir_ids} with error: {e}"
       )
 
-    # Squeeze the encoded representations down to the maximum lengths allowed.
-    for seq in encoded:
-      seq.encoded[:] = seq.encoded[: self.max_encoded_length]
-      seq.encoded_node_length[:] = seq.encoded_node_length[: self.max_nodes]
-      seq.node[:] = seq.node[: self.max_nodes]
-
     return encoded
 
   @property
@@ -324,15 +490,14 @@ class StatementEncoder(EncoderBase):
         f"({humanize.DecimalPrefix(token_count / t, ' tokens/sec')})"
       ),
     ):
-      message = graph2seq_pb2.GraphEncoderJob(
-        vocabulary=self.vocabulary, graph=graphs,
-      )
-      pbutil.RunProcessMessageInPlace(
-        [str(GRAPH_ENCODER_WORKER)],
-        message,
-        timeout_seconds=FLAGS.graph_encoder_timeout,
+      jobs = [
+        graph2seq_pb2.GraphEncoderJob(graph=chunk)
+        for chunk in labtypes.Chunkify(graphs, FLAGS.graph_encoder_job_size)
+      ]
+      self.graph_encoder_worker.RunMessagesInPlace(
+        jobs, timeout_seconds=FLAGS.graph_encoder_timeout,
       )
-      encoded_graphs = [encoded for encoded in message.seq]
+      encoded_graphs = [encoded for job in jobs for encoded in job.seq]
       token_count = sum(len(encoded.encoded) for encoded in encoded_graphs)
       if len(encoded_graphs) != len(graphs):
         raise ValueError(
@@ -16,8 +16,11 @@
 """Unit tests for //deeplearning/ml4pl/seq:lexer."""
 import random
 import string
+from typing import List
 from typing import Set
 
+import numpy as np
+
 from datasets.opencl.device_mapping import opencl_device_mapping_dataset
 from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
 from deeplearning.ml4pl.graphs.labelled.devmap import make_devmap_dataset
@@ -25,6 +28,7 @@ from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
 from deeplearning.ml4pl.ir import ir_database
 from deeplearning.ml4pl.seq import graph2seq
 from deeplearning.ml4pl.seq import ir2seq
+from deeplearning.ml4pl.seq import sequence_database
 from deeplearning.ml4pl.testing import random_graph_tuple_database_generator
 from deeplearning.ml4pl.testing import (
   random_unlabelled_graph_database_generator,
@@ -66,6 +70,30 @@ def SelectRandomGraphs(graph_db: graph_tuple_database.Database):
   return graphs
 
 
+class MockIr2SeqEncoder(ir2seq.EncoderBase):
+  """An ir2seq encoder which records the IDs of the IRs that it encodes."""
+
+  def __init__(self):
+    super(MockIr2SeqEncoder, self).__init__(ir_db=None)
+    self.encoded_ir_ids: List[int] = []
+
+  def Encode(self, ids: List[int], ctx=None) -> List[np.array]:
+    self.encoded_ir_ids += ids
+    return [np.array([ir_id % 7] * (ir_id % 5 + 1)) for ir_id in ids]
+
+  @property
+  def vocabulary(self):
+    return {str(i): i for i in range(7)}
+
+  @property
+  def vocabulary_size(self) -> int:
+    return 8
+
+  @property
+  def max_encoded_length(self) -> int:
+    return 5
+
+
 ###############################################################################
 # Fixtures.
 ###############################################################################
@@ -218,6 +246,18 @@ def statement_encoder(
   )
 
 
+@test.Fixture(
+  scope="function",
+  params=testing_databases.GetDatabaseUrls(),
+  namer=testing_databases.DatabaseUrlNamer("sequence_db"),
+)
+def sequence_db(request) -> sequence_database.Database:
+  """A test fixture which yields an empty sequence database."""
+  yield from testing_databases.YieldDatabase(
+    sequence_database.Database, request.param
+  )
+
+
 ###############################################################################
 # Tests.
 ###############################################################################
@@ -249,5 +289,156 @@ def test_fuzz_StatementEncoder(
     assert max(seq.node) < graph.node_count
 
 
+def test_GraphEncoder_sequence_db_write_back(
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that encoded sequences are written to the sequence database."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  ir2seq_encoder = MockIr2SeqEncoder()
+  encoder = graph2seq.GraphEncoder(
+    populated_graph_db, ir2seq_encoder, sequence_db=sequence_db
+  )
+  encoded = encoder.Encode(graphs)
+
+  unique_ir_ids = {graph.ir_id for graph in graphs}
+  assert sorted(ir2seq_encoder.encoded_ir_ids) == sorted(unique_ir_ids)
+  stored = sequence_db.GetSequences(encoder.sequence_encoder_id, unique_ir_ids)
+  assert stored.keys() == unique_ir_ids
+  for graph, seq in zip(graphs, encoded):
+    assert stored[graph.ir_id].encoded.tolist() == seq.tolist()
+
+
+def test_GraphEncoder_sequence_db_read_through(
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that a new encoder reads sequences from the sequence database, rather
+  than encoding them again."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  encoded = graph2seq.GraphEncoder(
+    populated_graph_db, MockIr2SeqEncoder(), sequence_db=sequence_db
+  ).Encode(graphs)
+
+  # A new encoder has an empty in-memory cache.
+  ir2seq_encoder = MockIr2SeqEncoder()
+  encoder = graph2seq.GraphEncoder(
+    populated_graph_db, ir2seq_encoder, sequence_db=sequence_db
+  )
+  cached = encoder.Encode(graphs)
+
+  assert not ir2seq_encoder.encoded_ir_ids
+  assert len(cached) == len(encoded)
+  for a, b in zip(cached, encoded):
+    assert a.tolist() == b.tolist()
+
+
+def test_GraphEncoder_sequence_db_partial_hit(
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that only the sequences missing from the database are encoded."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  graph2seq.GraphEncoder(
+    populated_graph_db, MockIr2SeqEncoder(), sequence_db=sequence_db
+  ).Encode(graphs[:1])
+
+  ir2seq_encoder = MockIr2SeqEncoder()
+  graph2seq.GraphEncoder(
+    populated_graph_db, ir2seq_encoder, sequence_db=sequence_db
+  ).Encode(graphs)
+
+  assert set(ir2seq_encoder.encoded_ir_ids) == {
+    graph.ir_id for graph in graphs
+  } - {graphs[0].ir_id}
+
+
+def test_GraphEncoder_sequence_db_is_keyed_on_encoder(
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that sequences from a different encoder are not read."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  graph2seq.GraphEncoder(
+    populated_graph_db, MockIr2SeqEncoder(), sequence_db=sequence_db
+  ).Encode(graphs)
+
+  class OtherIr2SeqEncoder(MockIr2SeqEncoder):
+    pass
+
+  ir2seq_encoder = OtherIr2SeqEncoder()
+  graph2seq.GraphEncoder(
+    populated_graph_db, ir2seq_encoder, sequence_db=sequence_db
+  ).Encode(graphs)
+
+  assert sorted(ir2seq_encoder.encoded_ir_ids) == sorted(
+    {graph.ir_id for graph in graphs}
+  )
+
+
+def test_StatementEncoder_sequence_db_read_through(
+  populated_proto_db: unlabelled_graph_database.Database,
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that statement encodings read from the sequence database are
+  identical to the freshly encoded sequences."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  encoded = graph2seq.StatementEncoder(
+    populated_graph_db,
+    populated_proto_db,
+    max_encoded_length=100,
+    max_nodes=50,
+    sequence_db=sequence_db,
+  ).Encode(graphs)
+
+  encoder = graph2seq.StatementEncoder(
+    populated_graph_db,
+    populated_proto_db,
+    max_encoded_length=100,
+    max_nodes=50,
+    sequence_db=sequence_db,
+  )
+
+  def _EncodeIds(*args, **kwargs):
+    raise AssertionError("EncodeIds() called")
+
+  encoder.EncodeIds = _EncodeIds
+  assert encoder.Encode(graphs) == encoded
+
+
+def test_StatementEncoder_truncation_does_not_modify_cache(
+  populated_proto_db: unlabelled_graph_database.Database,
+  populated_graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+):
+  """Test that sequences are squeezed without modifying the cached sequences,
+  which are shared with encoders with larger maximum lengths."""
+  graphs = SelectRandomGraphs(populated_graph_db)
+  encoder = graph2seq.StatementEncoder(
+    populated_graph_db,
+    populated_proto_db,
+    max_encoded_length=5,
+    max_nodes=2,
+    sequence_db=sequence_db,
+  )
+  # Encode twice, so that the second call reads from the in-memory cache.
+  for _ in range(2):
+    squeezed = encoder.Encode(graphs)
+    stored = sequence_db.GetSequences(
+      encoder.sequence_encoder_id, {graph.ir_id for graph in graphs}
+    )
+    for graph, seq in zip(graphs, squeezed):
+      full = stored[graph.ir_id]
+      assert list(seq.encoded) == full.encoded[:5].tolist()
+      assert list(seq.node) == full.node[:2].tolist()
+      assert list(seq.encoded_node_length) == (
+        full.encoded_node_length[:2].tolist()
+      )
+      assert encoder.ir_id_to_encoded[graph.ir_id] == encoder.FromSequence(
+        full
+      )
+
+
 if __name__ == "__main__":
   test.Main()
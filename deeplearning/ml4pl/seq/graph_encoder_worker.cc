@@ -19,24 +19,32 @@
 
 #include "labm8/cpp/pbutil.h"
 
+#include <memory>
+
 namespace ml4pl {
 
+// The graph encoder for the most recently received vocabulary. When processing
+// a stream of jobs, only the first job needs to contain a vocabulary.
+std::unique_ptr<GraphEncoder> encoder;
+
 // Process a graph encoder job inplace.
 void ProgressGraphEncoderJobInplace(GraphEncoderJob* job) {
-  // Create the vocabulary.
-  absl::flat_hash_map<string, int> vocabulary;
-  for (auto it = job->vocabulary().begin(); it != job->vocabulary().end();
-       ++it) {
-    vocabulary.insert({it->first, it->second});
+  if (job->vocabulary_size() || !encoder) {
+    // Create the vocabulary.
+    absl::flat_hash_map<string, int> vocabulary;
+    for (auto it = job->vocabulary().begin(); it != job->vocabulary().end();
+         ++it) {
+      vocabulary.insert({it->first, it->second});
+    }
+
+    // Create the string and graph encoders.
+    CachedStringEncoder string_encoder(vocabulary);
+    encoder = std::make_unique<GraphEncoder>(string_encoder);
   }
 
-  // Create the string and graph encoders.
-  CachedStringEncoder string_encoder(vocabulary);
-  GraphEncoder encoder(string_encoder);
-
   // Encode each of the graphs and record the results.
   for (const auto& graph : job->graph()) {
-    *job->add_seq() = encoder.Encode(graph);
+    *job->add_seq() = encoder->Encode(graph);
   }
 
   // Unset the input fields to minimize the size of the proto that must be
@@ -47,5 +55,5 @@ void ProgressGraphEncoderJobInplace(GraphEncoderJob* job) {
 
 }  // namespace ml4pl
 
-PBUTIL_INPLACE_PROCESS_MAIN(ml4pl::ProgressGraphEncoderJobInplace,
-                            ml4pl::GraphEncoderJob);
+PBUTIL_INPLACE_PROCESS_STREAM_MAIN(ml4pl::ProgressGraphEncoderJobInplace,
+                                   ml4pl::GraphEncoderJob);
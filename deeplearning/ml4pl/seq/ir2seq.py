@@ -15,6 +15,7 @@
 # limitations under the License.
 """Module to convert intermediate representations into vocabulary sequences."""
 import json
+from typing import Dict
 from typing import List
 from typing import Tuple
 
@@ -62,6 +63,11 @@ class EncoderBase(object):
     """Convert a list of strings to a list of encoded sequences."""
     raise NotImplementedError("abstract class")
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Get the vocabulary, a mapping from tokens to encoded values."""
+    raise NotImplementedError("abstract class")
+
   @property
   def vocabulary_size(self) -> int:
     """Get the size of the vocabulary, including the unknown-vocab element."""
@@ -141,6 +147,11 @@ class LlvmEncoder(EncoderBase):
   ) -> List[np.array]:
     return self.lexer.Lex(strings, ctx=ctx)
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    return self.lexer.vocab
+
   @property
   def vocabulary_size(self) -> int:
     """Return the size of the encoder vocabulary."""
@@ -239,6 +250,11 @@ class OpenClEncoder(EncoderBase):
   ) -> List[np.array]:
     raise TypeError("OpenCL encoder does not support encoding strings")
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    return self.lexer.vocab
+
   @property
   def vocabulary_size(self) -> int:
     """Return the size of the encoder vocabulary."""
@@ -333,6 +349,11 @@ class Inst2VecEncoder(EncoderBase):
       for string in strings
     ]
 
+  @property
+  def vocabulary(self) -> Dict[str, int]:
+    """Return the encoder vocabulary."""
+    return self.vocab.dictionary
+
   @property
   def vocabulary_size(self) -> int:
     """Get the size of the vocabulary."""
@@ -267,6 +267,13 @@ class Lexer(object):
     self.vocab = copy.deepcopy(vocabulary)
     self.max_encoded_length = max_encoded_length
 
+    # A long-running string encoder, which receives the vocabulary once when it
+    # is started rather than with every job.
+    self.string_encoder_worker = pbutil.ProtoWorkerProcess(
+      [str(STRING_ENCODER_WORKER), "--stream"],
+      init_message=ir2seq_pb2.StringEncoderJob(vocabulary=self.vocab),
+    )
+
   @property
   def vocabulary_size(self) -> int:
     """Get the size of the vocabulary."""
@@ -291,8 +298,8 @@ class Lexer(object):
     If any out-of-vocab elements appear, they are set with max(vocab) + 1
     values.
 
-    There is non-negligible overhead in calling this method. For the sake of
-    efficiency try to minimize the number of calls.
+    Strings are encoded by a long-running string encoder process which is
+    started once per lexer, and restarted if it crashes or times out.
 
     Args:
       texts: A list of strings to lex.
@@ -312,11 +319,8 @@ class Lexer(object):
     ):
       message = ir2seq_pb2.StringEncoderJob(
         string=[text[: self.max_encoded_length] for text in texts],
-        vocabulary=self.vocab,
-      )
-      pbutil.RunProcessMessageInPlace(
-        [str(STRING_ENCODER_WORKER)], message, timeout_seconds=60
       )
+      self.string_encoder_worker.RunMessageInPlace(message, timeout_seconds=60)
 
       # Used in profiling callback.
       token_count = sum([len(seq.encoded) for seq in message.seq])
@@ -0,0 +1,244 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Pre-encode the graphs in a graph database to a sequence database.
+
+This encodes every unique IR in a graph database in parallel and stores the
+encoded sequences, so that LSTM models which use the same --sequence_db need
+never encode a graph themselves. IRs which have already been encoded are
+skipped, so an interrupted run can be resumed.
+
+Usage:
+
+  bazel run //deeplearning/ml4pl/seq:make_sequence_database -- \
+    --graph_db='sqlite:////tmp/graphs.db' \
+    --ir_db='sqlite:////tmp/ir.db' \
+    --sequence_db='sqlite:////tmp/sequences.db' \
+    --sequence_encoder=llvm
+"""
+import enum
+import multiprocessing
+import sys
+import time
+from typing import List
+from typing import Tuple
+
+import sqlalchemy as sql
+
+from deeplearning.ml4pl.graphs.labelled import graph_tuple_database
+from deeplearning.ml4pl.graphs.unlabelled import unlabelled_graph_database
+from deeplearning.ml4pl.ir import ir_database
+from deeplearning.ml4pl.seq import graph2seq
+from deeplearning.ml4pl.seq import ir2seq
+from deeplearning.ml4pl.seq import sequence_database
+from labm8.py import app
+from labm8.py import humanize
+from labm8.py import labtypes
+from labm8.py import progress
+
+
+FLAGS = app.FLAGS
+
+
+class EncoderType(enum.Enum):
+  OPENCL = 1
+  LLVM = 2
+  INST2VEC = 3
+  STATEMENT = 4
+
+  def ToEncoder(
+    self, graph_db: graph_tuple_database.Database
+  ) -> graph2seq.EncoderBase:
+    """Create the graph2seq encoder.
+
+    Encoders read the IR and proto databases from --ir_db and --proto_db.
+    """
+    if self == EncoderType.STATEMENT:
+      if not FLAGS.proto_db:
+        raise app.UsageError("--proto_db required")
+      # Sequences are stored at their full length, so no limits are imposed.
+      return graph2seq.StatementEncoder(
+        graph_db,
+        FLAGS.proto_db(),
+        max_encoded_length=sys.maxsize,
+        max_nodes=sys.maxsize,
+      )
+
+    if not FLAGS.ir_db:
+      raise app.UsageError("--ir_db required")
+    ir_db = FLAGS.ir_db()
+    if self == EncoderType.OPENCL:
+      ir2seq_encoder = ir2seq.OpenClEncoder(ir_db)
+    elif self == EncoderType.LLVM:
+      ir2seq_encoder = ir2seq.LlvmEncoder(ir_db)
+    elif self == EncoderType.INST2VEC:
+      ir2seq_encoder = ir2seq.Inst2VecEncoder(ir_db)
+    else:
+      raise NotImplementedError("unreachable")
+    return graph2seq.GraphEncoder(graph_db, ir2seq_encoder)
+
+
+app.DEFINE_enum(
+  "sequence_encoder",
+  EncoderType,
+  EncoderType.LLVM,
+  "The type of graph2seq encoder to pre-encode sequences with.",
+)
+app.DEFINE_integer(
+  "encode_nproc",
+  multiprocessing.cpu_count(),
+  "Tuning parameter. The number of encoder processes to spawn.",
+)
+app.DEFINE_integer(
+  "encode_chunk_size",
+  128,
+  "Tuning parameter. The number of IRs to assign to each encoder process.",
+)
+
+# The encoder of a worker process, set by _InitWorker().
+_encoder: graph2seq.EncoderBase = None
+
+
+def _InitWorker(encoder_type: EncoderType, graph_db_url: str) -> None:
+  """Initialize a worker process with its own encoder."""
+  global _encoder
+  _encoder = encoder_type.ToEncoder(
+    graph_tuple_database.Database(graph_db_url, must_exist=True)
+  )
+
+
+def _GetSequenceEncoder() -> sequence_database.SequenceEncoder:
+  """Return the sequence database entry describing the worker's encoder."""
+  return _encoder.sequence_encoder
+
+
+def _EncodeIrIds(
+  ir_ids: List[int],
+) -> Tuple[List[sequence_database.Sequence], int]:
+  """Encode a chunk of IRs.
+
+  Returns:
+    A tuple of encoded sequences, and the number of IRs that failed to encode.
+  """
+  try:
+    encoded = _encoder.EncodeIds(ir_ids, ctx=progress.NullContext)
+  except (ValueError, KeyError, OSError) as e:
+    app.Error("Failed to encode %s: %s", humanize.Plural(len(ir_ids), "IR"), e)
+    return [], len(ir_ids)
+  return (
+    [
+      _encoder.ToSequence(ir_id, encoded)
+      for ir_id, encoded in zip(ir_ids, encoded)
+    ],
+    0,
+  )
+
+
+def MakeSequenceDatabase(
+  graph_db: graph_tuple_database.Database,
+  sequence_db: sequence_database.Database,
+  encoder_type: EncoderType,
+  nproc: int,
+  chunk_size: int,
+) -> int:
+  """Encode all of the IRs in a graph database and store them.
+
+  Args:
+    graph_db: The graph database to encode the IRs of.
+    sequence_db: The database to write encoded sequences to.
+    encoder_type: The type of encoder to use.
+    nproc: The number of encoder processes.
+    chunk_size: The number of IRs to encode in each job.
+
+  Returns:
+    The number of IRs that failed to encode.
+  """
+  # Encoders are created only in the worker processes, so that long-running
+  # encoder subprocesses are not shared across forks.
+  pool = multiprocessing.Pool(
+    processes=nproc,
+    initializer=_InitWorker,
+    initargs=(encoder_type, graph_db.url),
+  )
+  try:
+    encoder_id = sequence_db.GetEncoderId(pool.apply(_GetSequenceEncoder))
+
+    with graph_db.Session() as session:
+      ir_ids = {
+        row.ir_id
+        for row in session.query(
+          sql.func.distinct(graph_tuple_database.GraphTuple.ir_id).label(
+            "ir_id"
+          )
+        )
+      }
+    already_done = sequence_db.GetEncodedIrIds(encoder_id)
+    ir_ids_to_do = sorted(ir_ids - already_done)
+    app.Log(
+      1,
+      "Encoding %s of %s with %s",
+      humanize.Commas(len(ir_ids_to_do)),
+      humanize.Plural(len(ir_ids), "unique IR"),
+      encoder_type.name.lower(),
+    )
+
+    start_time = time.time()
+    done_count = 0
+    failed_count = 0
+    for sequences, chunk_failed_count in pool.imap_unordered(
+      _EncodeIrIds, labtypes.Chunkify(ir_ids_to_do, chunk_size)
+    ):
+      sequence_db.AddSequences(encoder_id, sequences)
+      done_count += len(sequences) + chunk_failed_count
+      failed_count += chunk_failed_count
+      app.Log(
+        1,
+        "Encoded %s of %s IRs (%.2f%%, %s)",
+        humanize.Commas(done_count),
+        humanize.Commas(len(ir_ids_to_do)),
+        (done_count / len(ir_ids_to_do)) * 100,
+        humanize.DecimalPrefix(
+          done_count / (time.time() - start_time), " IRs/sec"
+        ),
+      )
+  finally:
+    pool.close()
+    pool.join()
+
+  return failed_count
+
+
+def Main():
+  """Main entry point."""
+  if not FLAGS.graph_db:
+    raise app.UsageError("--graph_db required")
+  if not FLAGS.sequence_db:
+    raise app.UsageError("--sequence_db required")
+
+  failed_count = MakeSequenceDatabase(
+    FLAGS.graph_db(),
+    FLAGS.sequence_db(),
+    FLAGS.sequence_encoder(),
+    nproc=FLAGS.encode_nproc,
+    chunk_size=FLAGS.encode_chunk_size,
+  )
+  if failed_count:
+    app.FatalWithoutStackTrace(
+      "Failed to encode %s", humanize.Plural(failed_count, "IR")
+    )
+
+
+if __name__ == "__main__":
+  app.Run(Main)
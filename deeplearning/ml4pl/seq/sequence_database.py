@@ -13,11 +13,22 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-"""A database backend for storing sequences."""
-import codecs
+"""A database backend for storing encoded sequences.
+
+This database is a persistent cache of the sequences produced by graph2seq
+encoders. Sequences are keyed by the encoder that produced them and the ID of
+the IR that was encoded, so that a database can be shared by multiple models
+and runs. Encoded arrays are stored as raw little-endian int32 buffers, which
+are decoded without copying.
+"""
+import datetime
+import json
 import pickle
 from typing import Dict
+from typing import Iterable
+from typing import List
 from typing import Optional
+from typing import Set
 
 import numpy as np
 import sqlalchemy as sql
@@ -25,6 +36,7 @@ from sqlalchemy.ext import declarative
 
 from labm8.py import app
 from labm8.py import crypto
+from labm8.py import labtypes
 from labm8.py import sqlutil
 
 
@@ -32,88 +44,123 @@ FLAGS = app.FLAGS
 
 Base = declarative.declarative_base()
 
+# The dtype of stored arrays.
+SEQUENCE_DTYPE = np.dtype("<i4")
+
+# The maximum number of IDs to use in a single "IN" query. SQLite limits the
+# number of host parameters in a query to 999.
+_MAX_IN_QUERY_SIZE = 512
+
 
 class SequenceEncoder(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
   """An encoder for graphs to sequences."""
 
   id: int = sql.Column(sql.Integer, primary_key=True)
 
-  vocab_sha1: str = 1
-  binary_vocab: bytes = 2
+  # The name of the encoder, and a checksum of the name and vocabulary. Two
+  # encoders with the same checksum produce the same sequences.
+  name: str = sql.Column(sql.String(128), nullable=False)
+  sha1: str = sql.Column(sql.String(40), nullable=False, unique=True)
+
+  binary_vocab: bytes = sql.Column(
+    sqlutil.ColumnTypes.LargeBinary(), nullable=False
+  )
+
+  timestamp: datetime.datetime = sqlutil.ColumnFactory.MillisecondDatetime()
 
   @property
   def vocab(self) -> Dict[str, int]:
     return pickle.loads(self.binary_vocab)
 
+  @staticmethod
+  def Checksum(name: str, vocab: Dict[str, int]) -> str:
+    """Compute the checksum of an encoder name and vocabulary."""
+    return crypto.sha1_str(
+      json.dumps({"name": name, "vocab": vocab}, sort_keys=True)
+    )
+
   @classmethod
-  def Create(cls, vocab: Dict[str, int]):
-    binary_vocab = pickle.dumps(vocab)
-    return cls(vocab_sha1=crypto.sha1(binary_vocab), binary_vocab=binary_vocab)
+  def Create(cls, name: str, vocab: Dict[str, int]):
+    return cls(
+      name=name,
+      sha1=cls.Checksum(name, vocab),
+      binary_vocab=pickle.dumps(vocab),
+    )
 
 
 class Sequence(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
   """The data for an encoded sequence."""
 
-  ir_id: int = sql.Column(
-    sql.Integer, nullable=False, index=True,
-  )
-
   # The sequence encoder.
   encoder_id: int = sql.Column(
     sql.Integer,
     sql.ForeignKey(
       "sequence_encoders.id", onupdate="CASCADE", ondelete="CASCADE"
     ),
-    index=True,
-  )
-  encoder: SequenceEncoder = sql.orm.relationship(
-    "SequenceEncoder",
-    uselist=False,
-    single_parent=True,
-    cascade="all, delete-orphan",
+    primary_key=True,
   )
+  ir_id: int = sql.Column(sql.Integer, primary_key=True)
 
-  sequence_length: int = sql.Column(sql.Integer, nullable=False)
-  vocab_size: int = sql.Column(sql.Integer, nullable=False)
+  # The number of elements in the encoded sequence.
+  encoded_length: int = sql.Column(sql.Integer, nullable=False)
 
-  binary_encoded_sequence: bytes = sql.Column(
+  # Raw int32 buffers. The encoded node lengths and node indices are only set
+  # by encoders that map graph nodes to subsequences.
+  binary_encoded: bytes = sql.Column(
     sqlutil.ColumnTypes.LargeBinary(), nullable=False
   )
-  binary_segment_ids: Optional[bytes] = sql.Column(
-    sqlutil.ColumnTypes.LargeBinary(), nullable=False
+  binary_encoded_node_length: Optional[bytes] = sql.Column(
+    sqlutil.ColumnTypes.LargeBinary(), nullable=True
   )
-  binary_node_mask: Optional[bytes] = sql.Column(
-    sqlutil.ColumnTypes.LargeBinary(), nullable=False
+  binary_node: Optional[bytes] = sql.Column(
+    sqlutil.ColumnTypes.LargeBinary(), nullable=True
   )
 
   @property
-  def encoded_sequence(self) -> np.array:
-    """Return the encoded sequence, with shape (sequence_length, vocab_size)"""
-    return pickle.loads(codecs.decode(self.binary_encoded_sequence, "zlib"))
+  def encoded(self) -> np.array:
+    """Return the encoded sequence as a read-only array."""
+    return np.frombuffer(self.binary_encoded, dtype=SEQUENCE_DTYPE)
 
   @property
-  def segment_ids(self) -> np.array:
-    return pickle.loads(codecs.decode(self.binary_segment_ids, "zlib"))
+  def encoded_node_length(self) -> Optional[np.array]:
+    """Return the encoded lengths of each node as a read-only array."""
+    if self.binary_encoded_node_length is None:
+      return None
+    return np.frombuffer(self.binary_encoded_node_length, dtype=SEQUENCE_DTYPE)
 
   @property
-  def node_mask(self) -> np.array:
-    return pickle.loads(codecs.decode(self.binary_node_mask, "zlib"))
+  def node(self) -> Optional[np.array]:
+    """Return the indices of the encoded nodes as a read-only array."""
+    if self.binary_node is None:
+      return None
+    return np.frombuffer(self.binary_node, dtype=SEQUENCE_DTYPE)
+
+  @staticmethod
+  def ArrayToBytes(array: Iterable[int]) -> bytes:
+    """Serialize an array of integers to a raw int32 buffer."""
+    return np.asarray(array, dtype=SEQUENCE_DTYPE).tobytes()
 
   @classmethod
   def Create(
     cls,
     ir_id: int,
-    encoded_sequence: np.array,
-    segment_ids: np.array,
-    node_mask: np.array,
+    encoded: Iterable[int],
+    encoded_node_length: Optional[Iterable[int]] = None,
+    node: Optional[Iterable[int]] = None,
+    encoder_id: Optional[int] = None,
   ):
+    binary_encoded = cls.ArrayToBytes(encoded)
     return cls(
+      encoder_id=encoder_id,
       ir_id=ir_id,
-      binary_encoded_sequence=codecs.encode(
-        pickle.dumps(encoded_sequence), "zlib"
+      encoded_length=len(binary_encoded) // SEQUENCE_DTYPE.itemsize,
+      binary_encoded=binary_encoded,
+      binary_encoded_node_length=(
+        None
+        if encoded_node_length is None
+        else cls.ArrayToBytes(encoded_node_length)
       ),
-      binary_segment_ids=codecs.encode(pickle.dumps(segment_ids), "zlib"),
-      binary_node_mask=codecs.encode(pickle.dumps(node_mask), "zlib"),
+      binary_node=None if node is None else cls.ArrayToBytes(node),
     )
 
 
@@ -123,5 +170,132 @@ class Sequence(Base, sqlutil.PluralTablenameFromCamelCapsClassNameMixin):
 
 
 class Database(sqlutil.Database):
+  """A database of encoded sequences."""
+
   def __init__(self, url: str, must_exist: bool = False):
     super(Database, self).__init__(url, Base, must_exist=must_exist)
+
+  def GetEncoderId(self, encoder: SequenceEncoder) -> int:
+    """Return the ID of an encoder, adding it to the database if required.
+
+    Args:
+      encoder: A sequence encoder, as returned by SequenceEncoder.Create().
+
+    Returns:
+      The encoder ID.
+    """
+    with self.Session() as session:
+      encoder_id = (
+        session.query(SequenceEncoder.id)
+        .filter(SequenceEncoder.sha1 == encoder.sha1)
+        .scalar()
+      )
+      if encoder_id is not None:
+        return encoder_id
+
+      try:
+        session.add(encoder)
+        session.commit()
+        return encoder.id
+      except sql.exc.IntegrityError:
+        # Another process added the encoder concurrently.
+        session.rollback()
+        return (
+          session.query(SequenceEncoder.id)
+          .filter(SequenceEncoder.sha1 == encoder.sha1)
+          .one()
+          .id
+        )
+
+  def GetSequences(
+    self, encoder_id: int, ir_ids: Iterable[int]
+  ) -> Dict[int, Sequence]:
+    """Fetch the encoded sequences for a set of IR IDs.
+
+    Args:
+      encoder_id: The ID of the encoder.
+      ir_ids: The IR IDs to look up.
+
+    Returns:
+      A map from IR ID to sequence, for the IR IDs which have been encoded.
+      IDs which have not been encoded are absent.
+    """
+    sequences: Dict[int, Sequence] = {}
+    with self.Session() as session:
+      for chunk in labtypes.Chunkify(sorted(set(ir_ids)), _MAX_IN_QUERY_SIZE):
+        for sequence in session.query(Sequence).filter(
+          Sequence.encoder_id == encoder_id, Sequence.ir_id.in_(chunk)
+        ):
+          sequences[sequence.ir_id] = sequence
+    return sequences
+
+  def GetEncodedIrIds(self, encoder_id: int) -> Set[int]:
+    """Return the IDs of the IRs which have been encoded by an encoder."""
+    with self.Session() as session:
+      return {
+        row.ir_id
+        for row in session.query(Sequence.ir_id).filter(
+          Sequence.encoder_id == encoder_id
+        )
+      }
+
+  def AddSequences(self, encoder_id: int, sequences: List[Sequence]) -> None:
+    """Add encoded sequences to the database.
+
+    Sequences which are already in the database are ignored, so it is safe for
+    multiple processes to add the same sequences concurrently.
+
+    Args:
+      encoder_id: The ID of the encoder which produced the sequences.
+      sequences: The sequences to add.
+    """
+    if not sequences:
+      return
+
+    with self.Session() as session:
+      existing = set()
+      ir_ids = [sequence.ir_id for sequence in sequences]
+      for chunk in labtypes.Chunkify(ir_ids, _MAX_IN_QUERY_SIZE):
+        existing.update(
+          row.ir_id
+          for row in session.query(Sequence.ir_id).filter(
+            Sequence.encoder_id == encoder_id, Sequence.ir_id.in_(chunk)
+          )
+        )
+      mappings = []
+      for sequence in sequences:
+        if sequence.ir_id in existing:
+          continue
+        existing.add(sequence.ir_id)
+        mappings.append(
+          {
+            "encoder_id": encoder_id,
+            "ir_id": sequence.ir_id,
+            "encoded_length": sequence.encoded_length,
+            "binary_encoded": sequence.binary_encoded,
+            "binary_encoded_node_length": sequence.binary_encoded_node_length,
+            "binary_node": sequence.binary_node,
+          }
+        )
+      try:
+        session.bulk_insert_mappings(Sequence, mappings)
+        session.commit()
+      except sql.exc.IntegrityError:
+        # Another process added some of the sequences concurrently. Fall back
+        # to adding the sequences one at a time.
+        session.rollback()
+        for mapping in mappings:
+          try:
+            session.bulk_insert_mappings(Sequence, [mapping])
+            session.commit()
+          except sql.exc.IntegrityError:
+            session.rollback()
+
+
+app.DEFINE_database(
+  "sequence_db",
+  Database,
+  None,
+  "A database of encoded sequences. If set, the graph2seq encoders read and "
+  "write encoded sequences to this database.",
+)
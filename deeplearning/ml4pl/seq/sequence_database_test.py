@@ -0,0 +1,140 @@
+# Copyright 2019 the ProGraML authors.
+#
+# Contact Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //deeplearning/ml4pl/seq:sequence_database."""
+import numpy as np
+
+from deeplearning.ml4pl.seq import sequence_database
+from deeplearning.ml4pl.testing import testing_databases
+from labm8.py import test
+
+
+FLAGS = test.FLAGS
+
+
+@test.Fixture(
+  scope="function",
+  params=testing_databases.GetDatabaseUrls(),
+  namer=testing_databases.DatabaseUrlNamer("sequence_db"),
+)
+def db(request) -> sequence_database.Database:
+  """A test fixture which yields an empty sequence database."""
+  yield from testing_databases.YieldDatabase(
+    sequence_database.Database, request.param
+  )
+
+
+def test_SequenceEncoder_Checksum_is_order_independent():
+  a = sequence_database.SequenceEncoder.Create("foo", {"a": 0, "b": 1})
+  b = sequence_database.SequenceEncoder.Create("foo", {"b": 1, "a": 0})
+  assert a.sha1 == b.sha1
+
+
+def test_SequenceEncoder_Checksum_includes_name():
+  a = sequence_database.SequenceEncoder.Create("foo", {"a": 0})
+  b = sequence_database.SequenceEncoder.Create("bar", {"a": 0})
+  assert a.sha1 != b.sha1
+
+
+def test_Sequence_Create_arrays():
+  sequence = sequence_database.Sequence.Create(
+    ir_id=1, encoded=[1, 2, 3], encoded_node_length=[2, 1], node=[0, 5]
+  )
+  assert sequence.encoded_length == 3
+  assert sequence.encoded.tolist() == [1, 2, 3]
+  assert sequence.encoded_node_length.tolist() == [2, 1]
+  assert sequence.node.tolist() == [0, 5]
+
+
+def test_Sequence_Create_without_nodes():
+  sequence = sequence_database.Sequence.Create(
+    ir_id=1, encoded=np.array([1, 2, 3], dtype=np.int64)
+  )
+  assert sequence.encoded.dtype == np.int32
+  assert sequence.encoded_node_length is None
+  assert sequence.node is None
+
+
+def test_GetEncoderId_is_idempotent(db: sequence_database.Database):
+  a = db.GetEncoderId(sequence_database.SequenceEncoder.Create("foo", {}))
+  b = db.GetEncoderId(sequence_database.SequenceEncoder.Create("foo", {}))
+  c = db.GetEncoderId(sequence_database.SequenceEncoder.Create("bar", {}))
+  assert a == b
+  assert a != c
+
+
+def test_AddSequences_GetSequences(db: sequence_database.Database):
+  """Test that sequences are keyed on the encoder and IR ID."""
+  a = db.GetEncoderId(sequence_database.SequenceEncoder.Create("a", {}))
+  b = db.GetEncoderId(sequence_database.SequenceEncoder.Create("b", {}))
+  db.AddSequences(
+    a,
+    [
+      sequence_database.Sequence.Create(ir_id=i, encoded=[i] * i)
+      for i in range(10)
+    ],
+  )
+  db.AddSequences(
+    b, [sequence_database.Sequence.Create(ir_id=1, encoded=[5, 5])]
+  )
+
+  sequences = db.GetSequences(a, [2, 3, 20])
+  assert set(sequences.keys()) == {2, 3}
+  assert sequences[3].encoded.tolist() == [3, 3, 3]
+
+  assert db.GetSequences(b, range(10))[1].encoded.tolist() == [5, 5]
+  assert db.GetEncodedIrIds(a) == set(range(10))
+  assert db.GetEncodedIrIds(b) == {1}
+
+
+def test_AddSequences_ignores_duplicates(db: sequence_database.Database):
+  encoder_id = db.GetEncoderId(
+    sequence_database.SequenceEncoder.Create("a", {})
+  )
+  db.AddSequences(
+    encoder_id, [sequence_database.Sequence.Create(ir_id=1, encoded=[1])]
+  )
+  db.AddSequences(
+    encoder_id,
+    [
+      sequence_database.Sequence.Create(ir_id=1, encoded=[2]),
+      sequence_database.Sequence.Create(ir_id=2, encoded=[2]),
+    ],
+  )
+
+  sequences = db.GetSequences(encoder_id, [1, 2])
+  assert sequences[1].encoded.tolist() == [1]
+  assert sequences[2].encoded.tolist() == [2]
+
+
+def test_GetSequences_many_ids(db: sequence_database.Database):
+  """Test fetching more IDs than fit in a single query."""
+  encoder_id = db.GetEncoderId(
+    sequence_database.SequenceEncoder.Create("a", {})
+  )
+  db.AddSequences(
+    encoder_id,
+    [
+      sequence_database.Sequence.Create(ir_id=i, encoded=[i])
+      for i in range(2000)
+    ],
+  )
+  sequences = db.GetSequences(encoder_id, range(2000))
+  assert len(sequences) == 2000
+  assert sequences[1999].encoded.tolist() == [1999]
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -18,24 +18,33 @@
 
 #include "labm8/cpp/pbutil.h"
 
+#include <memory>
+
 namespace ml4pl {
 
+// The string encoder for the most recently received vocabulary. When
+// processing a stream of jobs, only the first job needs to contain a
+// vocabulary, and the encoder's cache persists across jobs.
+std::unique_ptr<CachedStringEncoder> encoder;
+
 // Process a graph encoder job inplace.
 void ProgressStringEncoderJobInplace(StringEncoderJob* job) {
-  // Create the vocabulary.
-  absl::flat_hash_map<string, int> vocabulary;
-  for (auto it = job->vocabulary().begin(); it != job->vocabulary().end();
-       ++it) {
-    vocabulary.insert({it->first, it->second});
-  }
+  if (job->vocabulary_size() || !encoder) {
+    // Create the vocabulary.
+    absl::flat_hash_map<string, int> vocabulary;
+    for (auto it = job->vocabulary().begin(); it != job->vocabulary().end();
+         ++it) {
+      vocabulary.insert({it->first, it->second});
+    }
 
-  // Create the string encoder.
-  CachedStringEncoder encoder(vocabulary);
+    // Create the string encoder.
+    encoder = std::make_unique<CachedStringEncoder>(vocabulary);
+  }
 
   // Encode each of the string and record the results.
   for (const auto& string : job->string()) {
     EncodedString* message = job->add_seq();
-    std::vector<int> encoded = encoder.EncodeAndCache(string);
+    std::vector<int> encoded = encoder->EncodeAndCache(string);
     message->mutable_encoded()->Reserve(encoded.size());
     for (int i = 0; i < encoded.size(); ++i) {
       message->mutable_encoded()->Add(encoded[i]);
@@ -50,5 +59,5 @@ void ProgressStringEncoderJobInplace(StringEncoderJob* job) {
 
 }  // namespace ml4pl
 
-PBUTIL_INPLACE_PROCESS_MAIN(ml4pl::ProgressStringEncoderJobInplace,
-                            ml4pl::StringEncoderJob);
+PBUTIL_INPLACE_PROCESS_STREAM_MAIN(ml4pl::ProgressStringEncoderJobInplace,
+                                   ml4pl::StringEncoderJob);
@@ -134,6 +134,7 @@ class RandomLogDatabaseGenerator(object):
             max_batch_count=max_batch_count,
           ).all
         )
+      db.UpdateEpochStats(run_id)
     return run_ids
 
   #############################################################################
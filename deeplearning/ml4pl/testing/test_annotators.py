@@ -17,8 +17,12 @@
 import random
 import time
 from typing import Optional
+from typing import Type
+
+import numpy as np
 
 from deeplearning.ml4pl.graphs import programl
+from deeplearning.ml4pl.graphs import programl_pb2
 from deeplearning.ml4pl.graphs.labelled.dataflow import data_flow_graphs
 from labm8.py import app
 
@@ -79,3 +83,58 @@ class EmptyAnnotator(data_flow_graphs.DataFlowGraphAnnotator):
     self, n: int = 0
   ) -> data_flow_graphs.NetworkxDataFlowGraphs:
     return data_flow_graphs.NetworkxDataFlowGraphs([])
+
+
+def AssertAnnotatorsAreEquivalent(
+  proto: programl_pb2.ProgramGraph,
+  annotator_a: Type[data_flow_graphs.DataFlowGraphAnnotator],
+  annotator_b: Type[data_flow_graphs.DataFlowGraphAnnotator],
+  n: int = 0,
+  seed: int = 0,
+) -> None:
+  """Assert that two annotators produce identical annotated graphs.
+
+  Args:
+    proto: The unlabelled graph to annotate.
+    annotator_a: The first annotator class.
+    annotator_b: The second annotator class.
+    n: The maximum number of annotated graphs to produce.
+    seed: The random seed used to select root nodes. The same root nodes are
+      selected by both annotators.
+  """
+  random.seed(seed)
+  a = annotator_a(proto).MakeAnnotated(n)
+  random.seed(seed)
+  b = annotator_b(proto).MakeAnnotated(n)
+
+  a_graphs, b_graphs = a.graphs, b.graphs
+  assert len(a_graphs) == len(b_graphs)
+  for a_graph, b_graph in zip(a_graphs, b_graphs):
+    assert a_graph.graph == b_graph.graph
+    assert list(a_graph.nodes(data=True)) == list(b_graph.nodes(data=True))
+
+  a_graph_tuples, b_graph_tuples = a.graph_tuples, b.graph_tuples
+  assert len(a_graph_tuples) == len(b_graph_tuples)
+  for a_tuple, b_tuple in zip(a_graph_tuples, b_graph_tuples):
+    assert a_tuple.data_flow_root_node == b_tuple.data_flow_root_node
+    assert a_tuple.data_flow_steps == b_tuple.data_flow_steps
+    assert (
+      a_tuple.data_flow_positive_node_count
+      == b_tuple.data_flow_positive_node_count
+    )
+    for attr in ("node_x", "node_y", "graph_x", "graph_y"):
+      a_array = getattr(a_tuple.graph_tuple, attr)
+      b_array = getattr(b_tuple.graph_tuple, attr)
+      if a_array is None:
+        assert b_array is None
+      else:
+        assert np.array_equal(a_array, b_array)
+    for flow in range(3):
+      assert np.array_equal(
+        a_tuple.graph_tuple.adjacencies[flow],
+        b_tuple.graph_tuple.adjacencies[flow],
+      )
+      assert np.array_equal(
+        a_tuple.graph_tuple.edge_positions[flow],
+        b_tuple.graph_tuple.edge_positions[flow],
+      )
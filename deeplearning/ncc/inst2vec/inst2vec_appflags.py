@@ -20,6 +20,8 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 # ==============================================================================
 """Execution flags for inst2vec parameters"""
+import multiprocessing
+
 from labm8.py import app
 
 FLAGS = app.FLAGS
@@ -32,6 +34,11 @@ app.DEFINE_integer(
   'replace stmts which appear less than "cutoff" times by "unknown token',
 )
 app.DEFINE_float("subsampling", 1e-7, "frequent pairs subsampling")
+app.DEFINE_integer(
+  "vocabulary_nproc",
+  multiprocessing.cpu_count(),
+  "number of processes used to generate data pairs",
+)
 
 # Parameters of inst2vec (default)
 app.DEFINE_integer("embedding_size", 200, "Dimension of embedding space")
@@ -22,9 +22,11 @@
 # ==============================================================================
 """Preprocess LLVM IR code to XFG for inst2vec training"""
 import copy
+import functools
 import os
 import pickle
 import re
+import typing
 
 import networkx as nx
 
@@ -643,6 +645,51 @@ def remove_leading_spaces(data):
   return data
 
 
+def RemoveTrailingCommentsAndMetadataFromLine(line: str) -> str:
+  """
+  Remove comments, metadata and attribute groups trailing at the end of a line
+  :param line: a line of code, with leading spaces removed
+  :return: modified line
+  """
+  # If the line contains a trailing metadata
+  pos = line.find("!")
+  if pos != -1:
+    # Remove metadatas which are function arguments
+    while re.search(r"\(.*metadata !.*\)", line) is not None:
+      line = re.sub(r"(, )?metadata !\d+(, )?", "", line)
+      line = re.sub(r"(, )?metadata !\w+(, )?", "", line)
+      line = re.sub(r"metadata !\d+(, )?", "", line)
+      line = re.sub(r"metadata !\w+(, )?", "", line)
+      pos = line.find("!")
+  if pos != -1:
+    # Check whether the '!' is part of a string expression
+    pos_string = line[:pos].find('c"')
+    if pos_string == -1:  # there is no string expression earlier on the line
+      line = line[:pos].strip()  # erase from here to the end of the line
+      if line[-1] == ",":  # can happen with !tbaa
+        line = line[:-1].strip()
+    else:  # there is a string expression earlier on the line
+      pos_endstring = line[pos_string + 2 : pos].find('"')
+      if pos_endstring != -1:  # the string has been terminated before the ;
+        line = line[:pos].strip()  # erase from here to the end of the line
+        if line[-1] == ",":  # can happen with !tbaa
+          line = line[:-1].strip()
+
+  # If the line contains a trailing attribute group
+  pos = line.find("#")
+  if pos != -1:
+    # Check whether the ';' is part of a string expression
+    s = re.search(r'c".*"', line[:pos])
+    if not s:  # there is no string expression earlier on the line
+      line = line[:pos].strip()  # erase from here to the end of the line
+    else:  # there is a string expression earlier on the line
+      pos_endstring = s.end()
+      if pos_endstring != -1:  # the string has been terminated before the ;
+        line = line[:pos].strip()  # erase from here to the end of the line
+
+  return line
+
+
 def remove_trailing_comments_and_metadata(data):
   """
   Remove comments, metadata and attribute groups trailing at the end of a line
@@ -651,48 +698,7 @@ def remove_trailing_comments_and_metadata(data):
   """
   for i in range(len(data)):
     for j in range(len(data[i])):
-
-      line = data[i][j]
-
-      # If the line contains a trailing metadata
-      pos = line.find("!")
-      if pos != -1:
-        # Remove metadatas which are function arguments
-        while re.search(r"\(.*metadata !.*\)", line) is not None:
-          line = re.sub(r"(, )?metadata !\d+(, )?", "", line)
-          line = re.sub(r"(, )?metadata !\w+(, )?", "", line)
-          line = re.sub(r"metadata !\d+(, )?", "", line)
-          line = re.sub(r"metadata !\w+(, )?", "", line)
-          pos = line.find("!")
-      if pos != -1:
-        # Check whether the '!' is part of a string expression
-        pos_string = line[:pos].find('c"')
-        if (
-          pos_string == -1
-        ):  # there is no string expression earlier on the line
-          line = line[:pos].strip()  # erase from here to the end of the line
-          if line[-1] == ",":  # can happen with !tbaa
-            line = line[:-1].strip()
-        else:  # there is a string expression earlier on the line
-          pos_endstring = line[pos_string + 2 : pos].find('"')
-          if pos_endstring != -1:  # the string has been terminated before the ;
-            line = line[:pos].strip()  # erase from here to the end of the line
-            if line[-1] == ",":  # can happen with !tbaa
-              line = line[:-1].strip()
-
-      # If the line contains a trailing attribute group
-      pos = line.find("#")
-      if pos != -1:
-        # Check whether the ';' is part of a string expression
-        s = re.search(r'c".*"', line[:pos])
-        if not s:  # there is no string expression earlier on the line
-          line = line[:pos].strip()  # erase from here to the end of the line
-        else:  # there is a string expression earlier on the line
-          pos_endstring = s.end()
-          if pos_endstring != -1:  # the string has been terminated before the ;
-            line = line[:pos].strip()  # erase from here to the end of the line
-
-      data[i][j] = line
+      data[i][j] = RemoveTrailingCommentsAndMetadataFromLine(data[i][j])
 
   return data
 
@@ -772,6 +778,10 @@ def collapse_stmt_units_to_a_line(data):
   return data
 
 
+# Matches the definition of a structure type.
+_STRUCTURE_DEFINITION_RE = re.compile("%.* = type (<?{ .* }|opaque|{})")
+
+
 def remove_structure_definitions(data):
   """
   Remove lines of code that aren't representative of LLVM-IR "language"
@@ -781,9 +791,7 @@ def remove_structure_definitions(data):
   """
   for i in range(len(data)):
     data[i] = [
-      line
-      for line in data[i]
-      if not re.match("%.* = type (<?{ .* }|opaque|{})", line)
+      line for line in data[i] if not _STRUCTURE_DEFINITION_RE.match(line)
     ]
 
   return data
@@ -794,17 +802,25 @@ def preprocess(data):
   - remove non-representative lines of code
   - remove leading spaces (indentation)
   - remove trailing comments and metadata
-  :param data: input data as a list of files where each file is a list of strings
+  :param data: input data as a list of files where each file is a list of strings.
+               This is modified in place to contain the pre-processed code,
+               including structure definitions.
   :return: preprocessed_data: modified input data
            functions_declared_in_files:
   """
   functions_declared_in_files = get_functions_declared_in_files(data)
-  data = remove_non_representative_code(data)
-  data = remove_leading_spaces(data)
-  data = remove_trailing_comments_and_metadata(data)
+  # Remove non-representative code, leading spaces, and trailing comments in a
+  # single pass over each file.
+  for i in range(len(data)):
+    data[i] = [
+      RemoveTrailingCommentsAndMetadataFromLine(line.strip())
+      for line in data[i]
+      if keep(line)
+    ]
   data = collapse_stmt_units_to_a_line(data)
-  preprocessed_data = copy.deepcopy(data)
-  preprocessed_data = remove_structure_definitions(preprocessed_data)
+  # Lines are immutable, so a shallow copy of each file suffices to leave the
+  # structure definitions in the input data.
+  preprocessed_data = remove_structure_definitions([list(f) for f in data])
 
   return preprocessed_data, functions_declared_in_files
 
@@ -3015,18 +3031,41 @@ def abstract_statements_from_identifiers(G):
   return G
 
 
+# Precompiled patterns for PreprocessStatement().
+#
+# Local and global identifiers are substituted in a single pass. This is
+# equivalent to substituting local identifiers and then global identifiers,
+# since local identifiers consume any '@' characters that follow them, and
+# global identifiers cannot contain a '%' character.
+_IDENTIFIER_RE = re.compile(f"(?P<local>{rgx.local_id})|{rgx.global_id}")
+_NUMBERED_LABEL_RE = re.compile(r"; <label>:\d+:?(\s+; preds = )?")
+_LABEL_NUMBER_RE = re.compile(r":\d+")
+_NAMED_LABEL_RE = re.compile(rgx.local_id_no_perc + r":(\s+; preds = )?")
+_LABEL_NAME_RE = re.compile(rgx.local_id_no_perc + ":")
+_FLOAT_HEXA_RE = re.compile(rgx.immediate_value_float_hexa)
+_FLOAT_SCI_RE = re.compile(rgx.immediate_value_float_sci)
+_INT_RE = re.compile(r"(?<!align)(?<!\[) " + rgx.immediate_value_int)
+_STRING_RE = re.compile(rgx.immediate_value_string)
+_AGGREGATE_ACCESS_RE = re.compile("<%ID> = (?:extract|insert)(?:element|value)")
+_VECTOR_ACCESS_RE = re.compile("<%ID> = (?:extract|insert)element")
+_INDEX_TYPE_RE = re.compile(r"i\d+ ")
+
+
+def _SubstituteIdentifier(match) -> str:
+  return "<%ID>" if match.group("local") else "<@ID>"
+
+
 def PreprocessStatement(stmt: str) -> str:
-  # Remove local identifiers
-  stmt = re.sub(rgx.local_id, "<%ID>", stmt)
-  # Global identifiers
-  stmt = re.sub(rgx.global_id, "<@ID>", stmt)
+  # Remove local and global identifiers
+  if "%" in stmt or "@" in stmt:
+    stmt = _IDENTIFIER_RE.sub(_SubstituteIdentifier, stmt)
   # Remove labels
-  if re.match(r"; <label>:\d+:?(\s+; preds = )?", stmt):
-    stmt = re.sub(r":\d+", ":<LABEL>", stmt)
-    stmt = re.sub("<%ID>", "<LABEL>", stmt)
-  elif re.match(rgx.local_id_no_perc + r":(\s+; preds = )?", stmt):
-    stmt = re.sub(rgx.local_id_no_perc + ":", "<LABEL>:", stmt)
-    stmt = re.sub("<%ID>", "<LABEL>", stmt)
+  if _NUMBERED_LABEL_RE.match(stmt):
+    stmt = _LABEL_NUMBER_RE.sub(":<LABEL>", stmt)
+    stmt = stmt.replace("<%ID>", "<LABEL>")
+  elif _NAMED_LABEL_RE.match(stmt):
+    stmt = _LABEL_NAME_RE.sub("<LABEL>:", stmt)
+    stmt = stmt.replace("<%ID>", "<LABEL>")
   if "; preds = " in stmt:
     s = stmt.split("  ")
     if s[-1][0] == " ":
@@ -3035,33 +3074,81 @@ def PreprocessStatement(stmt: str) -> str:
       stmt = s[0] + " " + s[-1]
 
   # Remove floating point values
-  stmt = re.sub(rgx.immediate_value_float_hexa, "<FLOAT>", stmt)
-  stmt = re.sub(rgx.immediate_value_float_sci, "<FLOAT>", stmt)
+  if "0x" in stmt or "0X" in stmt:
+    stmt = _FLOAT_HEXA_RE.sub("<FLOAT>", stmt)
+  if "." in stmt:
+    stmt = _FLOAT_SCI_RE.sub("<FLOAT>", stmt)
 
   # Remove integer values
-  if (
-    re.match("<%ID> = extractelement", stmt) is None
-    and re.match("<%ID> = extractvalue", stmt) is None
-    and re.match("<%ID> = insertelement", stmt) is None
-    and re.match("<%ID> = insertvalue", stmt) is None
-  ):
-    stmt = re.sub(
-      r"(?<!align)(?<!\[) " + rgx.immediate_value_int, " <INT>", stmt
-    )
+  if _AGGREGATE_ACCESS_RE.match(stmt) is None:
+    stmt = _INT_RE.sub(" <INT>", stmt)
 
   # Remove string values
-  stmt = re.sub(rgx.immediate_value_string, " <STRING>", stmt)
+  if 'c"' in stmt:
+    stmt = _STRING_RE.sub(" <STRING>", stmt)
 
   # Remove index types
-  if (
-    re.match("<%ID> = extractelement", stmt) is not None
-    or re.match("<%ID> = insertelement", stmt) is not None
-  ):
-    stmt = re.sub(r"i\d+ ", "<TYP> ", stmt)
+  if _VECTOR_ACCESS_RE.match(stmt) is not None:
+    stmt = _INDEX_TYPE_RE.sub("<TYP> ", stmt)
 
   return stmt
 
 
+def _PreprocessLine(line: str) -> str:
+  """Apply preprocess() to a single line, returning an empty string if the line
+  is removed."""
+  if not keep(line):
+    return ""
+  line = RemoveTrailingCommentsAndMetadataFromLine(line.strip())
+  if _STRUCTURE_DEFINITION_RE.match(line):
+    return ""
+  return line
+
+
+# The maximum number of statements to memoize normalized texts for.
+NORMALIZE_STATEMENT_CACHE_SIZE = 1 << 18
+
+
+@functools.lru_cache(maxsize=NORMALIZE_STATEMENT_CACHE_SIZE)
+def NormalizeStatement(stmt: str) -> str:
+  """Normalize the text of a single LLVM statement.
+
+  This is equivalent to pre-processing the statement as a single-line file
+  using preprocess(), followed by PreprocessStatement(). Results are memoized
+  on the raw statement text, since statements repeat heavily across a corpus.
+
+  Args:
+    stmt: The text of a statement.
+
+  Returns:
+    The normalized statement, or an empty string if the statement is removed
+    by pre-processing.
+  """
+  return PreprocessStatement(_PreprocessLine(stmt))
+
+
+def NormalizeStatements(stmts: typing.Iterable[str]) -> typing.List[str]:
+  """Normalize the texts of many LLVM statements, e.g. all of the statements
+  of a graph.
+
+  Args:
+    stmts: The texts of the statements.
+
+  Returns:
+    A list of normalized statements, as returned by NormalizeStatement().
+  """
+  # Statements are looked up in a per-batch dictionary before the shared
+  # memo cache, since statements also repeat heavily within a graph.
+  normalized = {}
+  results = []
+  for stmt in stmts:
+    text = normalized.get(stmt)
+    if text is None:
+      text = normalized[stmt] = NormalizeStatement(stmt)
+    results.append(text)
+  return results
+
+
 ########################################################################################################################
 # Dual-XFG-building
 ########################################################################################################################
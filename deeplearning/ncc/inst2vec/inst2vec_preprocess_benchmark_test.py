@@ -0,0 +1,152 @@
+"""Benchmarks for //deeplearning/ncc/inst2vec:inst2vec_preprocess.
+
+The benchmarks normalize the statements of the ml4pl bytecode regression
+tests, comparing the memoized statement normalizer against the original
+multi-pass preprocess() and PreprocessStatement() implementation.
+"""
+import copy
+import re
+from typing import List
+
+from deeplearning.ncc import rgx_utils as rgx
+from deeplearning.ncc.inst2vec import inst2vec_preprocess
+from labm8.py import bazelutil
+from labm8.py import fs
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+MODULE_UNDER_TEST = None
+
+REGRESSION_TESTS = bazelutil.DataPath(
+  "phd/deeplearning/ml4pl/testing/data/bytecode_regression_tests"
+)
+
+
+def PreprocessStatementReference(stmt: str) -> str:
+  """The original uncompiled implementation of PreprocessStatement(), used as
+  a baseline for comparison.
+  """
+  # Remove local identifiers
+  stmt = re.sub(rgx.local_id, "<%ID>", stmt)
+  # Global identifiers
+  stmt = re.sub(rgx.global_id, "<@ID>", stmt)
+  # Remove labels
+  if re.match(r"; <label>:\d+:?(\s+; preds = )?", stmt):
+    stmt = re.sub(r":\d+", ":<LABEL>", stmt)
+    stmt = re.sub("<%ID>", "<LABEL>", stmt)
+  elif re.match(rgx.local_id_no_perc + r":(\s+; preds = )?", stmt):
+    stmt = re.sub(rgx.local_id_no_perc + ":", "<LABEL>:", stmt)
+    stmt = re.sub("<%ID>", "<LABEL>", stmt)
+  if "; preds = " in stmt:
+    s = stmt.split("  ")
+    if s[-1][0] == " ":
+      stmt = s[0] + s[-1]
+    else:
+      stmt = s[0] + " " + s[-1]
+
+  # Remove floating point values
+  stmt = re.sub(rgx.immediate_value_float_hexa, "<FLOAT>", stmt)
+  stmt = re.sub(rgx.immediate_value_float_sci, "<FLOAT>", stmt)
+
+  # Remove integer values
+  if (
+    re.match("<%ID> = extractelement", stmt) is None
+    and re.match("<%ID> = extractvalue", stmt) is None
+    and re.match("<%ID> = insertelement", stmt) is None
+    and re.match("<%ID> = insertvalue", stmt) is None
+  ):
+    stmt = re.sub(
+      r"(?<!align)(?<!\[) " + rgx.immediate_value_int, " <INT>", stmt
+    )
+
+  # Remove string values
+  stmt = re.sub(rgx.immediate_value_string, " <STRING>", stmt)
+
+  # Remove index types
+  if (
+    re.match("<%ID> = extractelement", stmt) is not None
+    or re.match("<%ID> = insertelement", stmt) is not None
+  ):
+    stmt = re.sub(r"i\d+ ", "<TYP> ", stmt)
+
+  return stmt
+
+
+def NormalizeStatementsReference(stmts: List[str]) -> List[str]:
+  """The original per-graph statement normalization, as performed by the
+  ml4pl node encoder, used as a baseline for comparison.
+  """
+  data = [[stmt] for stmt in stmts]
+  inst2vec_preprocess.get_functions_declared_in_files(data)
+  data = inst2vec_preprocess.remove_non_representative_code(data)
+  data = inst2vec_preprocess.remove_leading_spaces(data)
+  data = inst2vec_preprocess.remove_trailing_comments_and_metadata(data)
+  data = inst2vec_preprocess.collapse_stmt_units_to_a_line(data)
+  data = copy.deepcopy(data)
+  data = inst2vec_preprocess.remove_structure_definitions(data)
+  return [PreprocessStatementReference(x[0] if len(x) else "") for x in data]
+
+
+@test.Fixture(scope="session")
+def statements() -> List[str]:
+  """Test fixture which returns the lines of the bytecode regression tests.
+
+  As well as instructions, these include labels, '; preds' comments, global
+  definitions, function declarations and definitions, and type definitions.
+  """
+  statements = []
+  for path in sorted(REGRESSION_TESTS.iterdir()):
+    if path.suffix == ".ll":
+      statements += [line for line in fs.Read(path).split("\n") if line]
+  assert statements
+  return statements
+
+
+def test_NormalizeStatements_equals_reference(statements: List[str]):
+  """Check that normalized statements match the original implementation, both
+  when computed and when memoized."""
+  reference = NormalizeStatementsReference(statements)
+  inst2vec_preprocess.NormalizeStatement.cache_clear()
+  assert inst2vec_preprocess.NormalizeStatements(statements) == reference
+  assert inst2vec_preprocess.NormalizeStatements(statements) == reference
+  assert inst2vec_preprocess.NormalizeStatement.cache_info().hits
+
+
+def test_PreprocessStatement_equals_reference(statements: List[str]):
+  """Check that PreprocessStatement() matches the original implementation."""
+  for stmt in statements:
+    assert inst2vec_preprocess.PreprocessStatement(
+      stmt
+    ) == PreprocessStatementReference(stmt)
+
+
+def test_benchmark_NormalizeStatements_cold_cache(
+  benchmark, statements: List[str]
+):
+  """Benchmark statement normalization with an empty memo cache."""
+  benchmark.pedantic(
+    inst2vec_preprocess.NormalizeStatements,
+    args=(statements,),
+    setup=inst2vec_preprocess.NormalizeStatement.cache_clear,
+    rounds=5,
+  )
+
+
+def test_benchmark_NormalizeStatements_warm_cache(
+  benchmark, statements: List[str]
+):
+  """Benchmark statement normalization with a populated memo cache."""
+  inst2vec_preprocess.NormalizeStatements(statements)
+  benchmark(inst2vec_preprocess.NormalizeStatements, statements)
+
+
+def test_benchmark_NormalizeStatementsReference(
+  benchmark, statements: List[str]
+):
+  """Benchmark the original statement normalization."""
+  benchmark.pedantic(NormalizeStatementsReference, args=(statements,), rounds=5)
+
+
+if __name__ == "__main__":
+  test.Main()
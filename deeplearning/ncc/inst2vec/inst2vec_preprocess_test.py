@@ -105,5 +105,102 @@ def test_CreateContextualFlowGraphsFromBytecodes_files(data_folder: str):
   assert (d / "BLAS-3.8.0/blas_preprocessed/xfg_dual/fast_dcabs1.p").is_file()
 
 
+# Statements and their expected normalized texts.
+NORMALIZED_STATEMENTS = [
+  ("  %3 = alloca i32, align 4", "<%ID> = alloca i32, align 4"),
+  (
+    "  store i32 0, i32* %3, align 4, !tbaa !13",
+    "store i32 <INT>, i32* <%ID>, align 4",
+  ),
+  (
+    "  %10 = tail call double @llvm.pow.f64(double %9, double 2.500000e+00)",
+    "<%ID> = tail call double <@ID>(double <%ID>, double <FLOAT>)",
+  ),
+  (
+    "  %3 = extractelement <2 x double> %2, i32 0, !dbg !11",
+    "<%ID> = extractelement <2 x double> <%ID>, <TYP> 0",
+  ),
+  (
+    "  %7 = insertvalue { i32, i32 } %6, i32 1, 1",
+    "<%ID> = insertvalue { i32, i32 } <%ID>, i32 1, 1",
+  ),
+  (
+    "  store double 0x7FF0000000000000, double* %a, align 8",
+    "store double <FLOAT>, double* <%ID>, align 8",
+  ),
+  (
+    "  %call = call i32 (i8*, ...) @printf(i8* getelementptr inbounds "
+    "([18 x i8], [18 x i8]* @.str, i64 0, i64 0), i32 %argc)",
+    "<%ID> = call i32 (i8*, ...) <@ID>(i8* getelementptr inbounds "
+    "([18 x i8], [18 x i8]* <@ID>, i64 <INT>, i64 <INT>), i32 <%ID>)",
+  ),
+  ("  br i1 %6, label %7, label %8", "br i1 <%ID>, label <%ID>, label <%ID>"),
+  (
+    "; <label>:12:                                      ; preds = %7, %5",
+    "; <label>:<LABEL>: ; preds = <LABEL>, <LABEL>",
+  ),
+  (
+    "for.body:                                         ; preds = %for.inc, %entry",
+    "<LABEL>: ; preds = <LABEL>, <LABEL>",
+  ),
+  ("  call void @foo() #3", "call void <@ID>()"),
+  ("entry:", "<LABEL>:"),
+  (
+    "define i32 @main(i32 %argc, i8** %argv) #0 {",
+    "define i32 <@ID>(i32 <%ID>, i8** <%ID>)",
+  ),
+  ("@x = global i32 5, align 4", "<@ID> = global i32 <INT>, align 4"),
+  (
+    "@y = common global double 0.000000e+00, align 8",
+    "<@ID> = common global double <FLOAT>, align 8",
+  ),
+  (
+    '@.str = private unnamed_addr constant [4 x i8] c"%d\\0A\\00", align 1',
+    "<@ID> = private unnamed_addr constant [4 x i8]  <STRING>, align 1",
+  ),
+  # Statements which are removed by pre-processing.
+  ("declare double @llvm.pow.f64(double, double) #1", ""),
+  ("%struct.foo = type { i32, i8* }", ""),
+  ("; ModuleID = '-'", ""),
+  ("}", ""),
+  ("", ""),
+]
+
+
+@test.Parametrize("stmt,normalized", NORMALIZED_STATEMENTS)
+def test_NormalizeStatement_golden(stmt: str, normalized: str):
+  """Test the normalized text of statements."""
+  assert inst2vec_preprocess.NormalizeStatement(stmt) == normalized
+
+
+@test.Parametrize("stmt,normalized", NORMALIZED_STATEMENTS)
+def test_NormalizeStatement_equals_preprocess(stmt: str, normalized: str):
+  """Test that normalizing a statement is equivalent to preprocess() and
+  PreprocessStatement()."""
+  preprocessed_lines, _ = inst2vec_preprocess.preprocess([[stmt]])
+  preprocessed_line = preprocessed_lines[0][0] if preprocessed_lines[0] else ""
+  assert (
+    inst2vec_preprocess.PreprocessStatement(preprocessed_line) == normalized
+  )
+
+
+def test_NormalizeStatement_cached():
+  """Test that memoized statements normalize to the same texts."""
+  inst2vec_preprocess.NormalizeStatement.cache_clear()
+  stmts = [stmt for stmt, _ in NORMALIZED_STATEMENTS]
+  cold = [inst2vec_preprocess.NormalizeStatement(stmt) for stmt in stmts]
+  warm = [inst2vec_preprocess.NormalizeStatement(stmt) for stmt in stmts]
+  assert inst2vec_preprocess.NormalizeStatement.cache_info().hits == len(stmts)
+  assert cold == warm == [normalized for _, normalized in NORMALIZED_STATEMENTS]
+
+
+def test_NormalizeStatements():
+  """Test normalizing a batch of statements with duplicates."""
+  stmts = [stmt for stmt, _ in NORMALIZED_STATEMENTS]
+  assert inst2vec_preprocess.NormalizeStatements(stmts + stmts) == [
+    normalized for _, normalized in NORMALIZED_STATEMENTS
+  ] * 2
+
+
 if __name__ == "__main__":
   test.Main()
@@ -23,15 +23,14 @@
 """Construct vocabulary from XFGs and indexify the data set"""
 import collections
 import csv
-import math
+import multiprocessing
 import os
 import pickle
-import random
 import re
-import struct
 import sys
 
 import networkx as nx
+import numpy as np
 from scipy import sparse
 
 from deeplearning.ncc import rgx_utils as rgx
@@ -40,6 +39,9 @@ from labm8.py import app
 
 FLAGS = app.FLAGS
 
+# The suffix which distinguishes the nodes of repeated statements in dual graphs
+_NODE_SUFFIX_RE = re.compile(r"§\d+$")
+
 
 ########################################################################################################################
 # Counting and statistics
@@ -404,90 +406,105 @@ def build_H_dictionary(
 
   # if context_width = 1, then A_context is simply A1
 
-  A_num_rows = A_context.shape[0]
-  A_indices = A_context.indices
-  A_row_starts = A_context.indptr
-  H_dic = dict()
-
-  # Loop over rows
-  for i in range(A_num_rows):
-
-    if graph_is_big and i % 5e3 == 0:
-      print("Adjmat rows:", i, "/", A_num_rows)
-
-    col_indices = A_indices[A_row_starts[i] : A_row_starts[i + 1]]
-    for j in col_indices:
-
-      if i != j:
-
-        # Add nodes
-        target = re.sub("§\d+$", "", nodelist[i])
-        context = re.sub("§\d+$", "", nodelist[j])
-
-        if target != context:
-
-          # cut off?
-          if target in stmts_cut_off:
-            target = rgx.unknown_token
-            if context in stmts_cut_off:
-              break  # we don't want a pair (UNK, UNK)
-          if context in stmts_cut_off:
-            context = rgx.unknown_token
-
-          # target-context index pair
-          if (
-            target not in dictionary.keys() or context not in dictionary.keys()
-          ):
-            if target not in dictionary.keys():
-              print("WARNING, not in dictionary:", target)
-            if context not in dictionary.keys():
-              print("WARNING, not in dictionary:", context)
-          else:
-            t = dictionary[target]
-            c = dictionary[context]
-            if (t, c) in H_dic:
-              H_dic[(t, c)] += 1
-            else:
-              H_dic[(t, c)] = 1
+  # Map the nodes to vocabulary indices once, rather than for each pair
+  label_ids, indices, is_cut_off = get_node_vocabulary_indices(
+    nodelist, dictionary, stmts_cut_off
+  )
+
+  # Get the (row, column) coordinates of the non-zero entries of the context adjacency matrix
+  A_context = sparse.csr_matrix(A_context)
+  rows = np.repeat(
+    np.arange(A_context.shape[0], dtype=np.int64), np.diff(A_context.indptr)
+  )
+  cols = A_context.indices
+
+  # Keep the pairs of distinct statements which are in the dictionary, dropping pairs (UNK, UNK)
+  keep = (
+    (label_ids[rows] != label_ids[cols])
+    & ~(is_cut_off[rows] & is_cut_off[cols])
+    & (indices[rows] >= 0)
+    & (indices[cols] >= 0)
+  )
+  targets = indices[rows[keep]]
+  contexts = indices[cols[keep]]
+  del rows, cols, keep
+
+  # Count the occurrences of each target-context index pair
+  H = sparse.coo_matrix(
+    (np.ones(len(targets), dtype=np.int64), (targets, contexts)),
+    shape=(len(dictionary), len(dictionary)),
+  )
+  H.sum_duplicates()
+  H_dic = dict(zip(zip(H.row.tolist(), H.col.tolist()), H.data.tolist()))
 
   return H_dic
 
 
-def generate_data_pairs_from_H_dictionary(H_dic, t):
+def get_node_vocabulary_indices(nodelist, dictionary, stmts_cut_off):
+  """
+  Map the nodes of a dual graph to their statements' vocabulary indices
+  :param nodelist: list of node names, which are statements with an optional "§<n>" suffix
+  :param dictionary: [keys=statements, values=index]
+  :param stmts_cut_off: collection of statements cut off in the pruning step
+  :return: label_ids: array of statement identifiers, equal for nodes of the same statement
+           indices: array of vocabulary indices, -1 for nodes whose statement is not in the dictionary
+           is_cut_off: boolean array, true for nodes whose statement was cut off
+  """
+  stmts_cut_off = set(stmts_cut_off)
+  unknown_index = dictionary.get(rgx.unknown_token, -1)
+
+  # [keys=statements, values=(statement identifier, vocabulary index, is cut off)]
+  stmts = dict()
+  label_ids = np.empty(len(nodelist), dtype=np.int64)
+  indices = np.empty(len(nodelist), dtype=np.int64)
+  is_cut_off = np.empty(len(nodelist), dtype=np.bool_)
+  for i, node in enumerate(nodelist):
+    stmt = _NODE_SUFFIX_RE.sub("", node)
+    if stmt not in stmts:
+      if stmt in stmts_cut_off:
+        stmts[stmt] = (len(stmts), unknown_index, True)
+        if unknown_index < 0:
+          print("WARNING, not in dictionary:", rgx.unknown_token)
+      else:
+        stmts[stmt] = (len(stmts), dictionary.get(stmt, -1), False)
+        if stmt not in dictionary:
+          print("WARNING, not in dictionary:", stmt)
+    label_ids[i], indices[i], is_cut_off[i] = stmts[stmt]
+
+  return label_ids, indices, is_cut_off
+
+
+def generate_data_pairs_from_H_dictionary(H_dic, t, rng=None):
   """
   Generate data pairs from H-dictionary by reading them from a file and applying subsampling
   :param H_dic: [keys=(index of target statement, index of context-statement), values=number of occurences in files]
   :param t: subsampling threshold
-  :return: data_pairs: subsampled data pairs in a list
+  :param rng: numpy random number generator used for subsampling. If None, a freshly seeded generator is used
+  :return: data_pairs: subsampled data pairs, an array of shape (number of pairs, 2)
   """
-  data_pairs = list()
-  file = 0
+  if rng is None:
+    rng = np.random.default_rng()
 
   # Loop over the "in-context" graphs
   print("Generating data pairs from dic dump with subsampling threshold", t)
 
-  n_possible_pairs = sum(list(H_dic.values()))
-  var = t * n_possible_pairs
-
-  for ct, rep in H_dic.items():
+  pairs = np.array(list(H_dic.keys()), dtype=np.uint32).reshape(-1, 2)
+  reps = np.fromiter(H_dic.values(), dtype=np.int64, count=len(H_dic))
 
-    # Construct counter and discard probability
-    if t > 0:
-      p_discard = max(1.0 - math.sqrt(var / rep), 0)
-    else:
-      p_discard = 0
-
-    c = ct[0]
-    t = ct[1]
-    for i in range(rep):
-      # Add this edge's nodes to the list as a data pair if it is not discarded by susampling
-      if random.random() > p_discard:
-        data_pairs.append([c, t])
-      if random.random() > p_discard:
-        data_pairs.append([t, c])
+  # Construct discard probability
+  if t > 0:
+    var = t * reps.sum()
+    p_discard = np.maximum(1.0 - np.sqrt(var / reps), 0)
+  else:
+    p_discard = np.zeros(len(reps))
 
-  # Increment counter
-  file += 1
+  # Each occurrence of a pair [c, t] produces the data pairs [c, t] and [t, c], which are discarded independently by
+  # subsampling
+  pairs = np.repeat(pairs, reps, axis=0)
+  p_discard = np.repeat(p_discard, reps)
+  data_pairs = np.stack([pairs, pairs[:, ::-1]], axis=1)
+  keep = rng.random((len(pairs), 2)) > p_discard[:, np.newaxis]
+  data_pairs = data_pairs[keep]
 
   # Return
   print(
@@ -687,13 +704,13 @@ def construct_vocabulary(data_folder, folders):
     "\n--- Generating data pair dictionary from dual graphs and dump to files"
   )
 
+  jobs = list()
   for folder in folders:
 
     folder_preprocessed = folder + "_preprocessed"
     folder_Dfiles = os.path.join(folder_preprocessed, "xfg_dual")
     D_files_ = os.listdir(folder_Dfiles + "/")
     D_files = [Df for Df in D_files_ if Df[-2:] == ".p"]
-    num_D_files = len(D_files)
     folder_H = folder + "_datasetprep_cw_" + str(context_width)
     folder_mat = folder + "_datasetprep_adjmat"
     if not os.path.exists(folder_H):
@@ -701,7 +718,7 @@ def construct_vocabulary(data_folder, folders):
     if not os.path.exists(folder_mat):
       os.makedirs(folder_mat)
 
-    for i, D_file in enumerate(D_files):
+    for D_file in D_files:
 
       # "In-context" dictionary
       base_filename = D_file[:-2]
@@ -710,29 +727,23 @@ def construct_vocabulary(data_folder, folders):
         folder_H, base_filename + "_H_dic_cw_" + str(context_width) + ".p"
       )
       if not os.path.exists(to_dump):
-
-        # Load dual graph
-        print("Build H_dic from:", D_file_open, "(", i, "/", num_D_files, ")")
-        with open(D_file_open, "rb") as f:
-          D = pickle.load(f)
-
-        # Build H-dictionary
-        H_dic = build_H_dictionary(
-          D, context_width, folder_mat, base_filename, dictionary, stmts_cut_off
+        jobs.append(
+          (D_file_open, to_dump, context_width, folder_mat, base_filename)
         )
-        print("Print to", to_dump)
-        i2v_utils.safe_pickle(H_dic, to_dump)
-
       else:
-        print(
-          "Found context-dictionary dump:",
-          to_dump,
-          "(",
-          i,
-          "/",
-          num_D_files,
-          ")",
-        )
+        print("Found context-dictionary dump:", to_dump)
+
+  # Build the H-dictionaries of all folders in parallel. The dictionary and cut off statements are sent to each worker
+  # process once, rather than with every job
+  with multiprocessing.Pool(
+    processes=FLAGS.vocabulary_nproc,
+    initializer=_init_build_H_dictionary_worker,
+    initargs=(dictionary, stmts_cut_off),
+  ) as pool:
+    for i, to_dump in enumerate(
+      pool.imap_unordered(_build_and_dump_H_dictionary, jobs)
+    ):
+      print("Printed to", to_dump, "(", i + 1, "/", len(jobs), ")")
 
   ####################################################################################################################
   # Generate data_pairs.rec from data pair dictionary dumps
@@ -740,82 +751,125 @@ def construct_vocabulary(data_folder, folders):
   # Generate
   print("\n--- Writing .rec files")
 
-  for folder in folders:
+  # Each folder is subsampled with its own random number generator. Worker processes inherit the same global random
+  # state, so drawing from it would discard the same pairs in every folder
+  seeds = np.random.SeedSequence().spawn(len(folders))
+  with multiprocessing.Pool(processes=FLAGS.vocabulary_nproc) as pool:
+    for folder, data_pairs_in_folder in pool.imap_unordered(
+      _write_data_pairs_record,
+      [
+        (folder, context_width, subsample_threshold, seed)
+        for folder, seed in zip(folders, seeds)
+      ],
+    ):
+      print("Pairs in folder", folder, ":", data_pairs_in_folder)
 
-    # H dic dump files
-    folder_H = folder + "_datasetprep_cw_" + str(context_width)
-    H_files_ = os.listdir(folder_H + "/")
-    H_files = [
-      Hf
-      for Hf in H_files_
-      if "_H_dic_cw_" + str(context_width) in Hf and Hf[-2:] == ".p"
-    ]
-    num_H_files = len(H_files)
-
-    # Record files
-    folder_REC = folder + "_dataset_cw_" + str(context_width)
-    file_rec = os.path.join(
-      folder_REC, "data_pairs_cw_" + str(context_width) + ".rec"
-    )
-    if not os.path.exists(folder_REC):
-      os.makedirs(folder_REC)
 
-    if not os.path.exists(file_rec):
+# The dictionary and cut off statements of H-dictionary worker processes
+_worker_dictionary = None
+_worker_stmts_cut_off = None
 
-      # Clear contents
-      f = open(file_rec, "wb")
-      f.close()
 
-      data_pairs_in_folder = 0
-      for i, H_file in enumerate(H_files):
+def _init_build_H_dictionary_worker(dictionary, stmts_cut_off):
+  """Initialize an H-dictionary worker process"""
+  global _worker_dictionary
+  global _worker_stmts_cut_off
+  _worker_dictionary = dictionary
+  _worker_stmts_cut_off = stmts_cut_off
 
-        dic_dump = os.path.join(folder_H, H_file)
 
-        print(
-          "Building data pairs from file",
-          dic_dump,
-          "(",
-          i,
-          "/",
-          num_H_files,
-          ")",
-        )
-        with open(dic_dump, "rb") as f:
-          H_dic = pickle.load(f)
+def _build_and_dump_H_dictionary(job):
+  """
+  Build the H-dictionary of a dual graph file and write it to a file
+  :param job: tuple (dual graph file, file to dump to, context width, adjacency-matrix folder, base filename)
+  :return: the file that the H-dictionary was written to
+  """
+  D_file_open, to_dump, context_width, folder_mat, base_filename = job
+
+  # Load dual graph
+  print("Build H_dic from:", D_file_open)
+  with open(D_file_open, "rb") as f:
+    D = pickle.load(f)
+
+  # Build H-dictionary
+  H_dic = build_H_dictionary(
+    D,
+    context_width,
+    folder_mat,
+    base_filename,
+    _worker_dictionary,
+    _worker_stmts_cut_off,
+  )
+  i2v_utils.safe_pickle(H_dic, to_dump)
+  return to_dump
 
-        # Get pairs [target, context] from graph and write them to file
-        data_pairs = generate_data_pairs_from_H_dictionary(
-          H_dic, subsample_threshold
-        )
-        data_pairs_in_folder += len(data_pairs)
 
-        print("writing to fixed-length file: ", file_rec)
+def _write_data_pairs_record(job):
+  """
+  Write the data pairs record of a folder in a worker process
+  :param job: tuple (data folder, context width, subsampling threshold, seed)
+  :return: tuple (folder, number of data pairs in the record file)
+  """
+  return write_data_pairs_record(*job)
 
-        # Start read and write
-        counter = 0
-        with open(file_rec, "ab") as rec:
 
-          # Loop over pairs
-          num_pairs = len(data_pairs)
-          for p in data_pairs:
+def write_data_pairs_record(
+  folder, context_width, subsample_threshold, seed=None
+):
+  """
+  Generate the data pairs of a folder from its H-dictionary dumps and write them to a fixed-length record file
+  :param folder: data folder
+  :param context_width: width of skip-gram context
+  :param subsample_threshold: subsampling threshold
+  :param seed: seed of the random number generator used for subsampling. If None, a fresh seed is used
+  :return: tuple (folder, number of data pairs in the record file)
+  """
+  rng = np.random.default_rng(seed)
+
+  # H dic dump files
+  folder_H = folder + "_datasetprep_cw_" + str(context_width)
+  H_files_ = os.listdir(folder_H + "/")
+  H_files = [
+    Hf
+    for Hf in H_files_
+    if "_H_dic_cw_" + str(context_width) in Hf and Hf[-2:] == ".p"
+  ]
+  num_H_files = len(H_files)
+
+  # Record files
+  folder_REC = folder + "_dataset_cw_" + str(context_width)
+  file_rec = os.path.join(
+    folder_REC, "data_pairs_cw_" + str(context_width) + ".rec"
+  )
+  if not os.path.exists(folder_REC):
+    os.makedirs(folder_REC)
 
-            # Print progress ever so often
-            if counter % 10e5 == 0 and counter != 0:
-              print(
-                "wrote pairs: {:>10,d} / {:>10,d} ...".format(
-                  counter, num_pairs
-                )
-              )
+  if os.path.exists(file_rec):
+    filesize_bytes = os.path.getsize(file_rec)
+    # Number of pairs is filesize_bytes / 2 (pairs) / 4 (32-bit integers)
+    file_pairs = int(filesize_bytes / 8)
+    print("Found", file_rec, "with #pairs:", file_pairs)
+    return folder, file_pairs
 
-            # Write and increment counter
-            rec.write(struct.pack("II", int(p[0]), int(p[1])))
-            counter += 1
+  data_pairs_in_folder = 0
+  with open(file_rec, "wb") as rec:
+    for i, H_file in enumerate(H_files):
 
-      print("Pairs in folder", folder, ":", data_pairs_in_folder)
+      dic_dump = os.path.join(folder_H, H_file)
 
-    else:
+      print(
+        "Building data pairs from file", dic_dump, "(", i, "/", num_H_files, ")"
+      )
+      with open(dic_dump, "rb") as f:
+        H_dic = pickle.load(f)
+
+      # Get pairs [target, context] from graph and write them to file as pairs of native-endian 32-bit unsigned integers
+      data_pairs = generate_data_pairs_from_H_dictionary(
+        H_dic, subsample_threshold, rng
+      )
+      data_pairs_in_folder += len(data_pairs)
+
+      print("writing to fixed-length file: ", file_rec)
+      data_pairs.astype(np.uint32).tofile(rec)
 
-      filesize_bytes = os.path.getsize(file_rec)
-      # Number of pairs is filesize_bytes / 2 (pairs) / 4 (32-bit integers)
-      file_pairs = int(filesize_bytes / 8)
-      print("Found", file_rec, "with #pairs:", file_pairs)
+  return folder, data_pairs_in_folder
@@ -0,0 +1,146 @@
+"""Unit tests for //deeplearning/ncc/inst2vec:inst2vec_vocabulary."""
+import multiprocessing
+import pathlib
+import pickle
+
+import networkx as nx
+import numpy as np
+
+from deeplearning.ncc import rgx_utils as rgx
+from deeplearning.ncc.inst2vec import inst2vec_vocabulary
+from labm8.py import app
+from labm8.py import test
+
+FLAGS = app.FLAGS
+
+
+@test.Fixture(scope="function")
+def dual_graph() -> nx.DiGraph:
+  """A small dual graph, with a repeated statement 'b' and a cut off statement
+  'c'.
+  """
+  g = nx.DiGraph()
+  g.add_edge("a", "b§1")
+  g.add_edge("b§1", "b§2")
+  g.add_edge("b§2", "c")
+  g.add_edge("c", "d§1")
+  g.add_edge("d§1", "d§2")
+  return g
+
+
+DICTIONARY = {"a": 0, "b": 1, rgx.unknown_token: 2}
+
+
+def test_build_H_dictionary_context_width_1(
+  dual_graph: nx.DiGraph, tempdir: pathlib.Path
+):
+  """Test that pairs of the same statement or not in the dictionary are
+  ignored."""
+  H_dic = inst2vec_vocabulary.build_H_dictionary(
+    dual_graph, 1, str(tempdir), "g", DICTIONARY, ["c", "d"]
+  )
+  assert H_dic == {(0, 1): 1, (1, 2): 1}
+
+
+def test_build_H_dictionary_context_width_2(
+  dual_graph: nx.DiGraph, tempdir: pathlib.Path
+):
+  """Test that pairs are counted over the context window."""
+  H_dic = inst2vec_vocabulary.build_H_dictionary(
+    dual_graph, 2, str(tempdir), "g", DICTIONARY, ["c", "d"]
+  )
+  assert H_dic == {(0, 1): 2, (1, 2): 3}
+
+
+def test_build_H_dictionary_unknown_pairs_are_dropped(tempdir: pathlib.Path):
+  """Test that a pair of cut off statements does not produce a pair (UNK, UNK)
+  or prevent the counting of other pairs."""
+  g = nx.DiGraph()
+  g.add_edge("c", "d")
+  g.add_edge("c", "a")
+  H_dic = inst2vec_vocabulary.build_H_dictionary(
+    g, 1, str(tempdir), "g", DICTIONARY, ["c", "d"]
+  )
+  assert H_dic == {(2, 0): 1}
+
+
+def test_generate_data_pairs_from_H_dictionary_without_subsampling():
+  data_pairs = inst2vec_vocabulary.generate_data_pairs_from_H_dictionary(
+    {(1, 2): 2, (3, 4): 1}, 0
+  )
+  assert data_pairs.tolist() == [[1, 2], [2, 1], [1, 2], [2, 1], [3, 4], [4, 3]]
+
+
+def test_generate_data_pairs_from_H_dictionary_subsampling():
+  """Test that frequent pairs are subsampled."""
+  data_pairs = inst2vec_vocabulary.generate_data_pairs_from_H_dictionary(
+    {(1, 2): 10000, (3, 4): 1}, 1e-2
+  )
+  assert 0 < len(data_pairs) < 10000
+  assert [3, 4] in data_pairs.tolist()
+
+
+def test_generate_data_pairs_from_H_dictionary_rng():
+  """Test that subsampling is determined by the random number generator."""
+  H_dic = {(1, 2): 10000, (3, 4): 1}
+  a = inst2vec_vocabulary.generate_data_pairs_from_H_dictionary(
+    H_dic, 1e-2, np.random.default_rng(0)
+  )
+  b = inst2vec_vocabulary.generate_data_pairs_from_H_dictionary(
+    H_dic, 1e-2, np.random.default_rng(0)
+  )
+  c = inst2vec_vocabulary.generate_data_pairs_from_H_dictionary(
+    H_dic, 1e-2, np.random.default_rng(1)
+  )
+  assert a.tolist() == b.tolist()
+  assert a.tolist() != c.tolist()
+
+
+def test_write_data_pairs_record(tempdir: pathlib.Path):
+  """Test that data pairs are written as pairs of 32-bit integers."""
+  folder_H = tempdir / "foo_datasetprep_cw_1"
+  folder_H.mkdir()
+  with open(folder_H / "a_H_dic_cw_1.p", "wb") as f:
+    pickle.dump({(1, 2): 1}, f)
+
+  folder, num_pairs = inst2vec_vocabulary.write_data_pairs_record(
+    str(tempdir / "foo"), 1, 0
+  )
+  assert folder == str(tempdir / "foo")
+  assert num_pairs == 2
+  data_pairs = np.fromfile(
+    tempdir / "foo_dataset_cw_1" / "data_pairs_cw_1.rec", dtype=np.uint32
+  )
+  assert data_pairs.tolist() == [1, 2, 2, 1]
+
+
+def test_write_data_pairs_record_worker_processes_are_independent(
+  tempdir: pathlib.Path,
+):
+  """Test that forked worker processes do not subsample identically."""
+  folders = []
+  for name in ["foo", "bar"]:
+    folder_H = tempdir / f"{name}_datasetprep_cw_1"
+    folder_H.mkdir()
+    with open(folder_H / "a_H_dic_cw_1.p", "wb") as f:
+      pickle.dump({(1, 2): 10000, (3, 4): 10000}, f)
+    folders.append(str(tempdir / name))
+
+  seeds = np.random.SeedSequence().spawn(len(folders))
+  with multiprocessing.Pool(processes=2) as pool:
+    pool.map(
+      inst2vec_vocabulary._write_data_pairs_record,
+      [(folder, 1, 1e-2, seed) for folder, seed in zip(folders, seeds)],
+    )
+
+  foo, bar = [
+    np.fromfile(
+      f"{folder}_dataset_cw_1/data_pairs_cw_1.rec", dtype=np.uint32
+    ).tolist()
+    for folder in folders
+  ]
+  assert foo != bar
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -3,8 +3,10 @@
 
 #include "labm8/cpp/logging.h"
 
+#include <cstdint>
 #include <functional>
 #include <iostream>
+#include <string>
 
 namespace pbutil {
 
@@ -50,6 +52,63 @@ void ProcessMessage(
   CHECK(output_message.SerializeToOstream(ostream));
 }
 
+// Read a length-prefixed message from the istream, where the length is an
+// 8 byte little-endian unsigned integer. Returns false if the istream reached
+// EOF before the start of the message.
+template <typename Message>
+bool ReadLengthPrefixedMessage(Message *message, std::istream *istream) {
+  unsigned char header[8];
+  if (!istream->read(reinterpret_cast<char *>(header), sizeof(header))) {
+    CHECK(!istream->gcount()) << "Truncated message header";
+    return false;
+  }
+  uint64_t size = 0;
+  for (int i = sizeof(header) - 1; i >= 0; --i) {
+    size = (size << 8) | header[i];
+  }
+
+  std::string serialized(size, '\0');
+  CHECK(istream->read(&serialized[0], size)) << "Truncated message";
+  CHECK(message->ParseFromString(serialized));
+  return true;
+}
+
+// Write a length-prefixed message to the ostream. See
+// ReadLengthPrefixedMessage().
+template <typename Message>
+void WriteLengthPrefixedMessage(const Message &message,
+                                std::ostream *ostream) {
+  std::string serialized;
+  CHECK(message.SerializeToString(&serialized));
+
+  unsigned char header[8];
+  uint64_t size = serialized.size();
+  for (int i = 0; i < sizeof(header); ++i) {
+    header[i] = static_cast<unsigned char>(size >> (8 * i));
+  }
+  ostream->write(reinterpret_cast<char *>(header), sizeof(header));
+  ostream->write(serialized.data(), serialized.size());
+  ostream->flush();
+  CHECK(ostream->good());
+}
+
+// Run a process_function callback on a stream of proto messages, mutating each
+// of them in place. Each message is decoded from the istream and serialized to
+// the ostream in the length-prefixed format of ReadLengthPrefixedMessage(),
+// until the istream reaches EOF. This enables a long-running worker process to
+// amortize its startup cost over many messages.
+template <typename Message>
+void ProcessMessageStreamInPlace(
+    std::function<void(Message *)> process_function,
+    std::istream *istream = &std::cin, std::ostream *ostream = &std::cout) {
+  Message message;
+  while (ReadLengthPrefixedMessage(&message, istream)) {
+    process_function(&message);
+    WriteLengthPrefixedMessage(message, ostream);
+    message.Clear();
+  }
+}
+
 }  // namespace pbutil
 
 // A convenience macro to run an in-place process_function as the main()
@@ -60,6 +119,19 @@ void ProcessMessage(
     return 0;                                                       \
   }
 
+// A convenience macro to run an in-place process_function as the main()
+// function of a program. If the program is run with a --stream argument, it
+// processes a stream of messages until stdin is closed, else a single message.
+#define PBUTIL_INPLACE_PROCESS_STREAM_MAIN(process_function, message_type)   \
+  int main(int argc, char **argv) {                                         \
+    if (argc == 2 && std::string(argv[1]) == "--stream") {                  \
+      pbutil::ProcessMessageStreamInPlace<message_type>(process_function);  \
+    } else {                                                                \
+      pbutil::ProcessMessageInPlace<message_type>(process_function);        \
+    }                                                                       \
+    return 0;                                                               \
+  }
+
 // A convenience macro to run an process_function as the main() function of a
 // program.
 #define PBUTIL_PROCESS_MAIN(process_function, input_message_type,    \
@@ -15,8 +15,13 @@
 import collections
 import gzip
 import json
+import os
 import pathlib
+import select
+import struct
 import subprocess
+import threading
+import time
 import typing
 
 import google.protobuf.json_format
@@ -550,6 +555,202 @@ def RunProcessMessageInPlace(
   return input_proto
 
 
+# The header of length-prefixed messages: an 8 byte little-endian unsigned
+# integer. See //labm8/cpp:pbutil ReadLengthPrefixedMessage().
+_LENGTH_PREFIX = struct.Struct("<Q")
+
+
+class ProtoWorkerProcess(object):
+  """A long-running command which modifies a stream of protocol buffers inplace.
+
+  This amortizes the cost of starting a worker process over many messages,
+  compared to RunProcessMessageInPlace(). The command must read a stream of
+  length-prefixed messages from stdin and write each result to stdout, where
+  each serialized message is preceded by its size as an 8 byte little-endian
+  unsigned integer. C++ workers can do this using the
+  PBUTIL_INPLACE_PROCESS_STREAM_MAIN macro and a --stream argument.
+
+  The process is started lazily, and restarted on the next call after it
+  crashes or times out. An optional init_message is sent to every new process
+  before any other messages, so that state which is constant across messages
+  is only sent once.
+
+  Instances are thread safe.
+  """
+
+  def __init__(
+    self,
+    cmd: typing.List[str],
+    init_message: typing.Optional[ProtocolBuffer] = None,
+    env: typing.Dict[str, str] = None,
+  ):
+    """Constructor.
+
+    Args:
+      cmd: The command to execute.
+      init_message: An optional message to process when a new process is
+        started.
+      env: A map of environment variables to set, overriding the default
+        environment.
+    """
+    self.cmd = cmd
+    self.init_message = init_message
+    self.env = env
+    self.process: typing.Optional[subprocess.Popen] = None
+    self.lock = threading.Lock()
+
+  def RunMessageInPlace(
+    self, message: ProtocolBuffer, timeout_seconds: int = 360
+  ) -> ProtocolBuffer:
+    """Process a message inplace.
+
+    Args:
+      message: The message to process.
+      timeout_seconds: The maximum number of seconds to wait for the result.
+
+    Returns:
+      The same protocol buffer as message, with the values produced by the
+      command.
+
+    Raises:
+      ProtoWorkerTimeoutError: If timeout_seconds elapses without a result.
+      CalledProcessError: If the command terminates.
+    """
+    return self.RunMessagesInPlace([message], timeout_seconds)[0]
+
+  def RunMessagesInPlace(
+    self, messages: typing.List[ProtocolBuffer], timeout_seconds: int = 360
+  ) -> typing.List[ProtocolBuffer]:
+    """Process a list of messages inplace.
+
+    The messages are pipelined: they are written to the process from a
+    background thread while the results are read, so that the command can
+    start on the next message while the previous result is being decoded.
+
+    Args:
+      messages: The messages to process.
+      timeout_seconds: The maximum number of seconds to wait for each result.
+
+    Returns:
+      The same list of protocol buffers, with the values produced by the
+      command.
+
+    Raises:
+      ProtoWorkerTimeoutError: If timeout_seconds elapses without a result.
+      CalledProcessError: If the command terminates.
+    """
+    with self.lock:
+      if self.process is None:
+        self._Start(timeout_seconds)
+      self._Communicate(messages, timeout_seconds)
+    return messages
+
+  def Close(self) -> None:
+    """Close the stdin of the process and wait for it to terminate."""
+    with self.lock:
+      if self.process is None:
+        return
+      try:
+        self.process.stdin.close()
+        self.process.wait(timeout=10)
+      except (OSError, subprocess.TimeoutExpired):
+        pass
+      self._Kill()
+
+  def __enter__(self) -> "ProtoWorkerProcess":
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.Close()
+
+  def __del__(self):
+    if self.process is not None:
+      self._Kill()
+
+  def _Start(self, timeout_seconds: int) -> None:
+    self.process = subprocess.Popen(
+      self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=self.env,
+    )
+    if self.init_message is not None:
+      init_message = type(self.init_message)()
+      init_message.CopyFrom(self.init_message)
+      self._Communicate([init_message], timeout_seconds)
+
+  def _Kill(self) -> None:
+    process, self.process = self.process, None
+    if process.poll() is None:
+      process.kill()
+    process.wait()
+    for pipe in (process.stdin, process.stdout):
+      try:
+        pipe.close()
+      except OSError:
+        pass
+
+  def _Communicate(
+    self, messages: typing.List[ProtocolBuffer], timeout_seconds: int
+  ) -> None:
+    """Write messages to the process and read the results into them."""
+    serialized = [message.SerializeToString() for message in messages]
+    if len(messages) == 1:
+      # The command reads the whole of a message before writing its result, so
+      # a single message can be written without risk of deadlock.
+      writer = None
+      self._WriteMessages(self.process.stdin, serialized)
+    else:
+      writer = threading.Thread(
+        target=self._WriteMessages,
+        args=(self.process.stdin, serialized),
+        daemon=True,
+      )
+      writer.start()
+
+    try:
+      for message in messages:
+        deadline = time.time() + timeout_seconds
+        (size,) = _LENGTH_PREFIX.unpack(
+          self._Read(_LENGTH_PREFIX.size, deadline, timeout_seconds)
+        )
+        message.ParseFromString(self._Read(size, deadline, timeout_seconds))
+    except:
+      # Kill the process so that it is restarted on the next call. This also
+      # unblocks the writer thread.
+      self._Kill()
+      raise
+    finally:
+      if writer:
+        writer.join()
+
+  def _Read(self, size: int, deadline: float, timeout_seconds: int) -> bytes:
+    """Read size bytes from the stdout of the process."""
+    fd = self.process.stdout.fileno()
+    chunks = []
+    while size:
+      remaining = deadline - time.time()
+      if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+        raise ProtoWorkerTimeoutError(
+          cmd=self.cmd, timeout_seconds=timeout_seconds, returncode=-9
+        )
+      chunk = os.read(fd, min(size, 1 << 20))
+      if not chunk:
+        raise subprocess.CalledProcessError(self.process.wait(), self.cmd)
+      chunks.append(chunk)
+      size -= len(chunk)
+    return b"".join(chunks)
+
+  @staticmethod
+  def _WriteMessages(stdin, serialized: typing.List[bytes]) -> None:
+    try:
+      for data in serialized:
+        stdin.write(_LENGTH_PREFIX.pack(len(data)))
+        stdin.write(data)
+      stdin.flush()
+    except (OSError, ValueError):
+      # The process terminated, or was killed and its stdin closed. The
+      # reader raises the error.
+      pass
+
+
 class ProtoBackedMixin(object):
   """A class backed by protocol buffers.
 
@@ -0,0 +1,225 @@
+# Copyright 2014-2019 Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //labm8/py:pbutil."""
+import os
+import pathlib
+import subprocess
+import sys
+import threading
+
+from google.protobuf import wrappers_pb2
+
+from labm8.py import pbutil
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+# A stream worker which processes length-prefixed StringValue messages inplace.
+# A message "init:<prefix>" sets a prefix for all subsequent results, "crash"
+# terminates the worker, and "sleep" never completes. Any other value is
+# replaced by "<prefix><value>:<n>", where <n> is the number of messages that
+# the process has handled.
+STREAM_WORKER = """
+import struct
+import sys
+import time
+
+from google.protobuf import wrappers_pb2
+
+header = struct.Struct("<Q")
+prefix = ""
+count = 0
+while True:
+  data = sys.stdin.buffer.read(header.size)
+  if not data:
+    break
+  (size,) = header.unpack(data)
+  message = wrappers_pb2.StringValue.FromString(sys.stdin.buffer.read(size))
+  count += 1
+  if message.value.startswith("init:"):
+    prefix = message.value[len("init:"):]
+  elif message.value == "crash":
+    sys.exit(1)
+  elif message.value == "sleep":
+    time.sleep(60)
+  else:
+    message.value = f"{prefix}{message.value}:{count}"
+  data = message.SerializeToString()
+  sys.stdout.buffer.write(header.pack(len(data)))
+  sys.stdout.buffer.write(data)
+  sys.stdout.buffer.flush()
+"""
+
+
+@test.Fixture(scope="function")
+def stream_worker_cmd(tempdir: pathlib.Path):
+  """A test fixture which returns the command to run a stream worker."""
+  path = tempdir / "stream_worker.py"
+  path.write_text(STREAM_WORKER)
+  return [sys.executable, str(path)]
+
+
+@test.Fixture(scope="function")
+def stream_worker_env():
+  """A test fixture which returns the environment for the stream worker, so
+  that it can import protobuf."""
+  return dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+
+def _Messages(*values):
+  return [wrappers_pb2.StringValue(value=value) for value in values]
+
+
+def test_ProtoWorkerProcess_RunMessageInPlace(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that a message is processed inplace."""
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, env=stream_worker_env
+  ) as worker:
+    message = wrappers_pb2.StringValue(value="a")
+    assert worker.RunMessageInPlace(message) is message
+    assert message.value == "a:1"
+
+
+def test_ProtoWorkerProcess_process_is_reused(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that a single process handles consecutive calls."""
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, env=stream_worker_env
+  ) as worker:
+    values = [worker.RunMessageInPlace(m).value for m in _Messages("a", "b")]
+    assert values == ["a:1", "b:2"]
+
+
+def test_ProtoWorkerProcess_RunMessagesInPlace_pipelined(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that pipelined results are returned in order. The total size of the
+  messages exceeds the pipe buffers, so this deadlocks if the messages are not
+  written concurrently with reading the results."""
+  values = [f"{i}" * 10000 for i in range(100)]
+  messages = _Messages(*values)
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, env=stream_worker_env
+  ) as worker:
+    assert worker.RunMessagesInPlace(messages, timeout_seconds=60) is messages
+  assert [m.value for m in messages] == [
+    f"{value}:{i + 1}" for i, value in enumerate(values)
+  ]
+
+
+def test_ProtoWorkerProcess_concurrent_callers(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that calls from multiple threads are serialized."""
+  results = {}
+
+  def _Run(i):
+    messages = _Messages(*[f"{i}"] * 10)
+    worker.RunMessagesInPlace(messages, timeout_seconds=60)
+    results[i] = messages
+
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, env=stream_worker_env
+  ) as worker:
+    threads = [threading.Thread(target=_Run, args=(i,)) for i in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+  counts = []
+  for i, messages in results.items():
+    values = [m.value.split(":") for m in messages]
+    assert all(value == f"{i}" for value, _ in values)
+    counts += [int(count) for _, count in values]
+  assert sorted(counts) == list(range(1, 41))
+
+
+def test_ProtoWorkerProcess_init_message(stream_worker_cmd, stream_worker_env):
+  """Test that the init message is processed before other messages."""
+  init_message = wrappers_pb2.StringValue(value="init:x")
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, init_message=init_message, env=stream_worker_env
+  ) as worker:
+    messages = worker.RunMessagesInPlace(_Messages("a", "b"))
+  assert [m.value for m in messages] == ["xa:2", "xb:3"]
+  # The init message is copied, not modified.
+  assert init_message.value == "init:x"
+
+
+def test_ProtoWorkerProcess_restart_after_crash(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that the process is restarted, and the init message resent, after
+  the process crashes."""
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd,
+    init_message=wrappers_pb2.StringValue(value="init:x"),
+    env=stream_worker_env,
+  ) as worker:
+    assert worker.RunMessageInPlace(_Messages("a")[0]).value == "xa:2"
+    with test.Raises(subprocess.CalledProcessError) as e_ctx:
+      worker.RunMessagesInPlace(_Messages("b", "crash", "c"))
+    assert e_ctx.value.returncode == 1
+    assert worker.process is None
+    # The next call starts a fresh process.
+    assert worker.RunMessageInPlace(_Messages("d")[0]).value == "xd:2"
+
+
+def test_ProtoWorkerProcess_timeout(stream_worker_cmd, stream_worker_env):
+  """Test that a process which does not produce a result in time is killed,
+  and restarted on the next call."""
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd, env=stream_worker_env
+  ) as worker:
+    assert worker.RunMessageInPlace(_Messages("a")[0]).value == "a:1"
+    process = worker.process
+    with test.Raises(pbutil.ProtoWorkerTimeoutError) as e_ctx:
+      worker.RunMessagesInPlace(_Messages("b", "sleep"), timeout_seconds=1)
+    assert e_ctx.value.timeout_seconds == 1
+    assert process.poll() is not None
+    assert worker.RunMessageInPlace(_Messages("c")[0]).value == "c:1"
+
+
+def test_ProtoWorkerProcess_init_message_timeout(
+  stream_worker_cmd, stream_worker_env
+):
+  """Test that a timeout while processing the init message is raised."""
+  with pbutil.ProtoWorkerProcess(
+    stream_worker_cmd,
+    init_message=wrappers_pb2.StringValue(value="sleep"),
+    env=stream_worker_env,
+  ) as worker:
+    with test.Raises(pbutil.ProtoWorkerTimeoutError):
+      worker.RunMessageInPlace(_Messages("a")[0], timeout_seconds=1)
+    assert worker.process is None
+
+
+def test_ProtoWorkerProcess_Close(stream_worker_cmd, stream_worker_env):
+  """Test that closing a worker terminates the process."""
+  worker = pbutil.ProtoWorkerProcess(stream_worker_cmd, env=stream_worker_env)
+  worker.RunMessageInPlace(_Messages("a")[0])
+  process = worker.process
+  worker.Close()
+  assert worker.process is None
+  assert process.returncode == 0
+  # Closing is idempotent.
+  worker.Close()
+
+
+if __name__ == "__main__":
+  test.Main()